@@ -1,18 +1,20 @@
 import pandas as pd
 import numpy as np
-from scipy.interpolate import interp1d
 
-def apply_distance_correction():
-    print("Applying Distance Correction (Alignment)...")
-    
-    # 1. Load Data
-    master_ref = pd.read_csv('data/processed/reference_master.csv')
-    df15 = pd.read_csv('data/processed/standardized_2015.csv')
-    df22 = pd.read_csv('data/processed/standardized_2022.csv')
-    
-    print(f"Loaded {len(master_ref)} reference points.")
-    
-    # 2. Build Warp Function (Interpolation)
+from profiling import profiled
+
+ALIGN_CHUNK_ROWS = 1_000_000   # Rows warped per step when aligning a run file
+
+def build_warp(master_ref):
+    """
+    Build the 2022 -> 2015 odometer warp function from the master reference.
+
+    Args:
+        master_ref: Reference master with dist_15 and dist_22 columns
+
+    Returns:
+        Callable mapping 2022 distances to 2015 distances
+    """
     # We want to map dist_22 -> dist_15
     # x = dist_22, y = dist_15
     
@@ -25,11 +27,70 @@ def apply_distance_correction():
     y = y[sort_idx]
     
     # Extrapolate outside anchors using the same linear slope as the nearest segments
-    f_warp = interp1d(x, y, kind='linear', fill_value="extrapolate")
-    
-    # 3. Apply Correction to 2022 Anomaly Data
+    from scipy.interpolate import interp1d
+    return interp1d(x, y, kind='linear', fill_value="extrapolate")
+
+def align_run(master_ref, df22):
+    """
+    Align a 2022 run to the 2015 odometer.
+
+    Args:
+        master_ref: Reference master with dist_15 and dist_22 columns
+        df22: Standardized 2022 data
+
+    Returns:
+        Copy of df22 with distance_raw and distance_aligned columns
+    """
+    f_warp = build_warp(master_ref)
+    df22 = df22.copy()
     df22['distance_raw'] = df22['distance']
     df22['distance_aligned'] = f_warp(df22['distance_raw'])
+    return df22
+
+def align_run_file(master_ref, run, path, chunk_rows=ALIGN_CHUNK_ROWS):
+    """
+    Align a 2022 run file to the 2015 odometer into a new run file, one
+    column at a time (only the distance columns and the sort order are
+    held in memory).
+
+    Args:
+        master_ref: Reference master with dist_15 and dist_22 columns
+        run: RunFile of the standardized 2022 run
+        path: Output run file (sorted by distance_aligned)
+        chunk_rows: Rows warped per step
+
+    Returns:
+        The path
+    """
+    from runfile import RunFileWriter
+
+    f_warp = build_warp(master_ref)
+    raw = run.column('distance')
+    aligned = np.empty(len(run))
+    for start in range(0, len(run), chunk_rows):
+        aligned[start:start + chunk_rows] = f_warp(raw[start:start + chunk_rows])
+    order = np.argsort(aligned, kind='stable')
+
+    with RunFileWriter(path, len(run)) as writer:
+        for name in run.columns:
+            writer.add(name, run.values(name, order))
+        writer.add('distance_raw', raw[order])
+        writer.add('distance_aligned', aligned[order])
+    return path
+
+@profiled('alignment.apply_distance_correction')
+def apply_distance_correction():
+    print("Applying Distance Correction (Alignment)...")
+    
+    # 1. Load Data
+    master_ref = pd.read_csv('data/processed/reference_master.csv')
+    df15 = pd.read_csv('data/processed/standardized_2015.csv')
+    df22 = pd.read_csv('data/processed/standardized_2022.csv')
+    
+    print(f"Loaded {len(master_ref)} reference points.")
+    
+    # 2-3. Build Warp Function (Interpolation) and Apply Correction to 2022 Anomaly Data
+    df22 = align_run(master_ref, df22)
     
     # 4. Save Aligned Data
     df22.to_csv('data/processed/aligned_2022.csv', index=False)
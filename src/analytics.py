@@ -1,19 +1,83 @@
 import pandas as pd
 import numpy as np
+from validation import validate_arrays, DISTANCE_TOLERANCE_FT, ORIENTATION_TOLERANCE_DEG
+from scoring import score_anomalies
+from matching import INSPECTION_INTERVAL_YEARS
+from tiles import build_tile_pyramid, save_tile_pyramid
+from columnar import write_columnar
 
-def generate_report():
-    print("Generating Final Growth Analysis Report...")
-    
-    # 1. Load Data
-    matched = pd.read_csv('data/processed/matched_anomalies.csv')
-    df15 = pd.read_csv('data/processed/standardized_2015.csv')
-    df22 = pd.read_csv('data/processed/aligned_2022.csv')
-    
-    # Metal Loss filters (ensure we use same logic as matching)
-    anoms15 = df15[df15['event_type'].str.contains('metal loss', na=False)]
-    anoms22 = df22[df22['event_type'].str.contains('metal loss', na=False)]
-    
-    # 2. Add Anomaly Type Information
+from profiling import profiled
+from anomaly_store import load_store
+from clustering import cluster_anomalies, attach_clusters
+from remaining_strength import PIPE_PARAMS, RESULT_COLUMNS as STRENGTH_COLUMNS, assess
+from geo import GEO_COLUMNS, load_geo, attach_geo
+
+# Anomaly confidence factor weights (weighted average of 0-100 factor scores)
+CONFIDENCE_WEIGHTS = {
+    'validation_confidence': 0.40,  # 40% weight on spatial validation
+    'match_quality': 0.30,          # 30% weight on match quality
+    'depth_consistency': 0.20,      # 20% weight on depth consistency
+    'type_match': 0.10,             # 10% weight on type consistency
+}
+
+# Confidence level classification: (minimum confidence, level), checked in order
+CONFIDENCE_LEVELS = [(90, 'Very High'), (80, 'High'), (60, 'Medium')]
+
+# Thresholds of the "Review Required" criteria
+REVIEW_THRESHOLDS = {
+    'max_match_cost': 0.6,
+    'min_confidence': 70,       # %
+    'max_depth_growth': 30,     # % wall
+    'max_depth_shrinkage': 10,  # % wall
+}
+
+# Review criteria bit flags. The report stores them in one compact integer
+# column ('review_flags'); the text is only decoded at export/display time.
+REVIEW_SPATIAL = 1          # Spatial validation failed
+REVIEW_MATCH_COST = 2       # High match cost (>0.6)
+REVIEW_LOW_CONFIDENCE = 4   # Low confidence (<70%)
+REVIEW_DEPTH_CHANGE = 8     # Unusual depth change
+REVIEW_TYPE_MISMATCH = 16   # Type mismatch
+
+REVIEW_REASONS = {
+    REVIEW_SPATIAL: 'Spatial validation failed',
+    REVIEW_MATCH_COST: 'High match cost (>0.6)',
+    REVIEW_LOW_CONFIDENCE: 'Low confidence (<70%)',
+    REVIEW_DEPTH_CHANGE: 'Unusual depth change',
+    REVIEW_TYPE_MISMATCH: 'Type mismatch',
+}
+
+def decode_review_reasons(flags):
+    """
+    Decode review bit flags into the human-readable '; '-joined reasons.
+    Only the distinct flag values are decoded (at most 32), then broadcast back.
+    
+    Args:
+        flags: Array-like of integer review flags
+    
+    Returns:
+        Object array of reason strings ('' when no flag is set)
+    """
+    flags = np.asarray(flags, dtype=np.int64)
+    codes, inverse = np.unique(flags, return_inverse=True)
+    labels = np.array(
+        ['; '.join(text for bit, text in REVIEW_REASONS.items() if code & bit) for code in codes],
+        dtype=object
+    )
+    return labels[inverse.reshape(flags.shape)]
+
+def attach_event_types(matched, anoms15, anoms22):
+    """
+    Add event_type_15 / event_type_22 / anomaly_type to the matched pairs.
+    
+    Args:
+        matched: Matched anomalies (matching.py output)
+        anoms15: 2015 metal loss anomalies
+        anoms22: Aligned 2022 metal loss anomalies
+    
+    Returns:
+        Matched DataFrame with anomaly type columns
+    """
     # Merge event_type from both runs
     matched = matched.merge(
         anoms15[['distance', 'event_type']].rename(columns={'event_type': 'event_type_15'}),
@@ -31,32 +95,58 @@ def generate_report():
     
     # Use 2022 event type as primary, fallback to 2015
     matched['anomaly_type'] = matched['event_type_22'].fillna(matched['event_type_15']).fillna('metal loss')
-    
-    # 3. Add Validation Data
-    # Calculate distance and orientation differences for validation display
-    matched['dist_diff_ft'] = np.abs(matched['dist_22_aligned'] - matched['dist_15'])
-    
-    # Calculate orientation difference with wraparound handling
-    orient_diff = np.abs(matched['orient_22'] - matched['orient_15'])
-    matched['orient_diff_deg'] = np.where(orient_diff > 180, 360 - orient_diff, orient_diff)
-    
-    # Validation flags
-    matched['dist_within_tolerance'] = matched['dist_diff_ft'] <= 5.0
-    matched['orient_within_tolerance'] = matched['orient_diff_deg'] <= 60.0
-    matched['is_validated'] = matched['dist_within_tolerance'] & matched['orient_within_tolerance']
-    
-    # Validation confidence (0-100%) - proves it's the same anomaly
-    dist_score = np.maximum(0, 100 * (1 - matched['dist_diff_ft'] / 5.0))
-    orient_score = np.maximum(0, 100 * (1 - matched['orient_diff_deg'] / 60.0))
-    matched['validation_confidence'] = (dist_score + orient_score) / 2
-    
-    # 4. Enhanced Confidence Score - proves it's really an anomaly
-    # Combines multiple factors:
-    # - Match quality (low match_cost = high confidence)
-    # - Validation (distance + orientation match)
-    # - Depth consistency (similar depths = more confident)
-    # - Type consistency (same type in both runs = more confident)
-    
+    return matched
+
+def attach_index_22(matched, anoms22):
+    """
+    Add 'index_22' to matched tables written before matching recorded it:
+    the 2022 row with the same aligned distance, orientation and depth.
+    """
+    key = anoms22[['distance_aligned', 'orientation', 'depth']].rename(columns={
+        'distance_aligned': 'dist_22_aligned', 'orientation': 'orient_22', 'depth': 'depth_22'
+    }).assign(index_22=anoms22.index.to_numpy())
+    on = ['dist_22_aligned', 'orient_22', 'depth_22']
+    return matched.merge(key.drop_duplicates(on), on=on, how='left')
+
+def validation_columns(matched, dist_tolerance=DISTANCE_TOLERANCE_FT,
+                       orient_tolerance=ORIENTATION_TOLERANCE_DEG):
+    """
+    Distance/orientation checks and validation confidence from the shared
+    vectorized engine, so the tolerances live in one place (validation.py).
+    
+    Returns:
+        dict of report column -> array
+    """
+    val = validate_arrays(
+        matched['dist_15'].to_numpy(dtype=float),
+        matched['dist_22_aligned'].to_numpy(dtype=float),
+        matched['orient_15'].to_numpy(dtype=float),
+        matched['orient_22'].to_numpy(dtype=float),
+        dist_tolerance=dist_tolerance,
+        orient_tolerance=orient_tolerance
+    )
+    return {
+        'dist_diff_ft': val['dist_diff_ft'],
+        'orient_diff_deg': val['orient_diff_deg'],
+        # Validation flags
+        'dist_within_tolerance': val['dist_within_tolerance'],
+        'orient_within_tolerance': val['orient_within_tolerance'],
+        'is_validated': val['is_valid'],
+        # Validation confidence (0-100%) - proves it's the same anomaly
+        'validation_confidence': val['confidence_score'],
+    }
+
+def confidence_factors(matched, validation_confidence):
+    """
+    Per-factor anomaly confidence scores (0-100 each) - proves it's really an anomaly.
+    - Validation (distance + orientation match)
+    - Match quality (low match_cost = high confidence)
+    - Depth consistency (similar depths = more confident)
+    - Type consistency (same type in both runs = more confident)
+    
+    Returns:
+        dict of factor name -> array (keys match CONFIDENCE_WEIGHTS)
+    """
     # Match quality score (0-100)
     match_quality = 100 * (1.0 / (1.0 + matched['match_cost']))
     
@@ -68,165 +158,342 @@ def generate_report():
     type_match = (matched['event_type_15'] == matched['event_type_22']).astype(float) * 100
     type_match = type_match.fillna(50)  # Neutral if one is missing
     
-    # Overall anomaly confidence (weighted average)
-    matched['anomaly_confidence'] = (
-        0.40 * matched['validation_confidence'] +  # 40% weight on spatial validation
-        0.30 * match_quality +                     # 30% weight on match quality
-        0.20 * depth_consistency +                 # 20% weight on depth consistency
-        0.10 * type_match                          # 10% weight on type consistency
+    return {
+        'validation_confidence': np.asarray(validation_confidence, dtype=float),
+        'match_quality': match_quality.to_numpy(),
+        'depth_consistency': depth_consistency.to_numpy(),
+        'type_match': type_match.to_numpy(),
+    }
+
+def combine_confidence(factors, weights=CONFIDENCE_WEIGHTS, levels=CONFIDENCE_LEVELS):
+    """
+    Weighted anomaly confidence and its level classification.
+    
+    Returns:
+        Tuple of (anomaly_confidence array, confidence_level array)
+    """
+    conf = sum(weight * factors[name] for name, weight in weights.items())
+    level = np.select(
+        [conf >= minimum for minimum, _ in levels],
+        [name for _, name in levels],
+        default='Low'
     )
+    return conf, level
+
+def compute_review_flags(matched, is_validated, anomaly_confidence, thresholds=REVIEW_THRESHOLDS):
+    """
+    Review criteria as bit flags in one vectorized pass.
+    Each criterion sets one bit; any bit set means "Review Required".
+    
+    Returns:
+        uint8 array of REVIEW_* flags
+    """
+    type_15 = matched['event_type_15']
+    type_22 = matched['event_type_22']
+    depth_change = (matched['depth_22'] - matched['depth_15']).to_numpy()
+    review_flags = (
+        # Criterion 1: Poor spatial validation (distance or orientation out of tolerance)
+        np.where(~np.asarray(is_validated, dtype=bool), REVIEW_SPATIAL, 0) |
+        # Criterion 2: High match cost (poor algorithmic match)
+        np.where(matched['match_cost'].to_numpy() > thresholds['max_match_cost'], REVIEW_MATCH_COST, 0) |
+        # Criterion 3: Low overall anomaly confidence
+        np.where(np.asarray(anomaly_confidence) < thresholds['min_confidence'], REVIEW_LOW_CONFIDENCE, 0) |
+        # Criterion 4: Inconsistent depth (too much growth or shrinkage)
+        np.where((depth_change > thresholds['max_depth_growth']) |
+                 (depth_change < -thresholds['max_depth_shrinkage']), REVIEW_DEPTH_CHANGE, 0) |
+        # Criterion 5: Type mismatch between runs
+        np.where(((type_15 != type_22) & type_15.notna() & type_22.notna()).to_numpy(), REVIEW_TYPE_MISMATCH, 0)
+    )
+    return review_flags.astype(np.uint8)
+
+def assessed_depth(matched):
+    """
+    Depth each matched anomaly is assessed at. Interacting anomalies (when
+    cluster columns are present) are assessed together, at the depth of
+    their cluster's deepest feature.
+    """
+    depth = matched['depth_22'].to_numpy(dtype=float)
+    if 'cluster_max_depth' in matched.columns:
+        depth = np.fmax(depth, matched['cluster_max_depth'].to_numpy(dtype=float))
+    return depth
+
+def run_year(anoms):
+    """Inspection year of a run's anomalies (None when unknown)."""
+    if 'year' not in anoms.columns or anoms['year'].isna().all():
+        return None
+    return int(anoms['year'].max())
+
+def assessed_length(matched, anoms22=None):
+    """
+    Axial length (in) each matched anomaly is assessed at: its cluster's
+    combined length when cluster columns are present, otherwise the length
+    of the 2022 feature itself (looked up through 'index_22').
+
+    Returns:
+        Array of lengths, or None when neither is available
+    """
+    if 'cluster_length_in' in matched.columns:
+        return matched['cluster_length_in'].to_numpy(dtype=float)
+    if anoms22 is None or 'length' not in anoms22.columns:
+        return None
+    if 'index_22' not in matched.columns:
+        matched = attach_index_22(matched, anoms22)
+    return anoms22['length'].reindex(matched['index_22']).to_numpy(dtype=float)
+
+def remaining_strength(matched, pipe=PIPE_PARAMS, interval=INSPECTION_INTERVAL_YEARS, year=None,
+                       anoms22=None):
+    """
+    Remaining strength (B31G / modified B31G, see remaining_strength.py) of
+    each matched anomaly at its assessed depth and length (see
+    assessed_length()), projected with its growth rate.
+    
+    Returns:
+        dict of STRENGTH_COLUMNS -> array, or None when there are no
+        lengths to assess
+    """
+    length = assessed_length(matched, anoms22)
+    if length is None:
+        return None
+    return assess(
+        assessed_depth(matched),
+        length,
+        distance=matched['dist_22_aligned'].to_numpy(dtype=float),
+        growth_rate=(matched['growth'] / interval).to_numpy(dtype=float),
+        pipe=pipe,
+        year=year
+    )
+
+def proximity(matched, geo=None):
+    """
+    Coordinates and sensitive-location proximity of each matched anomaly
+    (see geo.py), from its aligned 2022 distance.
+    
+    Returns:
+        dict of GEO_COLUMNS -> array
+    """
+    return (geo or load_geo()).proximity(matched['dist_22_aligned'].to_numpy(dtype=float))
+
+def severity_scores(matched, rules='report', interval=INSPECTION_INTERVAL_YEARS, strength=None):
+    """
+    Severity combines depth, growth rate, absolute growth and projected time
+    to failure into a 0-100 score (rules live in scoring.py). With remaining
+    strength, time to failure is the earlier of the failure-depth and the
+    safe-pressure projections, so long flaws count as closer to failure.
+    """
+    return score_anomalies(
+        assessed_depth(matched),
+        growth_rate=(matched['growth'] / interval).to_numpy(dtype=float),
+        interval=interval,
+        growth=matched['growth'].to_numpy(dtype=float),
+        rules=rules,
+        failure_years=strength['years_to_unsafe'] if strength is not None else None
+    )
+
+def assemble_report(matched, validation, confidence, review_flags, scored,
+                    interval=INSPECTION_INTERVAL_YEARS, strength=None, geo=None):
+    """
+    Assemble the final report frame from the stage outputs.
+    
+    Args:
+        matched: Matched pairs with anomaly types (attach_event_types())
+        validation: validation_columns() output
+        confidence: (anomaly_confidence, confidence_level) from combine_confidence()
+        review_flags: compute_review_flags() output
+        scored: Severity scoring output
+        interval: Years between the two runs
+        strength: Optional remaining_strength() output
+        geo: Optional proximity() output (adds risk_score, the severity
+            score weighted by the consequence factor)
+    
+    Returns:
+        Report DataFrame
+    """
+    columns = dict(validation)
+    columns['anomaly_confidence'], columns['confidence_level'] = confidence
     
-    # Confidence level classification
-    matched['confidence_level'] = 'Low'
-    matched.loc[matched['anomaly_confidence'] >= 60, 'confidence_level'] = 'Medium'
-    matched.loc[matched['anomaly_confidence'] >= 80, 'confidence_level'] = 'High'
-    matched.loc[matched['anomaly_confidence'] >= 90, 'confidence_level'] = 'Very High'
-    
-    # 5. Identify Exceptions
-    # New Anomalies: features in 2022 that were NOT matched
-    matched_dists_22 = matched['dist_22_aligned'].values
-    new_anoms = anoms22[~anoms22['distance_aligned'].isin(matched_dists_22)].copy()
-    
-    # Missing Anomalies: features in 2015 that were NOT matched (possibly repaired or measurement noise)
-    matched_dists_15 = matched['dist_15'].values
-    missing_anoms = anoms15[~anoms15['distance'].isin(matched_dists_15)].copy()
-    
-    # 6. Growth Analytics
     # Annualized growth (assumed 7 years: 2015-2022)
-    DT = 7.0
-    matched['annual_growth_rate'] = matched['growth'] / DT
-    
-    # 7. Enhanced Confidence Label with Clear Criteria
-    # Determine if anomaly needs review based on multiple factors
-    
-    # Initialize all as "Confident"
-    matched['confidence_label'] = 'Confident'
-    matched['review_reasons'] = ''
-    
-    # Check multiple criteria for "Review Required"
-    review_flags = []
-    
-    # Criterion 1: Poor spatial validation (distance or orientation out of tolerance)
-    poor_spatial = ~matched['is_validated']
-    matched.loc[poor_spatial, 'confidence_label'] = 'Review Required'
-    matched.loc[poor_spatial, 'review_reasons'] = matched.loc[poor_spatial, 'review_reasons'] + 'Spatial validation failed; '
+    columns['annual_growth_rate'] = matched['growth'].to_numpy() / interval
     
-    # Criterion 2: High match cost (poor algorithmic match)
-    high_match_cost = matched['match_cost'] > 0.6
-    matched.loc[high_match_cost, 'confidence_label'] = 'Review Required'
-    matched.loc[high_match_cost, 'review_reasons'] = matched.loc[high_match_cost, 'review_reasons'] + 'High match cost (>0.6); '
-    
-    # Criterion 3: Low overall anomaly confidence
-    low_confidence = matched['anomaly_confidence'] < 70
-    matched.loc[low_confidence, 'confidence_label'] = 'Review Required'
-    matched.loc[low_confidence, 'review_reasons'] = matched.loc[low_confidence, 'review_reasons'] + 'Low confidence (<70%); '
-    
-    # Criterion 4: Inconsistent depth (too much or negative growth)
-    depth_diff = matched['depth_22'] - matched['depth_15']
-    unusual_growth = (depth_diff > 30) | (depth_diff < -10)  # >30% growth or >10% shrinkage
-    matched.loc[unusual_growth, 'confidence_label'] = 'Review Required'
-    matched.loc[unusual_growth, 'review_reasons'] = matched.loc[unusual_growth, 'review_reasons'] + 'Unusual depth change; '
-    
-    # Criterion 5: Type mismatch between runs
-    type_mismatch = (matched['event_type_15'] != matched['event_type_22']) & matched['event_type_15'].notna() & matched['event_type_22'].notna()
-    matched.loc[type_mismatch, 'confidence_label'] = 'Review Required'
-    matched.loc[type_mismatch, 'review_reasons'] = matched.loc[type_mismatch, 'review_reasons'] + 'Type mismatch; '
-    
-    # Clean up review reasons (remove trailing semicolon and space)
-    matched['review_reasons'] = matched['review_reasons'].str.rstrip('; ')
+    # Enhanced Confidence Label with Clear Criteria
+    columns['confidence_label'] = np.where(review_flags != 0, 'Review Required', 'Confident')
+    columns['review_flags'] = review_flags
     
     # Legacy confidence score for backward compatibility
-    matched['confidence_score'] = 1.0 / (1.0 + matched['match_cost']) # Scale 0-1
-    
-    # 8. Enhanced Severity Scoring System
-    # Combines multiple risk factors into a 0-100 severity score
-    
-    # Factor 1: Current Depth (0-40 points)
-    # Higher depth = higher severity
-    depth_score = np.minimum(40, matched['depth_22'] * 0.8)  # Max 40 points at 50% depth
-    
-    # Factor 2: Growth Rate (0-30 points)
-    # Faster growth = higher severity
-    growth_score = np.minimum(30, matched['annual_growth_rate'] * 10)  # Max 30 points at 3%/yr
-    
-    # Factor 3: Absolute Growth (0-20 points)
-    # Large total growth = higher severity
-    absolute_growth = np.abs(matched['growth'])
-    absolute_growth_score = np.minimum(20, absolute_growth * 0.8)  # Max 20 points at 25% growth
-    
-    # Factor 4: Projected Time to Failure (0-10 points)
-    # Closer to failure = higher severity
-    # Assume failure at 80% depth
-    remaining_depth = 80 - matched['depth_22']
-    years_to_failure = np.where(
-        matched['annual_growth_rate'] > 0,
-        remaining_depth / matched['annual_growth_rate'],
-        999  # If not growing, set to very high
-    )
-    time_score = np.where(
-        years_to_failure < 5, 10,
-        np.where(years_to_failure < 10, 7,
-        np.where(years_to_failure < 20, 4, 0))
+    columns['confidence_score'] = 1.0 / (1.0 + matched['match_cost'].to_numpy()) # Scale 0-1
+    
+    # Severity and status (simplified categories based on severity)
+    columns['severity_score'] = scored['severity_score']
+    columns['severity_level'] = scored['severity_level']
+    columns['years_to_failure'] = scored['years_to_failure']  # Capped at 100 years
+    columns['status'] = scored['status']
+    if strength is not None:
+        for col in STRENGTH_COLUMNS:
+            columns[col] = strength[col]
+    if geo is not None:
+        for col in GEO_COLUMNS:
+            columns[col] = geo[col]
+        columns['risk_score'] = np.asarray(columns['severity_score'], dtype=float) * geo['consequence_factor']
+    
+    # New columns in one concat instead of an insert per column; columns
+    # matched already has are replaced in place
+    added = pd.DataFrame({col: np.asarray(values) for col, values in columns.items()}, index=matched.index)
+    report = pd.concat([matched, added.drop(columns=matched.columns, errors='ignore')], axis=1)
+    for col in added.columns.intersection(matched.columns):
+        report[col] = added[col]
+    return report
+
+def build_report(matched, anoms15, anoms22, rules='report',
+                 dist_tolerance=DISTANCE_TOLERANCE_FT,
+                 orient_tolerance=ORIENTATION_TOLERANCE_DEG,
+                 confidence_weights=CONFIDENCE_WEIGHTS,
+                 review_thresholds=REVIEW_THRESHOLDS,
+                 interval=INSPECTION_INTERVAL_YEARS,
+                 clusters=None,
+                 pipe=PIPE_PARAMS,
+                 geo=None):
+    """
+    Build the growth report for matched anomalies entirely in memory.
+    
+    Args:
+        matched: Matched anomalies (matching.py output)
+        anoms15: 2015 metal loss anomalies
+        anoms22: Aligned 2022 metal loss anomalies
+        rules: Severity rule set (name or dict, see scoring.py)
+        dist_tolerance, orient_tolerance: Validation tolerances
+        confidence_weights: Weights of the anomaly confidence factors
+        review_thresholds: Thresholds of the review criteria
+        interval: Years between the two runs
+        clusters: Optional interacting clusters of the 2022 anomalies
+            (clustering.cluster_anomalies() features), used by severity
+        pipe: Pipe parameters of the remaining strength assessment
+        geo: GeoIndex of the proximity columns (default geo.load_geo())
+    
+    Returns:
+        Report DataFrame (one row per matched pair)
+    """
+    matched = attach_event_types(matched, anoms15, anoms22)
+    if clusters is not None:
+        if 'index_22' not in matched.columns:
+            matched = attach_index_22(matched, anoms22)
+        matched = attach_clusters(matched, clusters, 'index_22')
+    validation = validation_columns(matched, dist_tolerance, orient_tolerance)
+    factors = confidence_factors(matched, validation['validation_confidence'])
+    confidence = combine_confidence(factors, confidence_weights)
+    flags = compute_review_flags(matched, validation['is_validated'], confidence[0], review_thresholds)
+    strength = remaining_strength(matched, pipe, interval, run_year(anoms22), anoms22)
+    scored = severity_scores(matched, rules, interval, strength)
+    return assemble_report(matched, validation, confidence, flags, scored, interval, strength,
+                           proximity(matched, geo))
+
+def find_exceptions(matched, anoms15, anoms22):
+    """
+    New Anomalies: features in 2022 that were NOT matched.
+    Missing Anomalies: features in 2015 that were NOT matched (possibly repaired or measurement noise).
+    
+    Returns:
+        Tuple of (new_anoms, missing_anoms) DataFrames
+    """
+    new_anoms = anoms22[~anoms22['distance_aligned'].isin(matched['dist_22_aligned'].values)].copy()
+    missing_anoms = anoms15[~anoms15['distance'].isin(matched['dist_15'].values)].copy()
+    return new_anoms, missing_anoms
+
+def ui_payload_frame(matched, new_anoms):
+    """
+    Combine matched and new anomalies into the 3D UI records frame, keeping
+    missing values (used as-is by the binary columnar export).
+    """
+    ui_matched = matched.copy()
+    ui_matched['is_match'] = True
+    
+    ui_new = new_anoms.rename(columns={'distance_aligned': 'dist_22_aligned', 'orientation': 'orient_22', 'depth': 'depth_22'})
+    ui_new = ui_new.assign(
+        is_match=False,
+        confidence_label='Review Required', # New anomalies are unconfirmed
+        review_flags=0,
+        status='New',
+        is_validated=False,
+        validation_confidence=0,
+        anomaly_confidence=0,
+        confidence_level='Unknown',
+        anomaly_type=ui_new['event_type'],
     )
     
-    # Calculate total severity score (0-100)
-    matched['severity_score'] = depth_score + growth_score + absolute_growth_score + time_score
-    matched['severity_score'] = np.clip(matched['severity_score'], 0, 100)
+    # Combine for UI
+    return pd.concat([ui_matched, ui_new], ignore_index=True)
+
+def build_ui_payload(matched, new_anoms):
+    """
+    3D UI records frame for the JSON payload (missing values filled with 0).
+    """
+    return ui_payload_frame(matched, new_anoms).fillna(0)
+
+def report_csv_frame(report):
+    """Report with the review reasons decoded to text, for the CSV export."""
+    report_csv = report.copy()
+    report_csv.insert(
+        report_csv.columns.get_loc('review_flags') + 1,
+        'review_reasons',
+        decode_review_reasons(report_csv['review_flags'])
+    )
+    return report_csv
+
+@profiled('analytics.generate_report')
+def generate_report(rules='report'):
+    print("Generating Final Growth Analysis Report...")
     
-    # Classify severity level
-    matched['severity_level'] = 'Low'
-    matched.loc[matched['severity_score'] >= 30, 'severity_level'] = 'Moderate'
-    matched.loc[matched['severity_score'] >= 50, 'severity_level'] = 'High'
-    matched.loc[matched['severity_score'] >= 70, 'severity_level'] = 'Critical'
+    # 1. Load Data
+    matched = pd.read_csv('data/processed/matched_anomalies.csv')
     
-    # Calculate years to failure for display
-    matched['years_to_failure'] = years_to_failure
-    matched['years_to_failure'] = np.clip(matched['years_to_failure'], 0, 100)  # Cap at 100 years
+    # Metal Loss rows (the same shared stores and category as matching)
+    anoms15 = load_store('data/processed/standardized_2015.csv').subset('metal_loss')
+    anoms22 = load_store('data/processed/aligned_2022.csv').subset('metal_loss')
     
-    # 9. Flag Status (simplified categories based on severity)
-    matched['status'] = 'Active'
-    matched.loc[matched['severity_score'] >= 70, 'status'] = 'Critical'
-    matched.loc[matched['severity_score'] >= 50, 'status'] = 'High Risk'
-    matched.loc[matched['growth'] <= 0, 'status'] = 'Static'
+    # 2. Interacting anomaly clusters in the 2022 run
+    clusters, _ = cluster_anomalies(anoms22)
     
-    # 8. Export for UI
-    # We want a clean JSON with all anomalies (matched and new)
-    ui_matched = matched.copy()
-    ui_matched['is_match'] = True
+    # 3. Validation, confidence, review criteria and severity
+    matched = build_report(matched, anoms15, anoms22, rules=rules, clusters=clusters)
     
-    ui_new = new_anoms.copy().rename(columns={'distance_aligned': 'dist_22_aligned', 'orientation': 'orient_22', 'depth': 'depth_22'})
-    ui_new['is_match'] = False
-    ui_new['confidence_label'] = 'Review Required' # New anomalies are unconfirmed
-    ui_new['status'] = 'New'
-    ui_new['is_validated'] = False
-    ui_new['validation_confidence'] = 0
-    ui_new['anomaly_confidence'] = 0
-    ui_new['confidence_level'] = 'Unknown'
-    ui_new['anomaly_type'] = ui_new['event_type']
+    # 4. Identify Exceptions
+    new_anoms, missing_anoms = find_exceptions(matched, anoms15, anoms22)
+    new_anoms = attach_clusters(new_anoms, clusters)
+    new_anoms = attach_geo(new_anoms, 'distance_aligned')
     
-    # Combine for UI
-    ui_data = pd.concat([ui_matched, ui_new], ignore_index=True)
-    ui_data = ui_data.fillna(0)
+    # 5. Export for UI
+    # We want a clean JSON with all anomalies (matched and new)
+    ui_data = build_ui_payload(matched, new_anoms)
     
     # Take a sample or top 500 to keep UI smooth if it's too big
     ui_data.to_json('data/ui_payload.json', orient='records')
     print("Exported data/ui_payload.json for 3D UI")
+    
+    # Same records as typed columns (real nulls, no JSON parsing in the viewer)
+    write_columnar(ui_payload_frame(matched, new_anoms), 'data/ui_payload.bin', meta={'kind': 'ui_payload'})
+    print("Exported data/ui_payload.bin for 3D UI")
+    
+    # Level-of-detail tiles for the zoomed-out view
+    save_tile_pyramid(build_tile_pyramid(ui_data), 'data/tiles.json')
+    print("Exported data/tiles.json for 3D UI")
 
-    # 9. Export Reference Data for UI
+    # 6. Export Reference Data for UI
     master_ref = pd.read_csv('data/processed/reference_master.csv')
     master_ref.to_json('data/reference_payload.json', orient='records')
     print("Exported data/reference_payload.json for 3D UI")
 
-    # 10. Save Final Report
-    matched.to_csv('data/processed/final_growth_report.csv', index=False)
+    # 7. Save Final Report (review reasons decoded to text for the CSV export)
+    report_csv_frame(matched).to_csv('data/processed/final_growth_report.csv', index=False)
     new_anoms.to_csv('data/processed/new_anomalies.csv', index=False)
     
-    # 11. Summary Statistics
+    # 8. Summary Statistics
     print("\n--- Summary Report ---")
     print(f"Total Matched: {len(matched)}")
     print(f"Validated Matches: {matched['is_validated'].sum()} ({100*matched['is_validated'].sum()/len(matched):.1f}%)")
     print(f"New Anomalies (2022): {len(new_anoms)}")
     print(f"Missing/Repaired (2015): {len(missing_anoms)}")
+    print(f"Matched in Interacting Clusters: {int((matched['cluster_size'] > 1).sum())}")
+    print(f"Unsafe at MAOP (ERF > 1): {int((matched['erf'] > 1).sum())}")
+    print(f"Near Sensitive Locations: {int((matched['nearby_locations'] > 0).sum())} "
+          f"({int((matched['proximity_level'] == 'critical').sum())} critical)")
     print(f"\nStatus Distribution:")
     print(f"  Critical: {len(matched[matched['status'] == 'Critical'])} ({100*len(matched[matched['status'] == 'Critical'])/len(matched):.1f}%)")
     print(f"  High Risk: {len(matched[matched['status'] == 'High Risk'])} ({100*len(matched[matched['status'] == 'High Risk'])/len(matched):.1f}%)")
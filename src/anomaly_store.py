@@ -0,0 +1,399 @@
+"""
+Anomaly Store
+In-memory index over one run's records, shared by matching, analytics,
+prediction and the API's range and viewport queries. Rows are kept sorted
+by aligned distance (a distance range is a binary search and a slice),
+numeric columns are held as plain arrays, and event categories, joints
+and status / severity / confidence are indexed once at load time, so a
+query only touches the rows it returns.
+
+load_store() keeps one loaded copy per run file and process, so the
+modules that read the same run share it instead of re-reading the CSV
+and re-filtering it with their own str.contains().
+"""
+
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_PAGE_SIZE = 500
+MAX_PAGE_SIZE = 10_000
+
+# Distance column, in order of preference (UI payload, aligned run, raw run)
+DISTANCE_COLUMNS = ['dist_22_aligned', 'distance_aligned', 'distance']
+
+# Joint columns in the viewer's order of preference (first non-zero wins)
+JOINT_COLUMNS = ['joint_number', 'joint_22', 'joint']
+
+# Event type column, in order of preference (run, report / UI payload)
+EVENT_COLUMNS = ['event_type', 'event_type_22']
+
+# Event categories: name -> substrings of the (lowercased) event type.
+# 'metal_loss' is the matching population of matching.py and everything after it
+EVENT_CATEGORIES = {
+    'metal_loss': ('metal loss',),
+    'dent': ('dent',),
+    'girth_weld': ('girth weld',),
+}
+
+# Categorical filters: query name -> record column
+CATEGORY_FILTERS = {
+    'status': 'status',
+    'severity': 'severity_level',
+    'confidence': 'confidence_level',
+}
+
+# Numeric minimum filters: query name -> record column
+MIN_FILTERS = {
+    'min_depth': 'depth_22',
+    'min_severity': 'severity_score',
+    'min_confidence': 'anomaly_confidence',
+}
+
+# Bit flag filters: query name -> (record column, match mode filter). A row
+# passes when any bit of the mask is set, or every bit with mode 'all'
+FLAG_FILTERS = {
+    'review_mask': ('review_flags', 'review_match'),
+}
+FLAG_MATCH_MODES = ('any', 'all')
+
+
+def category_mask(events, category):
+    """
+    Boolean mask of the rows of an event type Series in an event category.
+
+    Args:
+        events: Event type Series
+        category: Key in EVENT_CATEGORIES
+
+    Returns:
+        numpy bool array
+    """
+    if category not in EVENT_CATEGORIES:
+        raise ValueError(f"Unknown event category '{category}'. Available: {', '.join(EVENT_CATEGORIES)}")
+    pattern = '|'.join(EVENT_CATEGORIES[category])
+    return events.str.contains(pattern, case=False, na=False, regex=True).to_numpy(dtype=bool)
+
+
+def flag_mask(flags, mask, require_all=False):
+    """
+    Boolean mask of the rows of a bit flag array (e.g. the report's
+    review_flags) with any bit of mask set.
+
+    Args:
+        flags: Integer flag array
+        mask: OR-ed flag bits to look for
+        require_all: If True, every bit in mask must be set
+
+    Returns:
+        numpy bool array
+    """
+    flags = np.asarray(flags)
+    if require_all:
+        return (flags & mask) == mask
+    return (flags & mask) != 0
+
+
+def filter_category(df, category='metal_loss'):
+    """
+    Rows of a frame in an event category, in their original order (for
+    frames not loaded through a store, e.g. the in-memory pipeline).
+    """
+    return df[category_mask(df['event_type'], category)]
+
+
+def joint_values(records):
+    """Joint number per row, NaN when no joint column has a value."""
+    joint = np.full(len(records), np.nan)
+    for col in reversed(JOINT_COLUMNS):
+        if col in records.columns:
+            values = pd.to_numeric(records[col], errors='coerce').to_numpy(dtype=float)
+            joint = np.where(np.isfinite(values) & (values != 0), values, joint)
+    return joint
+
+
+class AnomalyStore:
+    """
+    Distance-sorted, joint-indexed anomaly records with filtered, paginated
+    queries.
+
+    Usage:
+        store = AnomalyStore(pd.read_json('data/ui_payload.json'))
+        page = store.query(dist_min=1000, dist_max=5000, status=['Critical'], limit=100)
+    """
+
+    def __init__(self, records):
+        """
+        Args:
+            records: DataFrame of anomaly records (UI payload, report or parsed run)
+        """
+        self.distance_column = next((c for c in DISTANCE_COLUMNS if c in records.columns), None)
+        if self.distance_column is None:
+            raise ValueError(f"Records need one of the distance columns {DISTANCE_COLUMNS}")
+
+        distance = pd.to_numeric(records[self.distance_column], errors='coerce').to_numpy(dtype=float)
+        order = np.argsort(distance, kind='stable')    # NaN distances sort last
+        self.order = order                              # Sorted row -> input position
+        self.source_index = records.index[order]
+        self.records = records.iloc[order].reset_index(drop=True)
+        self.distance = distance[order]
+        self.columns = list(self.records.columns)
+
+        # Numeric columns as arrays (struct of arrays, in distance order)
+        self.arrays = {col: self.records[col].to_numpy(dtype=float) for col in self.columns
+                       if pd.api.types.is_numeric_dtype(self.records[col])
+                       and not pd.api.types.is_bool_dtype(self.records[col])}
+
+        # Event category masks
+        self.event_column = next((c for c in EVENT_COLUMNS if c in self.columns), None)
+        self.masks = {}
+        if self.event_column is not None:
+            events = self.records[self.event_column].astype('string')
+            self.masks = {name: category_mask(events, name) for name in EVENT_CATEGORIES}
+
+        # Joint index: rows ordered by joint, and the distinct joints
+        self.joint = joint_values(self.records)
+        has_joint = np.flatnonzero(np.isfinite(self.joint))
+        self._joint_rows = has_joint[np.argsort(self.joint[has_joint], kind='stable')]
+        self._joint_sorted = self.joint[self._joint_rows]
+        self.joints, first = np.unique(self._joint_sorted, return_index=True)
+
+        # Joint -> row range: [start, end) of the joint's rows in
+        # _joint_rows, and the distance-order span they cover
+        self._joint_starts = first
+        self._joint_ends = np.append(first[1:], len(self._joint_sorted)).astype(first.dtype)
+        if len(first):
+            self._joint_span_lo = np.minimum.reduceat(self._joint_rows, first)
+            self._joint_span_hi = np.maximum.reduceat(self._joint_rows, first) + 1
+        else:
+            self._joint_span_lo = self._joint_span_hi = first
+
+        # Categorical columns as integer codes
+        self._codes = {}
+        for name, col in CATEGORY_FILTERS.items():
+            if col in self.records.columns:
+                cat = pd.Categorical(self.records[col].astype(str))
+                self._codes[name] = (cat.codes, list(cat.categories))
+
+        # Bit flag columns as integers (rows without flags have none set)
+        self._flags = {}
+        for name, (col, _) in FLAG_FILTERS.items():
+            if col in self.records.columns:
+                values = pd.to_numeric(self.records[col], errors='coerce').fillna(0)
+                self._flags[name] = values.to_numpy(dtype=np.int64)
+
+    def __len__(self):
+        return len(self.records)
+
+    def _distance_rows(self, dist_min=None, dist_max=None):
+        """Row slice bounds for a distance range (inclusive)."""
+        start = 0 if dist_min is None else int(np.searchsorted(self.distance, dist_min, side='left'))
+        end = len(self.distance) if dist_max is None \
+            else int(np.searchsorted(self.distance, dist_max, side='right'))
+        return start, end
+
+    def interval(self, dist_min=None, dist_max=None):
+        """
+        Rows with an aligned distance in [dist_min, dist_max], as a slice
+        (a binary search; rows are distance-sorted).
+        """
+        start, end = self._distance_rows(dist_min, dist_max)
+        return slice(start, end)
+
+    def joint_rows(self, joint):
+        """Sorted row indices of one joint (empty when the run has no such joint)."""
+        idx = int(np.searchsorted(self.joints, joint))
+        if idx == len(self.joints) or self.joints[idx] != joint:
+            return np.empty(0, dtype=np.intp)
+        return np.sort(self._joint_rows[self._joint_starts[idx]:self._joint_ends[idx]])
+
+    def joint_span(self, joint):
+        """
+        Distance-order row range [start, end) covering a joint's rows, or
+        None. Joints run in distance order, so this is usually exactly the
+        joint; out-of-sequence joint numbers widen it.
+        """
+        idx = int(np.searchsorted(self.joints, joint))
+        if idx == len(self.joints) or self.joints[idx] != joint:
+            return None
+        return int(self._joint_span_lo[idx]), int(self._joint_span_hi[idx])
+
+    def column(self, name):
+        """Numeric column as a float array in distance order."""
+        if name not in self.arrays:
+            raise ValueError(f"No numeric column '{name}'")
+        return self.arrays[name]
+
+    def mask(self, category):
+        """Precomputed event category mask, in distance order."""
+        if self.event_column is None:
+            raise ValueError(f"Records have none of the event type columns {EVENT_COLUMNS}")
+        if category not in self.masks:
+            raise ValueError(f"Unknown event category '{category}'. Available: {', '.join(EVENT_CATEGORIES)}")
+        return self.masks[category]
+
+    def subset(self, category=None):
+        """
+        Records of an event category (all records when None) as a new
+        DataFrame, in the input's row order and with its index, so it is
+        a drop-in replacement for filtering the source frame.
+        """
+        rows = np.arange(len(self)) if category is None else np.flatnonzero(self.mask(category))
+        rows = rows[np.argsort(self.order[rows], kind='stable')]
+        frame = self.records.iloc[rows]
+        frame.index = self.source_index[rows]
+        return frame
+
+    def _joint_rows_between(self, joint_min=None, joint_max=None):
+        """Sorted row indices with a joint number in [joint_min, joint_max]."""
+        start = 0 if joint_min is None else np.searchsorted(self._joint_sorted, joint_min, side='left')
+        end = len(self._joint_sorted) if joint_max is None \
+            else np.searchsorted(self._joint_sorted, joint_max, side='right')
+        return np.sort(self._joint_rows[start:end])
+
+    def neighborhood(self, center, radius):
+        """
+        Joint range covering `radius` joints either side of the first joint
+        at or after `center` (the viewer's neighborhood filter).
+
+        Returns:
+            Tuple of (joint_min, joint_max), or (None, None) without joints
+        """
+        if len(self.joints) == 0:
+            return None, None
+        idx = min(int(np.searchsorted(self.joints, center, side='left')), len(self.joints) - 1)
+        lo = max(0, idx - radius)
+        hi = min(len(self.joints) - 1, idx + radius)
+        return float(self.joints[lo]), float(self.joints[hi])
+
+    def select(self, dist_min=None, dist_max=None, joint_min=None, joint_max=None, **filters):
+        """
+        Rows matching a query, in distance order.
+
+        Args:
+            dist_min, dist_max: Aligned distance range (ft, inclusive)
+            joint_min, joint_max: Joint number range (inclusive)
+            **filters: status / severity / confidence (lists of allowed values),
+                min_depth / min_severity / min_confidence (numbers) and
+                review_mask (OR-ed review flag bits; review_match 'any' or 'all')
+
+        Returns:
+            Array of row indices into self.records
+        """
+        start, end = self._distance_rows(dist_min, dist_max)
+        if joint_min is None and joint_max is None:
+            rows = np.arange(start, end)
+        else:
+            rows = self._joint_rows_between(joint_min, joint_max)
+            rows = rows[(rows >= start) & (rows < end)]
+
+        match_modes = {mode for _, mode in FLAG_FILTERS.values()}
+        for name, value in filters.items():
+            if value is None:
+                continue
+            if name in match_modes:
+                if value not in FLAG_MATCH_MODES:
+                    raise ValueError(f"{name} must be one of: {', '.join(FLAG_MATCH_MODES)}")
+                continue
+            if name in CATEGORY_FILTERS:
+                if name not in self._codes:
+                    raise ValueError(f"Dataset has no '{CATEGORY_FILTERS[name]}' column to filter by {name}")
+                codes, categories = self._codes[name]
+                wanted = [categories.index(v) for v in value if v in categories]
+                rows = rows[np.isin(codes[rows], wanted)]
+            elif name in MIN_FILTERS:
+                col = MIN_FILTERS[name]
+                if col not in self.records.columns:
+                    raise ValueError(f"Dataset has no '{col}' column to filter by {name}")
+                values = self.records[col].to_numpy(dtype=float)[rows]
+                rows = rows[values >= float(value)]
+            elif name in FLAG_FILTERS:
+                col, mode = FLAG_FILTERS[name]
+                if name not in self._flags:
+                    raise ValueError(f"Dataset has no '{col}' column to filter by {name}")
+                rows = rows[flag_mask(self._flags[name][rows], int(value), filters.get(mode) == 'all')]
+            else:
+                raise ValueError(f"Unknown filter '{name}'")
+        return rows
+
+    def page(self, rows, offset=0, limit=DEFAULT_PAGE_SIZE, fields=None):
+        """
+        One page of records.
+
+        Args:
+            rows: Row indices from select()
+            offset: Rows to skip
+            limit: Page size (capped at MAX_PAGE_SIZE)
+            fields: Columns to return (all when None)
+
+        Returns:
+            dict with total, offset, limit, next_offset (None on the last page) and data
+        """
+        if fields:
+            unknown = [f for f in fields if f not in self.columns]
+            if unknown:
+                raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+        offset = max(0, int(offset))
+        limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+
+        page_rows = rows[offset:offset + limit]
+        frame = self.records.iloc[page_rows]
+        if fields:
+            frame = frame[list(fields)]
+        next_offset = offset + limit if offset + limit < len(rows) else None
+        return {
+            'total': int(len(rows)),
+            'offset': offset,
+            'limit': limit,
+            'next_offset': next_offset,
+            'data': frame.replace({np.nan: None}).to_dict(orient='records'),
+        }
+
+    def query(self, offset=0, limit=DEFAULT_PAGE_SIZE, fields=None, **criteria):
+        """select() and page() in one call."""
+        return self.page(self.select(**criteria), offset=offset, limit=limit, fields=fields)
+
+    def describe(self):
+        """Extent of the store, for sizing the viewer's first query."""
+        finite = self.distance[np.isfinite(self.distance)]
+        return {
+            'rows': len(self),
+            'distance_column': self.distance_column,
+            'distance_range': [float(finite[0]), float(finite[-1])] if len(finite) else None,
+            'joint_range': [float(self.joints[0]), float(self.joints[-1])] if len(self.joints) else None,
+            'joints': int(len(self.joints)),
+            'columns': self.columns,
+            'categories': {name: categories for name, (_, categories) in self._codes.items()},
+            'event_categories': {name: int(mask.sum()) for name, mask in self.masks.items()},
+        }
+
+
+# Loaded run files: resolved path -> (mtime_ns, store)
+_loaded = {}
+_loaded_lock = threading.Lock()
+
+
+def load_store(path, reader=pd.read_csv):
+    """
+    The AnomalyStore of a run file, loaded once per process and reloaded
+    only when the file changes.
+
+    Args:
+        path: Run CSV (or another file, with a matching reader)
+        reader: Function reading the path into a DataFrame
+
+    Returns:
+        AnomalyStore (shared; treat its records as read-only)
+    """
+    key = os.path.realpath(path)
+    mtime = os.stat(key).st_mtime_ns
+    with _loaded_lock:
+        cached = _loaded.get(key)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+    store = AnomalyStore(reader(key))
+    with _loaded_lock:
+        _loaded[key] = (mtime, store)
+    return store
@@ -0,0 +1,320 @@
+"""
+Batch Pipeline Runner
+Runs the full in-memory pipeline for many lines from a manifest, one line
+per worker process, each into its own output directory, and collects a
+summary table across lines.
+
+Manifest (CSV or JSON list of objects), one row per line:
+
+    line_id     Unique line / segment name (its output directory name)
+    run_a       Older run file (any upload format), or
+    workbook    ILI workbook with both runs (the ingestion.py vendor layout)
+    run_b       Newer run file (with run_a)
+    year_a      Optional year of the older run
+    year_b      Optional year of the newer run (year_b - year_a sets the growth interval)
+    sheet_a     Older run's sheet (with workbook; default '2015')
+    sheet_b     Newer run's sheet (with workbook; default '2022')
+
+Relative paths are resolved from the manifest's directory.
+
+Each finished line writes <output>/<line_id>/summary.json last, keyed by
+its inputs (paths, sizes, modification times, years), the geo layer files
+and parameters. A
+re-run skips lines whose summary says 'done' for the same key, so a batch
+that crashed or was interrupted resumes where it stopped; failed lines are
+retried. Each line's console output goes to <output>/<line_id>/log.txt.
+
+Usage:
+    python src/batch.py lines.csv --output-dir batch_output --workers 8
+"""
+
+import argparse
+import contextlib
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_OUTPUT_DIR = 'batch_output'
+SUMMARY_FILE = 'summary.json'
+LOG_FILE = 'log.txt'
+BATCH_SUMMARY_FILE = 'batch_summary.csv'
+
+INPUT_FIELDS = ('run_a', 'run_b', 'workbook')
+DEFAULT_SHEETS = ('2015', '2022')
+
+# Columns of the cross-line summary table. 'critical' counts matched pairs
+# with severity_level 'Critical' (the report's status rules never emit a
+# 'Critical' status, see scoring.py)
+SUMMARY_COLUMNS = ['line_id', 'status', 'matched', 'validated', 'new', 'missing', 'critical',
+                   'interacting_clusters', 'near_sensitive_locations', 'mean_growth', 'max_depth',
+                   'interval', 'seconds', 'error']
+
+
+def _clean(value):
+    """Manifest cell as a string, None when empty."""
+    if value is None or (isinstance(value, float) and np.isnan(value)):
+        return None
+    value = str(value).strip()
+    return value or None
+
+
+def _year(value):
+    value = _clean(value)
+    return int(float(value)) if value is not None else None
+
+
+def load_manifest(path):
+    """
+    Read and check a batch manifest.
+
+    Args:
+        path: Manifest CSV or JSON file
+
+    Returns:
+        List of line entries (dicts with absolute input paths)
+    """
+    if str(path).lower().endswith('.json'):
+        with open(path) as f:
+            rows = json.load(f)
+    else:
+        rows = pd.read_csv(path, dtype=str).to_dict(orient='records')
+    base = os.path.dirname(os.path.abspath(path))
+
+    entries, seen = [], set()
+    for number, row in enumerate(rows, start=1):
+        line_id = _clean(row.get('line_id'))
+        if line_id is None:
+            raise ValueError(f"Manifest row {number} has no line_id")
+        if line_id in seen:
+            raise ValueError(f"Duplicate line_id '{line_id}' in manifest")
+        if os.path.basename(line_id) != line_id or line_id in ('.', '..'):
+            raise ValueError(f"line_id '{line_id}' must be usable as a directory name")
+        seen.add(line_id)
+
+        entry = {'line_id': line_id, 'year_a': _year(row.get('year_a')), 'year_b': _year(row.get('year_b'))}
+        for field in INPUT_FIELDS:
+            value = _clean(row.get(field))
+            entry[field] = os.path.normpath(os.path.join(base, value)) if value else None
+        if entry['workbook']:
+            entry['sheet_a'] = _clean(row.get('sheet_a')) or DEFAULT_SHEETS[0]
+            entry['sheet_b'] = _clean(row.get('sheet_b')) or DEFAULT_SHEETS[1]
+        elif not (entry['run_a'] and entry['run_b']):
+            raise ValueError(f"Line '{line_id}' needs a workbook or both run_a and run_b")
+        entries.append(entry)
+    return entries
+
+
+def line_key(entry, params):
+    """
+    Resume key of a line: its manifest entry, the size and modification
+    time of each input and of the geo layer files every report reads, and
+    the pipeline parameters.
+    """
+    from pipeline import DEFAULT_PARAMS, GEO_LAYER_PARAMS
+
+    def file_state(path):
+        # A missing input fails its line in the worker, not the whole batch
+        stat = os.stat(path) if os.path.exists(path) else None
+        return [stat.st_size, stat.st_mtime_ns] if stat else None
+
+    inputs = {field: file_state(entry[field]) for field in INPUT_FIELDS if entry.get(field)}
+    layers = {}
+    for name in GEO_LAYER_PARAMS:
+        path = params.get(name, DEFAULT_PARAMS[name])
+        layers[name] = [path, file_state(path)] if path else None
+    payload = json.dumps({'entry': entry, 'inputs': inputs, 'layers': layers, 'params': params},
+                         sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def read_summary(line_dir):
+    try:
+        with open(os.path.join(line_dir, SUMMARY_FILE)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_summary(line_dir, summary):
+    """Write a line's summary atomically (it is the line's completion marker)."""
+    path = os.path.join(line_dir, SUMMARY_FILE)
+    with open(f'{path}.tmp', 'w') as f:
+        json.dump(summary, f, indent=2, default=str)
+    os.replace(f'{path}.tmp', path)
+
+
+def load_runs(entry):
+    """
+    Standardized (older, newer) runs of a line, references kept for
+    alignment.
+    """
+    if entry['workbook']:
+        from ingestion import load_ili_data
+        return load_ili_data(entry['workbook'], sheet_15=entry['sheet_a'], sheet_22=entry['sheet_b'])
+
+    from universal_parser import UniversalParser
+    runs = []
+    for field, year in (('run_a', entry['year_a']), ('run_b', entry['year_b'])):
+        runs.append(UniversalParser().parse_file(entry[field], year=year, filter_references=False))
+    return tuple(runs)
+
+
+def process_line(entry, output_dir, params, key, intermediates=False, run_files=False):
+    """
+    Run one line's pipeline into output_dir/<line_id> (worker process body).
+
+    Returns:
+        The line's summary dict (also written to its summary.json)
+    """
+    from pipeline import Pipeline
+
+    line_dir = os.path.join(output_dir, entry['line_id'])
+    os.makedirs(line_dir, exist_ok=True)
+    start = time.perf_counter()
+    summary = {'line_id': entry['line_id'], 'key': key, 'entry': entry}
+
+    with open(os.path.join(line_dir, LOG_FILE), 'w') as log, \
+            contextlib.redirect_stdout(log), contextlib.redirect_stderr(log):
+        try:
+            line_params = dict(params)
+            if entry['year_a'] and entry['year_b'] and 'interval' not in line_params:
+                if entry['year_b'] <= entry['year_a']:
+                    raise ValueError("year_b must be later than year_a")
+                line_params['interval'] = float(entry['year_b'] - entry['year_a'])
+
+            pipe = Pipeline(source=load_runs(entry), **line_params)
+            pipe.run()
+            pipe.print_log()
+            pipe.export(line_dir, intermediates=intermediates, run_files=run_files)
+
+            report = pipe.outputs['report']
+            matched = report['report']
+            summary.update({
+                'status': 'done',
+                'matched': len(matched),
+                'validated': int(pipe.outputs['validation']['is_valid'].sum()),
+                'new': len(report['new_anomalies']),
+                'missing': len(report['missing_anomalies']),
+                'critical': int((matched['severity_level'] == 'Critical').sum()),
+                'interacting_clusters': int((pipe.outputs['clustering']['clusters']['size'] > 1).sum()),
+                'near_sensitive_locations': int((matched['nearby_locations'] > 0).sum()),
+                'mean_growth': float(matched['growth'].mean()) if len(matched) else None,
+                'max_depth': float(matched['depth_22'].max()) if len(matched) else None,
+                'interval': pipe.params['interval'],
+                'stages': pipe.run_log,
+            })
+        except Exception as e:
+            import traceback
+            traceback.print_exc()
+            summary.update({'status': 'failed', 'error': f'{type(e).__name__}: {e}'})
+
+    summary['seconds'] = round(time.perf_counter() - start, 3)
+    write_summary(line_dir, summary)
+    return summary
+
+
+def collect_summaries(entries, output_dir):
+    """Cross-line summary table from the lines' summary.json files."""
+    rows = []
+    for entry in entries:
+        summary = read_summary(os.path.join(output_dir, entry['line_id'])) or {'line_id': entry['line_id'],
+                                                                              'status': 'pending'}
+        rows.append({col: summary.get(col) for col in SUMMARY_COLUMNS})
+    table = pd.DataFrame(rows, columns=SUMMARY_COLUMNS)
+    counts = ['matched', 'validated', 'new', 'missing', 'critical', 'interacting_clusters',
+              'near_sensitive_locations']
+    table[counts] = table[counts].astype('Int64')
+    return table
+
+
+def run_batch(manifest, output_dir=DEFAULT_OUTPUT_DIR, workers=None, params=None,
+              force=False, intermediates=False, run_files=False):
+    """
+    Process every line of a manifest that isn't already done.
+
+    Args:
+        manifest: Manifest path
+        output_dir: Root of the per-line output directories
+        workers: Worker processes (default: CPU count)
+        params: Pipeline parameter overrides for every line
+        force: Re-run lines that are already done
+        intermediates, run_files: Passed to Pipeline.export()
+
+    Returns:
+        Summary DataFrame across lines (also written to batch_summary.csv)
+    """
+    params = params or {}
+    entries = load_manifest(manifest)
+    os.makedirs(output_dir, exist_ok=True)
+
+    pending = []
+    for entry in entries:
+        key = line_key(entry, params)
+        done = read_summary(os.path.join(output_dir, entry['line_id']))
+        if not force and done and done.get('status') == 'done' and done.get('key') == key:
+            continue
+        pending.append((entry, key))
+    print(f"{len(entries)} lines in manifest, {len(entries) - len(pending)} already done, {len(pending)} to run")
+
+    workers = max(1, min(workers or os.cpu_count() or 1, len(pending) or 1))
+    start = time.perf_counter()
+    if pending:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {pool.submit(process_line, entry, output_dir, params, key, intermediates, run_files):
+                       entry['line_id'] for entry, key in pending}
+            for done_count, future in enumerate(as_completed(futures), start=1):
+                line_id = futures[future]
+                try:
+                    summary = future.result()
+                except Exception as e:
+                    # The worker died (e.g. out of memory); the line stays pending
+                    print(f"[{done_count}/{len(pending)}] {line_id}: worker failed ({e})")
+                    continue
+                if summary['status'] == 'done':
+                    detail = f"matched {summary['matched']}, new {summary['new']}, missing {summary['missing']}"
+                else:
+                    detail = summary['error']
+                print(f"[{done_count}/{len(pending)}] {line_id}: {summary['status']} in {summary['seconds']:.1f}s ({detail})")
+
+    table = collect_summaries(entries, output_dir)
+    table.to_csv(os.path.join(output_dir, BATCH_SUMMARY_FILE), index=False)
+    print(f"Batch finished in {time.perf_counter() - start:.1f}s with {workers} workers: "
+          + ', '.join(f'{n} {status}' for status, n in table['status'].value_counts().items()))
+    return table
+
+
+if __name__ == "__main__":
+    from pipeline import DEFAULT_PARAMS
+
+    parser = argparse.ArgumentParser(description='Run the ILI pipeline for every line in a manifest')
+    parser.add_argument('manifest', help='Manifest CSV / JSON (line_id, run_a, run_b or workbook, year_a, year_b)')
+    parser.add_argument('--output-dir', default=DEFAULT_OUTPUT_DIR)
+    parser.add_argument('--workers', type=int, default=None, help='Worker processes (default: CPU count)')
+    parser.add_argument('--force', action='store_true', help='Re-run lines that are already done')
+    parser.add_argument('--intermediates', action='store_true', help='Also write each line\'s stage CSVs')
+    parser.add_argument('--run-files', action='store_true', help='Also write each line\'s memory-mapped run files')
+    parser.add_argument('--match-tolerance', type=float, default=DEFAULT_PARAMS['match_tolerance'])
+    parser.add_argument('--dist-tolerance', type=float, default=DEFAULT_PARAMS['dist_tolerance'])
+    parser.add_argument('--orient-tolerance', type=float, default=DEFAULT_PARAMS['orient_tolerance'])
+    args = parser.parse_args()
+
+    table = run_batch(
+        args.manifest,
+        output_dir=args.output_dir,
+        workers=args.workers,
+        params={
+            'match_tolerance': args.match_tolerance,
+            'dist_tolerance': args.dist_tolerance,
+            'orient_tolerance': args.orient_tolerance,
+        },
+        force=args.force,
+        intermediates=args.intermediates,
+        run_files=args.run_files,
+    )
+    print()
+    print(table.to_string(index=False))
@@ -0,0 +1,385 @@
+"""
+Pipeline Scaling Benchmark
+Times (and memory-profiles) every pipeline stage on synthetic run pairs of
+increasing size, measures match precision / recall against the generator's
+ground truth, and fails when a stage regresses past the stored baseline.
+Also audits cold start: the import time of the entry-point modules (and
+which heavy packages each one pulls in) and how long the API takes to
+answer /api/health after launch.
+
+Usage:
+    python src/benchmark.py                         # 1k, 10k, 100k, 1M anomalies
+    python src/benchmark.py --sizes 1000 10000      # quick check
+    python src/benchmark.py --update-baseline       # store the current numbers
+    python src/benchmark.py --sizes                 # cold start audit only
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+
+import profiling
+from pipeline import Pipeline, STAGE_ORDER
+from loadtest import SERVER_MODES
+from synthetic import generate_run_pair, ground_truth, match_quality
+from universal_parser import UniversalParser
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SRC_DIR = os.path.join(ROOT_DIR, 'src')
+BASELINE_PATH = os.path.join(ROOT_DIR, 'benchmarks', 'baseline.json')
+
+DEFAULT_SIZES = (1_000, 10_000, 100_000, 1_000_000)
+DEFAULT_SEED = 42
+
+# tracemalloc slows allocation-heavy stages several times over, so the
+# memory pass is a separate run, skipped above this size unless asked for
+MEMORY_MAX_SIZE = 100_000
+
+# A stage regresses when it is this much slower than the baseline and the
+# difference is above the noise floor
+REGRESSION_TOLERANCE = 0.5
+MIN_REGRESSION_MS = 25.0
+MAX_QUALITY_DROP = 0.01
+
+# Cold start audit: entry points timed in a fresh interpreter (median of
+# STARTUP_REPEATS runs) and the heavy packages reported when they load
+STARTUP_MODULES = ('upload_api', 'pipeline', 'universal_parser', 'prediction', 'matching', 'alignment')
+HEAVY_PACKAGES = ('flask', 'numpy', 'pandas', 'scipy', 'sklearn', 'joblib', 'openpyxl')
+STARTUP_REPEATS = 3
+STARTUP_PORT = 5058
+
+# The API must start without these (they load on first use of an endpoint)
+API_LAZY_PACKAGES = ('numpy', 'pandas', 'scipy', 'sklearn', 'joblib')
+API_HEALTH_BUDGET_MS = 500.0
+
+
+def _parse_stage(run22, trace_memory=False):
+    """Profile UniversalParser.parse_file on the 2022 run written as CSV."""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'run_2022.csv')
+        run22.drop(columns=['anomaly_id']).to_csv(path, index=False)
+        profiling.enable_memory_tracing(trace_memory)
+        try:
+            with profiling.stage('benchmark.parse') as timer:
+                timer.rows = len(UniversalParser().parse_file(path, year=2022))
+        finally:
+            profiling.enable_memory_tracing(False)
+    return timer.record
+
+
+def _run_pipeline(run15, run22, trace_memory):
+    """Run every pipeline stage once (no cache) and return the pipeline."""
+    profiling.enable_memory_tracing(trace_memory)
+    try:
+        pipe = Pipeline(source=(run15, run22))
+        with contextlib.redirect_stdout(io.StringIO()):
+            pipe.run()
+    finally:
+        profiling.enable_memory_tracing(False)
+    return pipe
+
+
+def warm_up(seed=DEFAULT_SEED):
+    """
+    Run the pipeline once on a tiny pair, so the lazily imported modules
+    (scipy) are loaded before any stage is timed. Their cost shows up in the
+    cold start audit instead.
+    """
+    _run_pipeline(*generate_run_pair(100, seed=seed), trace_memory=False)
+
+
+def run_benchmark(n_anomalies, seed=DEFAULT_SEED, memory=True, parse=True):
+    """
+    Benchmark one size.
+
+    Args:
+        n_anomalies: Metal loss anomalies in the synthetic 2015 run
+        seed: Generator seed
+        memory: Also run a tracemalloc pass for per-stage peak memory
+        parse: Also time the upload parser on the 2022 run
+
+    Returns:
+        dict with size, per-stage metrics, match quality and ground truth
+    """
+    start = time.perf_counter()
+    run15, run22 = generate_run_pair(n_anomalies, seed=seed)
+    generate_ms = 1000 * (time.perf_counter() - start)
+
+    pipe = _run_pipeline(run15, run22, trace_memory=False)
+    stages = {
+        entry['stage']: {
+            'wall_ms': round(1000 * entry['seconds'], 3),
+            'cpu_ms': entry.get('cpu_ms'),
+            'rows': entry['rows'],
+        }
+        for entry in pipe.run_log
+    }
+    matching = pipe.outputs['matching']
+    quality = match_quality(matching['matched'], matching['anoms15'], matching['anoms22'])
+    del pipe
+
+    if memory:
+        mem_pipe = _run_pipeline(run15, run22, trace_memory=True)
+        for entry in mem_pipe.run_log:
+            stages[entry['stage']]['peak_kb'] = entry.get('peak_kb')
+        del mem_pipe
+
+    if parse:
+        record = _parse_stage(run22)
+        stages['parse'] = {field: record[field] for field in ('wall_ms', 'cpu_ms', 'rows')}
+        if memory:
+            stages['parse']['peak_kb'] = _parse_stage(run22, trace_memory=True)['peak_kb']
+
+    return {
+        'size': n_anomalies,
+        'seed': seed,
+        'events': [len(run15), len(run22)],
+        'generate_ms': round(generate_ms, 3),
+        'total_ms': round(sum(s['wall_ms'] for name, s in stages.items() if name in STAGE_ORDER), 3),
+        'stages': stages,
+        'quality': {k: round(v, 6) if isinstance(v, float) else v for k, v in quality.items()},
+        'truth': ground_truth(run15, run22),
+    }
+
+
+def import_profile(module):
+    """
+    Import a module in a fresh interpreter with -X importtime.
+
+    Returns:
+        dict with import_ms (cumulative) and heavy (package -> cumulative ms)
+    """
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                          cwd=SRC_DIR, capture_output=True, text=True, check=True)
+    import_ms, heavy = None, {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:') or '|' not in line:
+            continue
+        _, cumulative, name = line.split('|')
+        if not cumulative.strip().isdigit():
+            continue    # Header line
+        ms = int(cumulative) / 1000
+        name = name.strip()
+        if name in HEAVY_PACKAGES:
+            heavy[name] = round(ms, 1)
+        elif name == module:
+            import_ms = round(ms, 1)
+    return {'import_ms': import_ms, 'heavy': heavy}
+
+
+def api_startup_ms(port=STARTUP_PORT, timeout=60):
+    """Milliseconds from launching the development server to its first /api/health answer."""
+    cmd = [part.format(port=port, workers=1) for part in SERVER_MODES['dev']]
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ, ILI_DATA_DIR=tmp, ILI_UPLOAD_DIR=tmp)
+        start = time.perf_counter()
+        proc = subprocess.Popen(cmd, cwd=SRC_DIR, env=env,
+                                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            while time.perf_counter() - start < timeout:
+                if proc.poll() is not None:
+                    raise RuntimeError(f"API exited with code {proc.returncode}")
+                try:
+                    with urllib.request.urlopen(f'http://127.0.0.1:{port}/api/health', timeout=1) as resp:
+                        if resp.status == 200:
+                            return round(1000 * (time.perf_counter() - start), 1)
+                except (urllib.error.URLError, ConnectionError, OSError):
+                    time.sleep(0.01)
+            raise RuntimeError(f"API did not answer /api/health within {timeout} s")
+        finally:
+            proc.terminate()
+            proc.wait()
+
+
+def run_startup(modules=STARTUP_MODULES, repeats=STARTUP_REPEATS):
+    """
+    Cold start audit.
+
+    Returns:
+        dict with imports (module -> import_ms, heavy packages) and api_health_ms
+    """
+    imports = {}
+    for module in modules:
+        runs = sorted((import_profile(module) for _ in range(repeats)), key=lambda r: r['import_ms'])
+        imports[module] = runs[len(runs) // 2]
+    health = sorted(api_startup_ms() for _ in range(repeats))
+    return {'imports': imports, 'api_health_ms': health[len(health) // 2]}
+
+
+def compare_startup(startup, baseline, tolerance=REGRESSION_TOLERANCE):
+    """
+    Check the cold start audit against the API budget and the baseline.
+
+    Returns:
+        List of regression messages (empty when nothing regressed)
+    """
+    regressions = []
+    eager = sorted(set(startup['imports'].get('upload_api', {}).get('heavy', {})) & set(API_LAZY_PACKAGES))
+    if eager:
+        regressions.append(f"upload_api imports {', '.join(eager)} at startup")
+    if startup['api_health_ms'] > API_HEALTH_BUDGET_MS:
+        regressions.append(f"/api/health answered {startup['api_health_ms']:.0f} ms after launch "
+                           f"(budget {API_HEALTH_BUDGET_MS:.0f} ms)")
+
+    base_imports = (baseline or {}).get('startup', {}).get('imports', {})
+    for module, profile in startup['imports'].items():
+        base_ms = base_imports.get(module, {}).get('import_ms')
+        ms = profile['import_ms']
+        if base_ms and ms > base_ms * (1 + tolerance) and ms - base_ms > MIN_REGRESSION_MS:
+            regressions.append(f"import {module}: {ms:.0f} ms vs baseline {base_ms:.0f} ms "
+                               f"(+{100 * (ms / base_ms - 1):.0f}%)")
+    return regressions
+
+
+def compare(results, baseline, tolerance=REGRESSION_TOLERANCE):
+    """
+    Compare results against a baseline.
+
+    Returns:
+        List of regression messages (empty when nothing regressed)
+    """
+    regressions = []
+    by_size = {str(r['size']): r for r in baseline.get('results', [])}
+    for result in results:
+        base = by_size.get(str(result['size']))
+        if base is None:
+            continue
+        for name, metrics in result['stages'].items():
+            base_ms = base['stages'].get(name, {}).get('wall_ms')
+            if base_ms is None:
+                continue
+            ms = metrics['wall_ms']
+            if ms > base_ms * (1 + tolerance) and ms - base_ms > MIN_REGRESSION_MS:
+                regressions.append(
+                    f"{result['size']:>9} {name}: {ms:.1f} ms vs baseline {base_ms:.1f} ms "
+                    f"(+{100 * (ms / base_ms - 1):.0f}%)"
+                )
+        for metric in ('precision', 'recall'):
+            value, base_value = result['quality'][metric], base['quality'][metric]
+            if value < base_value - MAX_QUALITY_DROP:
+                regressions.append(
+                    f"{result['size']:>9} {metric}: {value:.4f} vs baseline {base_value:.4f}"
+                )
+    return regressions
+
+
+def print_startup(startup):
+    print("Cold start (ms, fresh interpreter):")
+    for module, profile in startup['imports'].items():
+        heavy = ', '.join(f"{name} {ms:.0f}" for name, ms in profile['heavy'].items()) or '-'
+        print(f"  import {module:<17}{profile['import_ms']:>8.0f}   heavy: {heavy}")
+    print(f"  /api/health after launch {startup['api_health_ms']:>8.0f}")
+
+
+def print_results(results):
+    names = [name for name in ('parse',) + STAGE_ORDER if any(name in r['stages'] for r in results)]
+    header = f"{'stage':<12}" + ''.join(f"{r['size']:>14,}" for r in results)
+    print(header)
+    print("-" * len(header))
+    for name in names:
+        cells = []
+        for r in results:
+            m = r['stages'].get(name)
+            cells.append(f"{m['wall_ms']:>11.1f} ms" if m else f"{'-':>14}")
+        print(f"{name:<12}" + ''.join(cells))
+    print(f"{'total':<12}" + ''.join(f"{r['total_ms']:>11.1f} ms" for r in results))
+    if any('peak_kb' in m for r in results for m in r['stages'].values()):
+        print("\nPeak memory (MB, tracemalloc):")
+        for name in names:
+            cells = []
+            for r in results:
+                kb = r['stages'].get(name, {}).get('peak_kb')
+                cells.append(f"{kb / 1024:>14.1f}" if kb is not None else f"{'-':>14}")
+            print(f"{name:<12}" + ''.join(cells))
+    print("\nMatch quality:")
+    for r in results:
+        q = r['quality']
+        print(f"  {r['size']:>9,}: precision {q['precision']:.4f}, recall {q['recall']:.4f} "
+              f"({q['correct']}/{q['truth_pairs']} true pairs, {q['matched']} matched)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Pipeline scaling benchmark on synthetic runs')
+    parser.add_argument('--sizes', type=int, nargs='*', default=list(DEFAULT_SIZES),
+                        help='Anomaly counts to benchmark (none for the cold start audit only)')
+    parser.add_argument('--seed', type=int, default=DEFAULT_SEED)
+    parser.add_argument('--no-memory', action='store_true', help='Skip the tracemalloc pass')
+    parser.add_argument('--memory-max-size', type=int, default=MEMORY_MAX_SIZE,
+                        help='Largest size that gets a tracemalloc pass')
+    parser.add_argument('--no-parse', action='store_true', help='Skip the upload parser stage')
+    parser.add_argument('--no-startup', action='store_true', help='Skip the cold start audit')
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--update-baseline', action='store_true', help='Store these results as the baseline')
+    parser.add_argument('--tolerance', type=float, default=REGRESSION_TOLERANCE,
+                        help='Allowed slowdown vs the baseline (0.5 = 50%%)')
+    parser.add_argument('--output', default=None, help='Also write the results as JSON')
+    args = parser.parse_args()
+
+    startup = None
+    if not args.no_startup:
+        print("Measuring cold start...")
+        startup = run_startup()
+
+    results = []
+    if args.sizes:
+        warm_up(args.seed)
+    for size in args.sizes:
+        print(f"Benchmarking {size:,} anomalies...")
+        results.append(run_benchmark(
+            size, seed=args.seed,
+            memory=not args.no_memory and size <= args.memory_max_size,
+            parse=not args.no_parse
+        ))
+    peak_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print()
+    if startup:
+        print_startup(startup)
+        print()
+    if results:
+        print_results(results)
+        print(f"\nProcess peak RSS: {peak_rss_mb:.0f} MB")
+
+    report = {
+        'created': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'machine': {'python': platform.python_version(), 'platform': platform.platform(),
+                    'cpus': os.cpu_count()},
+        'peak_rss_mb': round(peak_rss_mb, 1),
+        'startup': startup,
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    baseline = None
+    if args.update_baseline:
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Saved baseline to {args.baseline}")
+    elif os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    else:
+        print(f"\nNo baseline at {args.baseline}; run with --update-baseline to store one")
+
+    regressions = compare(results, baseline, args.tolerance) if baseline else []
+    if startup:
+        regressions = compare_startup(startup, baseline, args.tolerance) + regressions
+    if regressions:
+        print(f"\nREGRESSIONS vs {args.baseline}:")
+        for line in regressions:
+            print(f"  {line}")
+        sys.exit(1)
+    if baseline:
+        print(f"\nNo regressions vs baseline ({baseline.get('created', 'unknown date')})")
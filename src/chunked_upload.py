@@ -0,0 +1,235 @@
+"""
+Chunked Uploads
+Resumable upload sessions for vendor files too large (or connections too
+flaky) for a single multipart POST. The client creates a session, PUTs
+fixed-size chunks in any order with a SHA-256 per chunk, can ask which
+chunks the server has after a dropped connection, and completes the
+session once every chunk is in.
+
+Session state lives on disk, so a session survives a restart and any
+worker can take any chunk:
+
+    <root>/<upload_id>/manifest.json    filename, size, chunk size, options
+    <root>/<upload_id>/upload<ext>      the file, chunks written at their offsets
+    <root>/<upload_id>/<index>.ok       marker per verified chunk (its SHA-256)
+
+As the contiguous prefix of chunks grows, a background thread hashes it
+and, for CSV / TSV / NDJSON, feeds it to an IncrementalParser, so parsing
+overlaps the transfer and completion only parses the tail. A worker that
+completes a session it hasn't been following catches up from disk.
+"""
+
+import hashlib
+import json
+import math
+import os
+import shutil
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from universal_parser import UniversalParser, IncrementalParser
+
+DEFAULT_CHUNK_SIZE = 8 * 1024 * 1024
+MAX_CHUNK_SIZE = 32 * 1024 * 1024       # Stays under the API's MAX_CONTENT_LENGTH
+MAX_UPLOAD_SIZE = 2 * 1024 * 1024 * 1024
+SESSION_TTL_S = 24 * 3600               # Idle sessions older than this are purged
+PARSE_WORKERS = 2
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _background(fn, *args):
+    """Run fn on the shared parse threads (created on first use, i.e. after any fork)."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=PARSE_WORKERS, thread_name_prefix='chunk-parse')
+    return _executor.submit(fn, *args)
+
+
+class UploadSession:
+    """
+    One resumable upload.
+
+    Usage:
+        session = UploadSession.create(root, 'run.csv', size, year=2022)
+        session.write_chunk(0, data, sha256_hex)
+        ...
+        digest = session.complete()
+        df = session.parsed()    # None for formats parsed after completion
+    """
+
+    def __init__(self, directory):
+        self.directory = Path(directory)
+        with open(self.directory / 'manifest.json') as f:
+            self.manifest = json.load(f)
+        self.upload_id = self.manifest['upload_id']
+        self.path = self.directory / f"upload{self.manifest['ext']}"
+        self.chunk_size = self.manifest['chunk_size']
+        self.size = self.manifest['size']
+        self.total_chunks = self.manifest['total_chunks']
+
+        fmt = UniversalParser().detect_format(str(self.path))
+        self.parser = IncrementalParser(fmt, year=self.manifest['year'],
+                                        filter_references=self.manifest['filter_references']) \
+            if fmt in IncrementalParser.FORMATS else None
+        self.error = None
+        self._hash = hashlib.sha256()
+        self._next_chunk = 0        # Chunks before this are hashed / parsed
+        self._lock = threading.Lock()
+
+    @classmethod
+    def create(cls, root, filename, size, chunk_size=DEFAULT_CHUNK_SIZE, sha256=None,
+               year=None, filter_references=True):
+        """
+        Start a session.
+
+        Args:
+            root: Directory holding the sessions
+            filename: Original file name (its extension selects the parser)
+            size: File size in bytes
+            chunk_size: Bytes per chunk (the last chunk may be shorter)
+            sha256: Optional whole-file SHA-256, checked on completion
+            year, filter_references: Parser options
+
+        Returns:
+            UploadSession
+        """
+        size, chunk_size = int(size), int(chunk_size)
+        if size <= 0 or size > MAX_UPLOAD_SIZE:
+            raise ValueError(f"File size must be between 1 byte and {MAX_UPLOAD_SIZE // (1024 * 1024)}MB")
+        if not 0 < chunk_size <= MAX_CHUNK_SIZE:
+            raise ValueError(f"Chunk size must be between 1 byte and {MAX_CHUNK_SIZE // (1024 * 1024)}MB")
+
+        upload_id = uuid.uuid4().hex
+        directory = Path(root) / upload_id
+        directory.mkdir(parents=True)
+        manifest = {
+            'upload_id': upload_id,
+            'filename': filename,
+            'ext': Path(filename).suffix.lower(),
+            'size': size,
+            'chunk_size': chunk_size,
+            'total_chunks': math.ceil(size / chunk_size),
+            'sha256': sha256.lower() if sha256 else None,
+            'year': year,
+            'filter_references': filter_references,
+            'created': time.time(),
+        }
+        with open(directory / f"upload{manifest['ext']}", 'wb') as f:
+            f.truncate(size)
+        with open(directory / 'manifest.json', 'w') as f:
+            json.dump(manifest, f)
+        return cls(directory)
+
+    def chunk_length(self, index):
+        return min(self.chunk_size, self.size - index * self.chunk_size)
+
+    def received(self):
+        """Sorted indices of the verified chunks on disk."""
+        return sorted(int(p.stem) for p in self.directory.glob('*.ok'))
+
+    def missing(self):
+        have = set(self.received())
+        return [i for i in range(self.total_chunks) if i not in have]
+
+    def write_chunk(self, index, data, sha256):
+        """
+        Verify and store one chunk, then advance the background parse.
+
+        Args:
+            index: Chunk number (0-based)
+            data: Chunk bytes
+            sha256: Hex SHA-256 of data, as computed by the client
+        """
+        if not 0 <= index < self.total_chunks:
+            raise ValueError(f"Chunk index {index} out of range (0-{self.total_chunks - 1})")
+        expected = self.chunk_length(index)
+        if len(data) != expected:
+            raise ValueError(f"Chunk {index} has {len(data)} bytes, expected {expected}")
+        digest = hashlib.sha256(data).hexdigest()
+        if not sha256 or digest != sha256.lower():
+            raise ValueError(f"Checksum mismatch for chunk {index}")
+
+        with open(self.path, 'r+b') as f:
+            f.seek(index * self.chunk_size)
+            f.write(data)
+        # The marker goes last: a chunk only counts once its bytes are down
+        (self.directory / f'{index}.ok').write_text(digest)
+        os.utime(self.directory / 'manifest.json')
+        _background(self.advance)
+
+    def advance(self):
+        """Hash (and parse) chunks in order for as long as they are on disk."""
+        with self._lock:
+            if self.error is not None:
+                return
+            have = set(self.received())
+            try:
+                with open(self.path, 'rb') as f:
+                    while self._next_chunk in have:
+                        f.seek(self._next_chunk * self.chunk_size)
+                        data = f.read(self.chunk_length(self._next_chunk))
+                        self._hash.update(data)
+                        if self.parser is not None:
+                            self.parser.feed(data)
+                        self._next_chunk += 1
+            except Exception as e:
+                self.error = e
+
+    def complete(self):
+        """
+        Check that every chunk is in and catch the hash / parse up.
+
+        Returns:
+            SHA-256 hex digest of the whole file
+        """
+        missing = self.missing()
+        if missing:
+            raise ValueError(f"{len(missing)} chunks missing (first: {missing[0]})")
+        self.advance()
+        if self.error is not None:
+            raise ValueError(f"Failed to parse upload: {self.error}")
+        digest = self._hash.hexdigest()
+        if self.manifest['sha256'] and digest != self.manifest['sha256']:
+            raise ValueError("File checksum mismatch")
+        return digest
+
+    def parsed(self):
+        """Standardized DataFrame from the incremental parse (after complete()), None if not streamable."""
+        return self.parser.finish() if self.parser is not None else None
+
+    def status(self):
+        received = self.received()
+        return {
+            'upload_id': self.upload_id,
+            'filename': self.manifest['filename'],
+            'size': self.size,
+            'chunk_size': self.chunk_size,
+            'total_chunks': self.total_chunks,
+            'received': received,
+            'received_bytes': sum(self.chunk_length(i) for i in received),
+            'rows_parsed': self.parser.rows if self.parser is not None else None,
+        }
+
+    def delete(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+def purge_stale_sessions(root, ttl=SESSION_TTL_S):
+    """Delete sessions with no chunk activity for ttl seconds."""
+    root = Path(root)
+    if not root.exists():
+        return 0
+    cutoff = time.time() - ttl
+    purged = 0
+    for directory in root.iterdir():
+        manifest = directory / 'manifest.json'
+        if directory.is_dir() and (not manifest.exists() or manifest.stat().st_mtime < cutoff):
+            shutil.rmtree(directory, ignore_errors=True)
+            purged += 1
+    return purged
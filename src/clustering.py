@@ -0,0 +1,298 @@
+"""
+Interacting Anomaly Clusters
+Groups metal-loss features that are close enough to interact (within a few
+wall thicknesses axially and circumferentially) so they are assessed as one
+combined feature.
+
+Candidate pairs come from a sort-and-search sweep over aligned distance:
+after sorting by axial start, the features a given one can reach axially
+form a contiguous window, so only those pairs are checked (circumferential
+gap on the circular pipe surface), never all pairs. Clusters are the
+connected components of the interacting pairs.
+
+Cluster columns added to each feature:
+    cluster_id          Cluster number, in distance order (singletons included)
+    cluster_size        Features in the cluster
+    cluster_length_in   Combined axial length (in)
+    cluster_width_in    Combined circumferential width (in)
+    cluster_max_depth   Deepest feature in the cluster (% wall)
+"""
+
+import numpy as np
+import pandas as pd
+
+from profiling import profiled
+from anomaly_store import load_store
+from remaining_strength import PIPE_PARAMS
+
+# Interaction rules: features interact when both gaps are within the limits
+INTERACTION_RULES = {
+    'axial_spacing_wt': 6.0,                        # Axial gap limit, in wall thicknesses
+    'circ_spacing_wt': 6.0,                         # Circumferential gap limit, in wall thicknesses
+    'wall_thickness_in': PIPE_PARAMS['wall_in'],    # Nominal wall thickness (in)
+    'pipe_od_in': PIPE_PARAMS['od_in'],             # Pipe outside diameter (in)
+    'min_depth': 0.0,                               # Shallower features (% wall) are not clustered
+}
+
+CLUSTER_COLUMNS = ['cluster_id', 'cluster_size', 'cluster_length_in', 'cluster_width_in', 'cluster_max_depth']
+
+# Candidate pairs checked per block (bounds memory in dense stretches)
+PAIR_BLOCK = 2_000_000
+
+
+def make_interaction_rules(overrides=None):
+    """INTERACTION_RULES with optional overrides, checked."""
+    rules = {**INTERACTION_RULES, **(overrides or {})}
+    unknown = set(rules) - set(INTERACTION_RULES)
+    if unknown:
+        raise ValueError(f"Unknown interaction rules: {', '.join(sorted(unknown))}")
+    if rules['wall_thickness_in'] <= 0 or rules['pipe_od_in'] <= 0:
+        raise ValueError("wall_thickness_in and pipe_od_in must be positive")
+    return rules
+
+
+def feature_extents(distance, orientation, length, width, pipe_od_in):
+    """
+    Axial and circumferential extents of each feature, in inches.
+
+    Missing lengths / widths count as point features.
+
+    Returns:
+        dict of 'start', 'end' (axial, from the distance origin), 'center'
+        (circumferential, NaN when the orientation is unknown) and
+        'half_width' arrays
+    """
+    distance = np.asarray(distance, dtype=float) * 12.0
+    half_length = np.nan_to_num(np.asarray(length, dtype=float)) / 2.0
+    circumference = np.pi * pipe_od_in
+    return {
+        'start': distance - half_length,
+        'end': distance + half_length,
+        'center': np.mod(np.asarray(orientation, dtype=float), 360.0) / 360.0 * circumference,
+        'half_width': np.nan_to_num(np.asarray(width, dtype=float)) / 2.0,
+    }
+
+
+def interacting_pairs(extents, axial_limit, circ_limit, circumference, block=PAIR_BLOCK):
+    """
+    Interacting (i, j) feature pairs from a sort-and-search sweep.
+
+    With features sorted by axial start, feature i reaches every later
+    feature whose start is within end_i + axial_limit: a contiguous window
+    found with searchsorted. The windows are expanded into candidate pairs
+    block by block and filtered on the circumferential gap (shortest way
+    around the pipe). Features with an unknown orientation pass the
+    circumferential check (the conservative choice).
+
+    Args:
+        extents: feature_extents() output
+        axial_limit, circ_limit: Gap limits (in)
+        circumference: Pipe circumference (in)
+        block: Candidate pairs expanded at a time
+
+    Returns:
+        Tuple of (i, j) index arrays into the extents
+    """
+    order = np.argsort(extents['start'], kind='stable')
+    start = extents['start'][order]
+    end = extents['end'][order]
+    center = extents['center'][order]
+    half_width = extents['half_width'][order]
+
+    n = len(start)
+    hi = np.searchsorted(start, end + axial_limit, side='right')
+    counts = np.maximum(hi - np.arange(1, n + 1), 0)
+    cum = np.cumsum(counts)
+
+    out_i, out_j = [], []
+    first = 0
+    while first < n:
+        # Rows whose windows fit in this block (at least one row per block)
+        done = cum[first - 1] if first else 0
+        last = max(int(np.searchsorted(cum, done + block, side='right')), first + 1)
+        block_counts = counts[first:last]
+        total = int(block_counts.sum())
+        if total:
+            rows = np.repeat(np.arange(first, last), block_counts)
+            offsets = np.arange(total) - np.repeat(np.cumsum(block_counts) - block_counts, block_counts)
+            cols = rows + 1 + offsets
+
+            delta = np.abs(center[rows] - center[cols]) % circumference
+            gap = np.minimum(delta, circumference - delta) - half_width[rows] - half_width[cols]
+            keep = (gap <= circ_limit) | np.isnan(gap)
+            out_i.append(order[rows[keep]])
+            out_j.append(order[cols[keep]])
+        first = last
+
+    if not out_i:
+        empty = np.array([], dtype=np.int64)
+        return empty, empty
+    return np.concatenate(out_i), np.concatenate(out_j)
+
+
+def label_clusters(n, pairs, start):
+    """
+    Cluster number of each feature: connected components of the pairs,
+    numbered in order of their first feature along the pipe.
+    """
+    from scipy.sparse import coo_matrix
+    from scipy.sparse.csgraph import connected_components
+
+    i, j = pairs
+    adjacency = coo_matrix((np.ones(len(i), dtype=np.int8), (i, j)), shape=(n, n))
+    _, labels = connected_components(adjacency, directed=False)
+
+    order = np.argsort(start, kind='stable')
+    _, first = np.unique(labels[order], return_index=True)
+    rank = np.empty(len(first), dtype=np.int64)
+    rank[np.argsort(first)] = np.arange(len(first))
+    return rank[labels]
+
+
+def cluster_geometry(cluster_id, extents, depth, circumference):
+    """
+    Combined size of every cluster in one grouped pass.
+
+    The circumferential span is measured around the cluster's first member
+    with a known orientation (unwrapped to +/- half the circumference) and
+    capped at the full circumference.
+
+    Returns:
+        dict of per-cluster arrays: size, start, end, length, width,
+        orientation (deg, centre of the span) and max_depth
+    """
+    center = extents['center']
+    unknown = np.isnan(center)
+    # Group by cluster, members with a known orientation first
+    order = np.lexsort((unknown, cluster_id))
+    ids = cluster_id[order]
+    bounds = np.concatenate(([0], np.flatnonzero(np.diff(ids)) + 1))
+    size = np.diff(np.append(bounds, len(ids)))
+
+    start = np.minimum.reduceat(extents['start'][order], bounds)
+    end = np.maximum.reduceat(extents['end'][order], bounds)
+    max_depth = np.fmax.reduceat(np.asarray(depth, dtype=float)[order], bounds)
+
+    c = center[order]
+    half_width = extents['half_width'][order]
+    ref = np.repeat(c[bounds], size)
+    rel = np.mod(c - ref + circumference / 2.0, circumference) - circumference / 2.0
+    known = ~np.isnan(rel)
+    lo = np.minimum.reduceat(np.where(known, rel - half_width, np.inf), bounds)
+    hi = np.maximum.reduceat(np.where(known, rel + half_width, -np.inf), bounds)
+    widest = np.maximum.reduceat(2.0 * half_width, bounds)
+    with np.errstate(invalid='ignore'):
+        width = np.where(np.isfinite(lo), np.minimum(hi - lo, circumference), widest)
+        mid = np.where(np.isfinite(lo), c[bounds] + (lo + hi) / 2.0, np.nan)
+
+    return {
+        'size': size,
+        'start': start,
+        'end': end,
+        'length': end - start,
+        'width': width,
+        'orientation': np.mod(mid, circumference) / circumference * 360.0,
+        'max_depth': max_depth,
+    }
+
+
+@profiled('clustering.cluster_anomalies')
+def cluster_anomalies(df, rules=None, dist_col=None):
+    """
+    Find interacting anomaly clusters.
+
+    Args:
+        df: Metal-loss anomalies (distance, orientation, length, width, depth)
+        rules: Interaction rule overrides (see INTERACTION_RULES)
+        dist_col: Distance column (default: 'distance_aligned' if present,
+            else 'distance')
+
+    Returns:
+        Tuple of (features, clusters): features has the distance column
+        plus CLUSTER_COLUMNS for each clustered row of df (same index);
+        clusters has one row per cluster
+    """
+    rules = make_interaction_rules(rules)
+    dist_col = dist_col or ('distance_aligned' if 'distance_aligned' in df.columns else 'distance')
+    wall = rules['wall_thickness_in']
+    circumference = np.pi * rules['pipe_od_in']
+
+    def column(name):
+        return df[name].to_numpy(dtype=float) if name in df.columns else np.full(len(df), np.nan)
+
+    depth = column('depth')
+    keep = np.isfinite(column(dist_col)) & ~(depth < rules['min_depth'])
+    rows = df[keep]
+    depth = depth[keep]
+
+    extents = feature_extents(rows[dist_col], column('orientation')[keep], column('length')[keep],
+                              column('width')[keep], rules['pipe_od_in'])
+    pairs = interacting_pairs(extents, rules['axial_spacing_wt'] * wall, rules['circ_spacing_wt'] * wall,
+                              circumference)
+    cluster_id = label_clusters(len(rows), pairs, extents['start'])
+    geometry = cluster_geometry(cluster_id, extents, depth, circumference)
+
+    features = pd.DataFrame({
+        dist_col: rows[dist_col].to_numpy(dtype=float),
+        'cluster_id': cluster_id,
+        'cluster_size': geometry['size'][cluster_id],
+        'cluster_length_in': geometry['length'][cluster_id],
+        'cluster_width_in': geometry['width'][cluster_id],
+        'cluster_max_depth': geometry['max_depth'][cluster_id],
+    }, index=rows.index)
+    clusters = pd.DataFrame({
+        'cluster_id': np.arange(len(geometry['size'])),
+        'size': geometry['size'],
+        'start_ft': geometry['start'] / 12.0,
+        'end_ft': geometry['end'] / 12.0,
+        'length_in': geometry['length'],
+        'width_in': geometry['width'],
+        'orientation': geometry['orientation'],
+        'max_depth': geometry['max_depth'],
+    })
+    return features, clusters
+
+
+def attach_clusters(df, features, on=None):
+    """
+    Add the cluster columns to rows of df, keyed by the row index of the
+    clustered frame (distances are not unique: features at the same
+    distance can belong to different clusters).
+
+    Args:
+        df: Rows of the clustered frame, or a frame referencing them
+        features: cluster_anomalies() features
+        on: Column of df holding the clustered frame's index ('index_22'
+            in the report), or None to use df's own index
+
+    Returns:
+        df with CLUSTER_COLUMNS (NaN for rows that were not clustered)
+    """
+    keys = df.index if on is None else df[on]
+    values = features[CLUSTER_COLUMNS].reindex(keys).set_axis(df.index)
+    return pd.concat([df.drop(columns=CLUSTER_COLUMNS, errors='ignore'), values], axis=1)
+
+
+@profiled('clustering.generate_clusters')
+def generate_clusters(aligned_csv='data/processed/aligned_2022.csv',
+                      output_csv='data/processed/anomaly_clusters.csv', rules=None):
+    print("Finding interacting anomaly clusters...")
+    anoms22 = load_store(aligned_csv).subset('metal_loss')
+
+    features, clusters = cluster_anomalies(anoms22, rules)
+    interacting = clusters[clusters['size'] > 1]
+    interacting.to_csv(output_csv, index=False)
+
+    print(f"Metal loss features: {len(features)}")
+    print(f"Interacting clusters: {len(interacting)} ({int(interacting['size'].sum())} features)")
+    if len(interacting):
+        print(f"Largest cluster: {int(interacting['size'].max())} features")
+        print("\nDeepest interacting clusters:")
+        top = interacting.sort_values('max_depth', ascending=False).head()
+        print(top[['start_ft', 'size', 'length_in', 'width_in', 'max_depth']].to_string(index=False))
+    print(f"Saved {output_csv}")
+    return features, clusters
+
+
+if __name__ == "__main__":
+    generate_clusters()
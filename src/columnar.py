@@ -0,0 +1,215 @@
+"""
+Binary Columnar Payloads
+Typed, column-oriented container for the viewer payloads, loaded in the
+browser straight into typed arrays (viewer/src/columnar.js) instead of
+parsing row-oriented JSON.
+
+Layout (little-endian):
+
+    0   4 bytes   magic b'ILIC'
+    4   uint16    format version (COLUMNAR_VERSION)
+    6   uint16    flags (reserved, 0)
+    8   uint32    header length in bytes
+    12  header    UTF-8 JSON: {'rows': n, 'columns': [...], 'meta': {...}}
+        buffers   one per column (and validity bitmap), each 8-byte aligned
+
+Each column entry has name, type, offset and byteLength (offsets from the
+start of the file) and, when the column has missing values, a 'validity'
+{offset, byteLength} bitmap (bit i set = row i present, least significant
+bit first). Types:
+
+    float32 / float64   IEEE floats (missing rows are also NaN)
+    int32               integers
+    bool                uint8 0 / 1
+    dictionary          'index' codes (uint8 / uint16 / uint32) into the
+                        entry's 'dictionary' list of strings
+"""
+
+import json
+import struct
+
+import numpy as np
+import pandas as pd
+
+MAGIC = b'ILIC'
+COLUMNAR_VERSION = 1
+CONTENT_TYPE = 'application/vnd.ili.columnar'
+ALIGNMENT = 8
+
+# Float columns kept at double precision (everything else is float32;
+# coordinates would be off by feet)
+FLOAT64_COLUMNS = ('lat', 'lng')
+
+_PREAMBLE = struct.Struct('<4sHHI')
+
+
+def _index_type(n_values):
+    for dtype in (np.uint8, np.uint16, np.uint32):
+        if n_values <= np.iinfo(dtype).max + 1:
+            return dtype
+    raise ValueError(f"Too many distinct values for a dictionary column: {n_values}")
+
+
+def encode_column(series, float64=False):
+    """
+    Returns:
+        Tuple of (column entry without offsets, data bytes, validity mask or None)
+    """
+    missing = series.isna().to_numpy()
+    valid = None if not missing.any() else ~missing
+    entry = {'name': str(series.name)}
+
+    if pd.api.types.is_bool_dtype(series):
+        entry['type'] = 'bool'
+        data = series.fillna(False).to_numpy(dtype=np.uint8)
+    elif pd.api.types.is_integer_dtype(series) and series.dropna().between(-2**31, 2**31 - 1).all():
+        entry['type'] = 'int32'
+        data = series.fillna(0).to_numpy(dtype=np.int32)
+    elif pd.api.types.is_numeric_dtype(series):
+        dtype = np.float64 if float64 else np.float32
+        entry['type'] = 'float64' if float64 else 'float32'
+        data = series.to_numpy(dtype=dtype, na_value=np.nan)
+    else:
+        codes, dictionary = pd.factorize(series.astype(object).astype(str).where(~missing))
+        index = _index_type(max(len(dictionary), 1))
+        entry.update({'type': 'dictionary', 'index': np.dtype(index).name,
+                      'dictionary': [str(v) for v in dictionary]})
+        data = np.where(codes < 0, 0, codes).astype(index)
+    return entry, data.astype(data.dtype.newbyteorder('<'), copy=False).tobytes(), valid
+
+
+def encode_columnar(df, meta=None, float64_columns=FLOAT64_COLUMNS):
+    """
+    Encode a DataFrame as a columnar payload.
+
+    Args:
+        df: Records to encode (missing values stay missing)
+        meta: Optional JSON-serializable metadata stored in the header
+        float64_columns: Float columns to keep at double precision
+
+    Returns:
+        bytes
+    """
+    columns, buffers = [], []
+    for col in df.columns:
+        entry, data, valid = encode_column(df[col], float64=col in float64_columns)
+        buffers.append(data)
+        entry['byteLength'] = len(data)
+        if valid is not None:
+            bitmap = np.packbits(valid, bitorder='little').tobytes()
+            entry['validity'] = {'byteLength': len(bitmap)}
+            buffers.append(bitmap)
+        columns.append(entry)
+
+    parts = [encode_preamble(len(df), columns, meta)]
+    for data in buffers:
+        parts.extend((data, b'\0' * pad(len(data))))
+    return b''.join(parts)
+
+
+def pad(n):
+    """Zero bytes needed after n bytes to reach the next ALIGNMENT boundary."""
+    return -n % ALIGNMENT
+
+
+def encode_preamble(rows, columns, meta=None):
+    """
+    Lay out the buffers and encode everything before the first one.
+
+    Args:
+        rows: Row count
+        columns: Column entries with byteLength (and validity byteLength),
+            in buffer order; their offsets are filled in
+        meta: Optional header metadata
+
+    Returns:
+        bytes: preamble, header and padding (the buffers follow, each padded)
+    """
+    # Offsets depend on the header length, which depends on the offsets'
+    # digits: lay out with a provisional header until the length settles
+    header_len = 0
+    while True:
+        offset = _PREAMBLE.size + header_len + pad(_PREAMBLE.size + header_len)
+        for entry in columns:
+            entry['offset'] = offset
+            offset += entry['byteLength'] + pad(entry['byteLength'])
+            if 'validity' in entry:
+                entry['validity']['offset'] = offset
+                offset += entry['validity']['byteLength'] + pad(entry['validity']['byteLength'])
+        header = json.dumps({'rows': rows, 'columns': columns, 'meta': meta or {}},
+                            separators=(',', ':')).encode()
+        if len(header) == header_len:
+            break
+        header_len = len(header)
+
+    return _PREAMBLE.pack(MAGIC, COLUMNAR_VERSION, 0, len(header)) + header \
+        + b'\0' * pad(_PREAMBLE.size + len(header))
+
+
+def decode_header(payload):
+    """
+    Returns:
+        Header dict (rows, columns, meta) of a columnar payload
+    """
+    magic, version, _, header_len = _PREAMBLE.unpack_from(payload, 0)
+    if magic != MAGIC:
+        raise ValueError("Not a columnar payload (bad magic)")
+    if version > COLUMNAR_VERSION:
+        raise ValueError(f"Columnar payload version {version} is newer than supported ({COLUMNAR_VERSION})")
+    return json.loads(bytes(payload[_PREAMBLE.size:_PREAMBLE.size + header_len]))
+
+
+def write_columnar(df, path, meta=None):
+    """Write a DataFrame as a columnar payload file."""
+    with open(path, 'wb') as f:
+        f.write(encode_columnar(df, meta=meta))
+
+
+def decode_columnar(payload):
+    """
+    Decode a columnar payload back into a DataFrame. Missing values come
+    back as NaN (floats), None (strings) or pandas NA (bool, int).
+
+    Returns:
+        Tuple of (DataFrame, meta dict)
+    """
+    header = decode_header(payload)
+    rows = header['rows']
+
+    data = {}
+    for entry in header['columns']:
+        raw = memoryview(payload)[entry['offset']:entry['offset'] + entry['byteLength']]
+        valid = None
+        if 'validity' in entry:
+            v = entry['validity']
+            bits = np.frombuffer(payload, dtype=np.uint8, count=v['byteLength'], offset=v['offset'])
+            valid = np.unpackbits(bits, count=rows, bitorder='little').astype(bool)
+
+        kind = entry['type']
+        if kind == 'dictionary':
+            codes = np.frombuffer(raw, dtype=np.dtype(entry['index']).newbyteorder('<'))
+            values = np.array(entry['dictionary'] or [None], dtype=object)[codes]
+            if valid is not None:
+                values[~valid] = None
+            column = pd.Series(values, dtype=object)
+        elif kind == 'bool':
+            column = pd.Series(np.frombuffer(raw, dtype=np.uint8).astype(bool))
+            if valid is not None:
+                column = column.astype('boolean').mask(~valid)
+        elif kind == 'int32':
+            column = pd.Series(np.frombuffer(raw, dtype='<i4'))
+            if valid is not None:
+                column = column.astype('Int32').mask(~valid)
+        else:
+            column = pd.Series(np.frombuffer(raw, dtype='<f4' if kind == 'float32' else '<f8'))
+        data[entry['name']] = column
+    return pd.DataFrame(data), header.get('meta', {})
+
+
+def read_columnar(path):
+    """
+    Returns:
+        Tuple of (DataFrame, meta dict)
+    """
+    with open(path, 'rb') as f:
+        return decode_columnar(f.read())
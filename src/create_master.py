@@ -1,13 +1,21 @@
 import pandas as pd
 import numpy as np
 
-def create_master_reference():
-    print("Creating Unified Master Reference Data...")
-    
-    # Load raw with no header assumption to see what's really there, or just load and rename
-    r15 = pd.read_csv('../data/processed/ref15.csv')
-    r22 = pd.read_csv('../data/processed/ref22.csv')
-    
+from profiling import profiled
+
+def build_master_reference(r15, r22):
+    """
+    Match 2015 and 2022 reference points into the unified master reference.
+
+    Args:
+        r15, r22: Reference points from reference.extract_references()
+
+    Returns:
+        DataFrame with type, joint, dist_15, dist_22, shift sorted by dist_15
+    """
+    r15 = r15.copy()
+    r22 = r22.copy()
+
     # Force rename columns by position to guarantee 'joint' exists and is clean
     # Expected: year, dist, event, joint, oclock_deg, type
     cols = ['year', 'dist', 'event', 'joint', 'oclock_deg', 'type']
@@ -106,14 +114,24 @@ def create_master_reference():
     ], ignore_index=True)
     
     master['shift'] = (master['dist_22'] - master['dist_15']).round(2)
-    master = master.sort_values('dist_15')
+    return master.sort_values('dist_15')
+
+@profiled('create_master.create_master_reference')
+def create_master_reference():
+    print("Creating Unified Master Reference Data...")
+    
+    # Load raw with no header assumption to see what's really there, or just load and rename
+    r15 = pd.read_csv('../data/processed/ref15.csv')
+    r22 = pd.read_csv('../data/processed/ref22.csv')
+    
+    master = build_master_reference(r15, r22)
     
     output_path = '../data/processed/reference_master.csv'
     master.to_csv(output_path, index=False)
     
     print(f"Created Reference Master with {len(master)} matched points.")
-    print(f"  - Girth Welds: {len(matched_gw)}")
-    print(f"  - Hard Anchors: {len(matched_ha_df)}")
+    print(f"  - Girth Welds: {(master['type'] == 'Girth Weld').sum()}")
+    print(f"  - Hard Anchors: {(master['type'] != 'Girth Weld').sum()}")
     print("\nSample Data:")
     print(master.head(10))
 
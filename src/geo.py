@@ -0,0 +1,406 @@
+"""
+Geo Engine
+Server-side counterpart of the viewer's geoData.js: converts pipeline
+distances to coordinates and finds the sensitive locations (schools,
+hospitals, ...) each anomaly lies within the safety radius of, for whole
+reports at once, so anomalies can be ranked and exported by consequence.
+
+Distances are interpolated on the centerline's cumulative odometer with
+one searchsorted call (centerlines without odometer distances use their
+cumulative arc length). Radius queries go through a uniform grid over the
+locations' Earth-centred coordinates, so each anomaly only checks the
+locations in its own and the neighbouring cells.
+
+Proximity columns added to each anomaly:
+    lat, lng                Coordinates on the centerline
+    nearby_locations        Sensitive locations within their safety radius
+    nearest_location        Nearest of them (None when there are none)
+    nearest_location_type   Its type (school, hospital, ...)
+    nearest_location_ft     Its distance (ft)
+    proximity_level         Highest priority nearby: critical / high / medium
+    consequence_factor      CONSEQUENCE_FACTORS of the level (1 when none)
+
+The layers default to the viewer's example data below; set ILI_CENTERLINE
+and ILI_SENSITIVE_LOCATIONS to CSV / JSON files to use real ones.
+"""
+
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+from profiling import profiled
+
+EARTH_RADIUS_FT = 20902231.0
+
+# Centerline waypoints: (distance ft, lat, lng), as in geoData.js
+PIPELINE_WAYPOINTS = [
+    (0, 29.7604, -95.3698), (1000, 29.7612, -95.3688), (2000, 29.7625, -95.3672),
+    (3000, 29.7635, -95.3662), (4000, 29.7650, -95.3645), (5000, 29.7658, -95.3638),
+    (6000, 29.7672, -95.3620), (7000, 29.7680, -95.3612), (8000, 29.7698, -95.3592),
+    (9000, 29.7705, -95.3585), (10000, 29.7720, -95.3568), (11000, 29.7728, -95.3560),
+    (12000, 29.7745, -95.3542), (13000, 29.7752, -95.3535), (14000, 29.7768, -95.3518),
+    (15000, 29.7775, -95.3510), (16000, 29.7792, -95.3490), (17000, 29.7798, -95.3483),
+    (18000, 29.7815, -95.3465), (19000, 29.7822, -95.3458), (20000, 29.7838, -95.3440),
+    (21000, 29.7845, -95.3433), (22000, 29.7860, -95.3415), (23000, 29.7868, -95.3408),
+    (24000, 29.7885, -95.3388), (25000, 29.7892, -95.3381), (26000, 29.7908, -95.3363),
+    (27000, 29.7915, -95.3356), (28000, 29.7932, -95.3338), (29000, 29.7938, -95.3331),
+    (30000, 29.7955, -95.3313), (31000, 29.7962, -95.3306), (32000, 29.7978, -95.3286),
+    (33000, 29.7985, -95.3279), (34000, 29.8002, -95.3261), (35000, 29.8008, -95.3254),
+    (36000, 29.8025, -95.3236), (37000, 29.8032, -95.3229), (38000, 29.8048, -95.3211),
+    (39000, 29.8055, -95.3204), (40000, 29.8070, -95.3188),
+]
+
+# Branch connections, as in geoData.js
+PIPELINE_TEES = [
+    {'distance': 8000, 'lat': 29.7698, 'lng': -95.3592, 'name': 'Tee A - Industrial Branch',
+     'branchDirection': 120, 'branchLength': 2000, 'type': 'industrial'},
+    {'distance': 18000, 'lat': 29.7815, 'lng': -95.3465, 'name': 'Tee B - Residential Supply',
+     'branchDirection': 330, 'branchLength': 1500, 'type': 'residential'},
+    {'distance': 28000, 'lat': 29.7932, 'lng': -95.3338, 'name': 'Tee C - Commercial District',
+     'branchDirection': 90, 'branchLength': 2500, 'type': 'commercial'},
+]
+
+# Sensitive locations (example data from geoData.js); radius is the safety radius in ft
+SENSITIVE_LOCATIONS = [
+    {'name': 'Lincoln Elementary School', 'type': 'school',
+     'lat': 29.7650, 'lng': -95.3650, 'radius': 500, 'priority': 'high'},
+    {'name': 'Memorial Hospital', 'type': 'hospital',
+     'lat': 29.7700, 'lng': -95.3600, 'radius': 1000, 'priority': 'critical'},
+    {'name': 'Riverside Residential Area', 'type': 'residential',
+     'lat': 29.7750, 'lng': -95.3550, 'radius': 300, 'priority': 'high'},
+    {'name': 'City Park & Recreation Center', 'type': 'public',
+     'lat': 29.7800, 'lng': -95.3500, 'radius': 400, 'priority': 'medium'},
+    {'name': 'Oakwood Senior Living', 'type': 'senior_care',
+     'lat': 29.7550, 'lng': -95.3700, 'radius': 500, 'priority': 'critical'},
+    {'name': 'Downtown Shopping District', 'type': 'commercial',
+     'lat': 29.7604, 'lng': -95.3698, 'radius': 200, 'priority': 'medium'},
+]
+
+# Proximity levels, lowest first (other priorities count as 'medium', like
+# the viewer's getProximityAlertLevel())
+PROXIMITY_LEVELS = ['medium', 'high', 'critical']
+
+# Consequence multiplier of each proximity level (anomalies near nothing: 1)
+CONSEQUENCE_FACTORS = {
+    'medium': 1.5,
+    'high': 2.0,
+    'critical': 3.0,
+}
+
+GEO_COLUMNS = ['lat', 'lng', 'nearby_locations', 'nearest_location', 'nearest_location_type',
+               'nearest_location_ft', 'proximity_level', 'consequence_factor']
+
+# Anomalies expanded into candidate pairs at a time (bounds memory)
+POINT_BLOCK = 1_000_000
+
+CENTERLINE_PATH = os.environ.get('ILI_CENTERLINE')
+LOCATIONS_PATH = os.environ.get('ILI_SENSITIVE_LOCATIONS')
+
+
+def haversine_ft(lat1, lng1, lat2, lng2):
+    """Great-circle distance (ft) between coordinate arrays (as calculateDistance())."""
+    lat1, lng1, lat2, lng2 = (np.radians(np.asarray(v, dtype=float)) for v in (lat1, lng1, lat2, lng2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_FT * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def _xyz(lat, lng):
+    """Earth-centred coordinates (ft): chords are never longer than arcs."""
+    lat, lng = np.radians(np.asarray(lat, dtype=float)), np.radians(np.asarray(lng, dtype=float))
+    return EARTH_RADIUS_FT * np.stack([np.cos(lat) * np.cos(lng), np.cos(lat) * np.sin(lng), np.sin(lat)], axis=1)
+
+
+def _expand(starts, counts):
+    """Concatenated ranges starts[k] .. starts[k] + counts[k] as one index array."""
+    return np.repeat(starts - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+
+
+def _read_layer(path):
+    if str(path).lower().endswith('.json'):
+        return pd.read_json(path, orient='records')
+    return pd.read_csv(path)
+
+
+def load_centerline(path=None):
+    """
+    Centerline as a DataFrame of distance, lat, lng (PIPELINE_WAYPOINTS
+    without a path). A file without a distance column is measured by its
+    cumulative arc length from the first vertex.
+    """
+    if path is None:
+        return pd.DataFrame(PIPELINE_WAYPOINTS, columns=['distance', 'lat', 'lng'])
+    line = _read_layer(path)
+    if 'lat' not in line.columns or 'lng' not in line.columns:
+        raise ValueError(f"Centerline {path} needs lat and lng columns")
+    if 'distance' not in line.columns:
+        lat, lng = line['lat'].to_numpy(dtype=float), line['lng'].to_numpy(dtype=float)
+        line['distance'] = np.concatenate(([0.0], np.cumsum(haversine_ft(lat[:-1], lng[:-1], lat[1:], lng[1:]))))
+    return line[['distance', 'lat', 'lng']]
+
+
+def load_locations(path=None):
+    """
+    Sensitive locations as a DataFrame of name, type, lat, lng, radius (ft)
+    and priority (SENSITIVE_LOCATIONS without a path).
+    """
+    if path is None:
+        return pd.DataFrame(SENSITIVE_LOCATIONS)
+    locations = _read_layer(path)
+    missing = {'name', 'lat', 'lng', 'radius'} - set(locations.columns)
+    if missing:
+        raise ValueError(f"Sensitive locations {path} need columns: {', '.join(sorted(missing))}")
+    if 'type' not in locations.columns:
+        locations['type'] = None
+    if 'priority' not in locations.columns:
+        locations['priority'] = 'medium'
+    return locations
+
+
+class GeoIndex:
+    """
+    Centerline and sensitive-location layers, indexed once for bulk
+    distance -> coordinate and radius queries.
+
+    Usage:
+        geo = GeoIndex()
+        fields = geo.proximity(report['dist_22_aligned'])
+    """
+
+    def __init__(self, centerline=None, locations=None):
+        """
+        Args:
+            centerline: load_centerline() frame (default PIPELINE_WAYPOINTS)
+            locations: load_locations() frame (default SENSITIVE_LOCATIONS)
+        """
+        line = (load_centerline() if centerline is None else centerline).sort_values('distance', kind='stable')
+        if len(line) < 2:
+            raise ValueError("A centerline needs at least two points")
+        self.distance = line['distance'].to_numpy(dtype=float)
+        self.lat = line['lat'].to_numpy(dtype=float)
+        self.lng = line['lng'].to_numpy(dtype=float)
+
+        self.locations = (load_locations() if locations is None else locations).reset_index(drop=True)
+        loc = self.locations
+        self.radius = loc['radius'].to_numpy(dtype=float)
+        self.level = np.array([PROXIMITY_LEVELS.index(p) if p in PROXIMITY_LEVELS else 0
+                               for p in loc['priority']], dtype=np.int8)
+
+        # Grid cells as wide as the largest radius: every location within
+        # its radius of a point is in the point's cell or a neighbouring one
+        self.cell_ft = max(float(self.radius.max()) if len(loc) else 1.0, 1.0)
+        self._lat = loc['lat'].to_numpy(dtype=float)
+        self._lng = loc['lng'].to_numpy(dtype=float)
+        self._xyz = _xyz(self._lat, self._lng)
+        cells = np.floor(self._xyz / self.cell_ft).astype(np.int64)
+        self._origin = cells.min(axis=0) - 1 if len(loc) else np.zeros(3, dtype=np.int64)
+        self._shape = (cells.max(axis=0) + 2 - self._origin) if len(loc) else np.ones(3, dtype=np.int64)
+        keys = self._cell_keys(cells)
+        self._order = np.argsort(keys, kind='stable')
+        self._keys = keys[self._order]
+
+    def _cell_keys(self, cells):
+        """Flat key of each cell (-1 outside the locations' grid)."""
+        rel = cells - self._origin
+        inside = np.all((rel >= 0) & (rel < self._shape), axis=1)
+        keys = np.ravel_multi_index(tuple(np.clip(rel, 0, self._shape - 1).T), tuple(self._shape))
+        return np.where(inside, keys, -1)
+
+    def to_latlng(self, distance):
+        """
+        Coordinates of pipeline distances (ft), interpolated between the
+        centerline points and extrapolated along the end segments.
+
+        Returns:
+            Tuple of (lat, lng) arrays
+        """
+        d = np.asarray(distance, dtype=float)
+        i = np.clip(np.searchsorted(self.distance, d, side='right') - 1, 0, len(self.distance) - 2)
+        span = self.distance[i + 1] - self.distance[i]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            t = np.where(span > 0, (d - self.distance[i]) / span, 0.0)
+        return (self.lat[i] + t * (self.lat[i + 1] - self.lat[i]),
+                self.lng[i] + t * (self.lng[i + 1] - self.lng[i]))
+
+    def nearby(self, lat, lng, block=POINT_BLOCK):
+        """
+        Every (point, location) pair within the location's safety radius.
+
+        Points sharing a grid cell share its candidate locations, so the
+        27-cell neighbourhood is searched once per occupied cell.
+
+        Returns:
+            Tuple of (point index, location index, distance ft) arrays, in
+            point order
+        """
+        lat, lng = np.asarray(lat, dtype=float), np.asarray(lng, dtype=float)
+        empty = np.array([], dtype=np.int64)
+        if not len(self._keys) or not len(lat):
+            return empty, empty, np.array([], dtype=float)
+
+        # Points outside the grid (or without coordinates) have no candidates
+        known = np.isfinite(lat) & np.isfinite(lng)
+        xyz = _xyz(np.where(known, lat, 0.0), np.where(known, lng, 0.0))
+        keys = np.where(known, self._cell_keys(np.floor(xyz / self.cell_ft).astype(np.int64)), -1)
+        occupied, cell_of = np.unique(keys, return_inverse=True)
+        known &= keys >= 0
+
+        # Candidate locations of each occupied cell (its 27 neighbours),
+        # grouped by cell
+        offsets = np.array(np.meshgrid([-1, 0, 1], [-1, 0, 1], [-1, 0, 1])).reshape(3, -1).T
+        occupied = np.stack(np.unravel_index(np.maximum(occupied, 0), tuple(self._shape)), axis=1) + self._origin
+        probe = self._cell_keys((occupied[:, None, :] + offsets[None, :, :]).reshape(-1, 3))
+        lo = np.searchsorted(self._keys, probe, side='left')
+        hi = np.where(probe >= 0, np.searchsorted(self._keys, probe, side='right'), lo)
+        cand_cell = np.repeat(np.arange(len(probe)) // len(offsets), hi - lo)
+        cand_loc = self._order[_expand(lo, hi - lo)]
+        # Keep the locations whose radius reaches into the cell's box
+        box = occupied[cand_cell] * self.cell_ft
+        gap = np.maximum(np.maximum(box - self._xyz[cand_loc], self._xyz[cand_loc] - box - self.cell_ft), 0.0)
+        reach = (gap ** 2).sum(axis=1) <= self.radius[cand_loc] ** 2
+        cand_cell, cand_loc = cand_cell[reach], cand_loc[reach]
+        cell_count = np.bincount(cand_cell, minlength=len(occupied))
+        cell_start = np.cumsum(cell_count) - cell_count
+
+        out_p, out_l, out_d = [], [], []
+        for first in range(0, len(lat), block):
+            points = np.flatnonzero(known[first:first + block]) + first
+            n = cell_count[cell_of[points]]
+            rows = np.repeat(points, n)
+            locs = cand_loc[_expand(cell_start[cell_of[points]], n)]
+            # Chords are never longer than arcs: a cheap, safe first filter
+            chord2 = ((xyz[rows] - self._xyz[locs]) ** 2).sum(axis=1)
+            close = chord2 <= self.radius[locs] ** 2
+            rows, locs = rows[close], locs[close]
+            dist = haversine_ft(lat[rows], lng[rows], self._lat[locs], self._lng[locs])
+            keep = dist <= self.radius[locs]
+            out_p.append(rows[keep])
+            out_l.append(locs[keep])
+            out_d.append(dist[keep])
+        return np.concatenate(out_p), np.concatenate(out_l), np.concatenate(out_d)
+
+    @profiled('geo.proximity')
+    def proximity(self, distance):
+        """
+        Coordinates and sensitive-location proximity of pipeline distances.
+
+        Args:
+            distance: Array of distances (ft)
+
+        Returns:
+            dict of GEO_COLUMNS -> arrays
+        """
+        lat, lng = self.to_latlng(distance)
+        n = len(lat)
+        points, locs, dist = self.nearby(lat, lng)
+
+        # Pairs come in point order: reduce each point's run of pairs
+        hit, bounds, count_hit = np.unique(points, return_index=True, return_counts=True)
+        count = np.zeros(n, dtype=np.int64)
+        count[hit] = count_hit
+        level = np.full(n, -1, dtype=np.int8)
+        names = np.full(n, None, dtype=object)
+        types = np.full(n, None, dtype=object)
+        nearest_ft = np.full(n, np.nan)
+        if len(hit):
+            level[hit] = np.maximum.reduceat(self.level[locs], bounds)
+            # Nearest location: the first pair at its point's minimum distance
+            closest = np.flatnonzero(dist == np.repeat(np.minimum.reduceat(dist, bounds), count_hit))
+            nearest = closest[np.searchsorted(closest, bounds)]
+            names[hit] = self.locations['name'].to_numpy(dtype=object)[locs[nearest]]
+            types[hit] = self.locations['type'].to_numpy(dtype=object)[locs[nearest]]
+            nearest_ft[hit] = dist[nearest]
+
+        level_names = np.array(PROXIMITY_LEVELS + [None], dtype=object)
+        factors = np.array([CONSEQUENCE_FACTORS[name] for name in PROXIMITY_LEVELS] + [1.0])
+        return {
+            'lat': lat,
+            'lng': lng,
+            'nearby_locations': count,
+            'nearest_location': names,
+            'nearest_location_type': types,
+            'nearest_location_ft': nearest_ft,
+            'proximity_level': level_names[level],
+            'consequence_factor': factors[level],
+        }
+
+    def layers(self):
+        """Centerline, tees and sensitive locations as JSON-ready records."""
+        return {
+            'centerline': [{'distance': float(d), 'lat': float(a), 'lng': float(b)}
+                           for d, a, b in zip(self.distance, self.lat, self.lng)],
+            'tees': PIPELINE_TEES,
+            'sensitive_locations': self.locations.replace({np.nan: None}).to_dict(orient='records'),
+        }
+
+
+_loaded = {}
+_loaded_lock = threading.Lock()
+
+
+def load_geo(centerline_path=CENTERLINE_PATH, locations_path=LOCATIONS_PATH):
+    """
+    The GeoIndex of a pair of layer files (the built-in layers for None),
+    built once per process and rebuilt only when a file changes.
+    """
+    paths = tuple(os.path.realpath(p) if p else None for p in (centerline_path, locations_path))
+    key = tuple((p, os.stat(p).st_mtime_ns) if p else None for p in paths)
+    with _loaded_lock:
+        cached = _loaded.get(paths)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+    geo = GeoIndex(load_centerline(paths[0]), load_locations(paths[1]))
+    with _loaded_lock:
+        _loaded[paths] = (key, geo)
+    return geo
+
+
+def attach_geo(df, dist_col=None, geo=None):
+    """
+    Add GEO_COLUMNS to any anomaly DataFrame.
+
+    Args:
+        df: Anomalies with a distance column
+        dist_col: Distance column (default: the first of dist_22_aligned,
+            distance_aligned, distance)
+        geo: GeoIndex (default load_geo())
+
+    Returns:
+        Copy of df with GEO_COLUMNS
+    """
+    dist_col = dist_col or next(c for c in ('dist_22_aligned', 'distance_aligned', 'distance') if c in df.columns)
+    fields = (geo or load_geo()).proximity(df[dist_col].to_numpy(dtype=float))
+    return pd.concat([df.drop(columns=GEO_COLUMNS, errors='ignore'), pd.DataFrame(fields, index=df.index)], axis=1)
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description='Sensitive-location proximity of the growth report anomalies')
+    parser.add_argument('--report', default='data/processed/final_growth_report.csv')
+    parser.add_argument('--centerline', default=CENTERLINE_PATH, help='Centerline CSV / JSON (lat, lng[, distance])')
+    parser.add_argument('--locations', default=LOCATIONS_PATH,
+                        help='Sensitive locations CSV / JSON (name, type, lat, lng, radius, priority)')
+    parser.add_argument('--benchmark', type=int, default=0, help='Also time N synthetic anomalies')
+    args = parser.parse_args()
+
+    geo = load_geo(args.centerline, args.locations)
+    report = attach_geo(pd.read_csv(args.report), geo=geo)
+    near = report[report['nearby_locations'] > 0]
+    print(f"Located {len(report)} anomalies on {len(geo.distance)} centerline points, "
+          f"{len(geo.locations)} sensitive locations")
+    print(f"  Near sensitive locations: {len(near)}")
+    for level in reversed(PROXIMITY_LEVELS):
+        print(f"    {level}: {int((near['proximity_level'] == level).sum())}")
+    if len(near):
+        print("\nNearest sensitive location of those anomalies:")
+        print(near['nearest_location'].value_counts().to_string())
+
+    if args.benchmark:
+        distance = np.random.default_rng(0).uniform(geo.distance[0], geo.distance[-1], args.benchmark)
+        start = time.perf_counter()
+        fields = geo.proximity(distance)
+        print(f"\n{args.benchmark} anomalies located in {time.perf_counter() - start:.3f}s "
+              f"({int((fields['nearby_locations'] > 0).sum())} near sensitive locations)")
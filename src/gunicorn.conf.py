@@ -0,0 +1,52 @@
+"""
+Gunicorn configuration for the upload API.
+
+    cd src && gunicorn -c gunicorn.conf.py wsgi:app
+
+Background jobs (jobs.py) live in the worker that started them, and every
+client following one holds a server-sent events stream open. So the API
+runs as one gthread worker by default: jobs, their followers and the parse
+caches share a process, and a stream ties up a thread, not a worker.
+With more than one worker, async requests run synchronously instead (see
+post_fork below).
+
+Every setting can be changed through an environment variable:
+    ILI_BIND                 Address to listen on (default 0.0.0.0:5000)
+    ILI_WORKERS              Worker processes (default 1)
+    ILI_THREADS              Threads per worker (default 8)
+    ILI_TIMEOUT              Seconds before a silent worker is restarted (default 120)
+    ILI_GRACEFUL_TIMEOUT     Seconds a worker gets to finish on restart (default 30)
+    ILI_MAX_REQUESTS         Recycle a worker after this many requests (default 0 = never;
+                             recycling stops the jobs running on that worker)
+    ILI_MAX_REQUESTS_JITTER  Random extra requests so workers don't recycle together (default 50)
+    ILI_ASYNC_JOBS           1 or 0 to force background jobs on or off (default: on
+                             with one worker only; set 1 behind a sticky load balancer)
+    ILI_LOG_LEVEL            Gunicorn log level (default info)
+"""
+
+import os
+
+bind = os.environ.get('ILI_BIND', '0.0.0.0:5000')
+worker_class = 'gthread'
+workers = int(os.environ.get('ILI_WORKERS', 1))
+threads = int(os.environ.get('ILI_THREADS', 8))
+timeout = int(os.environ.get('ILI_TIMEOUT', 120))
+graceful_timeout = int(os.environ.get('ILI_GRACEFUL_TIMEOUT', 30))
+
+# Bound memory growth: workers are replaced after N requests. Off by default,
+# since a replaced worker takes its running jobs with it
+max_requests = int(os.environ.get('ILI_MAX_REQUESTS', 0))
+max_requests_jitter = int(os.environ.get('ILI_MAX_REQUESTS_JITTER', 50))
+
+# Load the app, model and report data once in the master (see wsgi.py)
+preload_app = True
+
+loglevel = os.environ.get('ILI_LOG_LEVEL', 'info')
+accesslog = '-'
+errorlog = '-'
+
+
+def post_fork(server, worker):
+    # Decided per worker, after command line overrides (--workers) apply:
+    # with several workers, a job's follow-up requests could land elsewhere
+    os.environ.setdefault('ILI_ASYNC_JOBS', '1' if server.cfg.workers == 1 else '0')
@@ -0,0 +1,285 @@
+"""
+Incremental Report Recomputation
+Keeps the intermediate arrays of the report stage (candidate graph, match
+costs, validation, confidence factors, severity factor scores) so that a
+threshold or weight change only recomputes the columns that depend on it.
+The assignment is only re-solved when the matching tolerance or the
+orientation scale changes.
+"""
+
+import copy
+import numpy as np
+
+import matching
+from analytics import (
+    CONFIDENCE_WEIGHTS, CONFIDENCE_LEVELS, REVIEW_THRESHOLDS,
+    attach_event_types, validation_columns, confidence_factors, assessed_depth,
+    remaining_strength, run_year, proximity, combine_confidence, compute_review_flags,
+    assemble_report, find_exceptions
+)
+from clustering import INTERACTION_RULES, cluster_anomalies, attach_clusters
+from remaining_strength import PIPE_PARAMS
+from scoring import FACTOR_RULE_KEYS, make_rules, years_to_failure, factor_scores, classify_scores
+from validation import DISTANCE_TOLERANCE_FT, ORIENTATION_TOLERANCE_DEG
+from anomaly_store import load_store
+
+DEFAULT_PARAMS = {
+    'match_tolerance': matching.DISTANCE_TOLERANCE_FT,
+    'orient_scale': matching.ORIENTATION_SCALE_DEG,
+    'dist_tolerance': DISTANCE_TOLERANCE_FT,
+    'orient_tolerance': ORIENTATION_TOLERANCE_DEG,
+    'confidence_weights': CONFIDENCE_WEIGHTS,
+    'confidence_levels': CONFIDENCE_LEVELS,
+    'review_thresholds': REVIEW_THRESHOLDS,
+    'rules': 'report',
+    'interval': matching.INSPECTION_INTERVAL_YEARS,
+    'interaction_rules': INTERACTION_RULES,
+    'pipe_params': PIPE_PARAMS,
+}
+
+# Stage -> stages that consume its output
+STAGE_DEPENDENTS = {
+    'clustering': ('severity_factors',),
+    'assignment': ('validation', 'severity_factors'),
+    'validation': ('confidence_factors',),
+    'confidence_factors': ('confidence',),
+    'confidence': ('review',),
+    'review': (),
+    'severity_factors': ('severity',),
+    'severity': (),
+}
+
+# Execution order (topological)
+STAGE_ORDER = ('clustering', 'assignment', 'validation', 'confidence_factors', 'confidence',
+               'review', 'severity_factors', 'severity')
+
+# Parameter -> first stage it invalidates
+PARAM_STAGES = {
+    'match_tolerance': 'assignment',
+    'orient_scale': 'assignment',
+    'dist_tolerance': 'validation',
+    'orient_tolerance': 'validation',
+    'confidence_weights': 'confidence',
+    'confidence_levels': 'confidence',
+    'review_thresholds': 'review',
+    'interval': 'severity_factors',
+    'interaction_rules': 'clustering',
+    'pipe_params': 'severity_factors',
+}
+
+
+class IncrementalReport:
+    """
+    Report stage with cached intermediates for interactive what-if tuning.
+
+    Usage:
+        session = IncrementalReport(anoms15, anoms22)
+        report = session.report()
+        session.update(review_thresholds={'max_match_cost': 0.8})
+        report = session.report()   # only the review columns were recomputed
+    """
+
+    def __init__(self, anoms15, anoms22, **params):
+        """
+        Args:
+            anoms15: 2015 metal loss anomalies
+            anoms22: Aligned 2022 metal loss anomalies
+            **params: Overrides of DEFAULT_PARAMS
+        """
+        self.anoms15 = anoms15.reset_index(drop=True)
+        self.anoms22 = anoms22.reset_index(drop=True)
+        self.params = copy.deepcopy(DEFAULT_PARAMS)
+        self.params.update(copy.deepcopy(params))
+        self.rules = make_rules(self.params['rules'])
+        self.graph = None
+        self._cache = {}
+        self._dirty = set(STAGE_ORDER)
+        self.last_recomputed = []
+
+    def _invalidate(self, stage):
+        """Mark a stage and everything downstream of it as stale."""
+        pending = [stage]
+        while pending:
+            current = pending.pop()
+            self._dirty.add(current)
+            pending.extend(STAGE_DEPENDENTS[current])
+
+    def update(self, **params):
+        """
+        Change parameters and invalidate only the dependent stages.
+        Dict-valued parameters (weights, thresholds, rules overrides) are
+        merged over the current values.
+
+        Returns:
+            Sorted list of stages that will be recomputed
+        """
+        for name, value in params.items():
+            if name == 'rules':
+                new_rules = make_rules(value) if isinstance(value, str) else make_rules(self.rules, value)
+                changed = [k for k in new_rules if new_rules[k] != self.rules.get(k)]
+                self.rules = new_rules
+                if any(k in FACTOR_RULE_KEYS for k in changed):
+                    self._invalidate('severity_factors')
+                elif changed:
+                    self._invalidate('severity')
+                continue
+            if name not in PARAM_STAGES:
+                raise ValueError(f"Unknown parameter '{name}'")
+            if isinstance(value, dict) and isinstance(self.params.get(name), dict):
+                value = {**self.params[name], **value}
+            if value != self.params[name]:
+                self.params[name] = copy.deepcopy(value)
+                self._invalidate(PARAM_STAGES[name])
+        return [stage for stage in STAGE_ORDER if stage in self._dirty]
+
+    # --- Stages -----------------------------------------------------------
+
+    def _run_clustering(self):
+        self._cache['clustering'], _ = cluster_anomalies(self.anoms22, self.params['interaction_rules'])
+
+    def _run_assignment(self):
+        tolerance = self.params['match_tolerance']
+        # The candidate graph is only rebuilt when the tolerance widens past it
+        if self.graph is None or self.graph['max_tolerance'] < tolerance:
+            self.graph = matching.candidate_graph_for(self.anoms15, self.anoms22, tolerance)
+        rows, cols, costs = matching.solve_assignment(self.graph, tolerance, self.params['orient_scale'])
+        matched = matching.build_matches(self.anoms15, self.anoms22, rows, cols, costs,
+                                         interval=self.params['interval'])
+        matched = attach_event_types(matched, self.anoms15, self.anoms22)
+        self._cache['assignment'] = {
+            'rows': rows, 'cols': cols, 'costs': costs,
+            'matched': matched,
+            'geo': proximity(matched),
+        }
+
+    def _run_validation(self):
+        self._cache['validation'] = validation_columns(
+            self._cache['assignment']['matched'],
+            self.params['dist_tolerance'],
+            self.params['orient_tolerance']
+        )
+
+    def _run_confidence_factors(self):
+        self._cache['confidence_factors'] = confidence_factors(
+            self._cache['assignment']['matched'],
+            self._cache['validation']['validation_confidence']
+        )
+
+    def _run_confidence(self):
+        self._cache['confidence'] = combine_confidence(
+            self._cache['confidence_factors'],
+            self.params['confidence_weights'],
+            self.params['confidence_levels']
+        )
+
+    def _run_review(self):
+        self._cache['review'] = compute_review_flags(
+            self._cache['assignment']['matched'],
+            self._cache['validation']['is_validated'],
+            self._cache['confidence'][0],
+            self.params['review_thresholds']
+        )
+
+    def _run_severity_factors(self):
+        matched = attach_clusters(self._cache['assignment']['matched'], self._cache['clustering'], 'index_22')
+        growth = matched['growth'].to_numpy(dtype=float)
+        depth = assessed_depth(matched)
+        growth_rate = growth / self.params['interval']
+        strength = remaining_strength(matched, self.params['pipe_params'], self.params['interval'],
+                                      run_year(self.anoms22))
+        ytf = np.fmin(years_to_failure(depth, growth_rate, self.rules), strength['years_to_unsafe'])
+        self._cache['severity_factors'] = {
+            'matched': matched,
+            'strength': strength,
+            'depth': depth,
+            'growth_rate': growth_rate,
+            'growth': growth,
+            'ytf': ytf,
+            'scores': factor_scores(depth, growth_rate, growth, ytf, self.rules),
+        }
+
+    def _run_severity(self):
+        f = self._cache['severity_factors']
+        self._cache['severity'] = classify_scores(
+            f['scores'], f['depth'], f['growth_rate'], f['growth'], f['ytf'], self.rules
+        )
+
+    def recompute(self):
+        """
+        Run the stale stages in dependency order.
+
+        Returns:
+            List of stages that were recomputed
+        """
+        recomputed = []
+        for stage in STAGE_ORDER:
+            if stage in self._dirty:
+                getattr(self, f'_run_{stage}')()
+                self._dirty.discard(stage)
+                recomputed.append(stage)
+        self.last_recomputed = recomputed
+        return recomputed
+
+    # --- Outputs ----------------------------------------------------------
+
+    def report(self):
+        """Current report DataFrame (same columns as analytics.build_report)."""
+        self.recompute()
+        return assemble_report(
+            self._cache['severity_factors']['matched'],
+            self._cache['validation'],
+            self._cache['confidence'],
+            self._cache['review'],
+            self._cache['severity'],
+            self.params['interval'],
+            self._cache['severity_factors']['strength'],
+            self._cache['assignment']['geo']
+        )
+
+    def summary(self):
+        """Headline counts for the current parameters."""
+        report = self.report()
+        new_anoms, missing_anoms = find_exceptions(report, self.anoms15, self.anoms22)
+        total = len(report)
+        return {
+            'total_matched': total,
+            'validated_matches': int(report['is_validated'].sum()),
+            'review_required': int((report['review_flags'] != 0).sum()),
+            'new_anomalies': len(new_anoms),
+            'missing_anomalies': len(missing_anoms),
+            'status_counts': report['status'].value_counts().to_dict(),
+            'severity_counts': report['severity_level'].value_counts().to_dict(),
+            'mean_severity': float(report['severity_score'].mean()) if total else None,
+            'mean_anomaly_confidence': float(report['anomaly_confidence'].mean()) if total else None,
+        }
+
+
+def load_session(processed_dir='data/processed', **params):
+    """
+    Create an IncrementalReport from the standardized 2015 and aligned 2022 CSVs.
+    """
+    anoms15 = load_store(f'{processed_dir}/standardized_2015.csv').subset('metal_loss')
+    anoms22 = load_store(f'{processed_dir}/aligned_2022.csv').subset('metal_loss')
+    return IncrementalReport(anoms15, anoms22, **params)
+
+
+if __name__ == "__main__":
+    import time
+
+    session = load_session()
+    start = time.perf_counter()
+    session.report()
+    print(f"Initial report: {1000 * (time.perf_counter() - start):.1f} ms ({', '.join(session.last_recomputed)})")
+
+    for change in [
+        {'review_thresholds': {'max_match_cost': 0.8}},
+        {'rules': {'factors': {'depth': {'weight': 1.0}}}},
+        {'dist_tolerance': 4.0},
+        {'match_tolerance': 4.0},
+    ]:
+        start = time.perf_counter()
+        session.update(**change)
+        summary = session.summary()
+        print(f"{change}: {1000 * (time.perf_counter() - start):.1f} ms "
+              f"({', '.join(session.last_recomputed)}) -> {summary['total_matched']} matched, "
+              f"{summary['review_required']} review")
@@ -2,6 +2,8 @@ import pandas as pd
 import numpy as np
 from datetime import time
 
+from profiling import profiled
+
 def oclock_to_degrees(t):
     if isinstance(t, time):
         return (t.hour + t.minute / 60.0) * 30.0
@@ -58,7 +60,20 @@ class ILIStandardizer:
                 
         return df_std[self.standard_cols]
 
-def load_ili_data(file_path):
+@profiled('ingestion.load_ili_data')
+def load_ili_data(file_path, sheet_15='2015', sheet_22='2022'):
+    """
+    Load and standardize the two runs of an ILI workbook.
+
+    Args:
+        file_path: Workbook path
+        sheet_15: Sheet in the 2015 vendor layout (older run)
+        sheet_22: Sheet in the 2022 vendor layout (newer run)
+
+    Returns:
+        Tuple of standardized (older, newer) DataFrames; 'year' comes from
+        numeric sheet names
+    """
     print(f"Loading and Standardizing data from {file_path}...")
     standardizer = ILIStandardizer()
     
@@ -89,38 +104,42 @@ def load_ili_data(file_path):
     }
     
     # Load 2015
-    df15_raw = pd.read_excel(file_path, sheet_name='2015')
+    df15_raw = pd.read_excel(file_path, sheet_name=sheet_15)
     std_15 = standardizer.normalize(df15_raw, config_15)
-    std_15['year'] = 2015
+    std_15['year'] = int(sheet_15) if str(sheet_15).isdigit() else 2015
     
     # Load 2022
-    df22_raw = pd.read_excel(file_path, sheet_name='2022')
+    df22_raw = pd.read_excel(file_path, sheet_name=sheet_22)
     std_22 = standardizer.normalize(df22_raw, config_22)
-    std_22['year'] = 2022
+    std_22['year'] = int(sheet_22) if str(sheet_22).isdigit() else 2022
     
     return std_15, std_22
 
+# Reference keywords (to exclude from the anomaly dataset)
+REFERENCE_KEYWORDS = ['weld', 'valve', 'tee', 'tap', 'casing', 'agm', 'marker', 'launcher', 'receiver', 'start', 'end']
+
+def is_anomaly(event):
+    e = str(event).lower()
+    # If it contains any reference keyword, it's not an anomaly for the 'anomaly dataset'
+    if any(k in e for k in REFERENCE_KEYWORDS):
+        return False
+    # Otherwise, if it has 'loss', 'cluster', 'pit', 'anom', it's likely an anomaly
+    # Or if it's just not a reference point.
+    # Given the business case, anomalies are typically 'metal loss' etc.
+    return True
+
+def filter_anomalies(df):
+    """
+    Filter for anomalies only.
+    We want to remove reference features (welds, valves, etc.)
+    """
+    return df[df['event_type'].apply(is_anomaly)].copy()
+
 if __name__ == "__main__":
     df15, df22 = load_ili_data('ILIDataV2.xlsx')
     
-    # Filter for anomalies only
-    # We want to remove reference features (welds, valves, etc.)
-    # Reference keywords (to exclude)
-    ref_keywords = ['weld', 'valve', 'tee', 'tap', 'casing', 'agm', 'marker', 'launcher', 'receiver', 'start', 'end']
-    
-    # Filter function
-    def is_anomaly(event):
-        e = str(event).lower()
-        # If it contains any reference keyword, it's not an anomaly for the 'anomaly dataset'
-        if any(k in e for k in ref_keywords):
-            return False
-        # Otherwise, if it has 'loss', 'cluster', 'pit', 'anom', it's likely an anomaly
-        # Or if it's just not a reference point.
-        # Given the business case, anomalies are typically 'metal loss' etc.
-        return True
-
-    df15_anoms = df15[df15['event_type'].apply(is_anomaly)].copy()
-    df22_anoms = df22[df22['event_type'].apply(is_anomaly)].copy()
+    df15_anoms = filter_anomalies(df15)
+    df22_anoms = filter_anomalies(df22)
 
     print(f"2015 Anomalies: {len(df15_anoms)}")
     print(f"2022 Anomalies: {len(df22_anoms)}")
@@ -0,0 +1,299 @@
+"""
+Background Jobs
+Long-running API work (uploads, model training, pipeline runs) runs on a
+background thread as a Job that clients follow over server-sent events
+(/api/jobs/<id>/events) and can cancel.
+
+Progress comes from the same profiling stages as the metrics: every stage
+started or finished on a job's thread becomes a 'stage' event, and stages
+listed in the job's plan count towards its progress and ETA. Work with a
+finer unit (trees trained, rows parsed) calls report_progress().
+
+Both are cancellation points: once a job is cancelled, or every client
+following it has disconnected for ABANDON_AFTER_S, the next stage start or
+progress report raises JobCancelled and the thread stops.
+
+Jobs live in the process that started them. The production config runs
+one threaded worker; with several workers it turns jobs off
+(ILI_ASYNC_JOBS=0, see async_jobs_enabled()) and async requests run
+synchronously instead, unless a sticky load balancer pins each client to
+one worker and ILI_ASYNC_JOBS=1 is set explicitly.
+
+Events (one JSON object each, with an increasing 'id'):
+    {'type': 'state', 'state': 'running' | 'done' | 'failed' | 'cancelled', ...}
+    {'type': 'stage', 'stage': 'pipeline.matching', 'state': 'start' | 'end', 'rows': ..., 'wall_ms': ...}
+    {'type': 'progress', 'done': 40, 'total': 100, 'unit': 'trees', 'eta_s': 3.2}
+"""
+
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from profiling import add_stage_listener
+
+MAX_RUNNING_JOBS = 2            # More jobs wait in 'queued'
+MAX_JOB_EVENTS = 2000           # Events kept per job (oldest dropped)
+JOB_RETENTION_S = 3600          # Finished jobs kept this long for their results
+ABANDON_AFTER_S = 15            # Cancel a job nobody has followed for this long
+SSE_HEARTBEAT_S = 15
+FINISHED_STATES = ('done', 'failed', 'cancelled')
+
+# Stage names that are not job progress (the API's own request timers)
+IGNORED_STAGE_PREFIXES = ('api.',)
+
+_local = threading.local()
+_jobs = OrderedDict()
+_jobs_lock = threading.Lock()
+_slots = threading.BoundedSemaphore(MAX_RUNNING_JOBS)
+
+
+class JobCancelled(Exception):
+    """Raised on a job's thread at the first cancellation point after cancel()."""
+
+
+class Job:
+    """
+    One background operation and its event log.
+
+    Usage:
+        job = start_job('pipeline', run_pipeline, plan=['pipeline.ingest', ...])
+        for event in job.follow():
+            ...
+    """
+
+    def __init__(self, kind, plan=None, meta=None):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.plan = list(plan or [])
+        self.meta = meta or {}
+        self.state = 'queued'
+        self.stage = None
+        self.done = 0
+        self.total = len(self.plan) or None
+        self.unit = 'stages' if self.plan else None
+        self.result = None
+        self.error = None
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.cancel_requested = False
+        self.events = []
+        self._seq = 0
+        self._cond = threading.Condition()
+        self._followers = 0
+        self._ever_followed = False
+        self._last_followed = time.time()
+
+    # --- Events -------------------------------------------------------------
+
+    def emit(self, type, **data):
+        with self._cond:
+            self._seq += 1
+            self.events.append({'id': self._seq, 'type': type, 'ts': time.time(), **data})
+            if len(self.events) > MAX_JOB_EVENTS:
+                del self.events[:len(self.events) - MAX_JOB_EVENTS]
+            self._cond.notify_all()
+
+    def events_after(self, last_id, timeout=None):
+        """Events with id > last_id, waiting up to timeout for one to arrive."""
+        with self._cond:
+            if self._seq <= last_id and self.state not in FINISHED_STATES:
+                self._cond.wait(timeout)
+            return [e for e in self.events if e['id'] > last_id]
+
+    def follow(self, last_id=0, heartbeat=SSE_HEARTBEAT_S):
+        """
+        Yield events as they happen until the job finishes; None every
+        heartbeat seconds without one. Counts as a follower while iterated.
+        """
+        with self._cond:
+            self._followers += 1
+            self._ever_followed = True
+        try:
+            while True:
+                events = self.events_after(last_id, timeout=heartbeat)
+                if not events:
+                    if self.state in FINISHED_STATES:
+                        return
+                    yield None
+                for event in events:
+                    last_id = event['id']
+                    yield event
+        finally:
+            with self._cond:
+                self._followers -= 1
+                self._last_followed = time.time()
+
+    # --- Progress and cancellation -----------------------------------------
+
+    def eta(self):
+        """Seconds left, extrapolated from the progress so far (None if unknown)."""
+        if not self.total or not self.done or self.started is None:
+            return None
+        elapsed = time.time() - self.started
+        return round(elapsed / self.done * (self.total - self.done), 1)
+
+    def progress(self, done, total=None, unit=None):
+        self.check()
+        self.done = done
+        if total is not None:
+            self.total = total
+        if unit is not None:
+            self.unit = unit
+        self.emit('progress', done=self.done, total=self.total, unit=self.unit, eta_s=self.eta())
+
+    def abandoned(self):
+        """True once a followed job has had no followers for ABANDON_AFTER_S."""
+        return (self._ever_followed and self._followers == 0
+                and time.time() - self._last_followed > ABANDON_AFTER_S)
+
+    def check(self):
+        """Cancellation point: raise JobCancelled if the job should stop."""
+        if not self.cancel_requested and self.abandoned():
+            self.cancel_requested = True
+        if self.cancel_requested:
+            raise JobCancelled()
+
+    def cancel(self):
+        """Ask the job to stop at its next cancellation point (queued jobs never start)."""
+        self.cancel_requested = True
+        self.emit('cancel_requested')
+
+    def on_stage(self, event, stage):
+        if stage.name.startswith(IGNORED_STAGE_PREFIXES):
+            return
+        if event == 'start':
+            self.check()
+            self.stage = stage.name
+            self.emit('stage', stage=stage.name, state='start')
+            return
+        record = stage.record or {}
+        self.emit('stage', stage=stage.name, state='end', rows=record.get('rows'),
+                  wall_ms=record.get('wall_ms'), error=record.get('error'))
+        if stage.name in self.plan and record.get('error') is None:
+            self.done += 1
+            self.emit('progress', done=self.done, total=self.total, unit=self.unit, eta_s=self.eta())
+
+    def snapshot(self):
+        return {
+            'job_id': self.id,
+            'kind': self.kind,
+            'state': self.state,
+            'stage': self.stage,
+            'done': self.done,
+            'total': self.total,
+            'unit': self.unit,
+            'eta_s': self.eta() if self.state == 'running' else None,
+            'error': self.error,
+            'created': self.created,
+            'started': self.started,
+            'finished': self.finished,
+        }
+
+    # --- Execution ----------------------------------------------------------
+
+    def _run(self, fn, args, kwargs):
+        with _slots:
+            if self.cancel_requested:
+                self._finish('cancelled')
+                return
+            self.started = time.time()
+            self.state = 'running'
+            self.emit('state', state='running')
+            _local.job = self
+            try:
+                self.result = fn(*args, **kwargs)
+                self._finish('done')
+            except JobCancelled:
+                self._finish('cancelled')
+            except Exception as e:
+                self.error = str(e)
+                self._finish('failed', error=self.error)
+            finally:
+                _local.job = None
+
+    def _finish(self, state, **data):
+        # State and final event change together, so followers never see a
+        # finished job without its last event
+        with self._cond:
+            self.state = state
+            self.finished = time.time()
+            self.emit('state', state=state, elapsed_s=round(self.finished - (self.started or self.created), 3), **data)
+
+
+def async_jobs_enabled():
+    """
+    Whether async requests may start jobs. False when ILI_ASYNC_JOBS=0, as
+    the production config sets for more than one worker: a job's events and
+    result are only found by requests that reach the worker running it.
+    """
+    return os.environ.get('ILI_ASYNC_JOBS', '1') != '0'
+
+
+def current_job():
+    """The job running on this thread, or None."""
+    return getattr(_local, 'job', None)
+
+
+def report_progress(done, total=None, unit=None):
+    """Progress of the current job (a no-op outside jobs). Also a cancellation point."""
+    job = current_job()
+    if job is not None:
+        job.progress(done, total=total, unit=unit)
+
+
+def check_cancelled():
+    """Cancellation point for loops with no progress to report (no-op outside jobs)."""
+    job = current_job()
+    if job is not None:
+        job.check()
+
+
+def _on_stage(event, stage):
+    job = current_job()
+    if job is not None:
+        job.on_stage(event, stage)
+
+
+add_stage_listener(_on_stage)
+
+
+def _purge_finished():
+    cutoff = time.time() - JOB_RETENTION_S
+    with _jobs_lock:
+        for job_id in [j.id for j in _jobs.values() if j.finished is not None and j.finished < cutoff]:
+            del _jobs[job_id]
+
+
+def start_job(kind, fn, *args, plan=None, meta=None, **kwargs):
+    """
+    Run fn(*args, **kwargs) on a background thread as a job.
+
+    Args:
+        kind: Job type ('upload', 'predict', 'pipeline')
+        fn: The work; its return value becomes job.result
+        plan: Stage names whose completion measures progress
+        meta: Extra job attributes (e.g. request options for the result)
+
+    Returns:
+        Job
+    """
+    _purge_finished()
+    job = Job(kind, plan=plan, meta=meta)
+    with _jobs_lock:
+        _jobs[job.id] = job
+    threading.Thread(target=job._run, args=(fn, args, kwargs), name=f'job-{kind}-{job.id[:8]}',
+                     daemon=True).start()
+    return job
+
+
+def get_job(job_id):
+    with _jobs_lock:
+        return _jobs.get(job_id)
+
+
+def list_jobs():
+    with _jobs_lock:
+        return [job.snapshot() for job in _jobs.values()]
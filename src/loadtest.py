@@ -0,0 +1,374 @@
+"""
+API Load Test
+Launches the upload API locally against a scratch copy of the processed
+data and replays a weighted mix of preview, upload, load_demo and predict
+requests at a configurable concurrency, using synthetic run files of
+several sizes. Reports throughput, latency percentiles, error rates and
+peak RSS of every server process.
+
+Usage:
+    python src/loadtest.py --concurrency 8 --requests 200
+    python src/loadtest.py --mix upload=3,predict=1 --sizes 1000 20000
+    python src/loadtest.py --mode gunicorn --workers 4
+    python src/loadtest.py --url http://localhost:5000   # existing server
+"""
+
+import argparse
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from synthetic import generate_run_pair
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SRC_DIR = os.path.join(ROOT_DIR, 'src')
+
+DEFAULT_MIX = {'preview': 2, 'upload': 3, 'load_demo': 1, 'predict': 1}
+DEFAULT_SIZES = (100, 1_000, 10_000)    # Rows of generated upload files
+DEFAULT_PORT = 5057
+PERCENTILES = (50, 90, 99)
+
+# Processed files the predict and report endpoints read
+SEED_FILES = ['matched_anomalies.csv', 'standardized_2015.csv', 'aligned_2022.csv',
+              'final_growth_report.csv']
+
+# Server launch commands per serving mode ({port} and {workers} are filled in)
+SERVER_MODES = {
+    'dev': [sys.executable, '-c',
+            "import upload_api; upload_api.app.run(host='127.0.0.1', port={port}, threaded=True)"],
+    'gunicorn': [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py',
+                 '--bind', '127.0.0.1:{port}', '--workers', '{workers}', 'wsgi:app'],
+}
+
+RSS_SAMPLE_SECONDS = 0.2
+
+
+def prepare_data_dir(scratch_dir):
+    """Copy the processed inputs into a scratch data dir the server can overwrite."""
+    processed = os.path.join(scratch_dir, 'data', 'processed')
+    os.makedirs(processed, exist_ok=True)
+    for name in SEED_FILES:
+        src = os.path.join(ROOT_DIR, 'data', 'processed', name)
+        if os.path.exists(src):
+            shutil.copy(src, processed)
+    model = os.path.join(ROOT_DIR, 'data', 'models', 'growth_model.pkl')
+    if os.path.exists(model):
+        os.makedirs(os.path.join(scratch_dir, 'data', 'models'), exist_ok=True)
+        shutil.copy(model, os.path.join(scratch_dir, 'data', 'models'))
+    return os.path.join(scratch_dir, 'data')
+
+
+def generate_files(sizes, out_dir, seed=0):
+    """
+    Write synthetic 2022 runs as upload CSVs.
+
+    Returns:
+        dict of size -> file bytes
+    """
+    files = {}
+    for size in sizes:
+        _, run22 = generate_run_pair(size, seed=seed)
+        path = os.path.join(out_dir, f'run_{size}.csv')
+        run22.drop(columns=['anomaly_id', 'year']).to_csv(path, index=False)
+        with open(path, 'rb') as f:
+            files[size] = f.read()
+    return files
+
+
+def start_server(mode, port, data_dir, upload_dir, workers=None):
+    """Launch the API and wait for /api/health."""
+    cmd = [part.format(port=port, workers=workers or 1) for part in SERVER_MODES[mode]]
+    env = dict(os.environ, ILI_DATA_DIR=data_dir, ILI_UPLOAD_DIR=upload_dir,
+               PYTHONUNBUFFERED='1')
+    proc = subprocess.Popen(cmd, cwd=SRC_DIR, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    url = f'http://127.0.0.1:{port}'
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"Server exited with code {proc.returncode}")
+        try:
+            with urllib.request.urlopen(f'{url}/api/health', timeout=1) as resp:
+                if resp.status == 200:
+                    return proc, url
+        except (urllib.error.URLError, ConnectionError, OSError):
+            time.sleep(0.2)
+    proc.terminate()
+    raise RuntimeError("Server did not become healthy within 60 s")
+
+
+def _process_tree(pid):
+    """PIDs of a process and all its descendants (Linux /proc)."""
+    children = {}
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat') as f:
+                ppid = int(f.read().rsplit(')', 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children.setdefault(ppid, []).append(int(entry))
+    tree, pending = [], [pid]
+    while pending:
+        current = pending.pop()
+        tree.append(current)
+        pending.extend(children.get(current, []))
+    return tree
+
+
+def _peak_rss_kb(pid):
+    """Peak resident set size (VmHWM) of a process in KB, None if gone."""
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])
+    except OSError:
+        return None
+    return None
+
+
+class RssMonitor:
+    """Samples the peak RSS of every process in the server's tree."""
+
+    def __init__(self, pid):
+        self.pid = pid
+        self.peaks = {}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _sample(self):
+        if not os.path.exists('/proc'):
+            return
+        for pid in _process_tree(self.pid):
+            rss = _peak_rss_kb(pid)
+            if rss is not None:
+                self.peaks[pid] = max(self.peaks.get(pid, 0), rss)
+
+    def _run(self):
+        while not self._stop.wait(RSS_SAMPLE_SECONDS):
+            self._sample()
+
+    def start(self):
+        self._sample()
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._sample()
+        self._stop.set()
+        self._thread.join()
+        return self.peaks
+
+
+def _multipart(fields, filename, data):
+    boundary = uuid.uuid4().hex
+    parts = [
+        f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode()
+        for name, value in fields.items()
+    ]
+    parts.append(
+        f'--{boundary}\r\nContent-Disposition: form-data; name="file"; filename="{filename}"\r\n'
+        f'Content-Type: text/csv\r\n\r\n'.encode() + data + b'\r\n'
+    )
+    parts.append(f'--{boundary}--\r\n'.encode())
+    return b''.join(parts), f'multipart/form-data; boundary={boundary}'
+
+
+def send_request(url, kind, size=None, data=None, timeout=300):
+    """
+    Send one request of the given kind.
+
+    Returns:
+        dict with kind, size, status, latency_ms, bytes (status 0 on connection errors)
+    """
+    if kind in ('preview', 'upload'):
+        # Unique names: the API stores uploads under their (secured) filename
+        body, content_type = _multipart({'year': 2022}, f'run_{size}_{uuid.uuid4().hex[:8]}.csv', data)
+    elif kind == 'predict':
+        body, content_type = json.dumps({'years': 7}).encode(), 'application/json'
+    else:
+        body, content_type = b'', 'application/json'
+
+    req = urllib.request.Request(f'{url}/api/{kind}', data=body, method='POST',
+                                 headers={'Content-Type': content_type})
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as resp:
+            payload = resp.read()
+            status = resp.status
+    except urllib.error.HTTPError as e:
+        payload = e.read()
+        status = e.code
+    except (urllib.error.URLError, ConnectionError, OSError):
+        payload = b''
+        status = 0
+    return {
+        'kind': kind,
+        'size': size,
+        'status': status,
+        'latency_ms': 1000 * (time.perf_counter() - start),
+        'bytes': len(payload),
+    }
+
+
+def build_schedule(mix, n_requests, sizes, seed=0):
+    """Weighted random sequence of (kind, size) requests."""
+    rng = random.Random(seed)
+    kinds = list(mix)
+    weights = [mix[k] for k in kinds]
+    schedule = []
+    for _ in range(n_requests):
+        kind = rng.choices(kinds, weights)[0]
+        schedule.append((kind, rng.choice(sizes) if kind in ('preview', 'upload') else None))
+    return schedule
+
+
+def run_load(url, schedule, files, concurrency):
+    """
+    Replay the schedule with a pool of concurrent clients.
+
+    Returns:
+        (list of request results, elapsed seconds)
+    """
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(
+            lambda item: send_request(url, item[0], item[1], files.get(item[1])),
+            schedule
+        ))
+    return results, time.perf_counter() - start
+
+
+def summarize(results, elapsed):
+    """Throughput, latency percentiles and error rate, overall and per request kind."""
+    def stats(rows):
+        latencies = np.array([r['latency_ms'] for r in rows])
+        errors = sum(1 for r in rows if r['status'] == 0 or r['status'] >= 400)
+        entry = {
+            'requests': len(rows),
+            'errors': errors,
+            'error_rate': errors / len(rows) if rows else 0.0,
+            'throughput_rps': len(rows) / elapsed if elapsed else 0.0,
+        }
+        if len(rows):
+            for p, v in zip(PERCENTILES, np.percentile(latencies, PERCENTILES)):
+                entry[f'p{p}_ms'] = round(float(v), 2)
+            entry['max_ms'] = round(float(latencies.max()), 2)
+        return entry
+
+    summary = {'overall': stats(results), 'by_kind': {}}
+    for kind in sorted({r['kind'] for r in results}):
+        summary['by_kind'][kind] = stats([r for r in results if r['kind'] == kind])
+    for size in sorted({r['size'] for r in results if r['size'] is not None}):
+        summary['by_kind'][f'upload/preview {size} rows'] = stats(
+            [r for r in results if r['size'] == size])
+    summary['elapsed_s'] = round(elapsed, 3)
+    return summary
+
+
+def print_summary(summary, rss_peaks=None):
+    print(f"\n{'requests':<28}{'count':>7}{'errors':>8}{'rps':>9}" +
+          ''.join(f"{f'p{p}':>10}" for p in PERCENTILES) + f"{'max':>10}")
+    rows = [('overall', summary['overall'])] + list(summary['by_kind'].items())
+    for name, s in rows:
+        lat = ''.join(f"{s.get(f'p{p}_ms', float('nan')):>8.1f}ms" for p in PERCENTILES)
+        print(f"{name:<28}{s['requests']:>7}{s['errors']:>8}{s['throughput_rps']:>9.2f}{lat}"
+              f"{s.get('max_ms', float('nan')):>8.1f}ms")
+    print(f"\nElapsed: {summary['elapsed_s']:.2f} s")
+    if rss_peaks:
+        print("Peak RSS per server process:")
+        for pid, kb in sorted(rss_peaks.items()):
+            print(f"  pid {pid}: {kb / 1024:.0f} MB")
+
+
+def parse_mix(text):
+    """'upload=3,predict=1' -> {'upload': 3.0, 'predict': 1.0}"""
+    mix = {}
+    for item in text.split(','):
+        kind, _, weight = item.partition('=')
+        kind = kind.strip()
+        if kind not in DEFAULT_MIX:
+            raise ValueError(f"Unknown request kind '{kind}'. Available: {', '.join(DEFAULT_MIX)}")
+        mix[kind] = float(weight or 1)
+    return mix
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Load test the upload API')
+    parser.add_argument('--mode', choices=sorted(SERVER_MODES), default='dev', help='How to launch the server')
+    parser.add_argument('--workers', type=int, default=None, help='Server worker processes (multi-worker modes)')
+    parser.add_argument('--url', default=None, help='Target an already running server instead of launching one')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--requests', type=int, default=100)
+    parser.add_argument('--warmup', type=int, default=4, help='Unmeasured requests before the run')
+    parser.add_argument('--mix', type=parse_mix, default=DEFAULT_MIX,
+                        help="Request weights, e.g. 'preview=2,upload=3,load_demo=1,predict=1'")
+    parser.add_argument('--sizes', type=int, nargs='+', default=list(DEFAULT_SIZES),
+                        help='Rows of the generated upload files')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default=None, help='Write the summary as JSON')
+    args = parser.parse_args()
+
+    scratch = tempfile.mkdtemp(prefix='ili-loadtest-')
+    proc = None
+    try:
+        print(f"Generating upload files ({', '.join(str(s) for s in args.sizes)} anomalies)...")
+        files = generate_files(args.sizes, scratch, seed=args.seed)
+
+        url = args.url
+        monitor = None
+        if url is None:
+            data_dir = prepare_data_dir(scratch)
+            upload_dir = os.path.join(scratch, 'uploads')
+            print(f"Starting API ({args.mode}) on port {args.port}...")
+            proc, url = start_server(args.mode, args.port, data_dir, upload_dir, args.workers)
+            monitor = RssMonitor(proc.pid).start()
+
+        schedule = build_schedule(args.mix, args.requests, args.sizes, seed=args.seed)
+        if args.warmup:
+            run_load(url, build_schedule(args.mix, args.warmup, args.sizes, seed=args.seed + 1),
+                     files, args.concurrency)
+
+        print(f"Replaying {args.requests} requests at concurrency {args.concurrency}...")
+        results, elapsed = run_load(url, schedule, files, args.concurrency)
+        summary = summarize(results, elapsed)
+        rss_peaks = monitor.stop() if monitor else None
+        summary['config'] = {'mode': args.mode if args.url is None else 'external', 'workers': args.workers,
+                             'concurrency': args.concurrency, 'mix': args.mix, 'sizes': args.sizes}
+        summary['peak_rss_mb'] = {str(pid): round(kb / 1024, 1) for pid, kb in (rss_peaks or {}).items()}
+
+        # Server-side per-endpoint timings, when the server exposes them
+        try:
+            with urllib.request.urlopen(f'{url}/api/metrics?prefix=api.', timeout=5) as resp:
+                summary['server_metrics'] = json.loads(resp.read()).get('stages')
+        except (urllib.error.URLError, OSError, ValueError):
+            pass
+
+        print_summary(summary, rss_peaks)
+        if args.output:
+            with open(args.output, 'w') as f:
+                json.dump(summary, f, indent=2)
+            print(f"Saved summary to {args.output}")
+    finally:
+        if proc is not None:
+            proc.terminate()
+            try:
+                proc.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+        shutil.rmtree(scratch, ignore_errors=True)
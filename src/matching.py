@@ -1,86 +1,289 @@
 import pandas as pd
 import numpy as np
-from scipy.spatial import distance_matrix
-from scipy.optimize import linear_sum_assignment
 
+from profiling import profiled
+from anomaly_store import load_store
+
+# Matching parameters
+DISTANCE_TOLERANCE_FT = 5.0    # Hard constraint on aligned distance shift
+ORIENTATION_SCALE_DEG = 30.0   # Degrees per ft-equivalent in the cost (1 clock hour ~ 1 ft)
+IMPOSSIBLE_COST = 1e6          # Cost of a pair outside the hard constraints
+INSPECTION_INTERVAL_YEARS = 7.0
+SEGMENT_FT = 5280.0            # Minimum segment length when matching run files
+
+def build_candidate_graph(dist15, orient15, dist22, orient22, max_tolerance=DISTANCE_TOLERANCE_FT):
+    """
+    Build the sparse candidate graph of (2015, 2022) pairs whose distance
+    difference is within max_tolerance, using a sort-and-search sweep instead
+    of a dense pairwise matrix.
+
+    The graph keeps the raw distance and orientation deltas so it can be
+    reused for any tolerance <= max_tolerance and any orientation scale.
+
+    Args:
+        dist15, orient15: 2015 distances (ft) and orientations (deg)
+        dist22, orient22: 2022 aligned distances (ft) and orientations (deg)
+        max_tolerance: Widest distance tolerance the graph must support (ft)
+
+    Returns:
+        dict with 'rows', 'cols', 'dist_diff', 'orient_delta' edge arrays,
+        plus 'n15', 'n22' and 'max_tolerance'
+    """
+    dist15 = np.asarray(dist15, dtype=float)
+    dist22 = np.asarray(dist22, dtype=float)
+    orient15 = np.asarray(orient15, dtype=float)
+    orient22 = np.asarray(orient22, dtype=float)
+
+    # For each 2015 anomaly, find the window of 2022 anomalies within tolerance
+    order22 = np.argsort(dist22, kind='stable')
+    sorted22 = dist22[order22]
+    lo = np.searchsorted(sorted22, dist15 - max_tolerance, side='left')
+    hi = np.searchsorted(sorted22, dist15 + max_tolerance, side='right')
+    counts = np.maximum(hi - lo, 0)
+
+    # Expand the windows into edge lists without a Python loop
+    rows = np.repeat(np.arange(len(dist15)), counts)
+    starts = np.repeat(lo - np.concatenate(([0], np.cumsum(counts)[:-1])), counts)
+    cols = order22[starts + np.arange(counts.sum())]
+
+    return {
+        'rows': rows,
+        'cols': cols,
+        'dist_diff': np.abs(dist15[rows] - dist22[cols]),
+        'orient_delta': orient15[rows] - orient22[cols],
+        'n15': len(dist15),
+        'n22': len(dist22),
+        'max_tolerance': max_tolerance,
+    }
+
+def edge_costs(graph, orient_scale=ORIENTATION_SCALE_DEG):
+    """Euclidean cost of each candidate edge in (ft, orientation / scale) space."""
+    return np.sqrt(graph['dist_diff'] ** 2 + (graph['orient_delta'] / orient_scale) ** 2)
+
+def solve_assignment(graph, tolerance=DISTANCE_TOLERANCE_FT, orient_scale=ORIENTATION_SCALE_DEG):
+    """
+    Solve the optimal one-to-one assignment on the candidate graph.
+
+    Pairs outside the tolerance cost IMPOSSIBLE_COST, so the problem splits
+    into independent connected components; each one is solved with the
+    Hungarian algorithm on its own small dense matrix.
+
+    Args:
+        graph: Candidate graph from build_candidate_graph()
+        tolerance: Distance tolerance to apply (must be <= graph max_tolerance)
+        orient_scale: Degrees per ft-equivalent in the cost
+
+    Returns:
+        Tuple of (rows, cols, costs) arrays for the matched pairs, sorted by row
+    """
+    if tolerance > graph['max_tolerance']:
+        raise ValueError(f"Tolerance {tolerance} exceeds candidate graph tolerance {graph['max_tolerance']}")
+
+    from scipy.optimize import linear_sum_assignment
+    from scipy.sparse import coo_matrix
+    from scipy.sparse.csgraph import connected_components
+
+    n15, n22 = graph['n15'], graph['n22']
+    costs = edge_costs(graph, orient_scale)
+    keep = (graph['dist_diff'] <= tolerance) & np.isfinite(costs)
+    rows, cols, costs = graph['rows'][keep], graph['cols'][keep], costs[keep]
+    if len(rows) == 0:
+        empty = np.array([], dtype=int)
+        return empty, empty, np.array([], dtype=float)
+
+    # Connected components of the bipartite graph (2022 nodes offset by n15)
+    adjacency = coo_matrix((np.ones(len(rows)), (rows, cols + n15)), shape=(n15 + n22, n15 + n22))
+    _, labels = connected_components(adjacency, directed=False)
+    edge_label = labels[rows]
+
+    # Components with a single edge are matched directly
+    comp_sizes = np.bincount(edge_label)
+    single = comp_sizes[edge_label] == 1
+    out_rows = [rows[single]]
+    out_cols = [cols[single]]
+    out_costs = [costs[single]]
+
+    # Solve the remaining components one dense block at a time
+    multi = ~single
+    m_rows, m_cols, m_costs, m_label = rows[multi], cols[multi], costs[multi], edge_label[multi]
+    order = np.argsort(m_label, kind='stable')
+    m_rows, m_cols, m_costs, m_label = m_rows[order], m_cols[order], m_costs[order], m_label[order]
+    bounds = np.flatnonzero(np.diff(m_label)) + 1
+    for start, end in zip(np.concatenate(([0], bounds)), np.concatenate((bounds, [len(m_label)]))):
+        if start == end:
+            continue
+        r_ids, r_local = np.unique(m_rows[start:end], return_inverse=True)
+        c_ids, c_local = np.unique(m_cols[start:end], return_inverse=True)
+        block = np.full((len(r_ids), len(c_ids)), IMPOSSIBLE_COST)
+        block[r_local, c_local] = m_costs[start:end]
+        r, c = linear_sum_assignment(block)
+        cost = block[r, c]
+        ok = cost < IMPOSSIBLE_COST / 10
+        out_rows.append(r_ids[r[ok]])
+        out_cols.append(c_ids[c[ok]])
+        out_costs.append(cost[ok])
+
+    rows = np.concatenate(out_rows)
+    cols = np.concatenate(out_cols)
+    costs = np.concatenate(out_costs)
+    order = np.argsort(rows, kind='stable')
+    return rows[order], cols[order], costs[order]
+
+def build_matches(anoms15, anoms22, rows, cols, costs, interval=INSPECTION_INTERVAL_YEARS):
+    """
+    Build the matched-anomaly table for assigned (2015 row, 2022 row) pairs.
+    'index_22' keeps the 2022 row's index label, the key later stages join
+    per-feature results on (distances are not unique).
+
+    Returns:
+        DataFrame with the matched_anomalies.csv columns
+    """
+    depth15 = anoms15['depth'].to_numpy(dtype=float)[rows]
+    depth22 = anoms22['depth'].to_numpy(dtype=float)[cols]
+
+    # Calculate Growth
+    depth_growth = depth22 - depth15
+
+    return pd.DataFrame({
+        'joint': anoms15['joint_number'].to_numpy()[rows],
+        'dist_15': anoms15['distance'].to_numpy()[rows],
+        'dist_22_aligned': anoms22['distance_aligned'].to_numpy()[cols],
+        'orient_15': anoms15['orientation'].to_numpy()[rows],
+        'orient_22': anoms22['orientation'].to_numpy()[cols],
+        'depth_15': depth15,
+        'depth_22': depth22,
+        'growth': depth_growth,
+        'annual_growth_rate': depth_growth / interval,
+        'match_cost': costs,
+        'index_22': anoms22.index.to_numpy()[cols]
+    })
+
+def candidate_graph_for(anoms15, anoms22, max_tolerance=DISTANCE_TOLERANCE_FT):
+    """Candidate graph for filtered 2015 / aligned 2022 anomaly frames."""
+    return build_candidate_graph(
+        anoms15['distance'].to_numpy(dtype=float),
+        anoms15['orientation'].to_numpy(dtype=float),
+        anoms22['distance_aligned'].to_numpy(dtype=float),
+        anoms22['orientation'].to_numpy(dtype=float),
+        max_tolerance=max_tolerance
+    )
+
+def match_frames(anoms15, anoms22, tolerance=DISTANCE_TOLERANCE_FT,
+                 orient_scale=ORIENTATION_SCALE_DEG, graph=None,
+                 interval=INSPECTION_INTERVAL_YEARS):
+    """
+    Match two in-memory anomaly frames.
+
+    Args:
+        anoms15: 2015 anomalies (distance, orientation, depth, joint_number)
+        anoms22: 2022 anomalies (distance_aligned, orientation, depth)
+        tolerance: Distance tolerance (ft)
+        orient_scale: Degrees per ft-equivalent in the cost
+        graph: Optional prebuilt candidate graph (reused if wide enough)
+        interval: Years between the two runs
+
+    Returns:
+        DataFrame of matched anomalies
+    """
+    if graph is None or graph['max_tolerance'] < tolerance:
+        graph = candidate_graph_for(anoms15, anoms22, tolerance)
+    rows, cols, costs = solve_assignment(graph, tolerance, orient_scale)
+    return build_matches(anoms15, anoms22, rows, cols, costs, interval)
+
+def segment_bounds(dist15, dist22, tolerance=DISTANCE_TOLERANCE_FT, segment_ft=SEGMENT_FT):
+    """
+    Cut points splitting a line into segments at least segment_ft long
+    that no candidate pair crosses: each cut sits in a gap wider than the
+    tolerance between consecutive anomalies of either run, so matching
+    the segments separately gives the same assignment as matching the
+    whole line.
+
+    Returns:
+        Sorted array of cut distances (ft)
+    """
+    both = np.concatenate((np.asarray(dist15, dtype=float), np.asarray(dist22, dtype=float)))
+    both = np.sort(both[np.isfinite(both)])
+    if len(both) < 2:
+        return np.array([])
+    gaps = np.flatnonzero(np.diff(both) > tolerance)
+    midpoints = (both[gaps] + both[gaps + 1]) / 2
+
+    cuts, start = [], both[0]
+    for cut in midpoints:
+        if cut - start >= segment_ft:
+            cuts.append(cut)
+            start = cut
+    return np.array(cuts)
+
+def match_run_files(run15, run22, tolerance=DISTANCE_TOLERANCE_FT,
+                    orient_scale=ORIENTATION_SCALE_DEG, interval=INSPECTION_INTERVAL_YEARS,
+                    segment_ft=SEGMENT_FT):
+    """
+    Match the metal loss anomalies of two memory-mapped run files segment by
+    segment, so only one segment's rows are in memory at a time.
+
+    Args:
+        run15: RunFile of the 2015 run (distance)
+        run22: RunFile of the aligned 2022 run (distance_aligned)
+        tolerance, orient_scale, interval: As for match_frames()
+        segment_ft: Minimum segment length (ft)
+
+    Returns:
+        DataFrame of matched anomalies, in 2015 distance order; index_22 is
+        the row (position) of the 2022 anomaly in run22
+    """
+    ml15 = run15.category_rows('metal_loss')
+    ml22 = run22.category_rows('metal_loss')
+    cuts = segment_bounds(run15.column('distance')[ml15], run22.column('distance_aligned')[ml22],
+                          tolerance, segment_ft)
+
+    columns15 = ['joint_number', 'distance', 'orientation', 'depth']
+    columns22 = ['distance_aligned', 'orientation', 'depth']
+    bounds = np.concatenate(([-np.inf], cuts, [np.inf]))
+    segments = []
+    for lo, hi in zip(bounds[:-1], bounds[1:]):
+        # Segment frames keep their run rows as index, so index_22 names a run row
+        rows15 = run15.category_rows('metal_loss', run15.interval(lo, hi))
+        rows22 = run22.category_rows('metal_loss', run22.interval(lo, hi))
+        anoms15 = run15.frame(rows15, columns=columns15).set_axis(rows15)
+        anoms22 = run22.frame(rows22, columns=columns22).set_axis(rows22)
+        if len(anoms15) and len(anoms22):
+            segments.append(match_frames(anoms15, anoms22, tolerance=tolerance,
+                                         orient_scale=orient_scale, interval=interval))
+    if not segments:
+        empty = np.array([], dtype=int)
+        return build_matches(run15.frame(empty, columns=columns15), run22.frame(empty, columns=columns22),
+                             empty, empty, np.array([], dtype=float), interval)
+    return pd.concat(segments, ignore_index=True)
+
+@profiled('matching.match_anomalies')
 def match_anomalies():
     print("Matching Anomalies using Hungarian Algorithm...")
-    
+
     # 1. Load Data
-    df15 = pd.read_csv('data/processed/standardized_2015.csv')
-    df22 = pd.read_csv('data/processed/aligned_2022.csv')
-    
-    # Filter for 'metal loss' only for matching (or include all anomalies)
-    # Let's focus on metal loss as per business case
-    anoms15 = df15[df15['event_type'].str.contains('metal loss', na=False)].copy()
-    anoms22 = df22[df22['event_type'].str.contains('metal loss', na=False)].copy()
-    
+    # Metal loss only for matching, as per business case (the store's
+    # precomputed 'metal_loss' category)
+    anoms15 = load_store('data/processed/standardized_2015.csv').subset('metal_loss')
+    anoms22 = load_store('data/processed/aligned_2022.csv').subset('metal_loss')
+
     print(f"Candidates 2015: {len(anoms15)}")
     print(f"Candidates 2022: {len(anoms22)}")
-    
-    # 2. Build Cost Matrix
+
+    # 2. Candidate Graph + Hard Constraints
     # We use distance and orientation as the primary spatial keys
-    # Orientation 0-360 is scaled to match ft influence
-    # 1 ft roughly equivalent to 10 degrees? Let's use 1ft ~ 30deg (1 hour)
-    
-    coords15 = np.column_stack([
-        anoms15['distance'],
-        anoms15['orientation'] / 30.0 # Scale hours to ft-equivalent
-    ])
-    
-    coords22 = np.column_stack([
-        anoms22['distance_aligned'],
-        anoms22['orientation'] / 30.0
-    ])
-    
-    # Pairwise distance matrix
-    d_mat = distance_matrix(coords15, coords22)
-    
-    # 3. Hard Constraints
-    # Distance tolerance (e.g. 5.0 ft)
-    # If distance shift is more than 5ft after alignment, it's likely a new anomaly
-    dist_diffs = np.abs(np.subtract.outer(anoms15['distance'].values, anoms22['distance_aligned'].values))
-    impossible_mask = dist_diffs > 5.0
-    d_mat[impossible_mask] = 1e6
-    
-    # 4. Solve Assignment
-    row_ind, col_ind = linear_sum_assignment(d_mat)
-    
-    # 5. Extract Matches
-    matched_results = []
-    
-    for r, c in zip(row_ind, col_ind):
-        cost = d_mat[r, c]
-        if cost >= 1e5:
-            continue
-            
-        row15 = anoms15.iloc[r]
-        row22 = anoms22.iloc[c]
-        
-        # Calculate Growth
-        depth_growth = row22['depth'] - row15['depth']
-        
-        matched_results.append({
-            'joint': row15['joint_number'],
-            'dist_15': row15['distance'],
-            'dist_22_aligned': row22['distance_aligned'],
-            'orient_15': row15['orientation'],
-            'orient_22': row22['orientation'],
-            'depth_15': row15['depth'],
-            'depth_22': row22['depth'],
-            'growth': depth_growth,
-            'annual_growth_rate': depth_growth / 7.0,
-            'match_cost': cost
-        })
-        
-    results_df = pd.DataFrame(matched_results)
-    
-    # 6. Save Matches
+    # Orientation 0-360 is scaled to match ft influence (1ft ~ 30deg, 1 hour)
+    # If distance shift is more than 5ft after alignment, it's likely a new anomaly,
+    # so only pairs within the tolerance are ever considered
+
+    # 3. Solve Assignment
+    results_df = match_frames(anoms15, anoms22)
+
+    # 4. Save Matches
     results_df.to_csv('data/processed/matched_anomalies.csv', index=False)
-    
+
     print(f"Matched {len(results_df)} anomalies.")
     print(f"Average Growth: {results_df['growth'].mean():.2f} %")
-    
+
     return results_df
 
 if __name__ == "__main__":
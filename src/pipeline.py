@@ -0,0 +1,509 @@
+"""
+In-Memory Pipeline Runner
+Runs ingestion -> references -> master reference -> alignment -> matching
+-> validation -> clustering -> report as a dependency graph of stages that pass DataFrames
+in memory instead of CSV files in data/processed/.
+
+Each stage's output is cached under a hash of its parameters and of the
+content of its inputs, so a re-run only executes the stages whose inputs
+actually changed. Intermediate files are only written on export.
+"""
+
+import argparse
+import copy
+import hashlib
+import os
+import pickle
+import time
+
+import pandas as pd
+
+import ingestion
+import reference
+import create_master
+import alignment
+import matching
+import clustering
+import remaining_strength
+import geo
+from validation import validate_frame, DISTANCE_TOLERANCE_FT, ORIENTATION_TOLERANCE_DEG
+from analytics import (
+    CONFIDENCE_WEIGHTS, REVIEW_THRESHOLDS,
+    build_report, find_exceptions, build_ui_payload, ui_payload_frame, report_csv_frame
+)
+from tiles import build_tile_pyramid, save_tile_pyramid
+from columnar import write_columnar
+from anomaly_store import filter_category
+from runfile import write_run_file, RUN_FILE_EXT
+from profiling import stage as profile_stage, enable_profiler, enable_memory_tracing, configure_logging
+
+# Paths are resolved from the repository root so the runner works from any directory
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_SOURCE = os.path.join(ROOT_DIR, 'ILIDataV2.xlsx')
+DEFAULT_OUTPUT_DIR = os.path.join(ROOT_DIR, 'data')
+
+DEFAULT_PARAMS = {
+    # Path to the ILI workbook, or a (df15, df22) tuple of standardized runs
+    'source': DEFAULT_SOURCE,
+    'match_tolerance': matching.DISTANCE_TOLERANCE_FT,
+    'orient_scale': matching.ORIENTATION_SCALE_DEG,
+    'dist_tolerance': DISTANCE_TOLERANCE_FT,
+    'orient_tolerance': ORIENTATION_TOLERANCE_DEG,
+    'depth_tolerance': None,
+    'confidence_weights': CONFIDENCE_WEIGHTS,
+    'review_thresholds': REVIEW_THRESHOLDS,
+    'rules': 'report',
+    'interval': matching.INSPECTION_INTERVAL_YEARS,
+    'interaction_rules': clustering.INTERACTION_RULES,
+    'pipe_params': remaining_strength.PIPE_PARAMS,
+    # Geo layer files of the report's coordinates and proximity (None: the
+    # built-in layers; defaults from ILI_CENTERLINE / ILI_SENSITIVE_LOCATIONS)
+    'centerline': geo.CENTERLINE_PATH,
+    'sensitive_locations': geo.LOCATIONS_PATH,
+}
+
+# Parameters naming input files: cache keys use the file contents, not the path
+FILE_PARAMS = ('source', 'centerline', 'sensitive_locations')
+GEO_LAYER_PARAMS = ('centerline', 'sensitive_locations')
+
+# Stage -> (upstream stages, parameters it reads), in execution (topological) order
+STAGES = {
+    'ingest': ((), ('source',)),
+    'anomalies': (('ingest',), ()),
+    'references': (('ingest',), ()),
+    'master': (('references',), ()),
+    'alignment': (('master', 'anomalies'), ()),
+    'matching': (('anomalies', 'alignment'), ('match_tolerance', 'orient_scale', 'interval')),
+    'validation': (('matching',), ('dist_tolerance', 'orient_tolerance', 'depth_tolerance')),
+    'clustering': (('alignment',), ('interaction_rules',)),
+    'report': (('matching', 'clustering'), ('rules', 'dist_tolerance', 'orient_tolerance',
+                               'confidence_weights', 'review_thresholds', 'interval', 'pipe_params',
+                               'centerline', 'sensitive_locations')),
+}
+
+STAGE_ORDER = tuple(STAGES)
+
+# Columns (and dtypes, None = any) every frame of a given kind must carry
+SCHEMAS = {
+    'standardized': {'distance': 'float64', 'event_type': None, 'orientation': 'float64',
+                     'depth': 'float64', 'joint_number': 'float64'},
+    'reference': {'dist': 'float64', 'event': None, 'joint': None, 'type': None},
+    'master': {'type': None, 'joint': None, 'dist_15': 'float64', 'dist_22': 'float64', 'shift': 'float64'},
+    'aligned': {'distance': 'float64', 'distance_raw': 'float64', 'distance_aligned': 'float64',
+                'orientation': 'float64', 'depth': 'float64', 'event_type': None},
+    'matched': {'joint': None, 'dist_15': 'float64', 'dist_22_aligned': 'float64', 'orient_15': 'float64',
+                'orient_22': 'float64', 'depth_15': 'float64', 'depth_22': 'float64',
+                'growth': 'float64', 'annual_growth_rate': 'float64', 'match_cost': 'float64',
+                'index_22': None},
+}
+
+
+def check_schema(df, kind, stage):
+    """
+    Check that a frame has the columns of its schema and cast numeric
+    columns to their declared dtype.
+
+    Args:
+        df: DataFrame passed between stages
+        kind: Key in SCHEMAS
+        stage: Stage name (for the error message)
+
+    Returns:
+        The frame, with numeric columns cast where needed
+    """
+    schema = SCHEMAS[kind]
+    missing = [col for col in schema if col not in df.columns]
+    if missing:
+        raise ValueError(f"Stage '{stage}' produced a {kind} frame without columns: {', '.join(missing)}")
+    for col, dtype in schema.items():
+        if dtype is not None and df[col].dtype != dtype:
+            df[col] = pd.to_numeric(df[col], errors='coerce').astype(dtype)
+    return df
+
+
+def _update_hash(h, value):
+    """Feed a stage output or parameter value into a hash object."""
+    if isinstance(value, pd.DataFrame):
+        h.update(repr([(str(col), str(dtype)) for col, dtype in value.dtypes.items()]).encode())
+        h.update(pd.util.hash_pandas_object(value, index=True).to_numpy().tobytes())
+    elif isinstance(value, dict):
+        for key in sorted(value, key=str):
+            h.update(str(key).encode())
+            _update_hash(h, value[key])
+    elif isinstance(value, (list, tuple)):
+        h.update(f'{type(value).__name__}{len(value)}'.encode())
+        for item in value:
+            _update_hash(h, item)
+    else:
+        h.update(repr(value).encode())
+
+
+def fingerprint(value):
+    """Content hash of a stage output or parameter value."""
+    h = hashlib.sha256()
+    _update_hash(h, value)
+    return h.hexdigest()
+
+
+def file_fingerprint(path, block_size=1 << 20):
+    """Content hash of a file (so a renamed or touched file stays cached)."""
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _rows(output):
+    """Total rows of the frames in a stage output (for the run log)."""
+    if isinstance(output, pd.DataFrame):
+        return len(output)
+    if isinstance(output, dict):
+        return sum(_rows(v) for v in output.values())
+    return 0
+
+
+class Pipeline:
+    """
+    Stage graph runner with content-hash caching.
+
+    Usage:
+        pipe = Pipeline()
+        outputs = pipe.run()                  # every stage runs
+        pipe.update(review_thresholds={'max_match_cost': 0.8})
+        outputs = pipe.run()                  # only the report stage runs
+        pipe.export()                         # write the final artifacts
+    """
+
+    def __init__(self, cache_dir=None, verbose=False, **params):
+        """
+        Args:
+            cache_dir: Optional directory for a pickle cache shared between
+                processes (in-memory caching is always on)
+            verbose: Print the run log after each run
+            **params: Overrides of DEFAULT_PARAMS
+        """
+        self.params = copy.deepcopy(DEFAULT_PARAMS)
+        self.update(**params)
+        self.cache_dir = cache_dir
+        self.verbose = verbose
+        self.outputs = {}
+        self.fingerprints = {}
+        self.run_log = []
+        self._memory = {}
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    def update(self, **params):
+        """
+        Change parameters. Dict-valued parameters (weights, thresholds) are
+        merged over the current values. Nothing runs until run().
+        """
+        for name, value in params.items():
+            if name not in DEFAULT_PARAMS:
+                raise ValueError(f"Unknown parameter '{name}'")
+            if isinstance(value, dict) and isinstance(self.params.get(name), dict):
+                value = {**self.params[name], **value}
+            self.params[name] = value if name in FILE_PARAMS else copy.deepcopy(value)
+
+    # --- Cache keys -------------------------------------------------------
+
+    def _param_token(self, name):
+        value = self.params[name]
+        if name in FILE_PARAMS and isinstance(value, (str, os.PathLike)):
+            return ('file', file_fingerprint(value))
+        return value
+
+    def _stage_key(self, stage):
+        upstream, param_names = STAGES[stage]
+        h = hashlib.sha256(stage.encode())
+        for name in param_names:
+            h.update(name.encode())
+            h.update(fingerprint(self._param_token(name)).encode())
+        for dep in upstream:
+            h.update(self.fingerprints[dep].encode())
+        return h.hexdigest()
+
+    def _cache_path(self, stage, key):
+        return os.path.join(self.cache_dir, f'{stage}-{key[:24]}.pkl')
+
+    def _load_cached(self, stage, key):
+        if key in self._memory:
+            return self._memory[key], 'cached'
+        if self.cache_dir and os.path.exists(self._cache_path(stage, key)):
+            with open(self._cache_path(stage, key), 'rb') as f:
+                entry = pickle.load(f)
+            self._memory[key] = entry
+            return entry, 'disk'
+        return None, None
+
+    def _store(self, stage, key, entry):
+        self._memory[key] = entry
+        if self.cache_dir:
+            with open(self._cache_path(stage, key), 'wb') as f:
+                pickle.dump(entry, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    # --- Stages -----------------------------------------------------------
+
+    def _run_ingest(self):
+        source = self.params['source']
+        if isinstance(source, (str, os.PathLike)):
+            std15, std22 = ingestion.load_ili_data(source)
+        else:
+            std15, std22 = source
+        return {
+            'std15': check_schema(std15.reset_index(drop=True), 'standardized', 'ingest'),
+            'std22': check_schema(std22.reset_index(drop=True), 'standardized', 'ingest'),
+        }
+
+    def _run_anomalies(self):
+        ingest = self.outputs['ingest']
+        return {
+            'anoms15': ingestion.filter_anomalies(ingest['std15']).reset_index(drop=True),
+            'anoms22': ingestion.filter_anomalies(ingest['std22']).reset_index(drop=True),
+        }
+
+    def _run_references(self):
+        ingest = self.outputs['ingest']
+        refs = {}
+        for year in ('15', '22'):
+            refs[f'ref{year}'] = check_schema(
+                reference.extract_references(reference.to_reference_frame(ingest[f'std{year}'])).reset_index(drop=True),
+                'reference', 'references'
+            )
+        return refs
+
+    def _run_master(self):
+        refs = self.outputs['references']
+        master = create_master.build_master_reference(refs['ref15'], refs['ref22'])
+        return check_schema(master, 'master', 'master')
+
+    def _run_alignment(self):
+        aligned = alignment.align_run(self.outputs['master'], self.outputs['anomalies']['anoms22'])
+        return check_schema(aligned, 'aligned', 'alignment')
+
+    def _run_matching(self):
+        anoms15 = self.outputs['anomalies']['anoms15']
+        anoms22 = self.outputs['alignment']
+        # Metal loss only, as in matching.py
+        anoms15 = filter_category(anoms15, 'metal_loss')
+        anoms22 = filter_category(anoms22, 'metal_loss')
+        matched = matching.match_frames(
+            anoms15, anoms22,
+            tolerance=self.params['match_tolerance'],
+            orient_scale=self.params['orient_scale'],
+            interval=self.params['interval']
+        )
+        return {
+            'anoms15': anoms15,
+            'anoms22': anoms22,
+            'matched': check_schema(matched, 'matched', 'matching'),
+        }
+
+    def _run_validation(self):
+        return validate_frame(
+            self.outputs['matching']['matched'],
+            dist_tolerance=self.params['dist_tolerance'],
+            orient_tolerance=self.params['orient_tolerance'],
+            depth_tolerance=self.params['depth_tolerance']
+        )
+
+    def _run_clustering(self):
+        # Interacting metal-loss features of the newer run
+        features, clusters = clustering.cluster_anomalies(
+            filter_category(self.outputs['alignment'], 'metal_loss'),
+            self.params['interaction_rules']
+        )
+        return {'features': features, 'clusters': clusters}
+
+    def _run_report(self):
+        m = self.outputs['matching']
+        features = self.outputs['clustering']['features']
+        layers = geo.load_geo(self.params['centerline'], self.params['sensitive_locations'])
+        report = build_report(
+            m['matched'], m['anoms15'], m['anoms22'],
+            rules=self.params['rules'],
+            dist_tolerance=self.params['dist_tolerance'],
+            orient_tolerance=self.params['orient_tolerance'],
+            confidence_weights=self.params['confidence_weights'],
+            review_thresholds=self.params['review_thresholds'],
+            interval=self.params['interval'],
+            clusters=features,
+            pipe=self.params['pipe_params'],
+            geo=layers
+        )
+        new_anoms, missing_anoms = find_exceptions(report, m['anoms15'], m['anoms22'])
+        new_anoms = clustering.attach_clusters(new_anoms, features)
+        new_anoms = geo.attach_geo(new_anoms, 'distance_aligned', geo=layers)
+        ui_payload = build_ui_payload(report, new_anoms)
+        return {
+            'report': report,
+            'new_anomalies': new_anoms,
+            'missing_anomalies': missing_anoms,
+            'ui_payload': ui_payload,
+            'tiles': build_tile_pyramid(ui_payload),
+        }
+
+    # --- Running ----------------------------------------------------------
+
+    def required_stages(self, targets=None):
+        """Stages needed to produce the targets (all stages by default), in order."""
+        needed = set()
+        pending = list(targets or STAGE_ORDER)
+        while pending:
+            stage = pending.pop()
+            if stage not in STAGES:
+                raise ValueError(f"Unknown stage '{stage}'. Available: {', '.join(STAGE_ORDER)}")
+            if stage not in needed:
+                needed.add(stage)
+                pending.extend(STAGES[stage][0])
+        return [stage for stage in STAGE_ORDER if stage in needed]
+
+    def run(self, targets=None):
+        """
+        Run the stale stages needed for the targets.
+
+        Args:
+            targets: Optional list of stage names (defaults to all stages)
+
+        Returns:
+            dict of stage name -> output
+        """
+        self.run_log = []
+        for stage in self.required_stages(targets):
+            start = time.perf_counter()
+            key = self._stage_key(stage)
+            entry, status = self._load_cached(stage, key)
+            metrics = {}
+            if entry is None:
+                with profile_stage(f'pipeline.{stage}') as timer:
+                    output = getattr(self, f'_run_{stage}')()
+                    timer.rows = _rows(output)
+                entry = (output, fingerprint(output))
+                self._store(stage, key, entry)
+                status = 'ran'
+                metrics = {'cpu_ms': timer.record['cpu_ms'], 'peak_kb': timer.record['peak_kb']}
+            self.outputs[stage], self.fingerprints[stage] = entry
+            self.run_log.append({
+                'stage': stage,
+                'status': status,
+                'seconds': time.perf_counter() - start,
+                'rows': _rows(entry[0]),
+                **metrics,
+            })
+        if self.verbose:
+            self.print_log()
+        return self.outputs
+
+    @property
+    def executed(self):
+        """Stages that actually ran (not served from cache) in the last run."""
+        return [entry['stage'] for entry in self.run_log if entry['status'] == 'ran']
+
+    def print_log(self):
+        for entry in self.run_log:
+            line = f"  {entry['stage']:<12} {entry['status']:<7} {1000 * entry['seconds']:8.1f} ms  {entry['rows']:>7} rows"
+            if entry.get('cpu_ms') is not None:
+                line += f"  cpu {entry['cpu_ms']:8.1f} ms"
+            if entry.get('peak_kb') is not None:
+                line += f"  peak {entry['peak_kb'] / 1024:7.1f} MB"
+            print(line)
+        total = sum(entry['seconds'] for entry in self.run_log)
+        print(f"  {'total':<12} {'':<7} {1000 * total:8.1f} ms")
+
+    # --- Export -----------------------------------------------------------
+
+    def export(self, output_dir=DEFAULT_OUTPUT_DIR, intermediates=False, run_files=False):
+        """
+        Write the final artifacts (report CSVs and UI payloads). With
+        intermediates=True, also write the stage CSVs read by the standalone
+        scripts and the upload API (standardized, aligned, matched, master).
+        With run_files=True, also write the 2015 and aligned 2022 anomalies
+        as memory-mapped run files in runs/ (see runfile.py).
+
+        Returns:
+            List of written paths
+        """
+        self.run()
+        processed_dir = os.path.join(output_dir, 'processed')
+        os.makedirs(processed_dir, exist_ok=True)
+        report = self.outputs['report']
+        written = []
+
+        def write(frame, name, kind='csv'):
+            path = os.path.join(processed_dir if kind == 'csv' else output_dir, name)
+            if kind == 'csv':
+                frame.to_csv(path, index=False)
+            else:
+                frame.to_json(path, orient='records')
+            written.append(path)
+
+        write(report_csv_frame(report['report']), 'final_growth_report.csv')
+        write(report['new_anomalies'], 'new_anomalies.csv')
+        clusters = self.outputs['clustering']['clusters']
+        write(clusters[clusters['size'] > 1], 'anomaly_clusters.csv')
+        write(report['ui_payload'], 'ui_payload.json', kind='json')
+        write(self.outputs['master'], 'reference_payload.json', kind='json')
+        save_tile_pyramid(report['tiles'], os.path.join(output_dir, 'tiles.json'))
+        written.append(os.path.join(output_dir, 'tiles.json'))
+        write_columnar(ui_payload_frame(report['report'], report['new_anomalies']),
+                       os.path.join(output_dir, 'ui_payload.bin'), meta={'kind': 'ui_payload'})
+        written.append(os.path.join(output_dir, 'ui_payload.bin'))
+
+        if intermediates:
+            write(self.outputs['anomalies']['anoms15'], 'standardized_2015.csv')
+            write(self.outputs['anomalies']['anoms22'], 'standardized_2022.csv')
+            write(self.outputs['master'], 'reference_master.csv')
+            write(self.outputs['alignment'], 'aligned_2022.csv')
+            write(self.outputs['matching']['matched'], 'matched_anomalies.csv')
+            write(self.outputs['validation'], 'validated_matches.csv')
+
+        if run_files:
+            runs_dir = os.path.join(output_dir, 'runs')
+            os.makedirs(runs_dir, exist_ok=True)
+            for frame, name in ((self.outputs['anomalies']['anoms15'], 'standardized_2015'),
+                                (self.outputs['alignment'], 'aligned_2022')):
+                written.append(write_run_file(frame, os.path.join(runs_dir, name + RUN_FILE_EXT)))
+        return written
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Run the ILI pipeline in memory')
+    parser.add_argument('--source', default=DEFAULT_SOURCE, help='ILI workbook (.xlsx)')
+    parser.add_argument('--output-dir', default=DEFAULT_OUTPUT_DIR)
+    parser.add_argument('--cache-dir', default=None, help='Persist stage outputs between runs')
+    parser.add_argument('--intermediates', action='store_true',
+                        help='Also write the intermediate stage CSVs to data/processed/')
+    parser.add_argument('--run-files', action='store_true',
+                        help='Also write memory-mapped run files to data/runs/')
+    parser.add_argument('--match-tolerance', type=float, default=DEFAULT_PARAMS['match_tolerance'])
+    parser.add_argument('--dist-tolerance', type=float, default=DEFAULT_PARAMS['dist_tolerance'])
+    parser.add_argument('--orient-tolerance', type=float, default=DEFAULT_PARAMS['orient_tolerance'])
+    parser.add_argument('--metrics-log', default=None, help="JSON stage metrics log file ('-' for stderr)")
+    parser.add_argument('--profile-dir', default=None, help='Dump a cProfile file per stage')
+    parser.add_argument('--trace-memory', action='store_true', help='Record peak memory per stage (slower)')
+    args = parser.parse_args()
+
+    configure_logging(args.metrics_log)
+    if args.trace_memory:
+        enable_memory_tracing()
+    if args.profile_dir:
+        enable_profiler(args.profile_dir)
+
+    print("Running ILI pipeline...")
+    pipe = Pipeline(
+        cache_dir=args.cache_dir,
+        source=args.source,
+        match_tolerance=args.match_tolerance,
+        dist_tolerance=args.dist_tolerance,
+        orient_tolerance=args.orient_tolerance,
+    )
+    pipe.run()
+    pipe.print_log()
+
+    for path in pipe.export(args.output_dir, intermediates=args.intermediates, run_files=args.run_files):
+        print(f"Exported {os.path.relpath(path, ROOT_DIR)}")
+
+    report = pipe.outputs['report']
+    print(f"\nMatched: {len(report['report'])}, New: {len(report['new_anomalies'])}, "
+          f"Missing: {len(report['missing_anomalies'])}")
@@ -1,29 +1,38 @@
 import pandas as pd
 import numpy as np
-from sklearn.ensemble import RandomForestRegressor
-from sklearn.preprocessing import StandardScaler
-import joblib
 import os
 from pathlib import Path
+from scoring import score_anomalies
+from remaining_strength import assess
+from anomaly_store import load_store, filter_category
+from analytics import run_year
+
+N_ESTIMATORS = 100
+TRAIN_BATCH_TREES = 10  # Trees grown between progress reports
+DEFAULT_RUN_YEAR = 2022  # Inspection year of runs without a year column
 
 class AnomalyPredictor:
-    def __init__(self):
-        self.model = RandomForestRegressor(n_estimators=100, random_state=42)
-        self.scaler = StandardScaler()
+    def __init__(self, model_path=None):
+        # sklearn and joblib take about a second to import, so they are only
+        # loaded when a model is actually trained or loaded
+        self.model = None
         self.is_trained = False
         
         # Determine project root
         self.base_dir = Path(__file__).resolve().parent.parent
-        self.model_path = self.base_dir / 'data' / 'models' / 'growth_model.pkl'
+        self.model_path = Path(model_path) if model_path else self.base_dir / 'data' / 'models' / 'growth_model.pkl'
         
         # Ensure model directory exists
         os.makedirs(os.path.dirname(self.model_path), exist_ok=True)
 
-    def train(self, matched_data_path=None):
+    def train(self, matched_data_path=None, progress=None):
         """
         Train the model on matched anomalies from 2015 -> 2022.
         Features: depth_15, orientation, joint_number (relative location?)
         Target: growth (depth_22 - depth_15) or annual_growth_rate
+        
+        progress: Optional callback(trees_done, trees_total), called as the
+        forest grows (it may raise to abandon training)
         """
         if matched_data_path is None:
              matched_data_path = self.base_dir / 'data' / 'processed' / 'matched_anomalies.csv'
@@ -56,7 +65,18 @@ class AnomalyPredictor:
         y = df[target]
         
         # Train
-        self.model.fit(X, y)
+        from sklearn.ensemble import RandomForestRegressor
+        import joblib
+        # Grown in batches with warm_start (the same forest as one fit of
+        # N_ESTIMATORS trees) so progress can be reported between batches
+        model = RandomForestRegressor(n_estimators=0, random_state=42, warm_start=True)
+        for n_trees in range(TRAIN_BATCH_TREES, N_ESTIMATORS + TRAIN_BATCH_TREES, TRAIN_BATCH_TREES):
+            model.n_estimators = min(n_trees, N_ESTIMATORS)
+            model.fit(X, y)
+            if progress is not None:
+                progress(model.n_estimators, N_ESTIMATORS)
+        model.warm_start = False
+        self.model = model
         self.is_trained = True
         
         # Save
@@ -66,6 +86,7 @@ class AnomalyPredictor:
 
     def load_model(self):
         if os.path.exists(self.model_path):
+            import joblib
             self.model = joblib.load(self.model_path)
             self.is_trained = True
             return True
@@ -74,6 +95,7 @@ class AnomalyPredictor:
     def predict_next_run(self, current_data_path='data/processed/aligned_2022.csv', years_ahead=7):
         """
         Predict the state of anomalies in N years (default 7, e.g., 2029).
+        current_data_path can also be an already-loaded run DataFrame.
         """
         if not self.is_trained and not self.load_model():
             print("Model not trained or found. Please train first.")
@@ -82,17 +104,22 @@ class AnomalyPredictor:
                 return None
 
         print(f"Predicting anomalies {years_ahead} years into the future...")
-        df_current = pd.read_csv(current_data_path)
+        # Metal loss only: a run file comes from the shared store, already
+        # indexed by event category
+        if isinstance(current_data_path, pd.DataFrame):
+            df_current = current_data_path
+            if 'event_type' in df_current.columns:
+                df_current = filter_category(df_current, 'metal_loss')
+            df_current = df_current.copy()
+        else:
+            df_current = load_store(current_data_path).subset('metal_loss')
+        year = run_year(df_current) or DEFAULT_RUN_YEAR
         
         # Prepare Features
         # Assuming current data is the "start" point (2022)
         # We need to map 2022 columns to the feature format used in training
         # Features: depth_15 -> depth_22, orient -> orient_22, etc.
         
-        # Filter for metal loss only
-        if 'event_type' in df_current.columns:
-            df_current = df_current[df_current['event_type'].str.contains('metal loss', case=False, na=False)].copy()
-        
         df_current['orient_sin'] = np.sin(np.radians(df_current['orientation']))
         df_current['orient_cos'] = np.cos(np.radians(df_current['orientation']))
         
@@ -121,10 +148,25 @@ class AnomalyPredictor:
         # Cap depth at 100%
         df_current['predicted_depth'] = df_current['predicted_depth'].clip(upper=100)
         
-        # Determine Status
-        df_current['future_status'] = 'Active'
-        df_current.loc[df_current['predicted_depth'] >= 50, 'future_status'] = 'High Risk'
-        df_current.loc[df_current['predicted_depth'] >= 80, 'future_status'] = 'Critical'
+        # Determine Status (projected depth thresholds from scoring.FORECAST_RULES)
+        forecast = score_anomalies(
+            df_current['predicted_depth'].to_numpy(dtype=float),
+            growth_rate=predicted_growth_rate,
+            interval=years_ahead,
+            rules='forecast'
+        )
+        df_current['future_status'] = forecast['status']
+        
+        # Remaining strength at the projected depth, and the year each
+        # anomaly's safe pressure falls below MAOP at its predicted rate
+        length = df_current['length'].to_numpy(dtype=float) if 'length' in df_current.columns else np.nan
+        distance = df_current['distance_aligned'].to_numpy(dtype=float)
+        now = assess(df_current['depth'], length, distance=distance,
+                     growth_rate=predicted_growth_rate, year=year)
+        future = assess(df_current['predicted_depth'], length, distance=distance)
+        df_current['failure_pressure_psi'] = future['failure_pressure_psi']
+        df_current['erf'] = future['erf']
+        df_current['unsafe_year'] = now['unsafe_year']
         
         # Prepare UI Payload
         # We want to return a JSON that the viewer can consume
@@ -135,12 +177,13 @@ class AnomalyPredictor:
         output['is_predicted'] = True
         output['prediction_years'] = years_ahead
         output['original_depth'] = df_current['depth']
-        output['year'] = 2022 + years_ahead
+        output['year'] = year + years_ahead
         
         # Select relevant columns
         cols = ['distance_aligned', 'orientation', 'depth', 'length', 'width', 
                 'joint_number', 'event_type', 'future_status', 'is_predicted', 
-                'prediction_years', 'original_depth', 'year']
+                'prediction_years', 'original_depth', 'year',
+                'failure_pressure_psi', 'erf', 'unsafe_year']
         
         # Rename for UI consistency if needed (viewer expects 'dist_22_aligned', etc.)
         # The viewer standardized on keys from `analytics.py` export
@@ -0,0 +1,271 @@
+"""
+Stage Profiling
+Measures wall time, CPU time, peak Python memory (tracemalloc) and row
+counts for named stages of the parser, the pipeline scripts and the API.
+Each finished stage is kept in a rolling window for percentile summaries
+(served by /api/metrics), emitted as a one-line JSON log record and passed
+to any stage listeners (job progress, see jobs.py).
+
+Environment:
+    ILI_TRACE_MEMORY=1      Record peak memory with tracemalloc (off by default:
+                            it makes allocation-heavy stages such as the Excel
+                            read several times slower)
+    ILI_METRICS_LOG=<path>  Append JSON records to a file ('-' for stderr)
+    ILI_PROFILE_DIR=<dir>   Dump a cProfile .prof file per stage
+"""
+
+import cProfile
+import functools
+import json
+import logging
+import os
+import threading
+import time
+import tracemalloc
+from collections import defaultdict, deque
+
+# Finished stages kept per name for the rolling percentiles
+METRICS_WINDOW = 500
+PERCENTILES = (50, 90, 99)
+METRIC_FIELDS = ('wall_ms', 'cpu_ms', 'peak_kb', 'rows')
+
+TRACE_MEMORY = os.environ.get('ILI_TRACE_MEMORY', '0') == '1'
+PROFILE_DIR = os.environ.get('ILI_PROFILE_DIR') or None
+
+logger = logging.getLogger('ili.metrics')
+
+
+class MetricsRegistry:
+    """Rolling window of finished stage records, keyed by stage name."""
+
+    def __init__(self, window=METRICS_WINDOW):
+        self.window = window
+        self._records = defaultdict(lambda: deque(maxlen=self.window))
+        self._totals = defaultdict(int)
+        self._errors = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def record(self, record):
+        with self._lock:
+            self._records[record['stage']].append(record)
+            self._totals[record['stage']] += 1
+            if record.get('error'):
+                self._errors[record['stage']] += 1
+
+    def reset(self):
+        with self._lock:
+            self._records.clear()
+            self._totals.clear()
+            self._errors.clear()
+
+    def summary(self, prefix=None):
+        """
+        Percentiles of each metric over the rolling window.
+
+        Args:
+            prefix: Only include stages whose name starts with this
+
+        Returns:
+            dict of stage name -> {'count', 'errors', 'window', '<metric>': {'p50', ...}}
+        """
+        # Imported here so the API can start without numpy (see upload_api.py)
+        import numpy as np
+
+        with self._lock:
+            snapshot = {name: list(records) for name, records in self._records.items()
+                        if prefix is None or name.startswith(prefix)}
+            totals = dict(self._totals)
+            errors = dict(self._errors)
+
+        summary = {}
+        for name, records in sorted(snapshot.items()):
+            entry = {'count': totals.get(name, 0), 'errors': errors.get(name, 0), 'window': len(records)}
+            for field in METRIC_FIELDS:
+                values = np.array([r[field] for r in records if r.get(field) is not None], dtype=float)
+                if len(values) == 0:
+                    continue
+                pct = np.percentile(values, PERCENTILES)
+                entry[field] = {f'p{p}': round(float(v), 3) for p, v in zip(PERCENTILES, pct)}
+                entry[field]['max'] = round(float(values.max()), 3)
+            summary[name] = entry
+        return summary
+
+
+METRICS = MetricsRegistry()
+
+# Open stages of the current thread (for nested memory peaks and profilers)
+_local = threading.local()
+
+# Callbacks fn(event, stage) for 'start' / 'stop' of every stage (see jobs.py).
+# A 'start' listener may raise to stop the stage from running.
+_listeners = []
+
+
+def add_stage_listener(fn):
+    if fn not in _listeners:
+        _listeners.append(fn)
+
+
+def remove_stage_listener(fn):
+    if fn in _listeners:
+        _listeners.remove(fn)
+
+
+def _stack():
+    if not hasattr(_local, 'stack'):
+        _local.stack = []
+    return _local.stack
+
+
+class Stage:
+    """
+    Timer for one stage. Use as a context manager (see stage()) or call
+    start() / stop() from separate hooks, as the API request hooks do.
+    Set .rows (and any extra fields) before the stage finishes.
+
+    Nested stages report their own peak memory; the enclosing stage's peak
+    includes its children. With profiling enabled, each stage's .prof file
+    holds only the time not spent in nested stages.
+    """
+
+    def __init__(self, name, rows=None, **fields):
+        self.name = name
+        self.rows = rows
+        self.fields = fields
+        self.record = None
+        self._peak = 0
+        self._base_memory = None
+        self._profiler = None
+
+    def start(self):
+        for listener in _listeners:
+            listener('start', self)
+        stack = _stack()
+        if TRACE_MEMORY:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            # Carry the parent's peak so far before resetting it for this stage
+            if stack:
+                stack[-1]._peak = max(stack[-1]._peak, tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+            self._base_memory = tracemalloc.get_traced_memory()[0]
+        if PROFILE_DIR:
+            if stack and stack[-1]._profiler:
+                stack[-1]._profiler.disable()
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+        stack.append(self)
+        self._wall = time.perf_counter()
+        self._cpu = time.process_time()
+        return self
+
+    def stop(self, error=None):
+        wall_ms = 1000 * (time.perf_counter() - self._wall)
+        cpu_ms = 1000 * (time.process_time() - self._cpu)
+        stack = _stack()
+        if stack and stack[-1] is self:
+            stack.pop()
+
+        peak_kb = None
+        if self._base_memory is not None and tracemalloc.is_tracing():
+            self._peak = max(self._peak, tracemalloc.get_traced_memory()[1])
+            peak_kb = (self._peak - self._base_memory) / 1024
+            if stack:
+                stack[-1]._peak = max(stack[-1]._peak, self._peak)
+
+        if self._profiler:
+            self._profiler.disable()
+            self._dump_profile()
+            if stack and stack[-1]._profiler:
+                stack[-1]._profiler.enable()
+
+        self.record = {
+            'stage': self.name,
+            'wall_ms': round(wall_ms, 3),
+            'cpu_ms': round(cpu_ms, 3),
+            'peak_kb': round(peak_kb, 1) if peak_kb is not None else None,
+            'rows': self.rows,
+            'ts': time.time(),
+        }
+        self.record.update(self.fields)
+        if error is not None:
+            self.record['error'] = type(error).__name__
+        METRICS.record(self.record)
+        if logger.isEnabledFor(logging.INFO):
+            logger.info(json.dumps(self.record, default=str))
+        for listener in _listeners:
+            listener('stop', self)
+        return self.record
+
+    def _dump_profile(self):
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        filename = f"{self.name.replace('/', '_')}-{time.strftime('%Y%m%d-%H%M%S')}-{id(self) & 0xffff:04x}.prof"
+        self._profiler.dump_stats(os.path.join(PROFILE_DIR, filename))
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop(error=exc)
+        return False
+
+
+def stage(name, rows=None, **fields):
+    """
+    Profile a block as a named stage.
+
+    Usage:
+        with stage('parse.read') as s:
+            df = pd.read_csv(path)
+            s.rows = len(df)
+    """
+    return Stage(name, rows, **fields)
+
+
+def profiled(name):
+    """Decorator form of stage(); rows are taken from a returned DataFrame."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage(name) as s:
+                result = func(*args, **kwargs)
+                if hasattr(result, 'shape'):
+                    s.rows = len(result)
+                return result
+        return wrapper
+    return decorator
+
+
+def enable_memory_tracing(enabled=True):
+    """Turn tracemalloc peak memory recording on or off."""
+    global TRACE_MEMORY
+    TRACE_MEMORY = enabled
+    if not enabled and tracemalloc.is_tracing():
+        tracemalloc.stop()
+
+
+def enable_profiler(profile_dir):
+    """Turn on per-stage cProfile dumps to profile_dir (None turns them off)."""
+    global PROFILE_DIR
+    PROFILE_DIR = profile_dir
+
+
+def configure_logging(target=None):
+    """
+    Send the JSON stage records to a file or stderr.
+
+    Args:
+        target: File path, '-' for stderr, or None to use ILI_METRICS_LOG
+            (logging stays off when neither is set)
+    """
+    target = target or os.environ.get('ILI_METRICS_LOG')
+    if not target:
+        return
+    handler = logging.StreamHandler() if target == '-' else logging.FileHandler(target)
+    handler.setFormatter(logging.Formatter('%(message)s'))
+    logger.handlers = [handler]
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+
+configure_logging()
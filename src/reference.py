@@ -1,5 +1,21 @@
 import pandas as pd
 
+from profiling import profiled
+
+def to_reference_frame(df):
+    """
+    Convert a standardized run (ingestion.py schema) to the reference
+    columns used downstream: year, dist, event, joint, oclock_deg.
+    """
+    return pd.DataFrame({
+        'year': df['year'],
+        'dist': df['distance'],
+        'event': df['event_type'],
+        'joint': df['joint_number'],
+        'oclock_deg': df['orientation'],
+    })
+
+@profiled('reference.extract_references')
 def extract_references(df):
     """
     Extracts Girth Welds, Valves, and Tees/Taps as reference points.
@@ -38,8 +54,8 @@ if __name__ == "__main__":
     import ingestion
     df15, df22 = ingestion.load_ili_data('../ILIDataV2.xlsx')
     
-    ref15 = extract_references(df15)
-    ref22 = extract_references(df22)
+    ref15 = extract_references(to_reference_frame(df15))
+    ref22 = extract_references(to_reference_frame(df22))
     
     print(f"2015 References: {len(ref15)} (Hard: {len(ref15[ref15['type']=='hard_anchor'])})")
     print(f"2022 References: {len(ref22)} (Hard: {len(ref22[ref22['type']=='hard_anchor'])})")
@@ -0,0 +1,272 @@
+"""
+Remaining Strength (Burst Pressure) Engine
+Vectorized metal-loss assessment with ASME B31G and modified B31G
+(0.85 dL): failure pressure, safe operating pressure, ERF and RPR for every
+anomaly in one NumPy pass, and, with a growth rate, the years until each
+anomaly's safe pressure falls below MAOP.
+
+Definitions (as in the vendor sheets of ILIDataV2.xlsx):
+    failure_pressure_psi   Predicted burst pressure Pf
+    safe_pressure_psi      Pf / safety_factor
+    erf                    Estimated repair factor, MAOP / safe pressure (> 1: unsafe)
+    rpr                    Rupture pressure ratio, Pf / pressure at 100% SMYS
+    years_to_unsafe        Years until ERF > 1 or depth reaches max_depth_fraction
+                           (0 when already unsafe, NaN when not growing)
+    unsafe_year            Inspection year + years_to_unsafe
+
+The growth projection keeps the length constant, which turns the depth at
+which Pf drops to safety_factor x MAOP into a closed form, so no iteration
+is needed.
+"""
+
+import numpy as np
+import pandas as pd
+
+from profiling import profiled
+
+# Pipe parameters (this line's values from the vendor sheets)
+PIPE_PARAMS = {
+    'od_in': 24.0,                  # Outside diameter (in)
+    'wall_in': 0.344,               # Nominal wall thickness (in)
+    'smys_psi': 65000.0,            # Specified minimum yield strength (psi)
+    'maop_psi': 1160.0,             # Maximum allowable operating pressure (psi)
+    'safety_factor': 1 / 0.72,      # Safe pressure = failure pressure / safety factor
+    'max_depth_fraction': 0.8,      # Deeper features are unsafe whatever the pressure
+    'method': 'modified_b31g',      # 'b31g' or 'modified_b31g'
+    # Per-segment overrides, e.g. [{'start_ft': 12000, 'wall_in': 0.5}]: each
+    # applies from its start_ft to the next segment's (pipe keys not given
+    # keep the line values)
+    'segments': [],
+}
+
+# Parameters that can vary along the line (per segment or per anomaly column)
+PIPE_KEYS = ('od_in', 'wall_in', 'smys_psi', 'maop_psi')
+
+RESULT_COLUMNS = ['failure_pressure_psi', 'safe_pressure_psi', 'erf', 'rpr', 'years_to_unsafe', 'unsafe_year']
+
+
+def make_pipe_params(overrides=None):
+    """PIPE_PARAMS with optional overrides, checked."""
+    pipe = {**PIPE_PARAMS, **(overrides or {})}
+    unknown = set(pipe) - set(PIPE_PARAMS)
+    if unknown:
+        raise ValueError(f"Unknown pipe parameters: {', '.join(sorted(unknown))}")
+    if pipe['method'] not in METHODS:
+        raise ValueError(f"Unknown method '{pipe['method']}'. Available: {', '.join(METHODS)}")
+    for segment in pipe['segments']:
+        if 'start_ft' not in segment or set(segment) - set(PIPE_KEYS) - {'start_ft'}:
+            raise ValueError(f"Segments need start_ft and only {', '.join(PIPE_KEYS)}: {segment}")
+    return pipe
+
+
+def segment_values(distance, pipe):
+    """
+    Pipe parameters at each distance, from the line values and segments.
+
+    Args:
+        distance: Array of distances (ft), or None for the line values
+        pipe: make_pipe_params() output
+
+    Returns:
+        dict of PIPE_KEYS -> float array (or scalar without segments)
+    """
+    values = {key: float(pipe[key]) for key in PIPE_KEYS}
+    if not pipe['segments'] or distance is None:
+        return values
+
+    segments = sorted(pipe['segments'], key=lambda s: s['start_ft'])
+    starts = np.array([s['start_ft'] for s in segments], dtype=float)
+    # Index of the segment each distance falls in (-1: before the first one)
+    idx = np.searchsorted(starts, np.asarray(distance, dtype=float), side='right') - 1
+    for key in PIPE_KEYS:
+        table = np.array([values[key]] + [s.get(key, values[key]) for s in segments], dtype=float)
+        values[key] = table[idx + 1]
+    return values
+
+
+# --- Methods ----------------------------------------------------------------
+# Each returns (flow stress, Folias factor M, depth coefficient a, long
+# mask) where Pf = 2 * flow * t / D * (1 - a x) / (1 - a x / M), x = d / t;
+# 'long' flaws use Pf = 2 * flow * t / D * (1 - x) instead.
+
+def _b31g(z, smys):
+    """ASME B31G: parabolic area, flow stress 1.1 SMYS, long flaws beyond A = 4."""
+    return 1.1 * smys, np.sqrt(1.0 + 0.8 * z), 2.0 / 3.0, z > (4.0 / 0.893) ** 2
+
+
+def _modified_b31g(z, smys):
+    """Modified B31G (0.85 dL): flow stress SMYS + 10 ksi, three-term Folias factor."""
+    with np.errstate(invalid='ignore'):
+        m = np.where(z <= 50.0, np.sqrt(1.0 + 0.6275 * z - 0.003375 * z ** 2), 0.032 * z + 3.3)
+    return smys + 10000.0, m, 0.85, np.zeros(np.shape(z), dtype=bool)
+
+
+METHODS = {
+    'b31g': _b31g,
+    'modified_b31g': _modified_b31g,
+}
+
+
+def failure_pressure(depth_fraction, length_in, od_in, wall_in, smys_psi, method='modified_b31g'):
+    """
+    Predicted failure pressure (psi) of metal-loss features.
+
+    Args:
+        depth_fraction: Depth as a fraction of the wall (0-1)
+        length_in: Axial length (in)
+        od_in, wall_in, smys_psi: Pipe parameters (scalars or arrays)
+        method: Name in METHODS
+
+    Returns:
+        Array of failure pressures
+    """
+    x = np.asarray(depth_fraction, dtype=float)
+    z = np.asarray(length_in, dtype=float) ** 2 / (od_in * wall_in)
+    flow, m, a, long = METHODS[method](z, smys_psi)
+    base = 2.0 * flow * wall_in / od_in
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(long, base * (1.0 - x), base * (1.0 - a * x) / (1.0 - a * x / m))
+
+
+def critical_depth(length_in, od_in, wall_in, smys_psi, target_psi, method='modified_b31g'):
+    """
+    Depth fraction at which the failure pressure drops to target_psi (the
+    inverse of failure_pressure() at constant length; 0 when even an
+    undamaged wall fails below the target).
+    """
+    z = np.asarray(length_in, dtype=float) ** 2 / (od_in * wall_in)
+    flow, m, a, long = METHODS[method](z, smys_psi)
+    r = target_psi / (2.0 * flow * wall_in / od_in)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        x = np.where(long, 1.0 - r, (1.0 - r) / (a * (1.0 - r / m)))
+    return np.clip(x, 0.0, 1.0)
+
+
+@profiled('remaining_strength.assess')
+def assess(depth, length, distance=None, growth_rate=None, pipe=None, year=None, overrides=None):
+    """
+    Remaining strength of every anomaly in one vectorized pass.
+
+    Args:
+        depth: Array of depths (% wall)
+        length: Array of axial lengths (in)
+        distance: Array of distances (ft) for segment parameters
+        growth_rate: Optional array of depth growth (% wall / yr)
+        pipe: Pipe parameter overrides (see PIPE_PARAMS)
+        year: Inspection year of the depths (for unsafe_year)
+        overrides: Optional dict of PIPE_KEYS -> per-anomaly arrays (NaN
+            keeps the segment value)
+
+    Returns:
+        dict of RESULT_COLUMNS -> arrays
+    """
+    pipe = make_pipe_params(pipe)
+    p = segment_values(distance, pipe)
+    for key, values in (overrides or {}).items():
+        p[key] = np.where(np.isnan(values), p[key], values)
+
+    depth = np.asarray(depth, dtype=float)
+    x = depth / 100.0
+    pf = failure_pressure(x, length, p['od_in'], p['wall_in'], p['smys_psi'], pipe['method'])
+    safe = pf / pipe['safety_factor']
+    with np.errstate(divide='ignore', invalid='ignore'):
+        erf = p['maop_psi'] / safe
+    rpr = pf / (2.0 * p['smys_psi'] * p['wall_in'] / p['od_in'])
+
+    # Depth at which the anomaly becomes unsafe, capped at max_depth_fraction
+    x_unsafe = np.minimum(
+        critical_depth(length, p['od_in'], p['wall_in'], p['smys_psi'],
+                       pipe['safety_factor'] * p['maop_psi'], pipe['method']),
+        pipe['max_depth_fraction']
+    )
+    unsafe_now = (erf > 1.0) | (x >= x_unsafe)
+    rate = np.zeros_like(depth) if growth_rate is None else np.asarray(growth_rate, dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        years = np.where(unsafe_now, 0.0, np.where(rate > 0, (100.0 * x_unsafe - depth) / rate, np.nan))
+    years = np.where(np.isnan(depth) | np.isnan(pf), np.nan, years)
+
+    return {
+        'failure_pressure_psi': pf,
+        'safe_pressure_psi': safe,
+        'erf': erf,
+        'rpr': rpr,
+        'years_to_unsafe': years,
+        'unsafe_year': years + year if year is not None else np.full(len(depth), np.nan),
+    }
+
+
+def assess_frame(df, pipe=None, year=None, depth_col=None, length_col=None, rate_col=None, dist_col=None):
+    """
+    Assess any anomaly DataFrame, detecting the usual column names
+    (depth_22/depth, cluster_length_in/length, annual_growth_rate/
+    predicted_growth_rate, dist_22_aligned/distance_aligned/distance).
+    Interacting anomalies (cluster columns) are assessed at their cluster's
+    combined length and max depth. Columns named like PIPE_KEYS override
+    the pipe parameters per row.
+
+    Returns:
+        Copy of df with RESULT_COLUMNS
+    """
+    def pick(explicit, candidates):
+        if explicit:
+            return explicit
+        return next((c for c in candidates if c in df.columns), None)
+
+    depth_col = pick(depth_col, ['depth_22', 'depth'])
+    length_col = pick(length_col, ['cluster_length_in', 'length'])
+    rate_col = pick(rate_col, ['annual_growth_rate', 'predicted_growth_rate'])
+    dist_col = pick(dist_col, ['dist_22_aligned', 'distance_aligned', 'distance'])
+    if depth_col is None or length_col is None:
+        raise ValueError("Depth and length columns are needed to assess remaining strength")
+
+    depth = df[depth_col].to_numpy(dtype=float)
+    if length_col == 'cluster_length_in' and 'cluster_max_depth' in df.columns:
+        depth = np.fmax(depth, df['cluster_max_depth'].to_numpy(dtype=float))
+
+    result = assess(
+        depth,
+        df[length_col].to_numpy(dtype=float),
+        distance=df[dist_col].to_numpy(dtype=float) if dist_col else None,
+        growth_rate=df[rate_col].to_numpy(dtype=float) if rate_col else None,
+        pipe=pipe,
+        year=year,
+        overrides={key: df[key].to_numpy(dtype=float) for key in PIPE_KEYS if key in df.columns},
+    )
+    out = df.copy()
+    for col in RESULT_COLUMNS:
+        out[col] = result[col]
+    return out
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description='Remaining strength of the growth report anomalies')
+    parser.add_argument('--report', default='data/processed/final_growth_report.csv')
+    parser.add_argument('--method', default=PIPE_PARAMS['method'], choices=list(METHODS))
+    parser.add_argument('--maop', type=float, default=PIPE_PARAMS['maop_psi'])
+    parser.add_argument('--year', type=int, default=2022, help='Inspection year of the report depths')
+    parser.add_argument('--benchmark', type=int, default=0, help='Also time N synthetic anomalies')
+    args = parser.parse_args()
+
+    pipe = {'method': args.method, 'maop_psi': args.maop}
+    report = pd.read_csv(args.report)
+    assessed = assess_frame(report, pipe=pipe, year=args.year)
+    unsafe = assessed['erf'] > 1.0
+    print(f"Assessed {len(assessed)} anomalies ({args.method}, MAOP {args.maop:.0f} psi)")
+    print(f"  Unsafe now (ERF > 1): {int(unsafe.sum())}")
+    print(f"  Minimum failure pressure: {assessed['failure_pressure_psi'].min():.0f} psi")
+    print(f"  Maximum ERF: {assessed['erf'].max():.3f}")
+    print("\nEarliest projected unsafe years:")
+    cols = [c for c in ('dist_22_aligned', 'depth_22', 'cluster_length_in', 'annual_growth_rate',
+                        'failure_pressure_psi', 'erf', 'unsafe_year') if c in assessed.columns]
+    print(assessed.sort_values('unsafe_year')[cols].head(10).to_string(index=False))
+
+    if args.benchmark:
+        rng = np.random.default_rng(0)
+        n = args.benchmark
+        start = time.perf_counter()
+        assess(rng.uniform(5, 70, n), rng.uniform(0.2, 40, n), distance=rng.uniform(0, 57000, n),
+               growth_rate=rng.uniform(-1, 3, n), pipe=pipe, year=args.year)
+        print(f"\nBenchmark: {n} anomalies in {time.perf_counter() - start:.3f}s")
@@ -0,0 +1,428 @@
+"""
+Memory-Mapped Run Files
+On-disk form of a run for lines whose feature lists don't fit comfortably
+in memory: a columnar payload (columnar.py) with every numeric column at
+double precision, rows sorted by (aligned) distance, and a small index in
+the header meta:
+
+    {'kind': 'run',
+     'distance_column': 'distance_aligned',
+     'index': {'stride': 4096, 'marks': [distance of every stride-th row]},
+     'joints': {'values': [...], 'lo': [...], 'hi': [...]}}    # row spans per joint
+
+A RunFile maps the file read-only and hands out columns as numpy views of
+the mapping, so a distance slice only reads the pages it touches, and
+processes that open the same file share its pages through the OS cache.
+Files are written column by column and replaced atomically, so readers
+that still map an old version keep a consistent view.
+
+Usage:
+    write_run_file(df, 'data/runs/aligned_2022.ilic')
+    run = open_run_file('data/runs/aligned_2022.ilic')
+    segment = run.frame(run.interval(1000, 5000), columns=['distance_aligned', 'depth'])
+"""
+
+import mmap
+import os
+import shutil
+import threading
+
+import numpy as np
+import pandas as pd
+
+from columnar import encode_column, encode_preamble, decode_header, pad
+from anomaly_store import (DISTANCE_COLUMNS, JOINT_COLUMNS, EVENT_COLUMNS, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE,
+                           category_mask, joint_values)
+
+RUN_FILE_EXT = '.ilic'
+RUN_FILE_KIND = 'run'
+INDEX_STRIDE = 4096                 # Rows between sparse distance index marks
+COPY_BLOCK_SIZE = 8 * 1024 * 1024
+
+_VIEW_DTYPES = {'float64': '<f8', 'float32': '<f4', 'int32': '<i4', 'bool': 'u1'}
+
+
+def _joint_spans(joint):
+    """Distinct joints and the [lo, hi) row span each one covers."""
+    has_joint = np.flatnonzero(np.isfinite(joint))
+    rows = has_joint[np.argsort(joint[has_joint], kind='stable')]
+    values, first = np.unique(joint[rows], return_index=True)
+    if len(first) == 0:
+        return values, first, first
+    return values, np.minimum.reduceat(rows, first), np.maximum.reduceat(rows, first) + 1
+
+
+class RunFileWriter:
+    """
+    Writes a run file one column at a time, so the run never has to be in
+    memory as a whole. Columns must already be in distance order.
+
+    Usage:
+        with RunFileWriter('run.ilic', rows=n) as writer:
+            writer.add('distance', distance)
+            ...
+    """
+
+    def __init__(self, path, rows, meta=None):
+        """
+        Args:
+            path: Output file (replaced when the writer closes)
+            rows: Rows in every column
+            meta: Extra header metadata
+        """
+        self.path = str(path)
+        self.rows = int(rows)
+        self.meta = dict(meta or {})
+        self.columns = []
+        self._index_columns = {}    # Distance / joint columns, for the index
+        self._body_path = f'{self.path}.body'
+        self._body = open(self._body_path, 'wb')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def _write(self, data):
+        self._body.write(data)
+        self._body.write(b'\0' * pad(len(data)))
+
+    def add(self, name, values):
+        """
+        Append a column.
+
+        Args:
+            name: Column name
+            values: Series or array with one value per row, in distance order
+        """
+        series = values.reset_index(drop=True).rename(name) if isinstance(values, pd.Series) \
+            else pd.Series(values, name=name)
+        if len(series) != self.rows:
+            raise ValueError(f"Column '{name}' has {len(series)} rows, expected {self.rows}")
+        if any(entry['name'] == name for entry in self.columns):
+            raise ValueError(f"Duplicate column '{name}'")
+
+        entry, data, valid = encode_column(series, float64=True)
+        entry['byteLength'] = len(data)
+        self._write(data)
+        if valid is not None:
+            bitmap = np.packbits(valid, bitorder='little').tobytes()
+            entry['validity'] = {'byteLength': len(bitmap)}
+            self._write(bitmap)
+        self.columns.append(entry)
+        if name in DISTANCE_COLUMNS or name in JOINT_COLUMNS:
+            self._index_columns[name] = pd.to_numeric(series, errors='coerce').to_numpy(dtype=float)
+
+    def close(self):
+        """Build the index and write the file (header first, then the column buffers)."""
+        self._body.close()
+        distance_column = next((c for c in DISTANCE_COLUMNS if c in self._index_columns), None)
+        if distance_column is None:
+            self.abort()
+            raise ValueError(f"A run file needs one of the distance columns {DISTANCE_COLUMNS}")
+        distance = self._index_columns[distance_column]
+        finite = np.isfinite(distance)
+        n_finite = int(finite.sum())
+        if not finite[:n_finite].all() or (np.diff(distance[:n_finite]) < 0).any():
+            self.abort()
+            raise ValueError(f"Rows must be sorted by '{distance_column}' (missing distances last)")
+
+        joints = pd.DataFrame({c: v for c, v in self._index_columns.items() if c in JOINT_COLUMNS},
+                              index=pd.RangeIndex(self.rows))
+        values, lo, hi = _joint_spans(joint_values(joints))
+        marks = distance[::INDEX_STRIDE]
+        meta = {
+            **self.meta,
+            'kind': RUN_FILE_KIND,
+            'distance_column': distance_column,
+            'index': {'stride': INDEX_STRIDE,
+                      'marks': [float(m) if np.isfinite(m) else None for m in marks]},
+            'joints': {'values': values.tolist(), 'lo': lo.tolist(), 'hi': hi.tolist()},
+        }
+
+        tmp_path = f'{self.path}.tmp'
+        with open(tmp_path, 'wb') as out:
+            out.write(encode_preamble(self.rows, self.columns, meta))
+            with open(self._body_path, 'rb') as body:
+                shutil.copyfileobj(body, out, COPY_BLOCK_SIZE)
+        os.replace(tmp_path, self.path)
+        os.remove(self._body_path)
+
+    def abort(self):
+        self._body.close()
+        for path in (self._body_path, f'{self.path}.tmp'):
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def write_run_file(df, path, meta=None):
+    """
+    Write a run DataFrame as a run file, sorted by its distance column.
+
+    Args:
+        df: Run records (standardized, aligned or report rows)
+        path: Output file
+        meta: Extra header metadata
+
+    Returns:
+        The path
+    """
+    distance_column = next((c for c in DISTANCE_COLUMNS if c in df.columns), None)
+    if distance_column is None:
+        raise ValueError(f"Records need one of the distance columns {DISTANCE_COLUMNS}")
+    distance = pd.to_numeric(df[distance_column], errors='coerce').to_numpy(dtype=float)
+    order = np.argsort(distance, kind='stable')    # NaN distances sort last
+    with RunFileWriter(path, len(df), meta=meta) as writer:
+        for col in df.columns:
+            writer.add(col, df[col].iloc[order])
+    return path
+
+
+class RunFile:
+    """
+    Read-only, memory-mapped run file.
+
+    Usage:
+        run = RunFile('data/runs/aligned_2022.ilic')
+        rows = run.interval(1000, 5000)               # a slice; reads a few index pages
+        depth = run.column('depth')[rows]             # only the touched pages are read
+        df = run.frame(rows, columns=['distance_aligned', 'depth'], category='metal_loss')
+    """
+
+    def __init__(self, path):
+        self.path = str(path)
+        with open(self.path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        header = decode_header(self._mmap)
+        self.meta = header['meta']
+        if self.meta.get('kind') != RUN_FILE_KIND:
+            raise ValueError(f"{self.path} is not a run file")
+        self.rows = header['rows']
+        self.entries = {entry['name']: entry for entry in header['columns']}
+        self.columns = list(self.entries)
+        self.distance_column = self.meta['distance_column']
+        self.event_column = next((c for c in EVENT_COLUMNS if c in self.entries), None)
+
+        index = self.meta['index']
+        self._stride = index['stride']
+        self._marks = np.array([np.nan if m is None else m for m in index['marks']], dtype=float)
+        joints = self.meta['joints']
+        self.joints = np.asarray(joints['values'], dtype=float)
+        self._joint_lo = np.asarray(joints['lo'], dtype=np.int64)
+        self._joint_hi = np.asarray(joints['hi'], dtype=np.int64)
+        self.distance = self.column(self.distance_column)
+
+    def __len__(self):
+        return self.rows
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.distance = None
+        try:
+            self._mmap.close()
+        except BufferError:
+            pass    # Column views still in use; the mapping goes when they do
+
+    # --- Columns ------------------------------------------------------------
+
+    def column(self, name):
+        """
+        Raw column as a read-only view of the mapping (dictionary columns
+        give their codes, bool columns uint8). Nothing is read until used.
+        """
+        if name not in self.entries:
+            raise ValueError(f"Unknown column '{name}'")
+        entry = self.entries[name]
+        dtype = _VIEW_DTYPES.get(entry['type']) or np.dtype(entry['index']).newbyteorder('<')
+        return np.frombuffer(self._mmap, dtype=dtype, count=self.rows, offset=entry['offset'])
+
+    def _valid(self, entry, positions):
+        if 'validity' not in entry:
+            return None
+        bitmap = np.frombuffer(self._mmap, dtype=np.uint8, count=entry['validity']['byteLength'],
+                               offset=entry['validity']['offset'])
+        return ((bitmap[positions >> 3] >> (positions & 7)) & 1).astype(bool)
+
+    def values(self, name, rows=None):
+        """
+        Decoded values of a column for a slice or array of rows (all rows
+        when None), with missing values as in decode_columnar().
+        """
+        rows = slice(0, self.rows) if rows is None else rows
+        positions = np.arange(self.rows)[rows] if isinstance(rows, slice) else np.asarray(rows, dtype=np.int64)
+        entry = self.entries.get(name)
+        raw = self.column(name)[rows]
+        valid = self._valid(entry, positions)
+
+        kind = entry['type']
+        if kind == 'dictionary':
+            values = np.array(entry['dictionary'] or [None], dtype=object)[raw]
+            if valid is not None:
+                values[~valid] = None
+            return pd.Series(values, dtype=object, name=name)
+        if kind == 'bool':
+            column = pd.Series(raw.astype(bool), name=name)
+            return column if valid is None else column.astype('boolean').mask(~valid)
+        if kind == 'int32':
+            column = pd.Series(raw.astype(np.int32), name=name)
+            return column if valid is None else column.astype('Int32').mask(~valid)
+        return pd.Series(np.array(raw, dtype=float), name=name)
+
+    def category_rows(self, category, rows=None):
+        """Rows (positions) of an event category within a slice or array of rows."""
+        if self.event_column is None:
+            raise ValueError(f"Run has none of the event type columns {EVENT_COLUMNS}")
+        rows = slice(0, self.rows) if rows is None else rows
+        positions = np.arange(self.rows)[rows] if isinstance(rows, slice) else np.asarray(rows, dtype=np.int64)
+        entry = self.entries[self.event_column]
+        wanted = np.flatnonzero(category_mask(pd.Series(entry['dictionary'], dtype=object), category))
+        keep = np.isin(self.column(self.event_column)[rows], wanted)
+        valid = self._valid(entry, positions)
+        if valid is not None:
+            keep &= valid
+        return positions[keep]
+
+    def frame(self, rows=None, columns=None, category=None):
+        """
+        DataFrame of some rows (a slice from interval(), or positions),
+        reading only the requested columns.
+
+        Args:
+            rows: Slice or array of rows (all rows when None)
+            columns: Column names (all when None)
+            category: Optional event category the rows must be in
+        """
+        if category is not None:
+            rows = self.category_rows(category, rows)
+        unknown = [c for c in columns or () if c not in self.entries]
+        if unknown:
+            raise ValueError(f"Unknown columns: {', '.join(unknown)}")
+        return pd.DataFrame({name: self.values(name, rows) for name in columns or self.columns})
+
+    # --- Lookups ------------------------------------------------------------
+
+    def _search(self, value, side):
+        # The marks narrow the search to one stride of rows
+        k = int(np.searchsorted(self._marks, value, side=side))
+        lo = max(0, (k - 1) * self._stride)
+        hi = min(self.rows, k * self._stride)
+        return lo + int(np.searchsorted(self.distance[lo:hi], value, side=side))
+
+    def interval(self, dist_min=None, dist_max=None):
+        """Rows with a distance in [dist_min, dist_max], as a slice."""
+        start = 0 if dist_min is None else self._search(dist_min, 'left')
+        end = self.rows if dist_max is None else self._search(dist_max, 'right')
+        return slice(start, max(start, end))
+
+    def joint_span(self, joint):
+        """Row range [lo, hi) covering a joint's rows, or None."""
+        idx = int(np.searchsorted(self.joints, joint))
+        if idx == len(self.joints) or self.joints[idx] != joint:
+            return None
+        return int(self._joint_lo[idx]), int(self._joint_hi[idx])
+
+    def _joints_of(self, rows):
+        present = [c for c in JOINT_COLUMNS if c in self.entries]
+        return joint_values(pd.DataFrame({c: self.column(c)[rows] for c in present},
+                                         index=pd.RangeIndex(len(np.arange(self.rows)[rows]))))
+
+    def select(self, dist_min=None, dist_max=None, joint_min=None, joint_max=None, category=None):
+        """
+        Rows matching a distance and joint range, in distance order.
+
+        Returns:
+            Array of row positions
+        """
+        rows = self.interval(dist_min, dist_max)
+        if joint_min is not None or joint_max is not None:
+            lo = 0 if joint_min is None else int(np.searchsorted(self.joints, joint_min, side='left'))
+            hi = len(self.joints) if joint_max is None else int(np.searchsorted(self.joints, joint_max, side='right'))
+            if lo >= hi:
+                return np.empty(0, dtype=np.int64)
+            span = slice(max(rows.start, int(self._joint_lo[lo:hi].min())),
+                         min(rows.stop, int(self._joint_hi[lo:hi].max())))
+            if span.start >= span.stop:
+                return np.empty(0, dtype=np.int64)
+            joint = self._joints_of(span)
+            keep = np.isfinite(joint)
+            if joint_min is not None:
+                keep &= joint >= joint_min
+            if joint_max is not None:
+                keep &= joint <= joint_max
+            positions = np.arange(span.start, span.stop)[keep]
+        else:
+            positions = np.arange(rows.start, rows.stop)
+        if category is not None:
+            positions = self.category_rows(category, positions)
+        return positions
+
+    def page(self, rows, offset=0, limit=DEFAULT_PAGE_SIZE, fields=None):
+        """One page of rows from select(), shaped like AnomalyStore.page()."""
+        offset = max(0, int(offset))
+        limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+        frame = self.frame(rows[offset:offset + limit], columns=fields)
+        return {
+            'total': int(len(rows)),
+            'offset': offset,
+            'limit': limit,
+            'next_offset': offset + limit if offset + limit < len(rows) else None,
+            'data': frame.replace({np.nan: None}).to_dict(orient='records'),
+        }
+
+    def describe(self):
+        """Extent of the run, as AnomalyStore.describe()."""
+        n_finite = self._search(np.inf, 'left')     # Missing distances sort last
+        return {
+            'rows': self.rows,
+            'bytes': os.path.getsize(self.path),
+            'distance_column': self.distance_column,
+            'distance_range': [float(self.distance[0]), float(self.distance[n_finite - 1])] if n_finite else None,
+            'joint_range': [float(self.joints[0]), float(self.joints[-1])] if len(self.joints) else None,
+            'joints': int(len(self.joints)),
+            'columns': self.columns,
+        }
+
+
+# Open run files: resolved path -> (mtime_ns, RunFile)
+_open_files = {}
+_open_files_lock = threading.Lock()
+
+
+def open_run_file(path):
+    """
+    The RunFile for a path, opened once per process and reopened when the
+    file is replaced.
+    """
+    key = os.path.realpath(path)
+    mtime = os.stat(key).st_mtime_ns
+    with _open_files_lock:
+        cached = _open_files.get(key)
+        if cached is None or cached[0] != mtime:
+            cached = _open_files[key] = (mtime, RunFile(key))
+        return cached[1]
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description='Convert a run CSV to a memory-mapped run file')
+    parser.add_argument('source', help='Run CSV (standardized or aligned)')
+    parser.add_argument('output', nargs='?', help=f'Run file (default: source with {RUN_FILE_EXT})')
+    args = parser.parse_args()
+
+    output = args.output or os.path.splitext(args.source)[0] + RUN_FILE_EXT
+    start = time.perf_counter()
+    write_run_file(pd.read_csv(args.source), output)
+    print(f"Wrote {output} in {1000 * (time.perf_counter() - start):.1f} ms")
+    for key, value in open_run_file(output).describe().items():
+        print(f"  {key}: {value}")
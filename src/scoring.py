@@ -0,0 +1,308 @@
+"""
+Severity and Time-to-Failure Scoring
+Vectorized scoring engine shared by the growth report, growth prediction
+and the upload API. Takes arrays of depth, growth rate and inspection
+interval and applies a configurable rule set in one call.
+"""
+
+import copy
+import numpy as np
+
+# Severity rules used by the 2015 -> 2022 growth report (analytics.py)
+REPORT_RULES = {
+    # Depth (% wall) treated as failure when projecting time to failure
+    'failure_depth': 80.0,
+    # Years reported when an anomaly is not growing, and the display cap
+    'no_growth_years': 999.0,
+    'max_display_years': 100.0,
+    # Score factors: points = min(max_points, value * weight)
+    'factors': {
+        'depth': {'weight': 0.8, 'max_points': 40},            # Max 40 points at 50% depth
+        'growth_rate': {'weight': 10.0, 'max_points': 30},     # Max 30 points at 3%/yr
+        'absolute_growth': {'weight': 0.8, 'max_points': 20},  # Max 20 points at 25% growth
+    },
+    # Time to failure points: (years below, points), checked in order
+    'time_points': [(5, 10), (10, 7), (20, 4)],
+    # Severity levels: (minimum score, level), checked in order
+    'levels': [(70, 'Critical'), (50, 'High'), (30, 'Moderate')],
+    'default_level': 'Low',
+    # Status rules, first match wins. Each rule matches if ANY of its
+    # alternatives matches; an alternative is a dict of field -> (op, value)
+    # conditions that must ALL hold. Fields: score, depth, growth_rate,
+    # growth, years_to_failure.
+    # The report has always let 'High Risk' (>=50) override 'Critical' (>=70),
+    # so Critical is not emitted for matched pairs; put
+    # {'status': 'Critical', 'any': [{'score': ('>=', 70)}]} after Static to split it out.
+    'status_rules': [
+        {'status': 'Static', 'any': [{'growth': ('<=', 0)}]},
+        {'status': 'High Risk', 'any': [{'score': ('>=', 50)}]},
+    ],
+    'default_status': 'Active',
+}
+
+# Depth-only status for uploaded single-run data (the viewer's legend categories)
+UPLOAD_RULES = copy.deepcopy(REPORT_RULES)
+UPLOAD_RULES.update({
+    'status_rules': [
+        {'status': 'Critical', 'any': [
+            {'depth': ('>=', 30)},
+            {'growth_rate': ('>=', 1.2)},
+            {'depth': ('>=', 25), 'growth_rate': ('>=', 0.8)},
+        ]},
+        {'status': 'Review Required', 'any': [
+            {'depth': ('>=', 15)},
+            {'growth_rate': ('>=', 0.5)},
+        ]},
+    ],
+    'default_status': 'Normal',
+})
+
+# Status of projected (future) depths from the growth model (prediction.py)
+FORECAST_RULES = copy.deepcopy(REPORT_RULES)
+FORECAST_RULES.update({
+    'status_rules': [
+        {'status': 'Critical', 'any': [{'depth': ('>=', 80)}]},
+        {'status': 'High Risk', 'any': [{'depth': ('>=', 50)}]},
+    ],
+    'default_status': 'Active',
+})
+
+# Rule keys that change the per-factor scores (the rest only re-classify)
+FACTOR_RULE_KEYS = ('factors', 'failure_depth', 'no_growth_years', 'time_points')
+
+RULE_SETS = {
+    'report': REPORT_RULES,
+    'upload': UPLOAD_RULES,
+    'forecast': FORECAST_RULES,
+}
+
+_OPS = {
+    '>=': np.greater_equal,
+    '>': np.greater,
+    '<=': np.less_equal,
+    '<': np.less,
+    '==': np.equal,
+}
+
+
+def _merge(base, overrides):
+    """Recursively merge override values into a copy of base."""
+    merged = copy.deepcopy(base)
+    for key, value in overrides.items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = _merge(merged[key], value)
+        else:
+            merged[key] = copy.deepcopy(value)
+    return merged
+
+
+def make_rules(base='report', overrides=None):
+    """
+    Build a rule set from a named base with optional overrides.
+
+    Args:
+        base: Name in RULE_SETS or a full rule dict
+        overrides: Optional (partial) rule dict merged on top of base,
+            e.g. {'factors': {'depth': {'weight': 1.0}}, 'failure_depth': 70}
+
+    Returns:
+        Rule set dict
+    """
+    if isinstance(base, str):
+        if base not in RULE_SETS:
+            raise ValueError(f"Unknown rule set '{base}'. Available: {', '.join(RULE_SETS)}")
+        base = RULE_SETS[base]
+    return _merge(base, overrides or {})
+
+
+def years_to_failure(depth, growth_rate, rules=None):
+    """
+    Project years until depth reaches the rule set's failure depth.
+
+    Args:
+        depth: Array of current depths (% wall)
+        growth_rate: Array of annual growth rates (% wall / yr)
+        rules: Rule set dict (defaults to REPORT_RULES)
+
+    Returns:
+        Array of years (no_growth_years where not growing)
+    """
+    rules = rules or REPORT_RULES
+    depth = np.asarray(depth, dtype=float)
+    growth_rate = np.asarray(growth_rate, dtype=float)
+    remaining_depth = rules['failure_depth'] - depth
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(
+            growth_rate > 0,
+            remaining_depth / growth_rate,
+            rules['no_growth_years']  # If not growing, set to very high
+        )
+
+
+def factor_scores(depth, growth_rate, growth, ytf, rules=None):
+    """
+    Per-factor severity points. Kept separate so callers can cache them
+    and only re-weight when the rule set changes.
+
+    Returns:
+        dict of factor name -> points array
+    """
+    rules = rules or REPORT_RULES
+    factors = rules['factors']
+    values = {
+        'depth': np.asarray(depth, dtype=float),
+        'growth_rate': np.asarray(growth_rate, dtype=float),
+        'absolute_growth': np.abs(np.asarray(growth, dtype=float)),
+    }
+    scores = {
+        f'{name}_score': np.minimum(spec['max_points'], values[name] * spec['weight'])
+        for name, spec in factors.items()
+    }
+
+    # Closer to failure = higher severity
+    conditions = [ytf < years for years, _ in rules['time_points']]
+    points = [pts for _, pts in rules['time_points']]
+    scores['time_score'] = np.select(conditions, points, default=0) if conditions else np.zeros(len(ytf))
+    return scores
+
+
+def classify_status(fields, rules=None):
+    """
+    Apply the rule set's status rules (first match wins).
+
+    Args:
+        fields: dict of field name -> array (score, depth, growth_rate, growth, years_to_failure)
+        rules: Rule set dict
+
+    Returns:
+        Object array of status strings
+    """
+    rules = rules or REPORT_RULES
+    conditions = []
+    for rule in rules['status_rules']:
+        matched = None
+        for alternative in rule['any']:
+            alt = None
+            for field, (op, value) in alternative.items():
+                cond = _OPS[op](fields[field], value)
+                alt = cond if alt is None else (alt & cond)
+            matched = alt if matched is None else (matched | alt)
+        conditions.append(matched)
+    statuses = [rule['status'] for rule in rules['status_rules']]
+    n = len(fields['depth'])
+    if not conditions:
+        return np.full(n, rules['default_status'], dtype=object)
+    return np.select(conditions, statuses, default=rules['default_status']).astype(object)
+
+
+def score_anomalies(depth, growth_rate=None, interval=7.0, growth=None, rules=None, failure_years=None):
+    """
+    Score anomalies in one vectorized call.
+
+    Args:
+        depth: Array of current depths (% wall)
+        growth_rate: Array of annual growth rates (% wall / yr); zero if None
+        interval: Years between inspections (scalar or per-row array), used to
+            derive total growth when growth is not given
+        growth: Optional array of total growth over the interval (% wall)
+        rules: Rule set dict or name in RULE_SETS (defaults to 'report')
+        failure_years: Optional array of years until failure from another
+            criterion (e.g. remaining strength); the earlier of the two
+            projections is used (NaN: no projection)
+
+    Returns:
+        dict of arrays: severity_score, severity_level, status, years_to_failure
+        (capped for display) plus the per-factor scores
+    """
+    if rules is None or isinstance(rules, str):
+        rules = make_rules(rules or 'report')
+
+    depth = np.asarray(depth, dtype=float)
+    if growth_rate is None:
+        growth_rate = np.zeros_like(depth)
+    growth_rate = np.asarray(growth_rate, dtype=float)
+    if growth is None:
+        growth = growth_rate * np.asarray(interval, dtype=float)
+    growth = np.asarray(growth, dtype=float)
+
+    ytf = years_to_failure(depth, growth_rate, rules)
+    if failure_years is not None:
+        ytf = np.fmin(ytf, np.asarray(failure_years, dtype=float))
+    scores = factor_scores(depth, growth_rate, growth, ytf, rules)
+    return classify_scores(scores, depth, growth_rate, growth, ytf, rules)
+
+
+def classify_scores(scores, depth, growth_rate, growth, ytf, rules=None):
+    """
+    Total the per-factor points and classify level and status. Split from
+    score_anomalies() so cached factor scores can be re-classified when
+    only the levels or status rules change.
+
+    Returns:
+        Same dict as score_anomalies()
+    """
+    rules = rules or REPORT_RULES
+
+    # Total severity score (0-100)
+    severity_score = np.clip(sum(scores.values()), 0, 100)
+
+    level_conditions = [severity_score >= minimum for minimum, _ in rules['levels']]
+    level_names = [name for _, name in rules['levels']]
+    severity_level = np.select(level_conditions, level_names, default=rules['default_level']).astype(object)
+
+    status = classify_status({
+        'score': severity_score,
+        'depth': depth,
+        'growth_rate': growth_rate,
+        'growth': growth,
+        'years_to_failure': ytf,
+    }, rules)
+
+    result = {
+        'severity_score': severity_score,
+        'severity_level': severity_level,
+        'status': status,
+        'years_to_failure': np.clip(ytf, 0, rules['max_display_years']),
+    }
+    result.update(scores)
+    return result
+
+
+def score_frame(df, rules=None, interval=7.0,
+                depth_col=None, rate_col=None, growth_col=None):
+    """
+    Score any anomaly DataFrame, detecting the usual column names
+    (depth_22/depth, annual_growth_rate/predicted_growth_rate, growth).
+
+    Args:
+        df: Anomaly DataFrame
+        rules: Rule set dict or name
+        interval: Years between inspections
+        depth_col, rate_col, growth_col: Optional explicit column names
+
+    Returns:
+        Copy of df with severity_score, severity_level, status and
+        years_to_failure columns
+    """
+    def pick(explicit, candidates):
+        if explicit:
+            return explicit
+        return next((c for c in candidates if c in df.columns), None)
+
+    depth_col = pick(depth_col, ['depth_22', 'depth'])
+    rate_col = pick(rate_col, ['annual_growth_rate', 'predicted_growth_rate'])
+    growth_col = pick(growth_col, ['growth'])
+    if depth_col is None:
+        raise ValueError("No depth column found to score")
+
+    scored = score_anomalies(
+        df[depth_col].to_numpy(dtype=float),
+        growth_rate=df[rate_col].to_numpy(dtype=float) if rate_col else None,
+        interval=interval,
+        growth=df[growth_col].to_numpy(dtype=float) if growth_col else None,
+        rules=rules
+    )
+    out = df.copy()
+    for col in ('severity_score', 'severity_level', 'status', 'years_to_failure'):
+        out[col] = scored[col]
+    return out
@@ -0,0 +1,158 @@
+"""
+Streaming API Responses
+Newline-delimited JSON (NDJSON) record streams with content-negotiated gzip
+and ETags, for the endpoints that return whole runs (/api/upload,
+/api/load_demo, /api/predict).
+
+A stream is one JSON object per line: first the response envelope (the
+usual JSON response without its 'data' list, plus 'rows', the number of
+records that follow), then one line per record:
+
+    {"success":true,"stats":{...},"rows":2}
+    {"distance":12.5,"depth":14.0,...}
+    {"distance":40.1,"depth":22.0,...}
+
+Records are serialized a chunk of rows at a time, so the first bytes go out
+as soon as the envelope is ready and the full list of dicts is never built.
+Clients opt in with 'Accept: application/x-ndjson'; everyone else keeps
+getting the buffered JSON response (gzipped if they accept it, see
+compress_response()).
+"""
+
+import gzip
+import hashlib
+import json
+import zlib
+
+from flask import Response
+
+NDJSON_MIMETYPE = 'application/x-ndjson'
+
+CHUNK_ROWS = 2000           # Records serialized per chunk of the stream
+GZIP_LEVEL = 6
+MIN_GZIP_BYTES = 1024       # Smaller buffered responses are sent uncompressed
+
+
+def wants_ndjson(request):
+    """True if the client asked for an NDJSON stream (Accept header or ?format=ndjson)."""
+    if request.args.get('format') == 'ndjson':
+        return True
+    return request.accept_mimetypes[NDJSON_MIMETYPE] > request.accept_mimetypes['application/json']
+
+
+def accepts_gzip(request):
+    return 'gzip' in request.accept_encodings
+
+
+def make_etag(*parts):
+    """
+    ETag from the inputs a response depends on (file stats, content hashes,
+    request parameters). Parts are JSON-serialized, so pass plain values.
+    Sent as a weak validator: the same data gzipped or not is one version.
+    """
+    return hashlib.sha1(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()[:32]
+
+
+def content_hash(path, block_size=1 << 20):
+    """SHA-256 hex digest of a file's contents."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def file_key(path):
+    """(size, mtime_ns) of a file, None if it doesn't exist."""
+    try:
+        st = path.stat()
+    except FileNotFoundError:
+        return None
+    return st.st_size, st.st_mtime_ns
+
+
+def not_modified(request, etag):
+    """304 response if the client already has this ETag, else None."""
+    if etag is not None and request.if_none_match.contains_weak(etag):
+        return tag_response(Response(status=304), etag)
+    return None
+
+
+def ndjson_lines(envelope, df, chunk_rows=CHUNK_ROWS):
+    """
+    Yield the NDJSON stream for an envelope and its records.
+
+    Args:
+        envelope: JSON-serializable dict sent as the first line
+        df: Records (NaN is sent as null)
+        chunk_rows: Rows serialized per yielded chunk
+
+    Yields:
+        bytes
+    """
+    yield (json.dumps({**envelope, 'rows': len(df)}) + '\n').encode()
+    for start in range(0, len(df), chunk_rows):
+        yield (df.iloc[start:start + chunk_rows].to_json(orient='records', lines=True).rstrip('\n') + '\n').encode()
+
+
+def gzip_chunks(chunks, level=GZIP_LEVEL):
+    """
+    Gzip a stream chunk by chunk. Each chunk is sync-flushed so the client
+    can decode it as soon as it arrives.
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        yield compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+    yield compressor.flush()
+
+
+def ndjson_response(request, envelope, df, etag=None):
+    """
+    Streamed NDJSON response, gzipped when the client accepts it.
+
+    Args:
+        request: The Flask request (for Accept-Encoding and If-None-Match)
+        envelope: Response fields sent as the first line
+        df: Records streamed after the envelope
+        etag: Optional ETag for conditional requests
+
+    Returns:
+        flask.Response
+    """
+    cached = not_modified(request, etag)
+    if cached is not None:
+        return cached
+
+    chunks = ndjson_lines(envelope, df)
+    headers = {}
+    if accepts_gzip(request):
+        chunks = gzip_chunks(chunks)
+        headers['Content-Encoding'] = 'gzip'
+    response = Response(chunks, mimetype=NDJSON_MIMETYPE, headers=headers)
+    return tag_response(response, etag)
+
+
+def tag_response(response, etag):
+    """Set the (weak) ETag and the Vary headers of a negotiated response."""
+    if etag is not None:
+        response.set_etag(etag, weak=True)
+    response.vary.update(('Accept', 'Accept-Encoding'))
+    return response
+
+
+def compress_response(request, response):
+    """
+    Gzip a buffered response body if the client accepts it and it is worth
+    compressing. Streamed, already-encoded and small responses pass through.
+    """
+    if (response.direct_passthrough or response.is_streamed
+            or response.status_code < 200 or response.status_code in (204, 304)
+            or 'Content-Encoding' in response.headers or not accepts_gzip(request)):
+        return response
+    body = response.get_data()
+    if len(body) < MIN_GZIP_BYTES:
+        return response
+    response.set_data(gzip.compress(body, compresslevel=GZIP_LEVEL))
+    response.headers['Content-Encoding'] = 'gzip'
+    response.vary.add('Accept-Encoding')
+    return response
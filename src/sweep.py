@@ -0,0 +1,188 @@
+"""
+Tolerance Sensitivity Sweep
+Evaluates how match counts, new-anomaly counts and growth statistics change
+across a grid of matching/validation parameters (distance tolerance,
+orientation tolerance, orientation cost scale).
+
+The candidate graph is built once at the widest distance tolerance; every
+grid point is solved as a filtered sub-problem of it in a process pool.
+"""
+
+import argparse
+import itertools
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+import numpy as np
+
+import matching
+from validation import calculate_orientation_difference, ORIENTATION_TOLERANCE_DEG
+from anomaly_store import load_store
+
+DEFAULT_GRID = {
+    'distance_tolerance': [2.0, 3.0, 4.0, 5.0, 6.0],
+    'orientation_tolerance': [30.0, 45.0, 60.0, 90.0, 120.0],
+    'orientation_scale': [15.0, 30.0],
+}
+
+# Worker state, set once per process by _init_worker
+_STATE = {}
+
+
+def _init_worker(graph, arrays):
+    _STATE['graph'] = graph
+    _STATE['arrays'] = arrays
+
+
+def _evaluate(task):
+    """
+    Solve one (distance tolerance, orientation scale) assignment and derive
+    the statistics for every orientation tolerance (validation only, so
+    no re-solve is needed for those).
+    """
+    dist_tol, orient_scale, orient_tols = task
+    graph = _STATE['graph']
+    a = _STATE['arrays']
+
+    rows, cols, costs = matching.solve_assignment(graph, dist_tol, orient_scale)
+    growth = a['depth22'][cols] - a['depth15'][rows]
+    dist_diff = np.abs(a['dist22'][cols] - a['dist15'][rows])
+    orient_diff = np.asarray(calculate_orientation_difference(a['orient15'][rows], a['orient22'][cols]), dtype=float)
+    n_matched = len(rows)
+
+    results = []
+    for orient_tol in orient_tols:
+        validated = (dist_diff <= dist_tol) & (orient_diff <= orient_tol)
+        results.append({
+            'distance_tolerance': dist_tol,
+            'orientation_tolerance': orient_tol,
+            'orientation_scale': orient_scale,
+            'matched': n_matched,
+            'validated': int(validated.sum()),
+            'validation_rate': 100 * validated.mean() if n_matched else np.nan,
+            'new_anomalies': graph['n22'] - n_matched,
+            'missing_anomalies': graph['n15'] - n_matched,
+            'mean_match_cost': costs.mean() if n_matched else np.nan,
+            'growth_mean': np.nanmean(growth) if n_matched else np.nan,
+            'growth_median': np.nanmedian(growth) if n_matched else np.nan,
+            'growth_p90': np.nanpercentile(growth, 90) if n_matched else np.nan,
+            'validated_growth_mean': np.nanmean(growth[validated]) if validated.any() else np.nan,
+            'annual_growth_rate_mean': np.nanmean(growth) / matching.INSPECTION_INTERVAL_YEARS if n_matched else np.nan,
+        })
+    return results
+
+
+def run_sweep(anoms15, anoms22, grid=None, workers=None):
+    """
+    Run the sensitivity sweep.
+
+    Args:
+        anoms15: 2015 metal loss anomalies
+        anoms22: Aligned 2022 metal loss anomalies
+        grid: dict of parameter -> list of values (defaults to DEFAULT_GRID)
+        workers: Process pool size (defaults to CPU count; 1 runs in-process)
+
+    Returns:
+        Tidy DataFrame with one row per grid point
+    """
+    grid = {**DEFAULT_GRID, **(grid or {})}
+
+    # One candidate graph at the widest tolerance serves every grid point
+    graph = matching.candidate_graph_for(anoms15, anoms22, max(grid['distance_tolerance']))
+    arrays = {
+        'dist15': anoms15['distance'].to_numpy(dtype=float),
+        'orient15': anoms15['orientation'].to_numpy(dtype=float),
+        'depth15': anoms15['depth'].to_numpy(dtype=float),
+        'dist22': anoms22['distance_aligned'].to_numpy(dtype=float),
+        'orient22': anoms22['orientation'].to_numpy(dtype=float),
+        'depth22': anoms22['depth'].to_numpy(dtype=float),
+    }
+
+    orient_tols = sorted(grid['orientation_tolerance'])
+    tasks = [(d, s, orient_tols) for d, s in itertools.product(
+        sorted(grid['distance_tolerance']), sorted(grid['orientation_scale']))]
+
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(tasks) == 1:
+        _init_worker(graph, arrays)
+        batches = [_evaluate(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=min(workers, len(tasks)),
+                                 initializer=_init_worker, initargs=(graph, arrays)) as pool:
+            batches = list(pool.map(_evaluate, tasks))
+
+    return pd.DataFrame([row for batch in batches for row in batch])
+
+
+def plot_summary(results, metric='matched', columns='distance_tolerance', index='orientation_scale',
+                 orientation_tolerance=None):
+    """
+    Plot-ready pivot of one metric over two parameters.
+
+    Args:
+        results: run_sweep() output
+        metric: Column to pivot (e.g. 'matched', 'new_anomalies', 'growth_mean')
+        columns, index: Parameters for the pivot axes
+        orientation_tolerance: Fix the orientation tolerance (validation metrics
+            depend on it); defaults to the current ORIENTATION_TOLERANCE_DEG
+            if present in the sweep, otherwise the first value
+
+    Returns:
+        Pivot DataFrame (index x columns)
+    """
+    subset = results
+    if 'orientation_tolerance' not in (columns, index):
+        tols = sorted(results['orientation_tolerance'].unique())
+        if orientation_tolerance is None:
+            orientation_tolerance = ORIENTATION_TOLERANCE_DEG if ORIENTATION_TOLERANCE_DEG in tols else tols[0]
+        subset = results[results['orientation_tolerance'] == orientation_tolerance]
+    return subset.pivot_table(index=index, columns=columns, values=metric)
+
+
+def load_inputs(processed_dir='data/processed'):
+    """Load the metal loss anomalies used by matching.py."""
+    anoms15 = load_store(f'{processed_dir}/standardized_2015.csv').subset('metal_loss')
+    anoms22 = load_store(f'{processed_dir}/aligned_2022.csv').subset('metal_loss')
+    return anoms15, anoms22
+
+
+if __name__ == "__main__":
+    import time
+
+    parser = argparse.ArgumentParser(description='Tolerance sensitivity sweep for matching and validation')
+    parser.add_argument('--distance', type=float, nargs='+', default=DEFAULT_GRID['distance_tolerance'],
+                        help='Distance tolerances (ft)')
+    parser.add_argument('--orientation', type=float, nargs='+', default=DEFAULT_GRID['orientation_tolerance'],
+                        help='Orientation validation tolerances (deg)')
+    parser.add_argument('--scale', type=float, nargs='+', default=DEFAULT_GRID['orientation_scale'],
+                        help='Orientation cost scales (deg per ft-equivalent)')
+    parser.add_argument('--workers', type=int, default=None, help='Process pool size')
+    parser.add_argument('--output', default='data/processed/sensitivity_sweep.csv')
+    args = parser.parse_args()
+
+    anoms15, anoms22 = load_inputs()
+    grid = {
+        'distance_tolerance': args.distance,
+        'orientation_tolerance': args.orientation,
+        'orientation_scale': args.scale,
+    }
+    n_points = len(args.distance) * len(args.orientation) * len(args.scale)
+    print(f"Running sensitivity sweep over {n_points} grid points...")
+
+    start = time.perf_counter()
+    results = run_sweep(anoms15, anoms22, grid, workers=args.workers)
+    print(f"Sweep finished in {time.perf_counter() - start:.2f} s")
+
+    results.to_csv(args.output, index=False)
+    print(f"Saved results to {args.output}")
+
+    print(f"\nMatched anomalies (orientation tolerance {ORIENTATION_TOLERANCE_DEG}°):")
+    print(plot_summary(results, 'matched').to_string())
+    print(f"\nNew anomalies:")
+    print(plot_summary(results, 'new_anomalies').to_string())
+    print(f"\nMean growth (%):")
+    print(plot_summary(results, 'growth_mean').round(2).to_string())
+    print(f"\nValidation rate by orientation tolerance (scale {matching.ORIENTATION_SCALE_DEG}):")
+    print(plot_summary(results[results['orientation_scale'] == matching.ORIENTATION_SCALE_DEG],
+                       'validation_rate', index='orientation_tolerance').round(1).to_string())
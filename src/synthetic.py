@@ -0,0 +1,221 @@
+"""
+Synthetic ILI Run Generator
+Generates a realistic pair of standardized inspection runs (2015 / 2022
+schema from ingestion.py) from a seed, with known ground truth:
+
+- girth welds at every joint and hard anchors (valves, tees, taps, AGMs)
+- odometer drift between the runs (scale error, offset and per-joint slip)
+- distance and orientation measurement noise
+- depth growth between the runs
+- repaired (removed) anomalies and new anomalies
+
+Every metal loss anomaly carries an 'anomaly_id'; a 2022 anomaly is the
+same physical anomaly as the 2015 one with the same id.
+"""
+
+import argparse
+import os
+
+import pandas as pd
+import numpy as np
+
+# Pipeline geometry
+JOINT_LENGTH_FT = 40.0
+JOINT_LENGTH_SD_FT = 1.5
+ANOMALIES_PER_JOINT = 1.2        # Roughly the ratio in ILIDataV2.xlsx
+HARD_ANCHOR_SPACING = 150        # Joints between hard anchors
+HARD_ANCHOR_EVENTS = ['valve', 'tee', 'tap', 'agm']
+BEND_FRACTION = 0.05             # Non-reference, non-metal-loss features per joint
+
+# Odometer drift of the 2022 tool relative to 2015
+DRIFT_SCALE = 0.002              # Relative distance scale error
+DRIFT_OFFSET_FT = 3.0
+DRIFT_SLIP_SD_FT = 0.05          # Per-joint random walk
+
+# Measurement noise and growth
+DISTANCE_NOISE_FT = 0.25
+ORIENTATION_NOISE_DEG = 8.0
+DEPTH_NOISE_PCT = 1.5
+GROWTH_RATE_MEAN = 0.3           # % wall / yr
+INTERVAL_YEARS = 7.0
+
+# Population changes between the runs
+REMOVED_FRACTION = 0.03          # Repaired / not re-detected
+NEW_FRACTION = 0.08              # New in 2022
+
+
+def _event_frame(distance, event_type, year, joint_number=None, orientation=None, depth=None,
+                 length=None, width=None, anomaly_id=None):
+    """Standardized-schema frame; missing measurements are NaN, anomaly_id -1."""
+    n = len(distance)
+    missing = np.full(n, np.nan)
+    return pd.DataFrame({
+        'distance': distance,
+        'event_type': np.broadcast_to(np.asarray(event_type, dtype=object), (n,)),
+        'orientation': missing if orientation is None else orientation,
+        'length': missing if length is None else length,
+        'width': missing if width is None else width,
+        'depth': missing if depth is None else depth,
+        'joint_number': missing if joint_number is None else joint_number.astype(float),
+        'comments': np.full(n, None, dtype=object),
+        'year': year,
+        'anomaly_id': np.full(n, -1) if anomaly_id is None else anomaly_id,
+    })
+
+
+def _random_orientation(rng, n):
+    """Half bottom-of-pipe corrosion around 6 o'clock, half anywhere."""
+    bottom = rng.normal(180.0, 40.0, n)
+    anywhere = rng.uniform(0.0, 360.0, n)
+    return np.where(rng.random(n) < 0.5, bottom, anywhere) % 360
+
+
+def generate_run_pair(n_anomalies, seed=0, interval=INTERVAL_YEARS):
+    """
+    Generate a 2015 / 2022 run pair.
+
+    Args:
+        n_anomalies: Metal loss anomalies in the 2015 run
+        seed: Random seed (same seed -> identical runs)
+        interval: Years between the runs (drives depth growth)
+
+    Returns:
+        Tuple of (run15, run22) standardized DataFrames sorted by distance
+    """
+    rng = np.random.default_rng(seed)
+    n_joints = max(10, int(np.ceil(n_anomalies / ANOMALIES_PER_JOINT)))
+
+    # Girth welds (start of each joint), identical joint numbers in both runs
+    joint_numbers = 10 * np.arange(1, n_joints + 1)
+    joint_lengths = rng.normal(JOINT_LENGTH_FT, JOINT_LENGTH_SD_FT, n_joints).clip(20.0)
+    weld15 = np.concatenate(([0.0], np.cumsum(joint_lengths)[:-1]))
+
+    # 2022 odometer: scale error + offset + per-joint slip, linear between welds
+    slip = np.cumsum(rng.normal(0.0, DRIFT_SLIP_SD_FT, n_joints))
+    weld22 = weld15 * (1 + DRIFT_SCALE) + DRIFT_OFFSET_FT + slip
+    weld_noise = rng.normal(0.0, 0.05, (2, n_joints))
+
+    def to_2022(dist15):
+        return np.interp(dist15, weld15, weld22)
+
+    # Hard anchors mid-joint every HARD_ANCHOR_SPACING joints
+    anchor_joints = np.arange(HARD_ANCHOR_SPACING // 2, n_joints, HARD_ANCHOR_SPACING)
+    anchor_dist15 = weld15[anchor_joints] + joint_lengths[anchor_joints] / 2
+    anchor_events = np.array(HARD_ANCHOR_EVENTS, dtype=object)[np.arange(len(anchor_joints)) % len(HARD_ANCHOR_EVENTS)]
+
+    # Bends (features that pass the anomaly filter but are not metal loss)
+    bend_joints = rng.choice(n_joints, int(BEND_FRACTION * n_joints), replace=False)
+    bend_dist15 = weld15[bend_joints] + rng.uniform(0.1, 0.9, len(bend_joints)) * joint_lengths[bend_joints]
+
+    # 2015 metal loss anomalies
+    a_joint = rng.integers(0, n_joints, n_anomalies)
+    a_dist15 = weld15[a_joint] + 0.5 + rng.random(n_anomalies) * (joint_lengths[a_joint] - 1.0)
+    a_orient15 = _random_orientation(rng, n_anomalies)
+    a_depth15 = (10.0 + rng.gamma(1.2, 7.0, n_anomalies)).clip(max=85.0)
+    a_length = rng.lognormal(0.0, 0.45, n_anomalies).round(2)
+    a_width = rng.lognormal(0.35, 0.45, n_anomalies).round(2)
+    ids = np.arange(n_anomalies)
+
+    # Which anomalies survive to 2022, and their 2022 measurements
+    kept = rng.random(n_anomalies) >= REMOVED_FRACTION
+    k = int(kept.sum())
+    growth = rng.gamma(2.0, GROWTH_RATE_MEAN / 2.0, k) * interval
+    k_dist22 = to_2022(a_dist15[kept]) + rng.normal(0.0, DISTANCE_NOISE_FT, k)
+    k_orient22 = (a_orient15[kept] + rng.normal(0.0, ORIENTATION_NOISE_DEG, k)) % 360
+    k_depth22 = (a_depth15[kept] + growth + rng.normal(0.0, DEPTH_NOISE_PCT, k)).clip(1.0, 100.0)
+
+    # New anomalies in 2022
+    n_new = int(NEW_FRACTION * n_anomalies)
+    new_joint = rng.integers(0, n_joints, n_new)
+    new_dist15 = weld15[new_joint] + 0.5 + rng.random(n_new) * (joint_lengths[new_joint] - 1.0)
+    new_dist22 = to_2022(new_dist15)
+    new_orient22 = _random_orientation(rng, n_new)
+    new_depth22 = (10.0 + rng.gamma(1.0, 5.0, n_new)).clip(max=85.0)
+
+    run15 = pd.concat([
+        _event_frame(weld15 + weld_noise[0], 'girthweld', 2015, joint_numbers),
+        _event_frame(anchor_dist15, anchor_events, 2015),
+        _event_frame(bend_dist15, 'bend', 2015, joint_numbers[bend_joints]),
+        _event_frame(a_dist15, 'metal loss', 2015, joint_numbers[a_joint], a_orient15, a_depth15.round(1),
+                     a_length, a_width, ids),
+    ], ignore_index=True)
+
+    run22 = pd.concat([
+        _event_frame(weld22 + weld_noise[1], 'girth weld', 2022, joint_numbers),
+        _event_frame(to_2022(anchor_dist15), anchor_events, 2022),
+        _event_frame(to_2022(bend_dist15), 'field bend', 2022, joint_numbers[bend_joints]),
+        _event_frame(k_dist22, 'metal loss', 2022, joint_numbers[a_joint[kept]], k_orient22, k_depth22.round(1),
+                     a_length[kept], a_width[kept], ids[kept]),
+        _event_frame(new_dist22, 'metal loss', 2022, joint_numbers[new_joint], new_orient22, new_depth22.round(1),
+                     anomaly_id=n_anomalies + np.arange(n_new)),
+    ], ignore_index=True)
+
+    run15 = run15.sort_values('distance', kind='stable').reset_index(drop=True)
+    run22 = run22.sort_values('distance', kind='stable').reset_index(drop=True)
+    return run15, run22
+
+
+def ground_truth(run15, run22):
+    """
+    Counts of the known population changes.
+
+    Returns:
+        dict with anomalies_15, anomalies_22, persisting, removed, new
+    """
+    ids15 = set(run15.loc[run15['anomaly_id'] >= 0, 'anomaly_id'])
+    ids22 = set(run22.loc[run22['anomaly_id'] >= 0, 'anomaly_id'])
+    return {
+        'anomalies_15': len(ids15),
+        'anomalies_22': len(ids22),
+        'persisting': len(ids15 & ids22),
+        'removed': len(ids15 - ids22),
+        'new': len(ids22 - ids15),
+    }
+
+
+def match_quality(matched, anoms15, anoms22):
+    """
+    Precision and recall of matched pairs against the generator's ids.
+
+    Args:
+        matched: Matched anomalies (dist_15, dist_22_aligned columns)
+        anoms15, anoms22: The metal loss frames that were matched
+            (anomaly_id column, 2022 with distance_aligned)
+
+    Returns:
+        dict with matched, correct, truth_pairs, precision, recall
+    """
+    id15 = pd.Series(anoms15['anomaly_id'].to_numpy(), index=anoms15['distance'].to_numpy())
+    id22 = pd.Series(anoms22['anomaly_id'].to_numpy(), index=anoms22['distance_aligned'].to_numpy())
+    id15 = id15[~id15.index.duplicated()]
+    id22 = id22[~id22.index.duplicated()]
+
+    pred15 = id15.reindex(matched['dist_15'].to_numpy()).to_numpy()
+    pred22 = id22.reindex(matched['dist_22_aligned'].to_numpy()).to_numpy()
+    correct = int(np.sum(pred15 == pred22))
+    truth_pairs = len(np.intersect1d(anoms15['anomaly_id'], anoms22['anomaly_id']))
+    return {
+        'matched': len(matched),
+        'correct': correct,
+        'truth_pairs': truth_pairs,
+        'precision': correct / len(matched) if len(matched) else 0.0,
+        'recall': correct / truth_pairs if truth_pairs else 0.0,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Generate a synthetic 2015 / 2022 ILI run pair')
+    parser.add_argument('--anomalies', type=int, default=10_000, help='Metal loss anomalies in the 2015 run')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output-dir', default='data/synthetic')
+    args = parser.parse_args()
+
+    run15, run22 = generate_run_pair(args.anomalies, seed=args.seed)
+    os.makedirs(args.output_dir, exist_ok=True)
+    for name, run in (('run_2015.csv', run15), ('run_2022.csv', run22)):
+        run.to_csv(os.path.join(args.output_dir, name), index=False)
+
+    truth = ground_truth(run15, run22)
+    print(f"Generated {len(run15)} / {len(run22)} events (seed {args.seed}) in {args.output_dir}")
+    print(f"  Anomalies: {truth['anomalies_15']} (2015), {truth['anomalies_22']} (2022)")
+    print(f"  Persisting: {truth['persisting']}, Removed: {truth['removed']}, New: {truth['new']}")
@@ -0,0 +1,179 @@
+"""
+Aggregate Tiles
+Distance-binned level-of-detail pyramid for the viewer. At each bin width
+the anomalies are summarised per bin (counts by status and severity, max
+depth, max growth rate, worst time to failure), so a zoomed-out view draws
+one mark per bin instead of one object per anomaly.
+
+Only non-empty bins are stored. A level is a columnar dict of equal-length
+lists keyed by field, sorted by bin number (bin b covers
+[b * width, (b + 1) * width) ft of aligned distance):
+
+    {'bin': [...], 'count': [...], 'max_depth': [...], 'max_growth_rate': [...],
+     'min_years_to_failure': [...], 'status': {'Active': [...], ...},
+     'severity': {'Low': [...], ...}}
+"""
+
+import json
+
+import numpy as np
+import pandas as pd
+
+from anomaly_store import DISTANCE_COLUMNS
+
+# Bin widths of the pyramid (ft): 10 ft, 100 ft, 1000 ft, 1 mile
+TILE_LEVELS_FT = [10, 100, 1000, 5280]
+
+# Per-bin counts: payload key -> (record column, matched pairs only)
+TILE_COUNTS = {'status': ('status', False), 'severity': ('severity_level', True)}
+
+# Per-bin extremes: field -> (candidate record columns, reduction, matched pairs only)
+TILE_STATS = {
+    'max_depth': (['depth_22', 'depth'], 'max', False),
+    'max_growth_rate': (['annual_growth_rate'], 'max', True),
+    'min_years_to_failure': (['years_to_failure'], 'min', True),
+}
+
+# NaN-skipping reductions of TILE_STATS, applied per bin with ufunc.at
+TILE_REDUCTIONS = {'max': np.fmax, 'min': np.fmin}
+
+
+def tile_inputs(records):
+    """
+    The per-record arrays build_tiles() bins: finite distances, the
+    TILE_STATS values and the TILE_COUNTS value codes. They don't depend on
+    the bin width, so a pyramid computes them once for all its levels.
+
+    Args:
+        records: Anomaly records (UI payload, report or parsed run)
+
+    Returns:
+        dict with dist (finite distances), stats (field -> (rows used,
+        their values, reduction)) and counts (key -> (rows used, their
+        value codes, value names))
+    """
+    dist_col = next((c for c in DISTANCE_COLUMNS if c in records.columns), None)
+    if dist_col is None:
+        raise ValueError(f"Records need one of the distance columns {DISTANCE_COLUMNS}")
+    dist = pd.to_numeric(records[dist_col], errors='coerce').to_numpy(dtype=float)
+    ok = np.isfinite(dist)
+
+    matched = np.ones(ok.sum(), dtype=bool)
+    if 'is_match' in records.columns:
+        matched = records['is_match'].to_numpy()[ok].astype(bool)
+    everyone = np.ones(ok.sum(), dtype=bool)
+
+    stats = {}
+    for field, (columns, how, matched_only) in TILE_STATS.items():
+        col = next((c for c in columns if c in records.columns), None)
+        if col is None:
+            continue
+        values = pd.to_numeric(records[col], errors='coerce').to_numpy(dtype=float)[ok]
+        use = matched if matched_only else everyone
+        stats[field] = (use, values[use], how)
+
+    counts = {}
+    for key, (col, matched_only) in TILE_COUNTS.items():
+        if col not in records.columns:
+            continue
+        use = matched if matched_only else everyone
+        codes, names = pd.factorize(records[col].astype(str).to_numpy()[ok][use])
+        counts[key] = (use, codes, names)
+    return {'dist': dist[ok], 'stats': stats, 'counts': counts}
+
+
+def build_tiles(records, width, inputs=None):
+    """
+    Aggregate anomaly records into distance bins of one width.
+
+    Growth rate, time to failure and severity only exist for matched pairs;
+    in the UI payload new anomalies carry 0 there, so rows with is_match
+    False are left out of those statistics.
+
+    Args:
+        records: Anomaly records (UI payload, report or parsed run)
+        width: Bin width (ft)
+        inputs: Optional tile_inputs() of the records (computed when None)
+
+    Returns:
+        DataFrame with one row per non-empty bin: bin, count, the TILE_STATS
+        fields and '<status|severity>:<value>' count columns
+    """
+    inputs = inputs or tile_inputs(records)
+    bins, inverse = np.unique(np.floor(inputs['dist'] / width).astype(np.int64), return_inverse=True)
+
+    # Columns are collected first and framed once (no insert per column)
+    tiles = {'bin': bins, 'count': np.bincount(inverse, minlength=len(bins))}
+
+    for field, (use, values, how) in inputs['stats'].items():
+        # Bins without (used) rows stay NaN
+        tiles[field] = np.full(len(bins), np.nan)
+        TILE_REDUCTIONS[how].at(tiles[field], inverse[use], values)
+
+    for key, (use, codes, names) in inputs['counts'].items():
+        # One bincount over (bin, value) pairs instead of a pass per value
+        counts = np.bincount(inverse[use] * len(names) + codes,
+                             minlength=len(bins) * len(names)).reshape(len(bins), len(names))
+        for code in np.argsort(names, kind='stable'):
+            tiles[f'{key}:{names[code]}'] = counts[:, code]
+    return pd.DataFrame(tiles)
+
+
+def build_tile_pyramid(records, levels=TILE_LEVELS_FT):
+    """
+    Returns:
+        dict of bin width -> tiles DataFrame (see build_tiles())
+    """
+    inputs = tile_inputs(records)
+    return {width: build_tiles(records, width, inputs) for width in levels}
+
+
+def slice_tiles(tiles, start=None, end=None):
+    """Bins in [start, end] (bin numbers, inclusive) of one level."""
+    bins = tiles['bin'].to_numpy()
+    lo = 0 if start is None else np.searchsorted(bins, start, side='left')
+    hi = len(bins) if end is None else np.searchsorted(bins, end, side='right')
+    return tiles.iloc[lo:hi]
+
+
+def tiles_payload(tiles):
+    """Columnar JSON-ready dict of a tiles DataFrame (see module docstring)."""
+    payload = {}
+    for col in tiles.columns:
+        values = [None if pd.isna(v) else v for v in tiles[col].tolist()]
+        if ':' in col:
+            key, name = col.split(':', 1)
+            payload.setdefault(key, {})[name] = values
+        else:
+            payload[col] = values
+    return payload
+
+
+def tiles_frame(payload):
+    """Inverse of tiles_payload()."""
+    columns = {}
+    for key, values in payload.items():
+        if isinstance(values, dict):
+            columns.update({f'{key}:{name}': counts for name, counts in values.items()})
+        else:
+            columns[key] = values
+    return pd.DataFrame(columns)
+
+
+def save_tile_pyramid(pyramid, path):
+    """Write a pyramid as JSON: {'levels': [...], 'tiles': {'<width>': <level payload>}}."""
+    with open(path, 'w') as f:
+        json.dump({
+            'levels': sorted(pyramid),
+            'tiles': {str(width): tiles_payload(tiles) for width, tiles in pyramid.items()},
+        }, f, separators=(',', ':'))
+
+
+def load_tile_pyramid(path):
+    """
+    Returns:
+        dict of bin width -> tiles DataFrame
+    """
+    with open(path) as f:
+        data = json.load(f)
+    return {int(width): tiles_frame(payload) for width, payload in data['tiles'].items()}
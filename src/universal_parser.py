@@ -1,9 +1,10 @@
 """
 Universal File Parser for Pipeline Data
-Supports Excel, CSV, JSON, TSV and other tabular formats
+Supports Excel, CSV, JSON, NDJSON, TSV and other tabular formats
 with intelligent column mapping and validation
 """
 
+import io
 import pandas as pd
 import numpy as np
 from datetime import time
@@ -13,6 +14,8 @@ from pathlib import Path
 from typing import Dict, List, Optional, Tuple, Any
 from difflib import SequenceMatcher
 
+from profiling import stage
+
 class UniversalParser:
     """
     Universal parser for pipeline inspection data files.
@@ -87,7 +90,7 @@ class UniversalParser:
             file_path: Path to the file
             
         Returns:
-            Format string: 'excel', 'csv', 'json', 'tsv', 'txt'
+            Format string: 'excel', 'csv', 'json', 'ndjson', 'tsv', 'txt'
         """
         path = Path(file_path)
         ext = path.suffix.lower()
@@ -97,6 +100,8 @@ class UniversalParser:
             '.xls': 'excel',
             '.csv': 'csv',
             '.json': 'json',
+            '.ndjson': 'ndjson',
+            '.jsonl': 'ndjson',
             '.tsv': 'tsv',
             '.txt': 'txt'
         }
@@ -293,33 +298,17 @@ class UniversalParser:
         df_filtered = df[df['event_type'].apply(is_anomaly)].copy()
         return df_filtered
     
-    def parse_file(self, file_path: str, 
-                   format: Optional[str] = None,
-                   manual_mapping: Optional[Dict] = None,
-                   filter_references: bool = True,
-                   year: Optional[int] = None) -> pd.DataFrame:
+    def read_raw(self, file_path: str, format: str) -> pd.DataFrame:
         """
-        Universal file parser - main entry point.
+        Read a file into a DataFrame with its original columns.
         
         Args:
             file_path: Path to file
-            format: Optional format override (auto-detected if None)
-            manual_mapping: Optional manual column mapping
-            filter_references: Whether to filter out reference features
-            year: Optional year to add to data
+            format: Format from detect_format()
             
         Returns:
-            Standardized DataFrame ready for pipeline processing
+            Raw DataFrame
         """
-        # Reset state
-        self.warnings = []
-        self.column_mapping = {}
-        
-        # Detect format
-        if format is None:
-            format = self.detect_format(file_path)
-        
-        # Parse based on format
         if format == 'excel':
             # Try to read all sheets, or just the first one
             try:
@@ -352,24 +341,68 @@ class UniversalParser:
                         raise ValueError("JSON must be an array or object")
             except Exception as e:
                 raise ValueError(f"Failed to read JSON file: {str(e)}")
+                
+        elif format == 'ndjson':
+            try:
+                df_raw = pd.read_json(file_path, lines=True)
+            except Exception as e:
+                raise ValueError(f"Failed to read NDJSON file: {str(e)}")
         else:
             raise ValueError(f"Unsupported file format: {format}")
         
+        return df_raw
+    
+    def parse_file(self, file_path: str, 
+                   format: Optional[str] = None,
+                   manual_mapping: Optional[Dict] = None,
+                   filter_references: bool = True,
+                   year: Optional[int] = None) -> pd.DataFrame:
+        """
+        Universal file parser - main entry point.
+        
+        Args:
+            file_path: Path to file
+            format: Optional format override (auto-detected if None)
+            manual_mapping: Optional manual column mapping
+            filter_references: Whether to filter out reference features
+            year: Optional year to add to data
+            
+        Returns:
+            Standardized DataFrame ready for pipeline processing
+        """
+        # Reset state
+        self.warnings = []
+        self.column_mapping = {}
+        
+        # Detect format
+        if format is None:
+            format = self.detect_format(file_path)
+        
+        # Parse based on format
+        with stage('parse.read', format=format) as s:
+            df_raw = self.read_raw(file_path, format)
+            s.rows = len(df_raw)
+        
         # Map columns
-        df_mapped = self.map_columns(df_raw, manual_mapping)
+        with stage('parse.map', rows=len(df_raw)):
+            df_mapped = self.map_columns(df_raw, manual_mapping)
         
         # Normalize data
-        df_normalized = self.normalize_data(df_mapped)
+        with stage('parse.normalize', rows=len(df_mapped)):
+            df_normalized = self.normalize_data(df_mapped)
         
         # Add year if provided
         if year is not None:
             df_normalized['year'] = year
         
         # Filter anomalies
-        df_filtered = self.filter_anomalies(df_normalized, filter_references)
+        with stage('parse.filter') as s:
+            df_filtered = self.filter_anomalies(df_normalized, filter_references)
+            s.rows = len(df_filtered)
         
         # Validate
-        is_valid, errors = self.validate_data(df_filtered)
+        with stage('parse.validate', rows=len(df_filtered)):
+            is_valid, errors = self.validate_data(df_filtered)
         if not is_valid:
             raise ValueError(f"Data validation failed: {'; '.join(errors)}")
         
@@ -398,6 +431,129 @@ class UniversalParser:
         return report
 
 
+class IncrementalParser:
+    """
+    Parses a CSV / TSV / NDJSON file while its bytes arrive (in order), for
+    chunked uploads. Complete lines are parsed in batches with the same
+    steps as UniversalParser.parse_file() (column mapping is detected from
+    the header and first batch, then reused), so finish() returns the same
+    DataFrame, row index included, as parsing the whole file.
+    
+    Usage:
+        inc = IncrementalParser('csv', year=2022)
+        for chunk in chunks:
+            inc.feed(chunk)
+        df = inc.finish()
+    """
+    
+    # Delimiter per streamable format (None: one JSON object per line)
+    FORMATS = {'csv': ',', 'tsv': '\t', 'txt': '\t', 'ndjson': None}
+    
+    # Buffered complete lines parsed at once
+    MIN_BATCH_BYTES = 1 << 20
+    
+    def __init__(self, format: str, year: Optional[int] = None, filter_references: bool = True,
+                 manual_mapping: Optional[Dict] = None):
+        if format not in self.FORMATS:
+            raise ValueError(f"Format '{format}' can't be parsed incrementally")
+        self.format = format
+        self.sep = self.FORMATS[format]
+        self.year = year
+        self.filter_references = filter_references
+        self.manual_mapping = manual_mapping
+        self.parser = UniversalParser()
+        self.header = None      # CSV header line (bytes), prepended to every batch
+        self.rows = 0           # Raw rows parsed so far
+        self._buffer = b''
+        self._frames = []
+    
+    @property
+    def column_mapping(self) -> Dict:
+        return self.parser.column_mapping
+    
+    @property
+    def warnings(self) -> List[str]:
+        return self.parser.warnings
+    
+    def _split(self, data: bytes) -> int:
+        """
+        End of the last complete record in data (0 if none). In CSV a
+        newline inside a quoted field doesn't end a record, so the cut is
+        the last newline with an even number of quotes before it.
+        """
+        end = data.rfind(b'\n') + 1
+        if self.sep is None or end == 0:
+            return end
+        quotes = data.count(b'"', 0, end)
+        while end > 0 and quotes % 2:
+            prev = data.rfind(b'\n', 0, end - 1) + 1
+            quotes -= data.count(b'"', prev, end)
+            end = prev
+        return end
+    
+    def feed(self, data: bytes):
+        """Add the next bytes of the file; parses once a batch of complete lines is buffered."""
+        self._buffer += data
+        if self.header is None and self.sep is not None:
+            first = self._buffer.find(b'\n') + 1
+            if first == 0:
+                return
+            self.header, self._buffer = self._buffer[:first], self._buffer[first:]
+        if len(self._buffer) >= self.MIN_BATCH_BYTES:
+            end = self._split(self._buffer)
+            if end:
+                batch, self._buffer = self._buffer[:end], self._buffer[end:]
+                self._parse(batch)
+    
+    def _parse(self, batch: bytes):
+        with stage('parse.chunk', format=self.format) as s:
+            if self.sep is None:
+                df_raw = pd.read_json(io.BytesIO(batch), lines=True)
+            else:
+                df_raw = pd.read_csv(io.BytesIO(self.header + batch), sep=self.sep)
+            df_raw.index = pd.RangeIndex(self.rows, self.rows + len(df_raw))
+            self.rows += len(df_raw)
+            
+            # Detect the mapping on the first batch, then apply it as is
+            if self.manual_mapping is None:
+                df_mapped = self.parser.map_columns(df_raw)
+                self.manual_mapping = {col: std for col, std in self.parser.column_mapping.items()
+                                       if col in df_raw.columns}
+            else:
+                df_mapped = self.parser.map_columns(df_raw, self.manual_mapping)
+            
+            df_normalized = self.parser.normalize_data(df_mapped)
+            if self.year is not None:
+                df_normalized['year'] = self.year
+            df_filtered = self.parser.filter_anomalies(df_normalized, self.filter_references)
+            self._frames.append(df_filtered)
+            s.rows = len(df_raw)
+    
+    def finish(self) -> pd.DataFrame:
+        """
+        Parse the remaining bytes and validate the whole file.
+        
+        Returns:
+            Standardized DataFrame (as UniversalParser.parse_file())
+        """
+        if self.header is None and self.sep is not None:
+            self.header, self._buffer = self._buffer + b'\n', b''
+        batch, self._buffer = self._buffer, b''
+        if batch.strip():
+            self._parse(batch if batch.endswith(b'\n') else batch + b'\n')
+        
+        if self._frames:
+            df = pd.concat(self._frames)
+        else:
+            df = pd.DataFrame(columns=self.parser.STANDARD_SCHEMA)
+        
+        with stage('parse.validate', rows=len(df)):
+            is_valid, errors = self.parser.validate_data(df)
+        if not is_valid:
+            raise ValueError(f"Data validation failed: {'; '.join(errors)}")
+        return df
+
+
 # Convenience function for quick parsing
 def parse_pipeline_file(file_path: str, **kwargs) -> pd.DataFrame:
     """
@@ -4,34 +4,85 @@ Handles file uploads, processes them through the universal parser,
 and returns standardized data for visualization
 """
 
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, g
 from flask_cors import CORS
 from werkzeug.utils import secure_filename
 import os
+import re
+import copy
 import json
 from pathlib import Path
 from pathlib import Path
 import traceback
 import logging
-from prediction import AnomalyPredictor
+import threading
+import uuid
 
-from universal_parser import UniversalParser
+# The parser, scoring, report and prediction modules (pandas, scipy,
+# sklearn) are imported inside the endpoints that use them, so the server
+# starts and answers /api/health without loading them
+from profiling import METRICS, METRICS_WINDOW, PERCENTILES, stage as profile_stage, configure_logging
+from streaming import (wants_ndjson, ndjson_response, tag_response, not_modified, compress_response,
+                       make_etag, file_key)
+from upload_cache import ParseCache, save_and_hash
+from jobs import start_job, get_job, list_jobs, report_progress, async_jobs_enabled
 
 app = Flask(__name__)
-CORS(app)  # Enable CORS for frontend requests
+CORS(app, expose_headers=['ETag'])  # Enable CORS for frontend requests (and let it read ETags)
 
 # Configuration
 # Determine project root based on this file's location (src/upload_api.py -> project_root)
 BASE_DIR = Path(__file__).resolve().parent.parent
 
-UPLOAD_FOLDER = BASE_DIR / 'src' / 'uploads'
-UPLOAD_FOLDER.mkdir(exist_ok=True)
-ALLOWED_EXTENSIONS = {'xlsx', 'xls', 'csv', 'json', 'tsv', 'txt'}
-MAX_FILE_SIZE = 50 * 1024 * 1024  # 50MB
+# ILI_DATA_DIR / ILI_UPLOAD_DIR point a server (e.g. a load test) at a scratch copy
+UPLOAD_FOLDER = Path(os.environ.get('ILI_UPLOAD_DIR', BASE_DIR / 'src' / 'uploads'))
+UPLOAD_FOLDER.mkdir(parents=True, exist_ok=True)
+ALLOWED_EXTENSIONS = {'xlsx', 'xls', 'csv', 'json', 'ndjson', 'jsonl', 'tsv', 'txt'}
+MAX_FILE_SIZE = 50 * 1024 * 1024  # 50MB per request; larger files use /api/uploads
+UPLOAD_SESSIONS_DIR = UPLOAD_FOLDER / 'sessions'
+
+# Parser stages that measure the progress of an async upload
+UPLOAD_PARSE_STAGES = ['parse.read', 'parse.map', 'parse.normalize', 'parse.filter', 'parse.validate']
+
+# Remaining strength columns scored for single uploaded runs (no growth to project)
+UPLOAD_STRENGTH_COLUMNS = ['failure_pressure_psi', 'safe_pressure_psi', 'erf', 'rpr']
 
 # Data Paths
-MATCHED_DATA_PATH = BASE_DIR / 'data' / 'processed' / 'matched_anomalies.csv'
-ALIGNED_2022_PATH = BASE_DIR / 'data' / 'processed' / 'aligned_2022.csv'
+DATA_DIR = Path(os.environ.get('ILI_DATA_DIR', BASE_DIR / 'data'))
+PROCESSED_DIR = DATA_DIR / 'processed'
+MATCHED_DATA_PATH = PROCESSED_DIR / 'matched_anomalies.csv'
+ALIGNED_2022_PATH = PROCESSED_DIR / 'aligned_2022.csv'   # Pipeline output, never written by uploads
+CURRENT_RUN_PATH = PROCESSED_DIR / 'current_run.csv'     # Last uploaded run
+REPORT_PATH = PROCESSED_DIR / 'final_growth_report.csv'
+UI_PAYLOAD_PATH = DATA_DIR / 'ui_payload.json'
+TILES_PATH = DATA_DIR / 'tiles.json'
+RUNS_DIR = DATA_DIR / 'runs'     # Memory-mapped run files (runfile.py)
+MODEL_PATH = DATA_DIR / 'models' / 'growth_model.pkl'
+WORKBOOK_DIR = Path(os.environ.get('ILI_WORKBOOK_DIR', BASE_DIR))   # Workbooks /api/pipeline may read
+
+# What-if report session, rebuilt only when the pipeline's source workbook changes
+_whatif_session = None
+_whatif_key = None
+_whatif_lock = threading.Lock()
+
+# Scored stores for /api/anomalies?dataset=upload: dataset -> (run store, scored store)
+STORE_DATASETS = {'report': UI_PAYLOAD_PATH, 'upload': CURRENT_RUN_PATH}
+_stores = {}
+_tiles = {}
+
+# Parsed uploads and previews keyed by (content hash, extension, options),
+# and the cache key of the run last written to CURRENT_RUN_PATH
+_parse_cache = ParseCache()
+_current_run = None
+
+# Chunked upload sessions followed (hashed / parsed) by this process
+_upload_sessions = {}
+_upload_sessions_lock = threading.Lock()
+
+# Growth model, loaded once per process (or before forking, see warm_up())
+_predictor = None
+_predictor_key = None
+_predictor_lock = threading.Lock()
 
 app.config['UPLOAD_FOLDER'] = str(UPLOAD_FOLDER)
 app.config['MAX_CONTENT_LENGTH'] = MAX_FILE_SIZE
@@ -42,10 +93,310 @@ def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
 
+def workbook_path(name):
+    """
+    Resolve a workbook named by a client inside WORKBOOK_DIR. Only bare
+    .xlsx / .xls file names that exist there are accepted, never paths.
+    
+    Returns:
+        Path, or None if the name is not an allowed workbook
+    """
+    if not isinstance(name, str) or Path(name).name != name or not name.lower().endswith(('.xlsx', '.xls')):
+        return None
+    path = WORKBOOK_DIR / name
+    return path if path.is_file() else None
+
+
+def upload_path(filename, prefix='upload'):
+    """
+    Temporary path in the upload folder for a client file, unique per
+    request: same-name uploads (and the queued jobs parsing them) never
+    overwrite each other's bytes.
+    """
+    return os.path.join(app.config['UPLOAD_FOLDER'],
+                        f'{prefix}_{uuid.uuid4().hex[:8]}_{secure_filename(filename)}')
+
+
+def save_current_run(df, cache_key=None):
+    """
+    Save the current run for prediction. Written to a temp file and swapped
+    in, so concurrent /api/predict requests never read a half-written CSV.
+    
+    Args:
+        df: Standardized run
+        cache_key: Parse cache key of df; the write is skipped when this
+            run is already the current one and the file is unchanged
+    """
+    global _current_run
+    if cache_key is not None and _current_run == (cache_key, file_key(CURRENT_RUN_PATH)):
+        return
+    os.makedirs(os.path.dirname(CURRENT_RUN_PATH), exist_ok=True)
+    tmp_path = CURRENT_RUN_PATH.with_name(f'.{CURRENT_RUN_PATH.name}.{os.getpid()}.{threading.get_ident()}.tmp')
+    df.to_csv(tmp_path, index=False)
+    os.replace(tmp_path, CURRENT_RUN_PATH)
+    _current_run = (cache_key, file_key(CURRENT_RUN_PATH)) if cache_key is not None else None
+
+
+def current_run_path():
+    """The last uploaded run, or the pipeline's aligned 2022 run before any upload."""
+    return CURRENT_RUN_PATH if CURRENT_RUN_PATH.exists() else ALIGNED_2022_PATH
+
+
+def current_run():
+    """
+    The current run for prediction: the cached parse if CURRENT_RUN_PATH
+    is still the file this process last wrote, else the CSV path.
+    """
+    if _current_run is not None and _current_run[1] == file_key(CURRENT_RUN_PATH):
+        entry = _parse_cache.get(_current_run[0])
+        if entry is not None:
+            return entry['df']
+    return current_run_path()
+
+
+def upload_cache_key(digest, ext, year=None, filter_references=True):
+    """Parse cache key of an upload's standardized result."""
+    return (digest, ext.lower(), 'parse', year, filter_references)
+
+
+def upload_scores(df):
+    """
+    Per-row scores of a single uploaded run: the depth-only status of the
+    'upload' rules, when the run has lengths, the remaining strength at
+    the line's pipe parameters (pressures, ERF and RPR; no growth yet) and,
+    when it has distances, the sensitive-location proximity (geo.py).
+
+    Returns:
+        DataFrame of score columns with df's index
+    """
+    import pandas as pd
+    from scoring import score_anomalies
+    from remaining_strength import assess
+    from geo import load_geo
+
+    depth = df['depth'].to_numpy(dtype=float)
+    scores = pd.DataFrame({'status': score_anomalies(depth, rules='upload')['status']}, index=df.index)
+    if 'length' in df.columns:
+        strength = assess(depth, df['length'].to_numpy(dtype=float),
+                          distance=df['distance'].to_numpy(dtype=float) if 'distance' in df.columns else None)
+        for col in UPLOAD_STRENGTH_COLUMNS:
+            scores[col] = strength[col]
+    if 'distance' in df.columns:
+        for col, values in load_geo().proximity(df['distance'].to_numpy(dtype=float)).items():
+            scores[col] = values
+    return scores
+
+
+def upload_entry(df, column_mapping, warnings):
+    """
+    Standardize and score a parsed run for the upload response.
+
+    Returns:
+        dict with df, scores, column_mapping, warnings, stats
+    """
+    # SAVE DATA FOR PREDICTION
+    if 'distance' in df.columns and 'distance_aligned' not in df.columns:
+        df['distance_aligned'] = df['distance']
+
+    # Score with the single-run rules so the viewer doesn't have to
+    scores = upload_scores(df)
+
+    # Generate statistics
+    stats = {
+        'total_rows': len(df),
+        'columns': list(df.columns),
+        'anomaly_count': len(df[df['event_type'].str.contains('loss|corrosion|pit', case=False, na=False)]) if 'event_type' in df.columns else 0,
+        'depth_range': {
+            'min': float(df['depth'].min()) if 'depth' in df.columns and not df['depth'].isna().all() else None,
+            'max': float(df['depth'].max()) if 'depth' in df.columns and not df['depth'].isna().all() else None,
+            'mean': float(df['depth'].mean()) if 'depth' in df.columns and not df['depth'].isna().all() else None
+        },
+        'distance_range': {
+            'min': float(df['distance'].min()) if 'distance' in df.columns and not df['distance'].isna().all() else None,
+            'max': float(df['distance'].max()) if 'distance' in df.columns and not df['distance'].isna().all() else None
+        }
+    }
+
+    return {
+        'df': df,
+        'scores': scores,
+        'column_mapping': dict(column_mapping),
+        'warnings': list(warnings),
+        'stats': stats,
+    }
+
+
+def parse_upload(filepath, digest, year=None, filter_references=True):
+    """
+    Parse, standardize and score an uploaded file, or return the cached
+    result for the same content and options.
+
+    Args:
+        filepath: Saved upload
+        digest: SHA-256 of the file (from save_and_hash())
+        year: Optional inspection year
+        filter_references: Drop reference features
+
+    Returns:
+        Tuple of (cache key, dict from upload_entry())
+    """
+    key = upload_cache_key(digest, Path(filepath).suffix, year, filter_references)
+    entry = _parse_cache.get(key)
+    if entry is not None:
+        return key, entry
+
+    from universal_parser import UniversalParser
+
+    # Parse file
+    parser = UniversalParser()
+    df = parser.parse_file(
+        filepath,
+        year=year,
+        filter_references=filter_references
+    )
+    return key, _parse_cache.put(key, upload_entry(df, parser.column_mapping, parser.warnings))
+
+
+def upload_response(cache_key, parsed, digest, year, filter_references, include_data):
+    """
+    Build the /api/upload response of a parsed upload (NDJSON stream or
+    JSON, with an ETag). Callers make the upload the current run first.
+    """
+    df, stats = parsed['df'], parsed['stats']
+
+    # Same file and options -> same response, so a client that
+    # already has it gets a 304 instead of the records again
+    stream = include_data and wants_ndjson(request)
+    etag = make_etag('upload', digest, year, filter_references, include_data, stream)
+    records = df.assign(**parsed['scores'])
+
+    g.metrics_rows = len(df)
+    envelope = {
+        'success': True,
+        'column_mapping': parsed['column_mapping'],
+        'warnings': parsed['warnings'],
+        'stats': stats,
+        'message': f'Successfully processed {len(df)} rows'
+    }
+    if stream:
+        return ndjson_response(request, envelope, records, etag=etag)
+    cached = not_modified(request, etag)
+    if cached is not None:
+        return cached
+
+    # Convert to JSON-serializable format (large runs can skip this
+    # and page through /api/anomalies?dataset=upload, or stream it)
+    data = records.replace({float('nan'): None}).to_dict(orient='records') if include_data else None
+    return tag_response(jsonify({**envelope, 'data': data}), etag)
+
+
+@app.before_request
+def start_request_metrics():
+    """Time every API request as an 'api.<endpoint>' stage."""
+    if request.method == 'OPTIONS' or request.endpoint == 'metrics':
+        return
+    g.metrics_stage = profile_stage(f"api.{request.endpoint or 'unmatched'}", method=request.method).start()
+
+
+@app.after_request
+def record_response_status(response):
+    timer = g.get('metrics_stage')
+    if timer is not None:
+        timer.fields['status'] = response.status_code
+    return compress_response(request, response)
+
+
+@app.teardown_request
+def finish_request_metrics(error=None):
+    timer = g.pop('metrics_stage', None)
+    if timer is not None:
+        timer.rows = g.get('metrics_rows')
+        timer.stop(error=error)
+
+
 @app.route('/api/health', methods=['GET'])
 def health_check():
     """Health check endpoint"""
-    return jsonify({'status': 'ok', 'message': 'Upload API is running'})
+    return jsonify({'status': 'ok', 'message': 'Upload API is running',
+                    'async_jobs': async_jobs_enabled()})
+
+
+@app.route('/api/metrics', methods=['GET'])
+def metrics():
+    """
+    Rolling percentiles of wall time, CPU time, peak memory and rows for
+    every profiled stage (API endpoints, parser stages, pipeline stages)
+    in this process.
+    
+    Query:
+        - prefix: Only stages starting with this (e.g. 'api.', 'parse.')
+        - reset: 'true' to clear the window after reading
+    """
+    summary = METRICS.summary(request.args.get('prefix'))
+    if request.args.get('reset', 'false').lower() == 'true':
+        METRICS.reset()
+    return jsonify({
+        'success': True,
+        'pid': os.getpid(),
+        'window': METRICS_WINDOW,
+        'percentiles': list(PERCENTILES),
+        'stages': summary,
+        'upload_cache': _parse_cache.stats()
+    })
+
+
+@app.route('/api/review_flags', methods=['GET'])
+def review_flags_legend():
+    """
+    Bit values of the report's review_flags column.
+    Clients filter by reason with (review_flags & mask) != 0, or server side
+    with /api/anomalies?review_mask=<mask>.
+    """
+    from analytics import REVIEW_REASONS
+    
+    return jsonify({
+        'flags': [{'bit': bit, 'reason': reason} for bit, reason in REVIEW_REASONS.items()]
+    })
+
+
+@app.route('/api/geo', methods=['GET', 'POST'])
+def geo_layers():
+    """
+    Centerline, tees and sensitive locations, or the coordinates and
+    sensitive-location proximity of pipeline distances (geo.py), so the
+    viewer and other clients use the same layers as the reports.
+    
+    Query (GET) or request JSON (POST):
+        - distances: Distances (ft) to locate (comma-separated for GET, a
+          list for POST); without them the layers are returned
+    
+    Response:
+        - success: boolean
+        - centerline, tees, sensitive_locations: Layer records (no distances)
+        - data: One record of proximity columns per distance (with distances)
+    """
+    try:
+        import pandas as pd
+        from geo import load_geo
+        
+        geo = load_geo()
+        if request.method == 'POST':
+            distances = (request.get_json(silent=True) or {}).get('distances')
+        else:
+            distances = _list_arg('distances')
+        if distances is None:
+            return jsonify({'success': True, **geo.layers()})
+        
+        located = pd.DataFrame({'distance': pd.to_numeric(pd.Series(distances, dtype=object), errors='raise')})
+        located = located.assign(**geo.proximity(located['distance'].to_numpy(dtype=float)))
+        g.metrics_rows = len(located)
+        return jsonify({'success': True, 'data': located.replace({float('nan'): None}).to_dict(orient='records')})
+        
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        logging.exception("Error in /api/geo")
+        return jsonify({'success': False, 'error': str(e)}), 500
 
 
 @app.route('/api/upload', methods=['POST'])
@@ -57,6 +408,9 @@ def upload_file():
         - file: The uploaded file (multipart/form-data)
         - year: Optional year parameter
         - filter_references: Optional boolean to filter reference features
+        - include_data: Optional boolean (default true); false omits data, see /api/anomalies
+        - async: Optional boolean; parse as a background job (202 with a job id, see /api/jobs).
+          Ignored when jobs are off (several workers): the upload is parsed inline
         
     Response:
         - success: boolean
@@ -91,59 +445,29 @@ def upload_file():
         
         # Get optional parameters
         year = request.form.get('year', type=int)
+        include_data = request.form.get('include_data', 'true').lower() == 'true'
         filter_references = request.form.get('filter_references', 'true').lower() == 'true'
         
-        # Save file
-        filename = secure_filename(file.filename)
-        filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(filepath)
+        # Save file, hashing it on the way to disk
+        filepath = upload_path(file.filename)
+        digest = save_and_hash(file.stream, filepath)
+        
+        if request.form.get('async', 'false').lower() == 'true' and async_jobs_enabled():
+            job = start_job('upload', run_upload_parse, filepath, digest, year, filter_references,
+                            plan=UPLOAD_PARSE_STAGES,
+                            meta={'respond': lambda result: upload_response(
+                                *result, digest, year, filter_references, include_data)})
+            return job_accepted(job)
         
         try:
-            # Parse file
-            parser = UniversalParser()
-            df = parser.parse_file(
-                filepath, 
-                year=year,
-                filter_references=filter_references
-            )
-            
-            # SAVE DATA FOR PREDICTION
-            os.makedirs(os.path.dirname(ALIGNED_2022_PATH), exist_ok=True)
-            if 'distance' in df.columns and 'distance_aligned' not in df.columns:
-                df['distance_aligned'] = df['distance']
-            df.to_csv(ALIGNED_2022_PATH, index=False)
-
-            
-            # Convert to JSON-serializable format
-            data = df.replace({float('nan'): None}).to_dict(orient='records')
-            
-            # Generate statistics
-            stats = {
-                'total_rows': len(df),
-                'columns': list(df.columns),
-                'anomaly_count': len(df[df['event_type'].str.contains('loss|corrosion|pit', case=False, na=False)]) if 'event_type' in df.columns else 0,
-                'depth_range': {
-                    'min': float(df['depth'].min()) if 'depth' in df.columns and not df['depth'].isna().all() else None,
-                    'max': float(df['depth'].max()) if 'depth' in df.columns and not df['depth'].isna().all() else None,
-                    'mean': float(df['depth'].mean()) if 'depth' in df.columns and not df['depth'].isna().all() else None
-                },
-                'distance_range': {
-                    'min': float(df['distance'].min()) if 'distance' in df.columns and not df['distance'].isna().all() else None,
-                    'max': float(df['distance'].max()) if 'distance' in df.columns and not df['distance'].isna().all() else None
-                }
-            }
+            # Parsed once per content and options; repeat uploads are cache hits
+            cache_key, parsed = parse_upload(filepath, digest, year=year, filter_references=filter_references)
             
             # Clean up uploaded file
             os.remove(filepath)
             
-            return jsonify({
-                'success': True,
-                'data': data,
-                'column_mapping': parser.column_mapping,
-                'warnings': parser.warnings,
-                'stats': stats,
-                'message': f'Successfully processed {len(df)} rows'
-            })
+            save_current_run(parsed['df'], cache_key=cache_key)
+            return upload_response(cache_key, parsed, digest, year, filter_references, include_data)
             
         except ValueError as e:
             # Clean up file on error
@@ -171,6 +495,205 @@ def upload_file():
         }), 500
 
 
+def get_upload_session(upload_id):
+    """Chunked upload session by id (loaded from disk if another worker created it), or None."""
+    from chunked_upload import UploadSession
+    
+    if not re.fullmatch(r'[0-9a-f]{32}', upload_id):
+        return None
+    with _upload_sessions_lock:
+        session = _upload_sessions.get(upload_id)
+        if session is None and (UPLOAD_SESSIONS_DIR / upload_id / 'manifest.json').exists():
+            session = _upload_sessions[upload_id] = UploadSession(UPLOAD_SESSIONS_DIR / upload_id)
+        return session
+
+
+@app.route('/api/uploads', methods=['POST'])
+def create_upload_session():
+    """
+    Start a resumable chunked upload (for files over MAX_FILE_SIZE or
+    unreliable connections).
+    
+    Request JSON:
+        - filename: Original file name (extension selects the parser)
+        - size: File size in bytes
+        - chunk_size: Optional bytes per chunk (default 8MB, max 32MB)
+        - sha256: Optional whole-file checksum, verified on completion
+        - year, filter_references: As for /api/upload
+    
+    Response:
+        - success, upload_id, chunk_size, total_chunks, received (chunk indices)
+    """
+    from chunked_upload import UploadSession, purge_stale_sessions, DEFAULT_CHUNK_SIZE
+    
+    try:
+        payload = request.get_json(silent=True) or {}
+        filename = secure_filename(payload.get('filename') or '')
+        if not filename or not allowed_file(filename):
+            return jsonify({'success': False, 'error': f'File type not supported. Allowed types: {", ".join(ALLOWED_EXTENSIONS)}'}), 400
+        if 'size' not in payload:
+            return jsonify({'success': False, 'error': 'size is required'}), 400
+        
+        purge_stale_sessions(UPLOAD_SESSIONS_DIR)
+        session = UploadSession.create(
+            UPLOAD_SESSIONS_DIR, filename, payload['size'],
+            chunk_size=payload.get('chunk_size') or DEFAULT_CHUNK_SIZE,
+            sha256=payload.get('sha256'),
+            year=int(payload['year']) if payload.get('year') is not None else None,
+            filter_references=bool(payload.get('filter_references', True))
+        )
+        with _upload_sessions_lock:
+            _upload_sessions[session.upload_id] = session
+        return jsonify({'success': True, **session.status()}), 201
+    
+    except (TypeError, ValueError) as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+
+
+@app.route('/api/uploads/<upload_id>', methods=['GET'])
+def upload_session_status(upload_id):
+    """Chunks received so far, so an interrupted client can resume with the missing ones."""
+    session = get_upload_session(upload_id)
+    if session is None:
+        return jsonify({'success': False, 'error': 'Unknown upload'}), 404
+    return jsonify({'success': True, **session.status()})
+
+
+@app.route('/api/uploads/<upload_id>/chunks/<int:index>', methods=['PUT'])
+def upload_chunk(upload_id, index):
+    """
+    Store one chunk. The body is the raw chunk bytes; the X-Chunk-SHA256
+    header carries their hex SHA-256. Re-sending a chunk is harmless.
+    """
+    session = get_upload_session(upload_id)
+    if session is None:
+        return jsonify({'success': False, 'error': 'Unknown upload'}), 404
+    try:
+        session.write_chunk(index, request.get_data(cache=False), request.headers.get('X-Chunk-SHA256'))
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    return jsonify({'success': True, 'index': index, 'missing': len(session.missing())})
+
+
+@app.route('/api/uploads/<upload_id>/complete', methods=['POST'])
+def complete_upload_session(upload_id):
+    """
+    Finish a chunked upload: verify it, finish parsing and answer like
+    /api/upload (NDJSON when requested).
+    
+    Request JSON:
+        - include_data: Optional boolean (default true)
+    """
+    session = get_upload_session(upload_id)
+    if session is None:
+        return jsonify({'success': False, 'error': 'Unknown upload'}), 404
+    try:
+        payload = request.get_json(silent=True) or {}
+        include_data = bool(payload.get('include_data', True))
+        year = session.manifest['year']
+        filter_references = session.manifest['filter_references']
+        
+        digest = session.complete()
+        cache_key = upload_cache_key(digest, session.path.suffix, year, filter_references)
+        parsed = _parse_cache.get(cache_key)
+        if parsed is None and session.parser is not None:
+            # Streamed formats: only the tail is left to parse
+            df = session.parsed()
+            parsed = _parse_cache.put(cache_key, upload_entry(df, session.parser.column_mapping, session.parser.warnings))
+        elif parsed is None:
+            cache_key, parsed = parse_upload(str(session.path), digest, year=year, filter_references=filter_references)
+        
+        with _upload_sessions_lock:
+            _upload_sessions.pop(upload_id, None)
+        session.delete()
+        save_current_run(parsed['df'], cache_key=cache_key)
+        return upload_response(cache_key, parsed, digest, year, filter_references, include_data)
+    
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        logging.exception("Error in /api/uploads/complete")
+        return jsonify({'success': False, 'error': f'Processing error: {str(e)}'}), 500
+
+
+@app.route('/api/uploads/<upload_id>', methods=['DELETE'])
+def abort_upload_session(upload_id):
+    """Abandon a chunked upload and delete its chunks."""
+    session = get_upload_session(upload_id)
+    if session is None:
+        return jsonify({'success': False, 'error': 'Unknown upload'}), 404
+    with _upload_sessions_lock:
+        _upload_sessions.pop(upload_id, None)
+    session.delete()
+    return jsonify({'success': True})
+
+
+def run_upload_parse(filepath, digest, year, filter_references):
+    """
+    Background job body of an async /api/upload: parses the file and makes
+    it the current run, so /api/predict and dataset=upload see it as soon
+    as the job is done (returns parse_upload()'s result).
+    """
+    try:
+        cache_key, parsed = parse_upload(filepath, digest, year=year, filter_references=filter_references)
+        save_current_run(parsed['df'], cache_key=cache_key)
+        return cache_key, parsed
+    finally:
+        if os.path.exists(filepath):
+            os.remove(filepath)
+
+
+def preview_upload(filepath, digest):
+    """
+    Columns, suggested mappings and first rows of an uploaded file (cached
+    by content, like parse_upload()).
+    
+    Returns:
+        dict with columns, suggested_mappings, preview_data, row_count
+    """
+    ext = Path(filepath).suffix.lower()
+    key = (digest, ext, 'preview')
+    preview = _parse_cache.get(key)
+    if preview is not None:
+        return preview
+    
+    # Read just the headers
+    import pandas as pd
+    
+    if ext in ['.xlsx', '.xls']:
+        df_preview = pd.read_excel(filepath, nrows=5)
+    elif ext == '.csv':
+        df_preview = pd.read_csv(filepath, nrows=5)
+    elif ext in ['.tsv', '.txt']:
+        df_preview = pd.read_csv(filepath, sep='\t', nrows=5)
+    elif ext == '.json':
+        with open(filepath, 'r') as f:
+            data = json.load(f)
+            if isinstance(data, list):
+                df_preview = pd.DataFrame(data[:5])
+            else:
+                df_preview = pd.DataFrame([data])
+    elif ext in ['.ndjson', '.jsonl']:
+        df_preview = pd.read_json(filepath, lines=True, nrows=5)
+    else:
+        raise ValueError('Unsupported format')
+    
+    # Get column mappings
+    from universal_parser import UniversalParser
+    parser = UniversalParser()
+    suggested_mappings = {}
+    for col in df_preview.columns:
+        mapped = parser.fuzzy_match_column(col)
+        suggested_mappings[col] = mapped if mapped else 'unknown'
+    
+    return _parse_cache.put(key, {
+        'columns': list(df_preview.columns),
+        'suggested_mappings': suggested_mappings,
+        'preview_data': df_preview.to_dict(orient='records'),
+        'row_count': len(df_preview)
+    })
+
+
 @app.route('/api/preview', methods=['POST'])
 def preview_file():
     """
@@ -189,49 +712,17 @@ def preview_file():
         if not allowed_file(file.filename):
             return jsonify({'success': False, 'error': 'File type not supported'}), 400
         
-        # Save file temporarily
-        filename = secure_filename(file.filename)
-        filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(filepath)
+        # Save file temporarily, hashing it on the way to disk
+        filepath = upload_path(file.filename, 'preview')
+        digest = save_and_hash(file.stream, filepath)
         
         try:
-            # Read just the headers
-            import pandas as pd
-            
-            ext = Path(filename).suffix.lower()
-            if ext in ['.xlsx', '.xls']:
-                df_preview = pd.read_excel(filepath, nrows=5)
-            elif ext == '.csv':
-                df_preview = pd.read_csv(filepath, nrows=5)
-            elif ext in ['.tsv', '.txt']:
-                df_preview = pd.read_csv(filepath, sep='\t', nrows=5)
-            elif ext == '.json':
-                with open(filepath, 'r') as f:
-                    data = json.load(f)
-                    if isinstance(data, list):
-                        df_preview = pd.DataFrame(data[:5])
-                    else:
-                        df_preview = pd.DataFrame([data])
-            else:
-                raise ValueError('Unsupported format')
-            
-            # Get column mappings
-            parser = UniversalParser()
-            suggested_mappings = {}
-            for col in df_preview.columns:
-                mapped = parser.fuzzy_match_column(col)
-                suggested_mappings[col] = mapped if mapped else 'unknown'
+            preview = preview_upload(filepath, digest)
             
             # Clean up
             os.remove(filepath)
             
-            return jsonify({
-                'success': True,
-                'columns': list(df_preview.columns),
-                'suggested_mappings': suggested_mappings,
-                'preview_data': df_preview.to_dict(orient='records'),
-                'row_count': len(df_preview)
-            })
+            return jsonify({'success': True, **preview})
             
         except Exception as e:
             if os.path.exists(filepath):
@@ -248,45 +739,504 @@ def preview_file():
         }), 500
 
 
+def get_predictor():
+    """
+    Return the process-wide growth model, reloading it only when the model
+    file changes (a fresh, untrained predictor if there is no model yet).
+    """
+    from prediction import AnomalyPredictor
+    
+    global _predictor, _predictor_key
+    key = MODEL_PATH.stat().st_mtime_ns if MODEL_PATH.exists() else None
+    with _predictor_lock:
+        if _predictor is None or key != _predictor_key or (key is None and not _predictor.is_trained):
+            predictor = AnomalyPredictor(model_path=MODEL_PATH)
+            predictor.load_model()
+            _predictor, _predictor_key = predictor, key
+        return _predictor
+
+
 @app.route('/api/predict', methods=['POST'])
 def predict_anomalies():
+    """
+    Predict anomaly growth for the current run.
+    
+    Request JSON:
+        - years: Years ahead (default 7)
+        - format: 'json' (default), 'ndjson' or 'columnar'
+        - async: Run as a background job (returns 202 with a job id; follow
+          /api/jobs/<id>/events, then fetch /api/jobs/<id>/result). Ignored
+          when jobs are off: the prediction runs inline
+    """
     try:
         # Check if we have data to predict on
-        if not os.path.exists(ALIGNED_2022_PATH):
+        if not os.path.exists(current_run_path()):
             return jsonify({'error': 'No 2022 data found. Please upload data first.'}), 404
-            
-        # Initialize predictor
-        predictor = AnomalyPredictor()
         
-        # Train if needed (if model doesn't exist or force retrain)
-        # For now, we'll try to load, if not, train
-        if not predictor.load_model():
+        # Predict
+        # Default to 7 years (2029)
+        payload = request.get_json(silent=True) or {}
+        years = payload.get('years', 7)
+        if not isinstance(years, int):
+            years = 7
+        fmt = payload.get('format') or ('ndjson' if wants_ndjson(request) else 'json')
+        
+        if payload.get('async') and async_jobs_enabled():
+            if not get_predictor().is_trained and not os.path.exists(MATCHED_DATA_PATH):
+                return jsonify({'error': 'No historical matched data found to train model.'}), 404
+            cached = not_modified(request, prediction_etag(years, fmt))
+            if cached is not None:
+                return cached
+            job = start_job('predict', run_prediction, years,
+                            meta={'respond': lambda df: prediction_response(df, years, fmt, prediction_etag(years, fmt))})
+            return job_accepted(job)
+            
+        # Cached predictor; trained on the matched history if no model exists yet
+        predictor = get_predictor()
+        if not predictor.is_trained:
             # Check if we have matched data to train on
             if os.path.exists(MATCHED_DATA_PATH):
-                success = predictor.train(MATCHED_DATA_PATH)
+                with _predictor_lock:
+                    success = predictor.is_trained or predictor.train(MATCHED_DATA_PATH)
                 if not success:
                      return jsonify({'error': 'Failed to train model. Match data issue.'}), 500
             else:
                  return jsonify({'error': 'No historical matched data found to train model.'}), 404
         
-        # Predict
-        # Default to 7 years (2029)
-        years = request.json.get('years', 7)
-        if not isinstance(years, int):
-            years = 7
+        # Unchanged run, model and parameters: the client's copy is current
+        etag = prediction_etag(years, fmt)
+        cached = not_modified(request, etag)
+        if cached is not None:
+            return cached
             
-        prediction_df = predictor.predict_next_run(ALIGNED_2022_PATH, years_ahead=years)
+        prediction_df = predictor.predict_next_run(current_run(), years_ahead=years)
         
         if prediction_df is None:
             return jsonify({'error': 'Prediction failed.'}), 500
-            
-        # Return JSON
-        return prediction_df.to_json(orient='records')
+        
+        return prediction_response(prediction_df, years, fmt, etag)
         
     except Exception as e:
         logging.exception("Error in /api/predict")
         return jsonify({'error': str(e)}), 500
 
+
+def prediction_etag(years, fmt):
+    return make_etag('predict', file_key(current_run_path()), file_key(MODEL_PATH), years, fmt)
+
+
+def run_prediction(years):
+    """
+    Background job body of an async /api/predict: trains the model if there
+    is none (reporting trees grown), then predicts the current run.
+    
+    Returns:
+        Prediction DataFrame
+    """
+    predictor = get_predictor()
+    if not predictor.is_trained:
+        with profile_stage('predict.train'):
+            with _predictor_lock:
+                success = predictor.is_trained or predictor.train(
+                    MATCHED_DATA_PATH, progress=lambda done, total: report_progress(done, total, unit='trees'))
+        if not success:
+            raise ValueError('Failed to train model. Match data issue.')
+    with profile_stage('predict.run') as timer:
+        prediction_df = predictor.predict_next_run(current_run(), years_ahead=years)
+        if prediction_df is None:
+            raise ValueError('Prediction failed.')
+        timer.rows = len(prediction_df)
+    return prediction_df
+
+
+def prediction_response(prediction_df, years, fmt, etag=None):
+    """Predictions as JSON records, an NDJSON stream or a columnar payload."""
+    g.metrics_rows = len(prediction_df)
+    if fmt == 'columnar':
+        from columnar import encode_columnar, CONTENT_TYPE
+        return tag_response(Response(encode_columnar(prediction_df, meta={'kind': 'prediction', 'years': years}),
+                                     mimetype=CONTENT_TYPE), etag)
+    if fmt == 'ndjson':
+        return ndjson_response(request, {'success': True, 'years': years}, prediction_df, etag=etag)
+
+    # Return JSON
+    return tag_response(Response(prediction_df.to_json(orient='records'), mimetype='application/json'), etag)
+
+
+@app.route('/api/score', methods=['POST'])
+def score_dataset():
+    """
+    Rescore a dataset on demand with a named or customized rule set,
+    without re-running the report script.
+    
+    Request JSON:
+        - rules: Rule set name ('report', 'upload', 'forecast'), default 'report'
+        - overrides: Optional partial rule dict (weights, thresholds, status rules)
+        - interval: Years between inspections (default 7)
+        - dataset: 'report' (final growth report) or 'upload' (last uploaded data)
+        - data: Optional list of records to score instead of a stored dataset
+    
+    Response:
+        - success: boolean
+        - data: Records with severity_score, severity_level, status, years_to_failure
+        - rules: The rule set that was applied
+    """
+    try:
+        import pandas as pd
+        from scoring import RULE_SETS, make_rules, score_frame
+        
+        payload = request.get_json(silent=True) or {}
+        rules = make_rules(payload.get('rules', 'report'), payload.get('overrides'))
+        interval = payload.get('interval', 7.0)
+        
+        if payload.get('data') is not None:
+            df = pd.DataFrame(payload['data'])
+        else:
+            dataset = payload.get('dataset', 'report')
+            path = {'report': REPORT_PATH, 'upload': CURRENT_RUN_PATH}.get(dataset)
+            if path is None:
+                return jsonify({'success': False, 'error': f"Unknown dataset '{dataset}'"}), 400
+            if not path.exists():
+                return jsonify({'success': False, 'error': f'No {dataset} data found. Run the pipeline or upload data first.'}), 404
+            df = pd.read_csv(path)
+        
+        scored = score_frame(df, rules=rules, interval=interval)
+        
+        g.metrics_rows = len(scored)
+        return jsonify({
+            'success': True,
+            'data': scored.replace({float('nan'): None}).to_dict(orient='records'),
+            'rules': rules,
+            'available_rules': list(RULE_SETS)
+        })
+        
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        logging.exception("Error in /api/score")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+def get_whatif_session():
+    """
+    Return the cached incremental report session. It is built from the
+    pipeline's own matching inputs (the source workbook, run in memory up
+    to matching), so uploads never replace the runs it compares. Callers
+    hold _whatif_lock while using it.
+    """
+    from pipeline import Pipeline, DEFAULT_SOURCE
+    from incremental import IncrementalReport
+    
+    global _whatif_session, _whatif_key
+    key = os.stat(DEFAULT_SOURCE).st_mtime_ns
+    if _whatif_session is None or key != _whatif_key:
+        pipe = Pipeline(source=DEFAULT_SOURCE)
+        pipe.run(targets=['matching'])
+        matching = pipe.outputs['matching']
+        _whatif_session = IncrementalReport(matching['anoms15'], matching['anoms22'])
+        _whatif_key = key
+    return _whatif_session
+
+
+@app.route('/api/whatif', methods=['POST'])
+def whatif_report():
+    """
+    Interactive what-if tuning of the growth report. Only the stages that
+    depend on the changed parameters are recomputed; the assignment is only
+    re-solved when match_tolerance or orient_scale changes.
+    
+    Request JSON (all optional):
+        - match_tolerance, orient_scale: Matching parameters
+        - dist_tolerance, orient_tolerance: Validation tolerances
+        - confidence_weights, confidence_levels, review_thresholds: Report criteria
+        - rules: Rule set name or partial rule overrides (see scoring.py)
+        - interaction_rules: Interacting anomaly rules (see clustering.py)
+        - pipe_params: Pipe parameters of the remaining strength (see remaining_strength.py)
+        - include_data: Return the report records as well as the summary
+    
+    Response:
+        - success: boolean
+        - summary: Headline counts
+        - recomputed: Stages that were recomputed
+        - params: Current parameters
+    """
+    try:
+        import time
+        
+        payload = request.get_json(silent=True) or {}
+        include_data = bool(payload.pop('include_data', False))
+        
+        start = time.perf_counter()
+        with _whatif_lock:
+            try:
+                session = get_whatif_session()
+            except FileNotFoundError:
+                return jsonify({'success': False, 'error': 'No source workbook found for the what-if report.'}), 404
+            session.update(**payload)
+            summary = session.summary()
+            response = {
+                'success': True,
+                'summary': summary,
+                'recomputed': session.last_recomputed,
+                'params': copy.deepcopy(session.params),
+                'elapsed_ms': round(1000 * (time.perf_counter() - start), 2)
+            }
+            if include_data:
+                response['data'] = session.report().replace({float('nan'): None}).to_dict(orient='records')
+        g.metrics_rows = summary['total_matched']
+        return jsonify(response)
+        
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        logging.exception("Error in /api/whatif")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+def get_store(dataset):
+    """Return the cached AnomalyStore for a dataset, rebuilt when its file changes."""
+    import pandas as pd
+    from anomaly_store import AnomalyStore, load_store
+    
+    path = STORE_DATASETS[dataset]
+    if dataset == 'report':
+        return load_store(path, reader=lambda p: pd.read_json(p, orient='records'))
+    
+    # Uploaded runs are stored unscored: score the shared run store's rows
+    # (already distance-sorted) with the same rules as /api/upload
+    run = load_store(path)
+    cached = _stores.get(dataset)
+    if cached is None or cached[0] is not run:
+        records = run.records
+        if 'depth' in records.columns:
+            records = records.assign(**upload_scores(records))
+        cached = (run, AnomalyStore(records))
+        _stores[dataset] = cached
+    return cached[1]
+
+
+def _list_arg(name):
+    """Comma-separated query argument as a list (None when absent)."""
+    value = request.args.get(name)
+    return [v.strip() for v in value.split(',') if v.strip()] if value else None
+
+
+@app.route('/api/anomalies', methods=['GET'])
+def query_anomalies():
+    """
+    Query anomalies by viewport instead of loading the whole payload.
+    Rows come back in aligned distance order, one page at a time.
+    
+    Query:
+        - dataset: 'report' (matched + new anomalies, default) or 'upload'
+        - dist_min, dist_max: Aligned distance range (ft)
+        - joint_min, joint_max: Joint number range
+        - joint_center, joint_radius: Neighborhood of joints (instead of a joint range)
+        - status, severity, confidence: Comma-separated allowed values
+        - min_depth, min_severity, min_confidence: Numeric lower bounds
+        - review_mask: OR-ed review flag bits (see /api/review_flags); rows with any of them set
+        - review_match: 'all' to require every bit of review_mask (default 'any')
+        - fields: Comma-separated columns to return (default all)
+        - offset, limit: Pagination (limit capped at 10000)
+        - describe: 'true' to also return the store's extent and categories
+    
+    Response:
+        - success: boolean
+        - total, offset, limit, next_offset: Pagination state
+        - data: Records for this page
+    """
+    try:
+        from anomaly_store import DEFAULT_PAGE_SIZE
+        
+        dataset = request.args.get('dataset', 'report')
+        if dataset not in STORE_DATASETS:
+            return jsonify({'success': False, 'error': f"Unknown dataset '{dataset}'"}), 400
+        try:
+            store = get_store(dataset)
+        except FileNotFoundError:
+            return jsonify({'success': False, 'error': f'No {dataset} data found. Run the pipeline or upload data first.'}), 404
+        
+        criteria = {name: request.args.get(name, type=float)
+                    for name in ('dist_min', 'dist_max', 'joint_min', 'joint_max',
+                                 'min_depth', 'min_severity', 'min_confidence')}
+        center = request.args.get('joint_center', type=float)
+        if center is not None:
+            criteria['joint_min'], criteria['joint_max'] = store.neighborhood(
+                center, request.args.get('joint_radius', 5, type=int))
+        for name in ('status', 'severity', 'confidence'):
+            criteria[name] = _list_arg(name)
+        criteria['review_mask'] = request.args.get('review_mask', type=int)
+        criteria['review_match'] = request.args.get('review_match')
+        
+        page = store.query(
+            offset=request.args.get('offset', 0, type=int),
+            limit=request.args.get('limit', DEFAULT_PAGE_SIZE, type=int),
+            fields=_list_arg('fields'),
+            **criteria
+        )
+        g.metrics_rows = len(page['data'])
+        response = {'success': True, 'dataset': dataset, **page}
+        if request.args.get('describe', 'false').lower() == 'true':
+            response['store'] = store.describe()
+        return jsonify(response)
+        
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        logging.exception("Error in /api/anomalies")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+def get_run_file(name):
+    """Memory-mapped run file by name (shared by this process's requests), or None."""
+    from runfile import open_run_file, RUN_FILE_EXT
+    
+    path = RUNS_DIR / f'{name}{RUN_FILE_EXT}'
+    if not re.fullmatch(r'[\w.-]+', name) or not path.exists():
+        return None
+    return open_run_file(path)
+
+
+@app.route('/api/runs', methods=['GET'])
+def list_run_files():
+    """Run files available for /api/runs/<name> queries, with their extent."""
+    from runfile import RUN_FILE_EXT
+    
+    names = sorted(p.name[:-len(RUN_FILE_EXT)] for p in RUNS_DIR.glob(f'*{RUN_FILE_EXT}')) if RUNS_DIR.exists() else []
+    return jsonify({'success': True, 'runs': {name: get_run_file(name).describe() for name in names}})
+
+
+@app.route('/api/runs/<name>', methods=['GET'])
+def query_run_file(name):
+    """
+    Query a memory-mapped run file directly: only the pages of the rows
+    and columns asked for are read, and every worker shares the file's
+    pages through the OS cache.
+    
+    Query:
+        - dist_min, dist_max: Distance range (ft) on the file's sort column
+        - joint_min, joint_max: Joint number range
+        - category: Event category ('metal_loss', 'dent', 'girth_weld')
+        - fields: Comma-separated columns to return (default all)
+        - offset, limit: Pagination (limit capped at 10000)
+        - format: 'columnar' for a binary columnar payload of the page
+        - describe: 'true' to also return the run's extent
+    
+    Response:
+        - success, total, offset, limit, next_offset, data (as /api/anomalies)
+    """
+    try:
+        from anomaly_store import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+        
+        run = get_run_file(name)
+        if run is None:
+            return jsonify({'success': False, 'error': f"Unknown run file '{name}'"}), 404
+        
+        rows = run.select(
+            category=request.args.get('category') or None,
+            **{key: request.args.get(key, type=float) for key in ('dist_min', 'dist_max', 'joint_min', 'joint_max')}
+        )
+        offset = max(0, request.args.get('offset', 0, type=int))
+        limit = max(1, min(request.args.get('limit', DEFAULT_PAGE_SIZE, type=int), MAX_PAGE_SIZE))
+        fields = _list_arg('fields')
+        
+        if request.args.get('format') == 'columnar':
+            from columnar import encode_columnar, CONTENT_TYPE
+            page_rows = rows[offset:offset + limit]
+            g.metrics_rows = len(page_rows)
+            meta = {'kind': 'run_page', 'run': name, 'total': int(len(rows)), 'offset': offset}
+            return Response(encode_columnar(run.frame(page_rows, columns=fields), meta=meta), mimetype=CONTENT_TYPE)
+        
+        page = run.page(rows, offset=offset, limit=limit, fields=fields)
+        g.metrics_rows = len(page['data'])
+        response = {'success': True, 'run': name, **page}
+        if request.args.get('describe', 'false').lower() == 'true':
+            response['describe'] = run.describe()
+        return jsonify(response)
+        
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        logging.exception("Error in /api/runs")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+def get_tiles(dataset):
+    """
+    Return the level-of-detail tile pyramid for a dataset. The report uses
+    the precomputed tiles.json when it is at least as new as the UI payload;
+    otherwise the pyramid is built from the dataset's store.
+    """
+    from tiles import build_tile_pyramid, load_tile_pyramid
+    
+    store = get_store(dataset)
+    cached = _tiles.get(dataset)
+    if cached is None or cached[0] is not store:
+        if dataset == 'report' and TILES_PATH.exists() \
+                and TILES_PATH.stat().st_mtime_ns >= UI_PAYLOAD_PATH.stat().st_mtime_ns:
+            pyramid = load_tile_pyramid(TILES_PATH)
+        else:
+            pyramid = build_tile_pyramid(store.records)
+        cached = (store, pyramid)
+        _tiles[dataset] = cached
+    return cached[1]
+
+
+@app.route('/api/tiles', methods=['GET'])
+def tile_range():
+    """
+    Aggregate tiles for the zoomed-out view: per distance bin, counts by
+    status and severity, max depth, max growth rate and worst time to failure.
+    
+    Query:
+        - dataset: 'report' (default) or 'upload'
+        - level: Bin width in ft (one of the response's 'levels'; default the coarsest)
+        - start, end: Bin number range (inclusive), or
+        - dist_min, dist_max: Aligned distance range (ft)
+    
+    Response:
+        - success: boolean
+        - level, levels: Bin width served and the available widths
+        - tiles: Columnar bins (see tiles.py), only non-empty bins
+    """
+    try:
+        from tiles import slice_tiles, tiles_payload
+        
+        dataset = request.args.get('dataset', 'report')
+        if dataset not in STORE_DATASETS:
+            return jsonify({'success': False, 'error': f"Unknown dataset '{dataset}'"}), 400
+        try:
+            pyramid = get_tiles(dataset)
+        except FileNotFoundError:
+            return jsonify({'success': False, 'error': f'No {dataset} data found. Run the pipeline or upload data first.'}), 404
+        
+        levels = sorted(pyramid)
+        level = request.args.get('level', levels[-1], type=int)
+        if level not in pyramid:
+            return jsonify({'success': False, 'error': f"Unknown level {level}. Available: {levels}"}), 400
+        
+        start = request.args.get('start', type=int)
+        end = request.args.get('end', type=int)
+        dist_min = request.args.get('dist_min', type=float)
+        dist_max = request.args.get('dist_max', type=float)
+        if start is None and dist_min is not None:
+            start = int(dist_min // level)
+        if end is None and dist_max is not None:
+            end = int(dist_max // level)
+        
+        tiles = slice_tiles(pyramid[level], start, end)
+        g.metrics_rows = len(tiles)
+        return jsonify({
+            'success': True,
+            'dataset': dataset,
+            'level': level,
+            'levels': levels,
+            'start': start,
+            'end': end,
+            'tiles': tiles_payload(tiles)
+        })
+        
+    except Exception as e:
+        logging.exception("Error in /api/tiles")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
 @app.route('/api/load_demo', methods=['POST'])
 def load_demo_data():
     """Load the demo dataset directly"""
@@ -296,6 +1246,8 @@ def load_demo_data():
         if not demo_path.exists():
             return jsonify({'success': False, 'error': f'Demo file not found at {demo_path}'}), 404
             
+        from universal_parser import UniversalParser
+        
         # Parse file
         parser = UniversalParser()
         df = parser.parse_file(
@@ -305,8 +1257,6 @@ def load_demo_data():
         )
         
         # SAVE DATA FOR PREDICTION (Missing step)
-        # Ensure directory exists
-        os.makedirs(os.path.dirname(ALIGNED_2022_PATH), exist_ok=True)
         # Save standardized column mapping
         df.rename(columns={
             'distance': 'distance_aligned', # API expects 'distance_aligned'
@@ -319,11 +1269,13 @@ def load_demo_data():
         if 'distance' in df.columns and 'distance_aligned' not in df.columns:
             df['distance_aligned'] = df['distance']
             
-        df.to_csv(ALIGNED_2022_PATH, index=False)
-        print(f"Saved demo data to {ALIGNED_2022_PATH}")
+        save_current_run(df)
+        print(f"Saved demo data to {CURRENT_RUN_PATH}")
         
-        # Convert to JSON-serializable format
-        data = df.replace({float('nan'): None}).to_dict(orient='records')
+        # Score with the single-run rules so the viewer doesn't have to
+        records = df.assign(**upload_scores(df))
+        stream = wants_ndjson(request)
+        etag = make_etag('load_demo', file_key(demo_path), stream)
         
         # Generate statistics
         stats = {
@@ -337,17 +1289,379 @@ def load_demo_data():
             }
         }
         
-        return jsonify({
+        g.metrics_rows = len(df)
+        envelope = {
             'success': True,
-            'data': data,
             'column_mapping': parser.column_mapping,
             'stats': stats,
             'message': f'Successfully loaded demo data ({len(df)} rows)'
-        })
+        }
+        if stream:
+            return ndjson_response(request, envelope, records, etag=etag)
+        cached = not_modified(request, etag)
+        if cached is not None:
+            return cached
+        
+        # Convert to JSON-serializable format
+        data = records.replace({float('nan'): None}).to_dict(orient='records')
+        return tag_response(jsonify({**envelope, 'data': data}), etag)
         
     except Exception as e:
          return jsonify({'success': False, 'error': str(e)}), 500
 
+def job_accepted(job):
+    """202 response pointing at a started job's events and result."""
+    return jsonify({
+        'success': True,
+        'job_id': job.id,
+        'state': job.state,
+        'events': f'/api/jobs/{job.id}/events',
+        'result': f'/api/jobs/{job.id}/result'
+    }), 202
+
+
+@app.route('/api/pipeline', methods=['POST'])
+def run_pipeline_job():
+    """
+    Run the full pipeline (workbook -> report) as a background job and
+    export its outputs, intermediates and run files included, to the data
+    directory.
+    
+    Request JSON (all optional):
+        - source: File name of an ILI workbook in WORKBOOK_DIR (ILI_WORKBOOK_DIR,
+          default the repository directory); paths are rejected
+        - match_tolerance, dist_tolerance, orient_tolerance: Pipeline parameters
+    
+    Response:
+        202 with job_id; progress counts pipeline stages. When jobs are off
+        (several workers), the pipeline runs inline: 200 with the job result
+    """
+    from pipeline import STAGE_ORDER
+    
+    payload = request.get_json(silent=True) or {}
+    params = {k: payload[k] for k in ('match_tolerance', 'dist_tolerance', 'orient_tolerance') if k in payload}
+    if 'source' in payload:
+        source = workbook_path(payload['source'])
+        if source is None:
+            return jsonify({'success': False,
+                            'error': 'source must be the file name of an Excel workbook in the workbook directory'}), 400
+        params['source'] = str(source)
+    if not async_jobs_enabled():
+        try:
+            return jsonify({'success': True, 'result': run_pipeline(params)})
+        except Exception as e:
+            logging.exception("Error in /api/pipeline")
+            return jsonify({'success': False, 'error': str(e)}), 500
+    plan = [f'pipeline.{name}' for name in STAGE_ORDER] + ['pipeline.export']
+    job = start_job('pipeline', run_pipeline, params, plan=plan)
+    return job_accepted(job)
+
+
+def run_pipeline(params):
+    """Background job body of /api/pipeline."""
+    from pipeline import Pipeline
+    
+    pipe = Pipeline(**params)
+    pipe.run()
+    with profile_stage('pipeline.export') as timer:
+        written = pipe.export(str(DATA_DIR), intermediates=True, run_files=True)
+        timer.rows = len(written)
+    report = pipe.outputs['report']
+    return {
+        'run_log': pipe.run_log,
+        'written': [os.path.relpath(path, DATA_DIR) for path in written],
+        'matched': len(report['report']),
+        'new': len(report['new_anomalies']),
+        'missing': len(report['missing_anomalies'])
+    }
+
+
+# Pipeline parameters /api/analyze accepts as form fields
+ANALYZE_PARAMS = {
+    'match_tolerance': float,
+    'orient_scale': float,
+    'dist_tolerance': float,
+    'orient_tolerance': float,
+    'depth_tolerance': float,
+    'interval': float,
+    'rules': str,
+}
+
+
+def parse_run(filepath, digest, year=None, manual_mapping=None):
+    """
+    Parse one inspection run for analysis (references kept, since alignment
+    needs the girth welds), or return the cached parse of the same content.
+
+    Returns:
+        dict with df, column_mapping, warnings
+    """
+    mapping_key = json.dumps(manual_mapping, sort_keys=True) if manual_mapping else None
+    key = (digest, Path(filepath).suffix.lower(), 'run', year, mapping_key)
+    entry = _parse_cache.get(key)
+    if entry is not None:
+        return entry
+
+    from universal_parser import UniversalParser
+
+    parser = UniversalParser()
+    df = parser.parse_file(filepath, year=year, filter_references=False, manual_mapping=manual_mapping)
+    return _parse_cache.put(key, {
+        'df': df,
+        'column_mapping': dict(parser.column_mapping),
+        'warnings': list(parser.warnings),
+    })
+
+
+def run_analysis(source, runs, params):
+    """
+    Parse two runs (or read a workbook) and run the whole pipeline on them
+    in memory. Body of /api/analyze, synchronously or as a job.
+
+    Args:
+        source: Workbook path, or None when runs are given
+        runs: List of (label, filepath, digest, year, manual_mapping), older run first
+        params: Pipeline parameter overrides
+
+    Returns:
+        dict with the pipeline, the parse log, column mappings and warnings
+    """
+    from pipeline import Pipeline
+
+    parse_log, column_mapping, warnings = [], {}, []
+    try:
+        if source is None:
+            frames = []
+            for label, filepath, digest, year, manual_mapping in runs:
+                with profile_stage(f'analyze.parse_{label}') as timer:
+                    entry = parse_run(filepath, digest, year=year, manual_mapping=manual_mapping)
+                    timer.rows = len(entry['df'])
+                frames.append(entry['df'])
+                column_mapping[label] = entry['column_mapping']
+                warnings += [f'{label}: {w}' for w in entry['warnings']]
+                parse_log.append({'stage': f'parse_{label}', 'ms': timer.record['wall_ms'], 'rows': timer.rows})
+            source = tuple(frames)
+        pipe = Pipeline(source=source, **params)
+        pipe.run()
+    finally:
+        for path in [source] if isinstance(source, str) else [run[1] for run in runs]:
+            if os.path.exists(path):
+                os.remove(path)
+    return {'pipeline': pipe, 'parse_log': parse_log, 'column_mapping': column_mapping, 'warnings': warnings}
+
+
+def analysis_response(result, include_data):
+    """Scored report, UI payload and per-stage timings of a run_analysis() result."""
+    from analytics import report_csv_frame
+
+    pipe = result['pipeline']
+    report = pipe.outputs['report']
+    stages = result['parse_log'] + [
+        {'stage': entry['stage'], 'status': entry['status'],
+         'ms': round(1000 * entry['seconds'], 2), 'rows': entry['rows']}
+        for entry in pipe.run_log
+    ]
+    g.metrics_rows = len(report['report'])
+    response = {
+        'success': True,
+        'summary': {
+            'matched': len(report['report']),
+            'validated': int(pipe.outputs['validation']['is_valid'].sum()),
+            'new': len(report['new_anomalies']),
+            'missing': len(report['missing_anomalies']),
+            'interacting_clusters': int((pipe.outputs['clustering']['clusters']['size'] > 1).sum()),
+            'near_sensitive_locations': int((report['report']['nearby_locations'] > 0).sum()),
+        },
+        'params': {k: v for k, v in pipe.params.items() if k != 'source'},
+        'stages': stages,
+        'total_ms': round(sum(s['ms'] for s in stages), 2),
+        'column_mapping': result['column_mapping'],
+        'warnings': result['warnings'],
+    }
+    if include_data:
+        response['report'] = report_csv_frame(report['report']).replace({float('nan'): None}).to_dict(orient='records')
+        response['ui_payload'] = report['ui_payload'].replace({float('nan'): None}).to_dict(orient='records')
+    return jsonify(response)
+
+
+@app.route('/api/analyze', methods=['POST'])
+def analyze_runs():
+    """
+    Analyze a new inspection in one call: parse two runs, extract
+    references, build the master reference, align, match, validate and
+    score, all in memory.
+    
+    Form data:
+        - file: ILI workbook with the 2015 and 2022 sheets (as read by ingestion.py), or
+        - run_a, run_b: The older and newer run, in any upload format
+        - year_a, year_b: Optional run years (their difference sets the growth interval)
+        - mapping_a, mapping_b: Optional JSON column mappings ({raw: standard})
+        - match_tolerance, orient_scale, dist_tolerance, orient_tolerance,
+          depth_tolerance, interval, rules: Optional pipeline parameters
+        - include_data: Return the report and UI payload records (default true)
+        - async: Run as a background job (202 with job_id; inline when jobs are off)
+    
+    Response:
+        - success, summary (matched, validated, new, missing)
+        - stages: Per-stage timings (ms, rows), total_ms
+        - report, ui_payload: Records (with include_data)
+    """
+    from pipeline import STAGE_ORDER
+    
+    try:
+        form = request.form
+        params = {}
+        for name, cast in ANALYZE_PARAMS.items():
+            if form.get(name):
+                try:
+                    params[name] = cast(form[name])
+                except ValueError:
+                    return jsonify({'success': False, 'error': f"Invalid value for '{name}'"}), 400
+        include_data = form.get('include_data', 'true').lower() == 'true'
+        
+        def save(file):
+            filepath = upload_path(file.filename, 'analyze')
+            return filepath, save_and_hash(file.stream, filepath)
+        
+        if 'file' in request.files:
+            workbook = request.files['file']
+            if not workbook.filename.lower().endswith(('.xlsx', '.xls')):
+                return jsonify({'success': False, 'error': 'A single file must be an Excel workbook with one sheet per run'}), 400
+            source, _ = save(workbook)
+            runs = []
+        elif 'run_a' in request.files and 'run_b' in request.files:
+            files, mappings = {}, {}
+            for label in ('a', 'b'):
+                files[label] = request.files[f'run_{label}']
+                if not allowed_file(files[label].filename):
+                    return jsonify({
+                        'success': False,
+                        'error': f'File type not supported. Allowed types: {", ".join(ALLOWED_EXTENSIONS)}'
+                    }), 400
+                try:
+                    mappings[label] = json.loads(form[f'mapping_{label}']) if form.get(f'mapping_{label}') else None
+                except ValueError:
+                    return jsonify({'success': False, 'error': f"Invalid JSON in 'mapping_{label}'"}), 400
+            year_a, year_b = form.get('year_a', type=int), form.get('year_b', type=int)
+            if year_a and year_b and 'interval' not in params:
+                if year_b <= year_a:
+                    return jsonify({'success': False, 'error': 'year_b must be later than year_a'}), 400
+                params['interval'] = year_b - year_a
+            source = None
+            runs = [(label, *save(files[label]), year, mappings[label])
+                    for label, year in (('a', year_a), ('b', year_b))]
+        else:
+            return jsonify({'success': False, 'error': "Provide a workbook as 'file', or two runs as 'run_a' and 'run_b'"}), 400
+        
+        if form.get('async', 'false').lower() == 'true' and async_jobs_enabled():
+            plan = [f'analyze.parse_{run[0]}' for run in runs] + [f'pipeline.{name}' for name in STAGE_ORDER]
+            job = start_job('analyze', run_analysis, source, runs, params, plan=plan,
+                            meta={'respond': lambda result: analysis_response(result, include_data)})
+            return job_accepted(job)
+        
+        return analysis_response(run_analysis(source, runs, params), include_data)
+        
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        logging.exception("Error in /api/analyze")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+@app.route('/api/jobs', methods=['GET'])
+def jobs_list():
+    """Jobs of this process (running, queued and recently finished)."""
+    return jsonify({'success': True, 'jobs': list_jobs()})
+
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    job = get_job(job_id)
+    if job is None:
+        return jsonify({'success': False, 'error': 'Unknown job'}), 404
+    return jsonify({'success': True, **job.snapshot()})
+
+
+@app.route('/api/jobs/<job_id>/events', methods=['GET'])
+def job_events(job_id):
+    """
+    Server-sent events for a job: 'state', 'stage' and 'progress' events
+    (see jobs.py) until it finishes. Reconnecting clients send
+    Last-Event-ID and get the events they missed.
+    
+    A job whose followers have all disconnected for a while is cancelled.
+    """
+    job = get_job(job_id)
+    if job is None:
+        return jsonify({'success': False, 'error': 'Unknown job'}), 404
+    last_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id') or 0
+    try:
+        last_id = int(last_id)
+    except ValueError:
+        last_id = 0
+    
+    def stream():
+        yield 'retry: 2000\n\n'
+        for event in job.follow(last_id):
+            if event is None:
+                yield ': keep-alive\n\n'
+                continue
+            yield f"id: {event['id']}\nevent: {event['type']}\ndata: {json.dumps(event, default=str)}\n\n"
+    
+    return Response(stream(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+@app.route('/api/jobs/<job_id>/cancel', methods=['POST'])
+@app.route('/api/jobs/<job_id>', methods=['DELETE'])
+def cancel_job(job_id):
+    """Stop a job at its next stage boundary or progress report."""
+    job = get_job(job_id)
+    if job is None:
+        return jsonify({'success': False, 'error': 'Unknown job'}), 404
+    if job.state not in ('done', 'failed', 'cancelled'):
+        job.cancel()
+    return jsonify({'success': True, **job.snapshot()})
+
+
+@app.route('/api/jobs/<job_id>/result', methods=['GET'])
+def job_result(job_id):
+    """
+    Result of a finished job, in the same shape as the synchronous endpoint
+    (the NDJSON negotiation of /api/upload and /api/predict applies).
+    """
+    job = get_job(job_id)
+    if job is None:
+        return jsonify({'success': False, 'error': 'Unknown job'}), 404
+    if job.state != 'done':
+        status = 409 if job.state in ('queued', 'running') else 410 if job.state == 'cancelled' else 500
+        return jsonify({'success': False, 'error': job.error or f'Job is {job.state}', **job.snapshot()}), status
+    respond = job.meta.get('respond')
+    if respond is not None:
+        return respond(job.result)
+    return jsonify({'success': True, 'result': job.result})
+
+
+def warm_up():
+    """
+    Load the growth model and the what-if report data up front. The
+    production server calls this in the master process before forking, so
+    workers share these pages copy-on-write instead of loading their own.
+    
+    Returns:
+        dict of what was loaded
+    """
+    loaded = {'model': get_predictor().is_trained}
+    try:
+        with _whatif_lock:
+            session = get_whatif_session()
+            session.report()
+            loaded['whatif_rows'] = len(session.anoms15) + len(session.anoms22)
+    except FileNotFoundError:
+        loaded['whatif_rows'] = 0
+    return loaded
+
+
 if __name__ == '__main__':
     print("=" * 60)
     print("Pipeline Data Upload API")
@@ -360,8 +1674,22 @@ if __name__ == '__main__':
     print("Endpoints:")
     print("  - GET  /api/health   - Health check")
     print("  - POST /api/upload   - Upload and process file")
+    print("  - POST /api/uploads  - Start a resumable chunked upload")
     print("  - POST /api/preview  - Preview file columns")
     print("  - POST /api/predict  - Predict anomaly growth")
+    print("  - POST /api/analyze  - Parse, align, match and score two runs in one call")
+    print("  - POST /api/pipeline - Run the pipeline as a background job")
+    print("  - GET  /api/jobs/<id>/events - Job progress (server-sent events)")
+    print("  - GET  /api/review_flags - Review reason bit values")
+    print("  - POST /api/score    - Rescore a dataset with a rule set")
+    print("  - POST /api/whatif   - Tune report thresholds/weights incrementally")
+    print("  - GET  /api/anomalies - Paginated range/joint/status queries")
+    print("  - GET  /api/tiles    - Distance-binned aggregates for zoomed-out views")
+    print("  - GET  /api/runs/<name> - Range queries on memory-mapped run files")
+    print("  - GET  /api/metrics  - Per-stage timing percentiles")
     print("=" * 60)
     
+    # JSON stage records to stderr unless ILI_METRICS_LOG points elsewhere
+    configure_logging(os.environ.get('ILI_METRICS_LOG', '-'))
+    
     app.run(debug=True, port=5000, host='0.0.0.0')
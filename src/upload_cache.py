@@ -0,0 +1,123 @@
+"""
+Upload Cache
+Uploads are identified by the SHA-256 of their bytes, computed while the
+file is written to disk. Parsed results are kept in a size-bounded LRU under
+(content hash, parser options), so re-uploading or previewing a file the
+server has already seen skips the Excel / CSV parse entirely.
+
+Environment:
+    ILI_UPLOAD_CACHE_MB=<n>  Memory budget of the cache (default 256, 0 disables it)
+"""
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+UPLOAD_CACHE_MB = float(os.environ.get('ILI_UPLOAD_CACHE_MB', 256))
+COPY_BLOCK_SIZE = 1 << 20
+
+
+def save_and_hash(stream, path, block_size=COPY_BLOCK_SIZE):
+    """
+    Copy an upload stream to disk, hashing it on the way.
+
+    Args:
+        stream: Readable binary file object (e.g. a werkzeug FileStorage's stream)
+        path: Destination file
+
+    Returns:
+        SHA-256 hex digest of the bytes written
+    """
+    digest = hashlib.sha256()
+    with open(path, 'wb') as f:
+        for block in iter(lambda: stream.read(block_size), b''):
+            digest.update(block)
+            f.write(block)
+    return digest.hexdigest()
+
+
+def _entry_bytes(value):
+    """Approximate memory footprint of a cached value (DataFrames, Series, containers)."""
+    if hasattr(value, 'memory_usage'):
+        usage = value.memory_usage(deep=True)
+        return int(usage.sum()) if hasattr(usage, 'sum') else int(usage)
+    if isinstance(value, dict):
+        return sum(_entry_bytes(v) for v in value.values())
+    if isinstance(value, (list, tuple)):
+        return sum(_entry_bytes(v) for v in value)
+    return 64
+
+
+class ParseCache:
+    """
+    Thread-safe LRU of parsed uploads, bounded by approximate memory size.
+
+    Usage:
+        cache = ParseCache(max_mb=256)
+        entry = cache.get((digest, 'parse', year, filter_references))
+        if entry is None:
+            entry = cache.put(key, {'df': df, ...})
+    """
+
+    def __init__(self, max_mb=UPLOAD_CACHE_MB):
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self._entries = OrderedDict()    # key -> (value, size)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def get(self, key):
+        """Cached value (marked most recently used), or None."""
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return item[0]
+
+    def put(self, key, value):
+        """
+        Cache a value, evicting least recently used entries to stay in
+        budget. Values larger than the whole budget are not kept.
+
+        Returns:
+            The value
+        """
+        size = _entry_bytes(value)
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            if size > self.max_bytes:
+                return value
+            self._entries[key] = (value, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._bytes -= evicted
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'mb': round(self._bytes / (1024 * 1024), 2),
+                'max_mb': round(self.max_bytes / (1024 * 1024), 2),
+                'hits': self.hits,
+                'misses': self.misses,
+            }
@@ -7,14 +7,20 @@ distance and orientation tolerances from vendor data.
 import pandas as pd
 import numpy as np
 
+from profiling import profiled
+
 # Industry-standard tolerances for ILI (In-Line Inspection)
 DISTANCE_TOLERANCE_FT = 5.0      # ±5 feet for distance
 ORIENTATION_TOLERANCE_DEG = 60.0  # ±60 degrees (2 clock hours)
 
+# Rows per chunk when streaming large match files through the validator
+DEFAULT_CHUNK_ROWS = 250_000
+
 def calculate_orientation_difference(orient1, orient2):
     """
     Calculate the minimum angular difference between two orientations.
     Handles wraparound (e.g., 350° and 10° are only 20° apart).
+    Accepts scalars or arrays.
     
     Args:
         orient1: Orientation in degrees (0-360)
@@ -23,98 +29,213 @@ def calculate_orientation_difference(orient1, orient2):
     Returns:
         Minimum angular difference in degrees
     """
-    diff = abs(orient1 - orient2)
+    diff = np.abs(np.asarray(orient1, dtype=float) - np.asarray(orient2, dtype=float))
     # Handle wraparound
-    if diff > 180:
-        diff = 360 - diff
-    return diff
+    diff = np.where(diff > 180, 360 - diff, diff)
+    return diff if diff.ndim else float(diff)
 
-def validate_match(dist_15, dist_22_aligned, orient_15, orient_22, 
-                   dist_tolerance=DISTANCE_TOLERANCE_FT, 
-                   orient_tolerance=ORIENTATION_TOLERANCE_DEG):
+def validate_arrays(dist_15, dist_22_aligned, orient_15, orient_22,
+                    dist_tolerance=DISTANCE_TOLERANCE_FT,
+                    orient_tolerance=ORIENTATION_TOLERANCE_DEG,
+                    depth_15=None, depth_22=None, depth_tolerance=None):
     """
-    Validate if two anomalies are truly the same based on distance and orientation.
+    Vectorized validation engine. Validates whole arrays of matched pairs in one pass.
+    
+    Every tolerance may be a scalar or an array with one value per row, so
+    tool-specific specs (e.g. a per-vendor depth sizing accuracy) can be applied
+    row by row.
     
     Args:
-        dist_15: Distance in 2015 run (feet)
-        dist_22_aligned: Aligned distance in 2022 run (feet)
-        orient_15: Orientation in 2015 run (degrees, 0-360)
-        orient_22: Orientation in 2022 run (degrees, 0-360)
+        dist_15: Distances in 2015 run (feet)
+        dist_22_aligned: Aligned distances in 2022 run (feet)
+        orient_15: Orientations in 2015 run (degrees, 0-360)
+        orient_22: Orientations in 2022 run (degrees, 0-360)
         dist_tolerance: Maximum allowed distance difference (feet)
         orient_tolerance: Maximum allowed orientation difference (degrees)
+        depth_15: Optional depths in 2015 run (% wall)
+        depth_22: Optional depths in 2022 run (% wall)
+        depth_tolerance: Optional maximum allowed depth difference (% wall).
+            The depth check is only applied when this and both depths are given.
     
     Returns:
-        dict with validation results
+        dict of numpy arrays with validation results
     """
+    dist_15 = np.asarray(dist_15, dtype=float)
+    dist_22_aligned = np.asarray(dist_22_aligned, dtype=float)
+    dist_tolerance = np.asarray(dist_tolerance, dtype=float)
+    orient_tolerance = np.asarray(orient_tolerance, dtype=float)
+    
     # Calculate differences
-    dist_diff = abs(dist_22_aligned - dist_15)
-    orient_diff = calculate_orientation_difference(orient_15, orient_22)
+    dist_diff = np.abs(dist_22_aligned - dist_15)
+    orient_diff = np.asarray(calculate_orientation_difference(orient_15, orient_22), dtype=float)
     
     # Check tolerances
     dist_valid = dist_diff <= dist_tolerance
     orient_valid = orient_diff <= orient_tolerance
     
     # Overall validation
-    is_valid = dist_valid and orient_valid
+    is_valid = dist_valid & orient_valid
     
-    # Confidence score (0-100)
-    dist_score = max(0, 100 * (1 - dist_diff / dist_tolerance))
-    orient_score = max(0, 100 * (1 - orient_diff / orient_tolerance))
+    # Confidence score (0-100); missing values score zero like the scalar check
+    dist_score = np.fmax(0, 100 * (1 - dist_diff / dist_tolerance))
+    orient_score = np.fmax(0, 100 * (1 - orient_diff / orient_tolerance))
     confidence = (dist_score + orient_score) / 2
     
-    return {
+    result = {
         'is_valid': is_valid,
         'dist_diff_ft': dist_diff,
         'orient_diff_deg': orient_diff,
         'dist_within_tolerance': dist_valid,
         'orient_within_tolerance': orient_valid,
         'confidence_score': confidence,
-        'validation_status': 'VALID' if is_valid else 'INVALID'
     }
+    
+    # Optional depth sizing check
+    if depth_tolerance is not None and depth_15 is not None and depth_22 is not None:
+        depth_diff = np.abs(np.asarray(depth_22, dtype=float) - np.asarray(depth_15, dtype=float))
+        depth_valid = depth_diff <= np.asarray(depth_tolerance, dtype=float)
+        result['depth_diff_pct'] = depth_diff
+        result['depth_within_tolerance'] = depth_valid
+        result['is_valid'] = is_valid & depth_valid
+    
+    result['validation_status'] = np.where(result['is_valid'], 'VALID', 'INVALID')
+    return result
 
+def validate_match(dist_15, dist_22_aligned, orient_15, orient_22, 
+                   dist_tolerance=DISTANCE_TOLERANCE_FT, 
+                   orient_tolerance=ORIENTATION_TOLERANCE_DEG):
+    """
+    Validate if two anomalies are truly the same based on distance and orientation.
+    Scalar wrapper around validate_arrays().
+    
+    Args:
+        dist_15: Distance in 2015 run (feet)
+        dist_22_aligned: Aligned distance in 2022 run (feet)
+        orient_15: Orientation in 2015 run (degrees, 0-360)
+        orient_22: Orientation in 2022 run (degrees, 0-360)
+        dist_tolerance: Maximum allowed distance difference (feet)
+        orient_tolerance: Maximum allowed orientation difference (degrees)
+    
+    Returns:
+        dict with validation results
+    """
+    result = validate_arrays(
+        [dist_15], [dist_22_aligned], [orient_15], [orient_22],
+        dist_tolerance=dist_tolerance, orient_tolerance=orient_tolerance
+    )
+    return {key: values[0].item() for key, values in result.items()}
+
+def _tolerance_values(df, tolerance):
+    """Resolve a tolerance given as a scalar, an array or a column name of df."""
+    if isinstance(tolerance, str):
+        return df[tolerance].to_numpy(dtype=float)
+    return tolerance
+
+def validate_frame(df, dist_tolerance=DISTANCE_TOLERANCE_FT,
+                   orient_tolerance=ORIENTATION_TOLERANCE_DEG,
+                   depth_tolerance=None):
+    """
+    Validate a DataFrame of matched anomalies and append the validation columns.
+    
+    Args:
+        df: DataFrame with dist_15, dist_22_aligned, orient_15, orient_22
+            (and depth_15, depth_22 when a depth tolerance is used)
+        dist_tolerance: Scalar, per-row array or column name (feet)
+        orient_tolerance: Scalar, per-row array or column name (degrees)
+        depth_tolerance: Optional scalar, per-row array or column name (% wall)
+    
+    Returns:
+        DataFrame with validation columns added
+    """
+    has_depth = depth_tolerance is not None
+    val = validate_arrays(
+        df['dist_15'].to_numpy(dtype=float),
+        df['dist_22_aligned'].to_numpy(dtype=float),
+        df['orient_15'].to_numpy(dtype=float),
+        df['orient_22'].to_numpy(dtype=float),
+        dist_tolerance=_tolerance_values(df, dist_tolerance),
+        orient_tolerance=_tolerance_values(df, orient_tolerance),
+        depth_15=df['depth_15'].to_numpy(dtype=float) if has_depth else None,
+        depth_22=df['depth_22'].to_numpy(dtype=float) if has_depth else None,
+        depth_tolerance=_tolerance_values(df, depth_tolerance) if has_depth else None
+    )
+    result_df = df.copy()
+    for col, values in val.items():
+        result_df[col] = values
+    return result_df
+
+def validate_chunks(chunks, **tolerances):
+    """
+    Stream validation over an iterable of DataFrame chunks
+    (e.g. pd.read_csv(..., chunksize=N)) so very large match sets never
+    have to be held in memory at once.
+    
+    Args:
+        chunks: Iterable of matched-anomaly DataFrames
+        **tolerances: Passed through to validate_frame()
+    
+    Yields:
+        Validated DataFrame chunks
+    """
+    for chunk in chunks:
+        yield validate_frame(chunk, **tolerances)
+
+@profiled('validation.validate_all_matches')
 def validate_all_matches(matched_csv='data/processed/matched_anomalies.csv',
-                        output_csv='data/processed/validated_matches.csv'):
+                        output_csv='data/processed/validated_matches.csv',
+                        chunksize=DEFAULT_CHUNK_ROWS,
+                        return_frame=True,
+                        **tolerances):
     """
     Validate all matched anomalies and add validation columns.
+    The input is streamed in chunks and each validated chunk is appended
+    to the output file as soon as it is ready.
     
     Args:
         matched_csv: Path to matched anomalies CSV
         output_csv: Path to save validated results
+        chunksize: Rows per streamed chunk
+        return_frame: Whether to collect and return the full validated DataFrame
+        **tolerances: Optional dist/orient/depth tolerances for validate_frame()
     
     Returns:
-        DataFrame with validation results
+        DataFrame with validation results (None if return_frame is False)
     """
     print("Validating Anomaly Matches...")
     print(f"Distance Tolerance: ±{DISTANCE_TOLERANCE_FT} ft")
     print(f"Orientation Tolerance: ±{ORIENTATION_TOLERANCE_DEG}° ({ORIENTATION_TOLERANCE_DEG/30:.1f} clock hours)")
     print("-" * 60)
     
-    # Load matched anomalies
-    df = pd.read_csv(matched_csv)
+    # Running statistics so chunks can be discarded once written
+    total = valid = dist_violations = orient_violations = 0
+    conf_sum = 0.0
+    conf_min = np.inf
+    conf_max = -np.inf
+    invalid_examples = []
+    frames = []
     
-    # Validate each match
-    validations = []
-    for idx, row in df.iterrows():
-        val = validate_match(
-            row['dist_15'], 
-            row['dist_22_aligned'],
-            row['orient_15'],
-            row['orient_22']
-        )
-        validations.append(val)
-    
-    # Add validation columns
-    val_df = pd.DataFrame(validations)
-    result_df = pd.concat([df, val_df], axis=1)
+    chunks = pd.read_csv(matched_csv, chunksize=chunksize)
+    for i, chunk_df in enumerate(validate_chunks(chunks, **tolerances)):
+        total += len(chunk_df)
+        valid += int(chunk_df['is_valid'].sum())
+        dist_violations += int((~chunk_df['dist_within_tolerance']).sum())
+        orient_violations += int((~chunk_df['orient_within_tolerance']).sum())
+        if len(chunk_df):
+            conf_sum += chunk_df['confidence_score'].sum()
+            conf_min = min(conf_min, chunk_df['confidence_score'].min())
+            conf_max = max(conf_max, chunk_df['confidence_score'].max())
+        if len(invalid_examples) < 5:
+            invalid_examples.extend(
+                chunk_df[~chunk_df['is_valid']].head(5 - len(invalid_examples)).to_dict('records')
+            )
+        
+        chunk_df.to_csv(output_csv, index=False, mode='w' if i == 0 else 'a', header=(i == 0))
+        if return_frame:
+            frames.append(chunk_df)
     
     # Statistics
-    total = len(result_df)
-    valid = result_df['is_valid'].sum()
     invalid = total - valid
     
-    dist_violations = (~result_df['dist_within_tolerance']).sum()
-    orient_violations = (~result_df['orient_within_tolerance']).sum()
-    
     print(f"\nValidation Results:")
     print(f"  Total Matches: {total}")
     print(f"  ✓ Valid Matches: {valid} ({100*valid/total:.1f}%)")
@@ -123,22 +244,21 @@ def validate_all_matches(matched_csv='data/processed/matched_anomalies.csv',
     print(f"  Distance violations: {dist_violations}")
     print(f"  Orientation violations: {orient_violations}")
     print(f"\nConfidence Statistics:")
-    print(f"  Mean confidence: {result_df['confidence_score'].mean():.1f}%")
-    print(f"  Min confidence: {result_df['confidence_score'].min():.1f}%")
-    print(f"  Max confidence: {result_df['confidence_score'].max():.1f}%")
+    print(f"  Mean confidence: {conf_sum / total:.1f}%")
+    print(f"  Min confidence: {conf_min:.1f}%")
+    print(f"  Max confidence: {conf_max:.1f}%")
     
     # Show examples of invalid matches
     if invalid > 0:
         print(f"\n⚠️  Invalid Matches (showing first 5):")
-        invalid_df = result_df[~result_df['is_valid']].head()
-        for idx, row in invalid_df.iterrows():
+        for row in invalid_examples:
             print(f"  Joint {row['joint']}: Δdist={row['dist_diff_ft']:.2f}ft, Δorient={row['orient_diff_deg']:.1f}°")
     
-    # Save results
-    result_df.to_csv(output_csv, index=False)
     print(f"\n✓ Validated results saved to: {output_csv}")
     
-    return result_df
+    if not return_frame:
+        return None
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
 
 def get_validation_summary(validated_csv='data/processed/validated_matches.csv'):
     """
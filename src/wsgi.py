@@ -0,0 +1,19 @@
+"""
+WSGI entry point for the production server (see gunicorn.conf.py).
+
+With preload_app the master process imports this module once: the app,
+the growth model and the report data are loaded before the workers are
+forked and shared with them copy-on-write.
+"""
+
+import gc
+
+import upload_api
+
+print(f"Warmed up: {upload_api.warm_up()}")
+
+app = upload_api.app
+
+# Move everything loaded so far out of the collector's generations, so
+# collections in the workers don't touch (and un-share) these pages
+gc.freeze()
@@ -1,6 +1,10 @@
 #!/bin/bash
 
 # Startup script for RCP Tidal Pipeline Upload API
+#
+# Usage:
+#   ./start_api.sh          Flask development server
+#   ./start_api.sh prod     Gunicorn (settings in src/gunicorn.conf.py)
 
 echo "=========================================="
 echo "RCP Tidal - Pipeline Upload API"
@@ -46,6 +50,10 @@ echo "Starting Upload API Server..."
 echo "=========================================="
 echo ""
 
-# Start the Flask API
+# Start the API
 cd src
-python3 upload_api.py
+if [ "$1" = "prod" ]; then
+    exec gunicorn -c gunicorn.conf.py wsgi:app
+else
+    python3 upload_api.py
+fi
@@ -0,0 +1,92 @@
+// Chunked Uploads
+// Client for the resumable upload API (/api/uploads, src/chunked_upload.py).
+// Files go up in fixed-size chunks, each with its SHA-256; after a dropped
+// connection (or a page reload) the same file resumes from the chunks the
+// server already has.
+
+import { fetchRecords } from './ndjson.js';
+
+export const CHUNKED_UPLOAD_THRESHOLD = 16 * 1024 * 1024; // Larger files use chunks
+export const CHUNK_SIZE = 8 * 1024 * 1024;
+export const CHUNK_RETRIES = 3;
+
+const SESSION_KEY_PREFIX = 'ili-upload:';
+
+async function sha256Hex(buffer) {
+    const digest = await crypto.subtle.digest('SHA-256', buffer);
+    return Array.from(new Uint8Array(digest), b => b.toString(16).padStart(2, '0')).join('');
+}
+
+function sessionKey(file) {
+    return `${SESSION_KEY_PREFIX}${file.name}:${file.size}:${file.lastModified}`;
+}
+
+async function jsonRequest(url, options) {
+    const response = await fetch(url, options);
+    const result = await response.json();
+    if (!response.ok || !result.success) throw new Error(result.error || response.statusText);
+    return result;
+}
+
+// Reuse the stored session for this file if the server still has it
+async function openSession(apiUrl, file, fields) {
+    const stored = localStorage.getItem(sessionKey(file));
+    if (stored) {
+        try {
+            const status = await jsonRequest(`${apiUrl}/uploads/${stored}`);
+            if (status.chunk_size === CHUNK_SIZE) return status;
+        } catch (error) {
+            // Expired or purged: start over
+        }
+    }
+    const session = await jsonRequest(`${apiUrl}/uploads`, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ filename: file.name, size: file.size, chunk_size: CHUNK_SIZE, ...fields })
+    });
+    localStorage.setItem(sessionKey(file), session.upload_id);
+    return session;
+}
+
+async function sendChunk(apiUrl, uploadId, index, blob) {
+    const buffer = await blob.arrayBuffer();
+    const checksum = await sha256Hex(buffer);
+    for (let attempt = 1; ; attempt++) {
+        try {
+            return await jsonRequest(`${apiUrl}/uploads/${uploadId}/chunks/${index}`, {
+                method: 'PUT',
+                headers: { 'X-Chunk-SHA256': checksum, 'Content-Type': 'application/octet-stream' },
+                body: buffer
+            });
+        } catch (error) {
+            if (attempt >= CHUNK_RETRIES) throw error;
+            await new Promise(resolve => setTimeout(resolve, 500 * 2 ** attempt));
+        }
+    }
+}
+
+// Upload a file in chunks and return the /api/upload-shaped result.
+// fields: { year, filter_references }; onProgress(sentBytes, totalBytes)
+export async function uploadInChunks(apiUrl, file, { fields = {}, onProgress = null } = {}) {
+    const session = await openSession(apiUrl, file, fields);
+    const have = new Set(session.received);
+    let sent = session.received_bytes || 0;
+    if (onProgress) onProgress(sent, file.size);
+
+    // In order, so the server can parse the file while it arrives
+    for (let index = 0; index < session.total_chunks; index++) {
+        if (have.has(index)) continue;
+        const blob = file.slice(index * CHUNK_SIZE, Math.min(file.size, (index + 1) * CHUNK_SIZE));
+        await sendChunk(apiUrl, session.upload_id, index, blob);
+        sent += blob.size;
+        if (onProgress) onProgress(sent, file.size);
+    }
+
+    const result = await fetchRecords(`${apiUrl}/uploads/${session.upload_id}/complete`, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ include_data: true })
+    });
+    if (result.success) localStorage.removeItem(sessionKey(file));
+    return result;
+}
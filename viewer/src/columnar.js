@@ -0,0 +1,82 @@
+// Binary Columnar Payloads
+// Reader for the typed column container written by src/columnar.py
+// (ui_payload.bin, /api/predict with format=columnar). Columns are views
+// onto the fetched ArrayBuffer - no JSON parsing and no copies.
+
+export const COLUMNAR_MAGIC = 'ILIC';
+export const COLUMNAR_VERSION = 1;
+export const COLUMNAR_CONTENT_TYPE = 'application/vnd.ili.columnar';
+
+const ARRAY_TYPES = {
+    float32: Float32Array,
+    float64: Float64Array,
+    int32: Int32Array,
+    bool: Uint8Array,
+    uint8: Uint8Array,
+    uint16: Uint16Array,
+    uint32: Uint32Array
+};
+
+// Decode a payload into { version, rows, meta, columns }. Each column is
+// { type, values: TypedArray, valid: Uint8Array bitmap | null, dictionary? }
+export function decodeColumnar(buffer) {
+    const view = new DataView(buffer);
+    const magic = String.fromCharCode(...new Uint8Array(buffer, 0, 4));
+    if (magic !== COLUMNAR_MAGIC) throw new Error('Not a columnar payload');
+    const version = view.getUint16(4, true);
+    if (version > COLUMNAR_VERSION) throw new Error(`Unsupported columnar payload version ${version}`);
+    const headerLength = view.getUint32(8, true);
+    const header = JSON.parse(new TextDecoder().decode(new Uint8Array(buffer, 12, headerLength)));
+
+    const columns = {};
+    header.columns.forEach(entry => {
+        const ArrayType = ARRAY_TYPES[entry.type === 'dictionary' ? entry.index : entry.type];
+        columns[entry.name] = {
+            type: entry.type,
+            values: new ArrayType(buffer, entry.offset, entry.byteLength / ArrayType.BYTES_PER_ELEMENT),
+            valid: entry.validity ? new Uint8Array(buffer, entry.validity.offset, entry.validity.byteLength) : null,
+            dictionary: entry.dictionary
+        };
+    });
+    return { version, rows: header.rows, meta: header.meta || {}, columns };
+}
+
+export function isValid(column, row) {
+    return !column.valid || (column.valid[row >> 3] & (1 << (row & 7))) !== 0;
+}
+
+// Value of one cell (null when missing)
+export function cell(column, row) {
+    if (!isValid(column, row)) return null;
+    const value = column.values[row];
+    if (column.type === 'dictionary') return column.dictionary[value];
+    if (column.type === 'bool') return value !== 0;
+    return value;
+}
+
+// Row objects for code that works on records (the JSON payload's shape).
+// `missing` replaces null cells (the JSON payload uses 0)
+export function toRecords(table, missing = null) {
+    const names = Object.keys(table.columns);
+    const getters = names.map(name => {
+        const { values, valid, dictionary, type } = table.columns[name];
+        const read = type === 'dictionary' ? row => dictionary[values[row]]
+            : type === 'bool' ? row => values[row] !== 0
+            : row => values[row];
+        return valid ? row => ((valid[row >> 3] & (1 << (row & 7))) === 0 ? missing : read(row)) : read;
+    });
+    // One object literal with every key, so all records share a single
+    // shape with in-object properties (much faster to build and read)
+    const makeRecord = new Function('g', 'row',
+        `return {${names.map((name, i) => `${JSON.stringify(name)}: g[${i}](row)`).join(', ')}};`);
+    const records = new Array(table.rows);
+    for (let row = 0; row < table.rows; row++) records[row] = makeRecord(getters, row);
+    return records;
+}
+
+// Fetch and decode a columnar payload
+export async function fetchColumnar(url, options = {}) {
+    const response = await fetch(url, options);
+    if (!response.ok) throw new Error(`Failed to load ${url}: ${response.status} ${response.statusText}`);
+    return decodeColumnar(await response.arrayBuffer());
+}
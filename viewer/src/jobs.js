@@ -0,0 +1,62 @@
+// Background Jobs
+// Follows a long-running API job (src/jobs.py) over server-sent events:
+// stage changes, progress and ETA while it runs, then fetches its result.
+// EventSource reconnects on its own and resumes from the last event id.
+
+import { fetchRecords } from './ndjson.js';
+
+// One-line description of a job's latest event, for status text
+export function describeJobEvent(event, job = {}) {
+    if (event.type === 'progress') {
+        const unit = event.unit && event.unit !== 'stages' ? ` ${event.unit}` : '';
+        const eta = event.eta_s != null ? ` · ~${Math.ceil(event.eta_s)}s left` : '';
+        return `${job.stage ? `${job.stage}: ` : ''}${event.done}/${event.total}${unit}${eta}`;
+    }
+    if (event.type === 'stage' && event.state === 'start') return `${event.stage}...`;
+    if (event.type === 'state') return event.state;
+    return null;
+}
+
+// Follow a job started by an endpoint's 202 response ({ job_id, ... }).
+// onEvent(event, job) sees every event; resolves with the job's result
+// (fetched like the synchronous endpoint) or rejects on failure / cancel.
+// A job the server doesn't know (the stream was refused, e.g. another
+// worker answered) rejects with error.lost, so callers can retry inline
+export function followJob(apiUrl, started, { onEvent = null, resultOptions = {} } = {}) {
+    const jobId = started.job_id;
+    const job = { id: jobId, stage: null, done: 0, total: null };
+
+    return new Promise((resolve, reject) => {
+        const source = new EventSource(`${apiUrl}/jobs/${jobId}/events`);
+        const handle = message => {
+            const event = JSON.parse(message.data);
+            if (event.type === 'stage' && event.state === 'start') job.stage = event.stage;
+            if (event.type === 'progress') Object.assign(job, { done: event.done, total: event.total });
+            if (onEvent) onEvent(event, job);
+            if (event.type !== 'state') return;
+
+            if (event.state === 'done') {
+                source.close();
+                fetchRecords(`${apiUrl}/jobs/${jobId}/result`, resultOptions).then(resolve, reject);
+            } else if (event.state === 'failed' || event.state === 'cancelled') {
+                source.close();
+                const error = new Error(event.state === 'cancelled' ? 'Cancelled' : (event.error || 'Job failed'));
+                error.cancelled = event.state === 'cancelled';
+                reject(error);
+            }
+        };
+        ['state', 'stage', 'progress', 'cancel_requested'].forEach(type => source.addEventListener(type, handle));
+        // Dropped connections reconnect by themselves; a refused one closes
+        source.onerror = () => {
+            if (source.readyState !== EventSource.CLOSED) return;
+            const error = new Error('Lost track of the job');
+            error.lost = true;
+            reject(error);
+        };
+    });
+}
+
+// Ask the server to stop a job (also works while the page unloads)
+export function cancelJob(apiUrl, jobId) {
+    return fetch(`${apiUrl}/jobs/${jobId}/cancel`, { method: 'POST', keepalive: true }).catch(() => null);
+}
@@ -0,0 +1,145 @@
+import * as THREE from 'three';
+
+// Level-of-Detail Tiles
+// Zoomed out, the viewer draws one bar per distance bin from the API's
+// aggregate tiles (/api/tiles, built by src/tiles.py) instead of one mesh
+// per anomaly. Bins are instanced, so a whole level is a single draw call.
+
+export const TILE_LEVELS_FT = [10, 100, 1000, 5280];
+export const DETAIL_SPAN_FT = 800;   // Individual anomalies below this visible span
+export const MAX_TILE_BINS = 200;    // Pick the finest level with at most this many bins on screen
+export const LOD_CHECK_MS = 250;
+
+const PIPE_RADIUS = 2.0;
+const COLORS = {
+    Critical: new THREE.Color(0xC40D3C),
+    'Review Required': new THREE.Color(0xeab308),
+    Normal: new THREE.Color(0x22c55e)
+};
+
+// Approximate length of pipe (ft) spanned by the view at the orbit target
+export function visibleSpanFt(camera, target) {
+    const distance = camera.position.distanceTo(target);
+    return 2 * distance * Math.tan((camera.fov * Math.PI) / 360) * camera.aspect;
+}
+
+export function pickLevel(spanFt) {
+    return TILE_LEVELS_FT.find(level => spanFt / level <= MAX_TILE_BINS) || TILE_LEVELS_FT[TILE_LEVELS_FT.length - 1];
+}
+
+// Worst status of a bin from its max depth and max growth rate, with the
+// viewer's calculateStatus thresholds (an upper bound: the two maxima can
+// come from different anomalies)
+export function binStatus(maxDepth, maxGrowthRate) {
+    const depth = maxDepth || 0;
+    const rate = maxGrowthRate || 0;
+    if (depth >= 30 || rate >= 1.2 || (depth >= 25 && rate >= 0.8)) return 'Critical';
+    if (depth >= 15 || rate >= 0.5) return 'Review Required';
+    return 'Normal';
+}
+
+export class TileLayer {
+    constructor(scene, apiUrl) {
+        this.scene = scene;
+        this.apiUrl = apiUrl;
+        this.mesh = null;
+        this.tiles = null;
+        this.loaded = null;    // { dataset, level, start, end } of the drawn bins
+        this.pending = null;
+        this.visible = false;
+        this.unavailable = false; // Set when the API can't serve tiles (static hosting)
+    }
+
+    setVisible(visible) {
+        this.visible = visible;
+        if (this.mesh) this.mesh.visible = visible;
+    }
+
+    // Fetch the bins covering [distMin, distMax] unless they are already drawn
+    async request(dataset, level, distMin, distMax) {
+        const start = Math.max(0, Math.floor(distMin / level));
+        const end = Math.ceil(distMax / level);
+        const loaded = this.loaded;
+        if (loaded && loaded.dataset === dataset && loaded.level === level && loaded.start <= start && loaded.end >= end) return;
+        if (this.pending) return;
+
+        // Load twice the requested range so small pans don't refetch
+        const pad = Math.ceil((end - start) / 2);
+        const range = { dataset, level, start: Math.max(0, start - pad), end: end + pad };
+        this.pending = range;
+        try {
+            const params = new URLSearchParams({ dataset, level, start: range.start, end: range.end });
+            const response = await fetch(`${this.apiUrl}/tiles?${params}`);
+            const result = await response.json();
+            if (!response.ok || !result.success) throw new Error(result.error || response.statusText);
+            this.tiles = result.tiles;
+            this.loaded = range;
+            this.build(level);
+        } catch (error) {
+            console.warn('Tile request failed, showing individual anomalies:', error);
+            this.unavailable = true;
+        } finally {
+            this.pending = null;
+        }
+    }
+
+    build(level) {
+        this.dispose();
+        const tiles = this.tiles;
+        const n = tiles.bin.length;
+        if (n === 0) return;
+
+        const geometry = new THREE.BoxGeometry(1, 1, 1);
+        const material = new THREE.MeshStandardMaterial({ roughness: 0.5, metalness: 0.1, transparent: true, opacity: 0.85 });
+        this.mesh = new THREE.InstancedMesh(geometry, material, n);
+
+        const matrix = new THREE.Matrix4();
+        for (let i = 0; i < n; i++) {
+            // Bar on top of the pipe, height by (log) anomaly count
+            const height = 1 + 2 * Math.log2(1 + tiles.count[i]);
+            matrix.makeScale(1.5, height, level * 0.9);
+            matrix.setPosition(0, PIPE_RADIUS + height / 2, (tiles.bin[i] + 0.5) * level);
+            this.mesh.setMatrixAt(i, matrix);
+            const status = binStatus(tiles.max_depth && tiles.max_depth[i], tiles.max_growth_rate && tiles.max_growth_rate[i]);
+            this.mesh.setColorAt(i, COLORS[status]);
+        }
+        this.mesh.instanceMatrix.needsUpdate = true;
+        if (this.mesh.instanceColor) this.mesh.instanceColor.needsUpdate = true;
+        this.mesh.userData = { type: 'TileLayer', level };
+        this.mesh.visible = this.visible;
+        this.scene.add(this.mesh);
+    }
+
+    // Bin record for an instance (for tooltips)
+    binAt(index) {
+        const tiles = this.tiles;
+        if (!tiles || index == null) return null;
+        const bin = { bin: tiles.bin[index], count: tiles.count[index], level: this.loaded.level };
+        ['max_depth', 'max_growth_rate', 'min_years_to_failure'].forEach(field => {
+            if (tiles[field]) bin[field] = tiles[field][index];
+        });
+        ['status', 'severity'].forEach(key => {
+            if (!tiles[key]) return;
+            bin[key] = {};
+            Object.entries(tiles[key]).forEach(([name, counts]) => {
+                if (counts[index]) bin[key][name] = counts[index];
+            });
+        });
+        return bin;
+    }
+
+    dispose() {
+        if (!this.mesh) return;
+        this.scene.remove(this.mesh);
+        this.mesh.geometry.dispose();
+        this.mesh.material.dispose();
+        this.mesh = null;
+    }
+
+    reset() {
+        this.dispose();
+        this.tiles = null;
+        this.loaded = null;
+        this.unavailable = false;
+    }
+}
@@ -4,6 +4,12 @@ import { LeafletMapIntegration } from './leafletMap.js';
 import { checkProximityToSensitiveLocations, getProximityAlertLevel, formatLocationType } from './geoData.js';
 import { PIPELINE_START_COORDS, GOOGLE_MAPS_API_KEY } from './config.js';
 import { StreetViewIntegration } from './streetView.js';
+import { decodeReviewReasons, hasReviewFlag, REVIEW_REASON_LABELS } from './reviewFlags.js';
+import { TileLayer, visibleSpanFt, pickLevel, DETAIL_SPAN_FT, LOD_CHECK_MS } from './lodTiles.js';
+import { fetchColumnar, toRecords } from './columnar.js';
+import { fetchRecords } from './ndjson.js';
+import { uploadInChunks, CHUNKED_UPLOAD_THRESHOLD } from './chunkedUpload.js';
+import { followJob, cancelJob, describeJobEvent } from './jobs.js';
 
 class PipelineViewer {
     constructor() {
@@ -22,6 +28,14 @@ class PipelineViewer {
         this.jointMap = new Map();
         this.jointAnomalyMap = new Map();
 
+        // Anomaly meshes live in one group, so the level-of-detail switch can
+        // hide them all without touching each mesh's filter visibility
+        this.anomalyLayer = new THREE.Group();
+        this.scene.add(this.anomalyLayer);
+        this.tileLayer = new TileLayer(this.scene, 'http://localhost:5000/api');
+        this.tileDataset = 'report'; // null turns the aggregate view off (uploaded data)
+        this.lastLodCheck = 0;
+
         this.raycaster = new THREE.Raycaster();
         this.mouse = new THREE.Vector2();
         this.hoveredSegment = null;
@@ -82,6 +96,7 @@ class PipelineViewer {
         document.getElementById('legend-critical').onclick = () => this.filterByStatus('Critical');
         document.getElementById('legend-review').onclick = () => this.filterByStatus('Review Required');
         document.getElementById('legend-normal').onclick = () => this.filterByStatus('Normal');
+        this.setupReviewReasonFilter();
 
         // Leaflet Map Integration (OpenStreetMap - No API Key!)
         this.mapIntegration = new LeafletMapIntegration();
@@ -212,8 +227,17 @@ class PipelineViewer {
 
         this.raycaster.setFromCamera(this.mouse, this.camera);
 
+        // Check aggregate tiles (zoomed out)
+        if (this.tileLayer.mesh && this.tileLayer.visible) {
+            const intersectTile = this.raycaster.intersectObject(this.tileLayer.mesh);
+            if (intersectTile.length > 0) {
+                this.showTileTooltip(event, this.tileLayer.binAt(intersectTile[0].instanceId));
+                return;
+            }
+        }
+
         // Check Anomalies
-        const visibleAnomalies = this.anomalies.filter(a => a.visible);
+        const visibleAnomalies = this.anomalyLayer.visible ? this.anomalies.filter(a => a.visible) : [];
         const intersectAnom = this.raycaster.intersectObjects(visibleAnomalies);
 
         if (intersectAnom.length > 0) {
@@ -387,6 +411,7 @@ class PipelineViewer {
 
     filterByStatus(status) {
         console.log(`Filtering anomalies by status: ${status}`);
+        this.setReviewMask(0);
 
         // Check if this filter is already active - if so, toggle it off
         if (this.activeStatusFilter === status) {
@@ -446,6 +471,77 @@ class PipelineViewer {
         }
     }
 
+    // Review reason rows under the status legend: each toggles its bit in
+    // the mask, and the match button switches between any and all bits
+    setupReviewReasonFilter() {
+        const container = document.getElementById('legend-review-reasons');
+        const modeBtn = document.getElementById('review-match-mode');
+        if (!container || !modeBtn) return;
+        this.reviewMask = 0;
+        this.reviewRequireAll = false;
+
+        this.reviewReasonRows = Object.entries(REVIEW_REASON_LABELS).map(([bit, label]) => {
+            const row = document.createElement('div');
+            row.className = 'cursor-pointer hover:bg-yellow-500/10 px-2 py-1 rounded transition-all text-[10px] text-slate-300';
+            row.textContent = label;
+            row.dataset.bit = bit;
+            row.onclick = () => this.applyReviewReasonFilter(this.reviewMask ^ Number(bit));
+            container.appendChild(row);
+            return row;
+        });
+
+        modeBtn.onclick = () => {
+            this.reviewRequireAll = !this.reviewRequireAll;
+            modeBtn.textContent = this.reviewRequireAll ? 'Match all' : 'Match any';
+            if (this.reviewMask) this.applyReviewReasonFilter(this.reviewMask);
+        };
+    }
+
+    // Highlight the selected reason rows (mask 0 clears them)
+    setReviewMask(mask) {
+        this.reviewMask = mask;
+        (this.reviewReasonRows || []).forEach(row => {
+            const active = (mask & Number(row.dataset.bit)) !== 0;
+            row.classList.toggle('ring-1', active);
+            row.classList.toggle('ring-yellow-400', active);
+            row.classList.toggle('bg-white/10', active);
+        });
+    }
+
+    applyReviewReasonFilter(mask) {
+        this.setReviewMask(mask);
+        if (mask) {
+            this.filterByReviewReason(mask, this.reviewRequireAll);
+            return;
+        }
+        this.anomalies.forEach(mesh => {
+            mesh.visible = true;
+        });
+        this.showSystemMessage(`Filter removed. Showing all anomalies.`);
+    }
+
+    filterByReviewReason(mask, requireAll = false) {
+        // mask is an OR of REVIEW_FLAGS bits (see reviewFlags.js)
+        let visibleCount = 0;
+        let firstVisible = null;
+
+        this.anomalies.forEach(mesh => {
+            mesh.visible = hasReviewFlag(mesh.userData, mask, requireAll);
+            if (mesh.visible) {
+                visibleCount++;
+                if (!firstVisible) firstVisible = mesh;
+            }
+        });
+
+        this.activeStatusFilter = null;
+        this.updateLegendActiveState(null);
+        this.showSystemMessage(`Showing ${visibleCount} anomalies for review reason: ${decodeReviewReasons(mask)}`);
+
+        if (firstVisible) {
+            this.jumpTo(firstVisible.userData);
+        }
+    }
+
     updateLegendActiveState(activeStatus) {
         // Remove active state from all
         ['legend-critical', 'legend-review', 'legend-normal'].forEach(id => {
@@ -1201,19 +1297,34 @@ class PipelineViewer {
         }
     }
 
+    // Anomaly records from the binary columnar payload, falling back to
+    // the JSON payload when there is no (valid) ui_payload.bin
+    async loadAnomalyPayload() {
+        try {
+            const table = await fetchColumnar('/data/ui_payload.bin');
+            console.log(`Loaded ui_payload.bin (v${table.version}, ${table.rows} rows)`);
+            // The rest of the viewer was written against the JSON payload, which fills missing values with 0
+            return toRecords(table, 0);
+        } catch (e) {
+            console.log('No columnar payload, loading ui_payload.json:', e.message);
+        }
+        // Try to load from root /data first, fallback to relative if needed (though usually /data works in Vite)
+        const anomsRes = await fetch('/data/ui_payload.json').catch(e => fetch('./data/ui_payload.json'));
+        if (!anomsRes.ok) throw new Error(`Failed to load ui_payload.json: ${anomsRes.status} ${anomsRes.statusText} `);
+        return anomsRes.json();
+    }
+
     async loadData() {
         try {
             console.log('Fetching data...');
-            const [anomsRes, refsRes] = await Promise.all([
-                // Try to load from root /data first, fallback to relative if needed (though usually /data works in Vite)
-                fetch('/data/ui_payload.json').catch(e => fetch('./data/ui_payload.json')),
+            const [anomalyData, refsRes] = await Promise.all([
+                this.loadAnomalyPayload(),
                 fetch('/data/reference_payload.json').catch(e => fetch('./data/reference_payload.json'))
             ]);
 
-            if (!anomsRes.ok) throw new Error(`Failed to load ui_payload.json: ${anomsRes.status} ${anomsRes.statusText} `);
             if (!refsRes.ok) throw new Error(`Failed to load reference_payload.json: ${refsRes.status} ${refsRes.statusText} `);
 
-            this.anomalyData = await anomsRes.json();
+            this.anomalyData = anomalyData;
             this.referenceData = await refsRes.json();
 
             // Fix Alignment: Shift original references back 20ft to center pipe on anomalies
@@ -1385,7 +1496,7 @@ class PipelineViewer {
 
             mesh.userData = item;
             mesh.visible = false; // Hidden by default
-            this.scene.add(mesh);
+            this.anomalyLayer.add(mesh);
             this.anomalies.push(mesh);
 
             // Populate joint map
@@ -1438,7 +1549,7 @@ class PipelineViewer {
         this.raycaster.setFromCamera(this.mouse, this.camera);
 
         // Check anomalies first (visible only)
-        const visibleAnomalies = this.anomalies.filter(a => a.visible);
+        const visibleAnomalies = this.anomalyLayer.visible ? this.anomalies.filter(a => a.visible) : [];
         const intersectsAnom = this.raycaster.intersectObjects(visibleAnomalies);
 
         if (intersectsAnom.length > 0) {
@@ -1744,6 +1855,7 @@ class PipelineViewer {
 
     showAnomalyInfo(item) {
         const container = document.getElementById('anomaly-info');
+        const reviewReasons = item.review_reasons || decodeReviewReasons(item.review_flags);
 
         // Determine status display based on source and match
         let statusColor = 'green';
@@ -1886,6 +1998,22 @@ class PipelineViewer {
                             <span class="font-bold text-${sevColor}-400">${yearsToFailure.toFixed(1)} years</span>
                         </div>
                         ` : ''}
+                        ${item.failure_pressure_psi ? `
+                        <div class="flex justify-between">
+                            <span>Failure Pressure:</span>
+                            <span class="font-mono">${item.failure_pressure_psi.toFixed(0)} psi</span>
+                        </div>
+                        <div class="flex justify-between">
+                            <span>ERF (MAOP / Safe Pressure):</span>
+                            <span class="font-bold ${item.erf > 1 ? 'text-red-400' : `text-${sevColor}-400`}">${item.erf.toFixed(3)}</span>
+                        </div>
+                        ` : ''}
+                        ${item.unsafe_year ? `
+                        <div class="flex justify-between">
+                            <span>Below Safety Factor:</span>
+                            <span class="font-bold text-${sevColor}-400">${Math.floor(item.unsafe_year)}</span>
+                        </div>
+                        ` : ''}
                         <div class="text-[9px] text-${sevColor}-400/60 mt-2 italic">
                             Based on: current depth (40%), growth rate (30%), total growth (20%), time to failure (10%)
                         </div>
@@ -1894,6 +2022,32 @@ class PipelineViewer {
     `;
         }
 
+        // Interacting anomaly cluster badge (assessed together, see src/clustering.py)
+        let clusterBadge = '';
+        if ((item.cluster_size || 0) > 1) {
+            clusterBadge = `
+    <div class="bg-fuchsia-900/20 p-3 rounded-lg border border-fuchsia-500/30 mb-3">
+                    <div class="flex items-center gap-2 mb-2">
+                        <span class="font-bold text-fuchsia-400 text-xs uppercase">Interacting Cluster #${item.cluster_id}</span>
+                        <span class="ml-auto text-fuchsia-300 font-mono text-sm font-bold">${item.cluster_size} features</span>
+                    </div>
+                    <div class="text-[10px] text-fuchsia-300/80 space-y-1">
+                        <div class="flex justify-between">
+                            <span>Combined Length × Width:</span>
+                            <span class="font-mono">${(item.cluster_length_in || 0).toFixed(1)} × ${(item.cluster_width_in || 0).toFixed(1)} in</span>
+                        </div>
+                        <div class="flex justify-between">
+                            <span>Cluster Max Depth:</span>
+                            <span class="font-bold text-fuchsia-400">${(item.cluster_max_depth || 0).toFixed(1)}%</span>
+                        </div>
+                        <div class="text-[9px] text-fuchsia-400/60 mt-2 italic">
+                            Severity is assessed at the cluster's deepest feature
+                        </div>
+                    </div>
+                </div>
+    `;
+        }
+
         // Proximity detection badge
         let proximityBadge = '';
         try {
@@ -1951,6 +2105,7 @@ class PipelineViewer {
             ${validationBadge}
             ${confidenceBadge}
             ${severityBadge}
+            ${clusterBadge}
             ${proximityBadge}
 
 <div class="bg-${statusColor}-900/20 p-4 rounded-lg border border-${statusColor}-500/30">
@@ -1971,10 +2126,10 @@ class PipelineViewer {
         <span class="stat-label">Match Confidence</span>
         <span class="stat-value text-${confidenceColor}-400">${item.confidence_label}</span>
     </div>
-    ${item.confidence_label === 'Review Required' && item.review_reasons ? `
+    ${item.confidence_label === 'Review Required' && reviewReasons ? `
                 <div class="bg-yellow-900/20 p-2 rounded border border-yellow-500/30 mb-2">
                     <div class="text-[10px] text-orange-300 font-semibold mb-1">Review Reasons:</div>
-                    <div class="text-[9px] text-orange-400/80">${item.review_reasons}</div>
+                    <div class="text-[9px] text-orange-400/80">${reviewReasons}</div>
                 </div>
                 ` : ''}
     <div class="stat-row">
@@ -2029,6 +2184,7 @@ class PipelineViewer {
     animate() {
         requestAnimationFrame(() => this.animate());
         this.controls.update();
+        this.updateLevelOfDetail();
 
         // Sync slider with camera
         const currentZ = this.controls.target.z;
@@ -2047,6 +2203,53 @@ class PipelineViewer {
         this.renderer.render(this.scene, this.camera);
     }
 
+    // Zoomed out past DETAIL_SPAN_FT, draw aggregate tiles instead of anomalies
+    updateLevelOfDetail() {
+        const now = performance.now();
+        if (now - this.lastLodCheck < LOD_CHECK_MS) return;
+        this.lastLodCheck = now;
+
+        const span = visibleSpanFt(this.camera, this.controls.target);
+        const aggregate = this.tileDataset !== null && !this.tileLayer.unavailable && span > DETAIL_SPAN_FT;
+        this.anomalyLayer.visible = !aggregate;
+        this.tileLayer.setVisible(aggregate);
+        if (aggregate) {
+            const center = this.controls.target.z;
+            this.tileLayer.request(this.tileDataset, pickLevel(span), center - span, center + span);
+        }
+    }
+
+    showTileTooltip(event, bin) {
+        if (!bin) return;
+        const start = bin.bin * bin.level;
+        const rows = (counts) => Object.entries(counts || {}).map(([name, count]) => `
+                    <div class="flex justify-between text-[10px] text-slate-400">
+                        <span>${name}:</span> <span class="text-slate-200">${count}</span>
+                    </div>`).join('');
+        this.tooltip.style.left = `${event.clientX + 15}px`;
+        this.tooltip.style.top = `${event.clientY + 15}px`;
+        this.tooltip.innerHTML = `
+                <div class="flex flex-col gap-1 min-w-[160px]">
+                    <div class="font-bold text-slate-200 text-xs border-b border-white/10 pb-1 mb-1">${start.toLocaleString()} - ${(start + bin.level).toLocaleString()} ft</div>
+                    <div class="flex justify-between text-[10px] text-slate-400">
+                        <span>Anomalies:</span> <span class="text-cyan-400 font-bold">${bin.count}</span>
+                    </div>
+                    <div class="flex justify-between text-[10px] text-slate-400">
+                        <span>Max Depth:</span> <span class="text-slate-200">${bin.max_depth != null ? bin.max_depth.toFixed(1) + '%' : 'N/A'}</span>
+                    </div>
+                    <div class="flex justify-between text-[10px] text-slate-400">
+                        <span>Max Growth:</span> <span class="text-slate-200">${bin.max_growth_rate != null ? bin.max_growth_rate.toFixed(2) + '%/yr' : 'N/A'}</span>
+                    </div>
+                    <div class="flex justify-between text-[10px] text-slate-400">
+                        <span>Min Years to Failure:</span> <span class="text-slate-200">${bin.min_years_to_failure != null ? bin.min_years_to_failure.toFixed(1) : 'N/A'}</span>
+                    </div>
+                    <div class="border-t border-white/10 pt-1 mt-1">${rows(bin.status)}</div>
+                    <div class="border-t border-white/10 pt-1 mt-1">${rows(bin.severity)}</div>
+                </div>
+            `;
+        this.tooltip.classList.remove('hidden');
+    }
+
     drawMeasurementGuides(data) {
         this.clearMeasurementGuides();
         if (!this.guidesGroup) return;
@@ -2226,6 +2429,16 @@ class PipelineViewer {
         this.uploadProgress = document.getElementById('upload-progress');
         this.progressBar = document.getElementById('progress-bar');
         this.processBtn = document.getElementById('btn-process-upload');
+        this.cancelJobBtn = document.getElementById('btn-cancel-job');
+        this.activeJob = null;
+
+        // Stop a running parse from the button or when the page goes away
+        this.cancelJobBtn.addEventListener('click', () => {
+            if (this.activeJob) cancelJob(this.uploadApiUrl, this.activeJob);
+        });
+        window.addEventListener('beforeunload', () => {
+            if (this.activeJob) cancelJob(this.uploadApiUrl, this.activeJob);
+        });
 
         // Click to browse
         this.uploadBox.addEventListener('click', () => {
@@ -2300,19 +2513,26 @@ class PipelineViewer {
         const formData = new FormData();
         formData.append('file', file);
         formData.append('filter_references', 'true');
+        // Parse as a background job so the stages can be followed and cancelled
+        formData.append('async', 'true');
 
         try {
             // Simulate progress (since we can't track actual upload progress easily)
             this.progressBar.style.width = '30%';
 
-            const response = await fetch(`${this.uploadApiUrl}/upload`, {
-                method: 'POST',
-                body: formData
-            });
-
-            this.progressBar.style.width = '70%';
-
-            const result = await response.json();
+            // Large files go up in resumable chunks, parsed while they arrive;
+            // records stream in as NDJSON once the file is parsed
+            const result = file.size > CHUNKED_UPLOAD_THRESHOLD
+                ? await uploadInChunks(this.uploadApiUrl, file, {
+                    fields: { filter_references: true },
+                    onProgress: (sent, total) => {
+                        this.progressBar.style.width = `${90 * sent / total}%`;
+                    }
+                })
+                : await this.followUploadJob(await fetchRecords(`${this.uploadApiUrl}/upload`, {
+                    method: 'POST',
+                    body: formData
+                }), file, formData);
 
             this.progressBar.style.width = '100%';
 
@@ -2336,15 +2556,47 @@ class PipelineViewer {
 
         } catch (error) {
             console.error('Upload error:', error);
-            this.showUploadStatus('error', 'Upload failed', error.message);
+            this.showUploadStatus('error', error.cancelled ? 'Upload cancelled' : 'Upload failed', error.message);
             this.uploadedData = null;
         } finally {
+            this.activeJob = null;
+            this.cancelJobBtn.classList.add('hidden');
             setTimeout(() => {
                 this.uploadProgress.classList.add('hidden');
             }, 1000);
         }
     }
 
+    // Follow an upload's parse job, showing its stages and progress; the
+    // result is the same as a synchronous /api/upload response. Servers
+    // with jobs off answer inline, and a job this page loses track of
+    // (another worker started it) is retried as a synchronous upload
+    async followUploadJob(started, file, formData) {
+        if (!started.job_id) return started;
+        this.activeJob = started.job_id;
+        this.cancelJobBtn.classList.remove('hidden');
+        this.showUploadStatus('uploading', 'Parsing file...', file.name);
+
+        return followJob(this.uploadApiUrl, started, {
+            onEvent: (event, job) => {
+                const text = describeJobEvent(event, job);
+                if (text) this.statusDetails.textContent = text;
+                if (job.total) this.progressBar.style.width = `${30 + 60 * job.done / job.total}%`;
+            },
+            resultOptions: {
+                onProgress: (received, total) => {
+                    this.progressBar.style.width = `${90 + 10 * (total ? received / total : 0)}%`;
+                }
+            }
+        }).catch(error => {
+            if (!error.lost) throw error;
+            this.activeJob = null;
+            this.cancelJobBtn.classList.add('hidden');
+            formData.delete('async');
+            return fetchRecords(`${this.uploadApiUrl}/upload`, { method: 'POST', body: formData });
+        });
+    }
+
     showUploadStatus(type, message, details = '') {
         this.uploadStatus.classList.remove('hidden');
         this.statusMessage.textContent = message;
@@ -2525,13 +2777,13 @@ class PipelineViewer {
             if (item.isMatch && item.bestMatch) {
                 // Inherit historical data and risk assessment
                 growthRate = item.bestMatch.annual_growth_rate || 0;
-                status = item.bestMatch.status || this.calculateStatus(row.depth, growthRate);
+                status = item.bestMatch.status || row.status || this.calculateStatus(row.depth, growthRate);
                 confidenceLabel = item.bestMatch.confidence_label || 'Normal';
                 confidenceScore = item.bestMatch.confidence_score || 0;
                 severityScore = item.bestMatch.severity_score || 0;
             } else {
-                // New anomaly - use simplified logic based on depth only
-                status = this.calculateStatus(row.depth, 0);
+                // New anomaly - status scored server-side (scoring.UPLOAD_RULES)
+                status = row.status || this.calculateStatus(row.depth, 0);
             }
 
             return {
@@ -2812,7 +3064,7 @@ class PipelineViewer {
 
             mesh.userData = item;
             mesh.visible = true; // Start visible in comparison mode
-            this.scene.add(mesh);
+            this.anomalyLayer.add(mesh);
             this.anomalies.push(mesh);
 
             // Populate joint map
@@ -2882,8 +3134,8 @@ class PipelineViewer {
 
 
     calculateStatus(depth, growthRate) {
-        // Determine status based on depth and growth rate
-        // Adjusted thresholds to match actual data ranges (max depth ~37%)
+        // Offline fallback only - the upload API scores rows with
+        // scoring.UPLOAD_RULES; keep these thresholds in sync with it
         if (depth >= 30 || growthRate >= 1.2 || (depth >= 25 && growthRate >= 0.8)) {
             return 'Critical';
         } else if (depth >= 15 || growthRate >= 0.5) {
@@ -2975,9 +3227,15 @@ class PipelineViewer {
     }
 
     clearVisualization() {
+        // Uploaded data is drawn anomaly by anomaly; the server tiles
+        // only cover the report
+        this.tileDataset = null;
+        this.tileLayer.reset();
+        this.anomalyLayer.visible = true;
+
         // Clear existing 3D objects
         this.anomalies.forEach(mesh => {
-            this.scene.remove(mesh);
+            this.anomalyLayer.remove(mesh);
             if (mesh.geometry) mesh.geometry.dispose();
             if (mesh.material) mesh.material.dispose();
         });
@@ -3017,12 +3275,10 @@ class PipelineViewer {
         document.getElementById('progress-bar').style.width = '50%';
 
         try {
-            const response = await fetch('http://localhost:5000/api/load_demo', {
+            const result = await fetchRecords('http://localhost:5000/api/load_demo', {
                 method: 'POST'
             });
 
-            const result = await response.json();
-
             document.getElementById('progress-bar').style.width = '100%';
 
             if (result.success) {
@@ -3058,15 +3314,39 @@ class PipelineViewer {
 
         try {
             console.log("Requesting prediction for 7 years ahead...");
-            const response = await fetch('http://localhost:5000/api/predict', {
+            // Revalidate the last prediction: unchanged data and model -> 304
+            const cached = this.predictionCache;
+            // Training runs as a job; its progress (trees grown, ETA) shows on the button
+            let result = await fetchRecords('http://localhost:5000/api/predict', {
                 method: 'POST',
                 headers: { 'Content-Type': 'application/json' },
-                body: JSON.stringify({ years: 7 })
+                body: JSON.stringify({ years: 7, async: true }),
+                etag: cached ? cached.etag : null
             });
+            if (result.job_id) {
+                this.activeJob = result.job_id;
+                result = await followJob('http://localhost:5000/api', result, {
+                    onEvent: (event, job) => {
+                        const text = describeJobEvent(event, job);
+                        if (text && event.type !== 'state') btn.lastChild.textContent = ` Running AI Prediction (${text})`;
+                    }
+                }).catch(error => {
+                    if (!error.lost) throw error;
+                    // Started on a worker this page can't follow: predict inline
+                    this.activeJob = null;
+                    return fetchRecords('http://localhost:5000/api/predict', {
+                        method: 'POST',
+                        headers: { 'Content-Type': 'application/json' },
+                        body: JSON.stringify({ years: 7 })
+                    });
+                });
+            }
 
-            if (!response.ok) throw new Error("Prediction API failed");
+            if (!result.notModified && !result.ok) throw new Error(result.error || "Prediction API failed");
 
-            const predictions = await response.json();
+            const predictions = result.notModified ? cached.predictions
+                : (Array.isArray(result) ? result : result.data);
+            this.predictionCache = { etag: result.etag, predictions };
             console.log(`Received ${predictions.length} predictions`);
 
             // Visualize predictions
@@ -3079,6 +3359,7 @@ class PipelineViewer {
             alert('Prediction failed: ' + e.message);
         } finally {
             this.isPredicting = false;
+            this.activeJob = null;
             btn.innerHTML = originalText;
             btn.disabled = true; // Disable after run to avoid double press
             btn.classList.add('opacity-50', 'cursor-not-allowed');
@@ -0,0 +1,59 @@
+// NDJSON Streams
+// Reader for the API's streamed record responses (src/streaming.py): the
+// first line is the response envelope, every later line one record. Lines
+// are parsed as chunks arrive instead of after the last byte.
+
+export const NDJSON_MIMETYPE = 'application/x-ndjson';
+
+// Read a streamed response into { ...envelope, data: [records] }.
+// onProgress(received, total) is called after each chunk
+export async function readNdjson(response, onProgress = null) {
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let envelope = null;
+    let buffer = '';
+    const data = [];
+
+    const take = line => {
+        if (!line) return;
+        const value = JSON.parse(line);
+        if (envelope === null) envelope = value;
+        else data.push(value);
+    };
+
+    for (;;) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        const lines = buffer.split('\n');
+        buffer = lines.pop();
+        lines.forEach(take);
+        if (onProgress && envelope) onProgress(data.length, envelope.rows);
+    }
+    take(buffer + decoder.decode());
+
+    if (envelope === null) throw new Error('Empty response stream');
+    if (envelope.rows != null && data.length !== envelope.rows) {
+        throw new Error(`Response stream ended early (${data.length} of ${envelope.rows} rows)`);
+    }
+    return { ...envelope, data };
+}
+
+// POST/GET asking for a stream. Falls back to the JSON body if the server
+// answers with plain JSON. Send `etag` to revalidate a cached result: the
+// result is then { notModified: true, etag } on a 304.
+export async function fetchRecords(url, { etag = null, onProgress = null, headers = {}, ...options } = {}) {
+    const response = await fetch(url, {
+        ...options,
+        headers: { Accept: `${NDJSON_MIMETYPE}, application/json;q=0.9`, ...(etag ? { 'If-None-Match': etag } : {}), ...headers }
+    });
+    const responseEtag = response.headers.get('ETag');
+    if (response.status === 304) return { notModified: true, etag: responseEtag || etag };
+
+    const type = response.headers.get('Content-Type') || '';
+    const result = response.ok && type.startsWith(NDJSON_MIMETYPE)
+        ? await readNdjson(response, onProgress)
+        : await response.json();
+    if (!response.ok && result.success === undefined) result.success = false;
+    return Object.assign(result, { etag: responseEtag, ok: response.ok });
+}
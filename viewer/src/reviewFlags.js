@@ -0,0 +1,34 @@
+// Review Reason Bit Flags
+// Mirrors REVIEW_* in src/analytics.py. The payload carries one integer
+// `review_flags` per anomaly; text is decoded only when displayed.
+
+export const REVIEW_FLAGS = {
+    SPATIAL: 1,
+    MATCH_COST: 2,
+    LOW_CONFIDENCE: 4,
+    DEPTH_CHANGE: 8,
+    TYPE_MISMATCH: 16
+};
+
+export const REVIEW_REASON_LABELS = {
+    [REVIEW_FLAGS.SPATIAL]: 'Spatial validation failed',
+    [REVIEW_FLAGS.MATCH_COST]: 'High match cost (>0.6)',
+    [REVIEW_FLAGS.LOW_CONFIDENCE]: 'Low confidence (<70%)',
+    [REVIEW_FLAGS.DEPTH_CHANGE]: 'Unusual depth change',
+    [REVIEW_FLAGS.TYPE_MISMATCH]: 'Type mismatch'
+};
+
+// Decode a flag value into the "; "-joined reason text
+export function decodeReviewReasons(flags) {
+    if (!flags) return '';
+    return Object.entries(REVIEW_REASON_LABELS)
+        .filter(([bit]) => flags & Number(bit))
+        .map(([, label]) => label)
+        .join('; ');
+}
+
+// True if the anomaly has any (or, with requireAll, every) bit in mask set
+export function hasReviewFlag(item, mask, requireAll = false) {
+    const flags = item.review_flags || 0;
+    return requireAll ? (flags & mask) === mask : (flags & mask) !== 0;
+}